@@ -1,6 +1,13 @@
-from flask import Flask, jsonify, request
+from flask import Flask, jsonify, request, g
 from flask_cors import CORS
 import os
+import sys
+
+# Make the flask_app package importable from the serverless function
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask_app.auth import require_user
+from flask_app import stats_engine
 
 app = Flask(__name__)
 CORS(app)
@@ -13,17 +20,13 @@ def health_check():
     })
 
 @app.route('/api/stats/overview/')
+@require_user
 def stats_overview():
-    return jsonify({
-        "leads": 42,
-        "campaigns": 3,
-        "open_rate": 0.25,
-        "reply_rate": 0.05,
-        "opens": 1250,
-        "replies": 63,
-        "active_campaigns": 2,
-        "delivery_rate": 0.95
-    })
+    try:
+        return jsonify(stats_engine.get_overview(g.user_id))
+    except Exception as e:
+        app.logger.exception(f"Error retrieving stats overview: {str(e)}")
+        return jsonify({"error": "Failed to retrieve statistics"}), 500
 
 @app.route('/api/campaigns/')
 def campaigns_list():
@@ -19,6 +19,8 @@ DEV_KEY = os.getenv("DEV_API_KEY", "dev-secret")
 def create_app():
     app = Flask(__name__)
     app.env = os.getenv("FLASK_ENV", "development")
+    # require_user reads the environment from the config
+    app.config["ENV"] = app.env
     
     # Configure CORS
     # Get allowed origins from environment variable or use default development origins
@@ -41,7 +43,7 @@ def create_app():
             return None
             
         # Skip auth for health, test, and simple endpoints
-        if request.path in ['/health', '/test', '/stats/overview/', '/campaigns/']:
+        if request.path in ['/health', '/test', '/campaigns/']:
             return None
             
         # Skip auth for database fix endpoints
@@ -107,20 +109,6 @@ def create_app():
             "path": request.path
         })
     
-    @app.route('/stats/overview/', methods=['GET'])
-    def simple_stats():
-        """Simple stats endpoint for testing"""
-        return jsonify({
-            "leads": 42,
-            "campaigns": 3,
-            "open_rate": 0.25,
-            "reply_rate": 0.05,
-            "opens": 1250,
-            "replies": 63,
-            "active_campaigns": 2,
-            "delivery_rate": 0.95
-        })
-    
     @app.route('/campaigns/', methods=['GET'])
     def simple_campaigns():
         """Simple campaigns endpoint for testing"""
@@ -161,12 +149,22 @@ def create_app():
     from .routes.database_fix import database_fix_bp
     app.register_blueprint(database_fix_bp)
     
+    # Import and register stats blueprint (counters read from owner_stats)
+    from .routes.stats import stats_bp
+    app.register_blueprint(stats_bp)
+    
+    # Import and register live updates blueprint (SSE)
+    from .routes.live import live_bp
+    app.register_blueprint(live_bp)
+    
+    # Import and register delta sync blueprint
+    from .routes.sync import sync_bp
+    app.register_blueprint(sync_bp)
+    
     # Temporarily disable other blueprints
     # app.register_blueprint(campaigns_bp)
     # from .routes.email_webhooks import email_webhooks_bp
     # app.register_blueprint(email_webhooks_bp)
-    # from .routes.stats import stats_bp
-    # app.register_blueprint(stats_bp)
     # app.register_blueprint(leads_bp)
     # app.register_blueprint(senders_bp)
     # app.register_blueprint(settings_bp)
@@ -0,0 +1,313 @@
+"""
+Adaptive admission control for the email event webhook.
+
+The controller samples the Celery queue depth and the worker lag (how long
+the batches workers are currently processing waited in the queue) from
+Redis, at most once per sample interval, and maps them to one of three
+states:
+
+- accept: queue events normally
+- spill:  workers are behind; write events to a local spill file in batches
+          and replay them once the queues have drained
+- shed:   answer 429 with Retry-After; providers retry later
+
+Thresholds use a low-water mark so the state does not flap around a limit.
+"""
+import fcntl
+import glob
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+
+from flask_app.redis_client import get_redis
+from flask_app.celery_config import EVENT_QUEUES, broker_transport_options
+
+logger = logging.getLogger(__name__)
+
+ACCEPT = "accept"
+SPILL = "spill"
+SHED = "shed"
+
+# Redis key workers write their current lag to
+WORKER_LAG_KEY = "email_events:worker_lag"
+
+# Marks a spill file claimed by a drain: spill-<name>.claimed-<pid>-<token>
+CLAIM_MARK = ".claimed-"
+
+# Fraction of a threshold a metric must drop below before leaving a state
+LOW_WATER = 0.8
+
+
+def record_worker_lag(enqueued_at):
+    """
+    Publish how long a batch a worker just picked up waited in the queue.
+
+    Called by the batch task with the time enqueue_events queued it. The
+    events' own timestamps are not used: replayed spills, dead letters and
+    replies found by the IMAP sync are old by nature and say nothing about
+    the queue. The key expires so a stopped worker pool does not leave a
+    stale lag behind.
+    """
+    client = get_redis()
+    if client is None or not enqueued_at:
+        return
+    try:
+        ts = datetime.fromisoformat(str(enqueued_at).replace("Z", "+00:00"))
+        if ts.tzinfo is None:
+            ts = ts.replace(tzinfo=timezone.utc)
+        lag = max(0.0, (datetime.now(timezone.utc) - ts).total_seconds())
+        client.set(WORKER_LAG_KEY, lag, ex=120)
+    except Exception as e:
+        logger.warning(f"Could not record worker lag: {str(e)}")
+
+
+def sample_broker():
+    """
+    Read the total depth of the event queues and the last reported worker lag.
+
+    Returns:
+        dict: {depth, lag} or None when Redis is unavailable
+    """
+    client = get_redis()
+    if client is None:
+        return None
+
+    sep = broker_transport_options["sep"]
+    # The Redis transport keeps one list per priority step
+    keys = []
+    for queue in EVENT_QUEUES.values():
+        keys.append(queue)
+        keys.extend(f"{queue}{sep}{step}" for step in broker_transport_options["priority_steps"] if step)
+
+    try:
+        pipe = client.pipeline(transaction=False)
+        for key in keys:
+            pipe.llen(key)
+        pipe.get(WORKER_LAG_KEY)
+        results = pipe.execute()
+    except Exception as e:
+        logger.warning(f"Could not sample broker depth: {str(e)}")
+        return None
+
+    lag = results[-1]
+    return {
+        "depth": sum(results[:-1]),
+        "lag": float(lag) if lag is not None else 0.0,
+    }
+
+
+def _is_current(f, path):
+    """Whether an open file is still the one at path"""
+    try:
+        current = os.stat(path)
+    except FileNotFoundError:
+        return False
+    opened = os.fstat(f.fileno())
+    return (opened.st_dev, opened.st_ino) == (current.st_dev, current.st_ino)
+
+
+def _claimer_alive(path):
+    """Whether the process that claimed a spill file is still running"""
+    try:
+        pid = int(path.rsplit(CLAIM_MARK, 1)[1].split("-")[0])
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    except ValueError:
+        return False
+    return True
+
+
+class SpillStore:
+    """
+    Append-only JSON-lines spill files for events admitted in spill state.
+
+    Every process appends to its own spill-<pid>.jsonl. Writes are batched
+    by the caller (an EventBuffer) and hold an flock on the file. A drain
+    claims each spill file with an atomic rename to a name unique to that
+    drain, so concurrent drains in any process never replay the same file.
+    Files of other workers and of recycled or dead processes are claimed
+    too, as are claims left behind by a drain that died.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._lock = threading.Lock()
+
+    @property
+    def active_path(self):
+        return os.path.join(self.directory, f"spill-{os.getpid()}.jsonl")
+
+    def write_batch(self, events):
+        """Append a batch of events with one write"""
+        os.makedirs(self.directory, exist_ok=True)
+        data = "".join(json.dumps(event) + "\n" for event in events)
+        with self._lock:
+            while True:
+                with open(self.active_path, "a", encoding="utf-8") as f:
+                    fcntl.flock(f, fcntl.LOCK_EX)
+                    if _is_current(f, self.active_path):
+                        f.write(data)
+                        return
+                # A drain claimed the file between open and lock; start a new one
+
+    def pending(self):
+        """Number of spill files waiting to be replayed"""
+        return len(glob.glob(os.path.join(self.directory, "spill-*")))
+
+    def _claimable(self):
+        paths = glob.glob(os.path.join(self.directory, "spill-*.jsonl"))
+        paths += glob.glob(os.path.join(self.directory, "spill-*.draining"))
+        paths += [path for path in glob.glob(os.path.join(self.directory, f"spill-*{CLAIM_MARK}*"))
+                  if not _claimer_alive(path)]
+        return sorted(paths)
+
+    def drain(self, dispatch, batch_size=500):
+        """
+        Claim and replay all spill files through dispatch in batches.
+
+        If dispatch fails, the events not yet dispatched go back to a new
+        spill file for the next drain and the error is raised.
+
+        Returns:
+            int: Number of events replayed
+        """
+        claimer = f"{os.getpid()}-{uuid.uuid4().hex[:12]}"
+        replayed = 0
+        for path in self._claimable():
+            claimed = f"{path.split(CLAIM_MARK)[0]}{CLAIM_MARK}{claimer}"
+            try:
+                os.rename(path, claimed)
+            except FileNotFoundError:
+                # Another drain claimed it first
+                continue
+            replayed += self._replay(claimed, claimer, dispatch, batch_size)
+        return replayed
+
+    def _replay(self, path, claimer, dispatch, batch_size):
+        replayed = 0
+        with open(path, encoding="utf-8") as f:
+            # Waits for a writer that opened the file before it was claimed
+            fcntl.flock(f, fcntl.LOCK_EX)
+            batch = []
+            for line in f:
+                if line.strip():
+                    batch.append(line)
+                if len(batch) >= batch_size:
+                    replayed += self._dispatch(batch, f, path, claimer, dispatch)
+                    batch = []
+            if batch:
+                replayed += self._dispatch(batch, f, path, claimer, dispatch)
+        os.remove(path)
+        return replayed
+
+    def _dispatch(self, lines, f, path, claimer, dispatch):
+        try:
+            dispatch([json.loads(line) for line in lines])
+        except Exception:
+            with open(os.path.join(self.directory, f"spill-requeue-{claimer}.jsonl"), "a", encoding="utf-8") as out:
+                out.writelines(lines)
+                out.write(f.read())
+            os.remove(path)
+            raise
+        return len(lines)
+
+
+class AdmissionController:
+    """Maps sampled broker depth and worker lag to accept, spill or shed"""
+
+    def __init__(self, sampler=sample_broker, spill_depth=50000, shed_depth=200000,
+                 spill_lag=60.0, shed_lag=300.0, sample_interval=1.0, retry_after=30,
+                 spill_store=None, on_recover=None):
+        self.sampler = sampler
+        self.spill_depth = spill_depth
+        self.shed_depth = shed_depth
+        self.spill_lag = spill_lag
+        self.shed_lag = shed_lag
+        self.sample_interval = sample_interval
+        self.retry_after = retry_after
+        self.spill_store = spill_store
+        self.on_recover = on_recover
+        self._state = ACCEPT
+        self._sample = None
+        self._sampled_at = 0.0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, **kwargs):
+        """Build a controller configured from WEBHOOK_* environment variables"""
+        return cls(
+            spill_depth=int(os.getenv("WEBHOOK_SPILL_DEPTH", 50000)),
+            shed_depth=int(os.getenv("WEBHOOK_SHED_DEPTH", 200000)),
+            spill_lag=float(os.getenv("WEBHOOK_SPILL_LAG_SECONDS", 60)),
+            shed_lag=float(os.getenv("WEBHOOK_SHED_LAG_SECONDS", 300)),
+            retry_after=int(os.getenv("WEBHOOK_RETRY_AFTER", 30)),
+            spill_store=SpillStore(os.getenv("WEBHOOK_SPILL_DIR", "/tmp/email-event-spill")),
+            **kwargs
+        )
+
+    def state(self):
+        """Current admission state, resampling at most once per interval"""
+        now = time.monotonic()
+        if now - self._sampled_at < self.sample_interval:
+            return self._state
+
+        with self._lock:
+            if now - self._sampled_at < self.sample_interval:
+                return self._state
+            self._sampled_at = now
+            self._sample = self.sampler()
+            previous, self._state = self._state, self._next_state(self._sample)
+
+        if previous != self._state:
+            logger.warning(f"Webhook admission state changed from {previous} to {self._state}: {self._sample}")
+            if self._state == ACCEPT and self.on_recover is not None:
+                self.on_recover()
+        return self._state
+
+    def _next_state(self, sample):
+        if sample is None:
+            # Fail open: without a broker reading we cannot judge the load
+            return ACCEPT
+
+        depth, lag = sample["depth"], sample["lag"]
+
+        def over(shed_limit, spill_limit, factor):
+            if depth >= shed_limit[0] * factor or lag >= shed_limit[1] * factor:
+                return SHED
+            if depth >= spill_limit[0] * factor or lag >= spill_limit[1] * factor:
+                return SPILL
+            return ACCEPT
+
+        shed = (self.shed_depth, self.shed_lag)
+        spill = (self.spill_depth, self.spill_lag)
+        raw = over(shed, spill, 1.0)
+        # Only step down once the metrics are clearly below the threshold
+        relaxed = over(shed, spill, LOW_WATER)
+        order = [ACCEPT, SPILL, SHED]
+        if order.index(raw) >= order.index(self._state):
+            return raw
+        return min(relaxed, self._state, key=order.index)
+
+    def status(self):
+        """Admission state and the sample it is based on, for monitoring"""
+        state = self.state()
+        return {
+            "state": state,
+            "depth": self._sample["depth"] if self._sample else None,
+            "worker_lag_seconds": self._sample["lag"] if self._sample else None,
+            "thresholds": {
+                "spill_depth": self.spill_depth,
+                "shed_depth": self.shed_depth,
+                "spill_lag_seconds": self.spill_lag,
+                "shed_lag_seconds": self.shed_lag,
+            },
+            "pending_spill_files": self.spill_store.pending() if self.spill_store else 0,
+            "retry_after": self.retry_after,
+        }
@@ -0,0 +1,222 @@
+"""
+Vectorized A/B analytics for step variants.
+
+Per-variant funnel totals are loaded from the rollups into NumPy arrays and
+every statistic is computed for all variants at once: funnel rates, Wilson
+confidence intervals and Bayesian probabilities that each variant is the
+best of its step.
+
+Win probabilities are Monte Carlo estimates over Beta(1 + successes,
+1 + failures) posteriors. Variants of a step are laid out as a padded
+[steps, variants] array so one argmax over the variant axis scores every
+step in the same pass. Posteriors with plenty of data on both sides are
+sampled from their normal approximation, which is several times cheaper
+than Beta sampling and indistinguishable at those counts; the remaining
+posteriors are sampled exactly.
+"""
+import os
+import logging
+from statistics import NormalDist
+import numpy as np
+from flask_app.auth import create_supabase_client
+
+logger = logging.getLogger(__name__)
+
+FUNNEL_COLUMNS = ("sent", "opened", "clicked", "replied")
+METRICS = ("opened", "clicked", "replied")
+POSTERIOR_DRAWS = int(os.getenv("ANALYTICS_POSTERIOR_DRAWS", "2000"))
+# Posteriors with both parameters at or above this use the normal approximation
+NORMAL_APPROX_MIN = 30
+# Bound on the number of posterior samples held in memory at once
+MAX_SAMPLES_PER_BLOCK = 4_000_000
+
+
+def load_variant_totals(owner, campaign_id=None):
+    """
+    Load lifetime funnel totals per variant from the daily rollups.
+
+    Args:
+        owner: The owner's user ID
+        campaign_id: Optional campaign filter
+
+    Returns:
+        list: Rows with campaign_id, step_id, variant_id, variant_idx and FUNNEL_COLUMNS
+    """
+    supabase = create_supabase_client()
+    response = supabase.rpc("email_variant_totals", {
+        "p_owner": owner,
+        "p_campaign_id": campaign_id,
+    }).execute()
+    return response.data or []
+
+
+def _ratio(numerator, denominator):
+    """Elementwise numerator / denominator with 0 where the denominator is 0."""
+    return np.divide(numerator, denominator, out=np.zeros(len(numerator)), where=denominator > 0)
+
+
+def wilson_interval(successes, trials, confidence=0.95):
+    """
+    Wilson score interval for binomial proportions.
+
+    Args:
+        successes: Array of success counts
+        trials: Array of trial counts
+        confidence: Two-sided confidence level
+
+    Returns:
+        tuple: (low, high) arrays; (0, 1) where there are no trials
+    """
+    z = NormalDist().inv_cdf(0.5 + confidence / 2)
+    n = np.maximum(trials, 1).astype(float)
+    p = successes / n
+    denominator = 1 + z * z / n
+    center = (p + z * z / (2 * n)) / denominator
+    half = z * np.sqrt(p * (1 - p) / n + z * z / (4 * n * n)) / denominator
+    empty = trials <= 0
+    low = np.where(empty, 0.0, np.clip(center - half, 0, 1))
+    high = np.where(empty, 1.0, np.clip(center + half, 0, 1))
+    return low, high
+
+
+def group_layout(keys):
+    """
+    Map items to (group, position) slots of a padded [groups, width] array.
+
+    Positions keep the input order within each group.
+
+    Args:
+        keys: Sequence of group keys, one per item
+
+    Returns:
+        tuple: (group index array, position array, number of groups, width)
+    """
+    _, group = np.unique(np.asarray(keys, dtype=object).astype(str), return_inverse=True)
+    group = group.ravel()
+    order = np.argsort(group, kind="stable")
+    sorted_group = group[order]
+    starts = np.flatnonzero(np.r_[True, sorted_group[1:] != sorted_group[:-1]])
+    counts = np.diff(np.r_[starts, len(group)])
+    position = np.empty(len(group), dtype=np.intp)
+    position[order] = np.arange(len(group)) - np.repeat(starts, counts)
+    return group, position, len(starts), int(counts.max())
+
+
+def _win_probabilities(alpha, beta, valid, draws, rng):
+    """Probability that each slot of [groups, width] posteriors is the largest."""
+    groups, width = alpha.shape
+    wins = np.zeros((groups, width))
+    if groups == 0:
+        return wins
+
+    total = alpha + beta
+    mean = (alpha / total).astype(np.float32)
+    std = np.sqrt(alpha * beta / (total * total * (total + 1))).astype(np.float32)
+    exact = valid & ((alpha < NORMAL_APPROX_MIN) | (beta < NORMAL_APPROX_MIN))
+    block = max(1, MAX_SAMPLES_PER_BLOCK // (width * draws))
+
+    for start in range(0, groups, block):
+        rows = slice(start, min(start + block, groups))
+        count = rows.stop - rows.start
+        samples = rng.standard_normal((count, width, draws), dtype=np.float32)
+        samples *= std[rows, :, None]
+        samples += mean[rows, :, None]
+        small = exact[rows]
+        if small.any():
+            samples[small] = rng.beta(alpha[rows][small, None], beta[rows][small, None], size=(int(small.sum()), draws))
+        samples[~valid[rows]] = -np.inf
+        # Count wins per (group, slot) with one bincount over flattened indices
+        winners = samples.argmax(axis=1) + width * np.arange(count)[:, None]
+        wins[rows] = np.bincount(winners.ravel(), minlength=count * width).reshape(count, width) / draws
+    return wins
+
+
+def compute_variant_stats(rows, metric="replied", confidence=0.95, draws=POSTERIOR_DRAWS, seed=None):
+    """
+    Compute funnels, intervals and win probabilities for every variant.
+
+    Variants compete within their step; the first variant of each step
+    (lowest variant_idx) is the control for lift.
+
+    Args:
+        rows: Variant totals as returned by load_variant_totals
+        metric: Funnel stage the comparison is made on (opened, clicked or replied)
+        confidence: Confidence level of the interval on the metric rate
+        draws: Posterior samples per variant
+        seed: Optional RNG seed for reproducible estimates
+
+    Returns:
+        dict: Column name -> NumPy array, one element per input row
+    """
+    if metric not in METRICS:
+        raise ValueError(f"Unsupported metric: {metric}")
+    if not 0 < confidence < 1:
+        raise ValueError("Confidence must be between 0 and 1")
+
+    counts = {
+        column: np.array([row.get(column) or 0 for row in rows], dtype=np.int64)
+        for column in FUNNEL_COLUMNS
+    }
+    sent = counts["sent"]
+    successes = np.minimum(counts[metric], sent)
+
+    stats = dict(counts)
+    stats["open_rate"] = _ratio(counts["opened"], sent)
+    stats["click_rate"] = _ratio(counts["clicked"], sent)
+    stats["reply_rate"] = _ratio(counts["replied"], sent)
+    stats["click_to_open_rate"] = _ratio(counts["clicked"], counts["opened"])
+    stats["reply_to_click_rate"] = _ratio(counts["replied"], counts["clicked"])
+    stats["ci_low"], stats["ci_high"] = wilson_interval(successes, sent, confidence)
+
+    if not rows:
+        stats["prob_best"] = np.zeros(0)
+        stats["lift"] = np.zeros(0)
+        return stats
+
+    group, position, groups, width = group_layout([row.get("step_id") for row in rows])
+    alpha = np.ones((groups, width))
+    beta = np.ones((groups, width))
+    valid = np.zeros((groups, width), dtype=bool)
+    alpha[group, position] += successes
+    beta[group, position] += sent - successes
+    valid[group, position] = True
+
+    wins = _win_probabilities(alpha, beta, valid, draws, np.random.default_rng(seed))
+    stats["prob_best"] = wins[group, position]
+
+    rate = _ratio(successes, sent)
+    control = np.zeros((groups, width))
+    control[group, position] = rate
+    control_rate = control[group, 0]
+    stats["lift"] = _ratio(rate - control_rate, control_rate)
+    return stats
+
+
+def variant_report(owner, campaign_id=None, metric="replied", confidence=0.95):
+    """
+    Build the per-variant report served by /stats/variants.
+
+    Args:
+        owner: The owner's user ID
+        campaign_id: Optional campaign filter
+        metric: Funnel stage the comparison is made on
+        confidence: Confidence level of the intervals
+
+    Returns:
+        list: One dict per variant with its identifiers and statistics
+    """
+    rows = load_variant_totals(owner, campaign_id)
+    stats = compute_variant_stats(rows, metric=metric, confidence=confidence)
+    columns = {name: values.tolist() for name, values in stats.items()}
+
+    report = []
+    for i, row in enumerate(rows):
+        item = {
+            "campaign_id": row.get("campaign_id"),
+            "step_id": row.get("step_id"),
+            "variant_id": row.get("variant_id"),
+            "variant_idx": row.get("variant_idx"),
+        }
+        item.update({name: values[i] for name, values in columns.items()})
+        report.append(item)
+    return report
@@ -11,6 +11,12 @@ from flask_app.routes.email_servers import email_servers_bp
 from flask_app.routes.email_webhooks import email_webhooks_bp
 from flask_app.routes.stats import stats_bp
 from flask_app.routes.templates import templates_bp
+from flask_app.routes.tracking import tracking_bp
+from flask_app.routes.live import live_bp
+from flask_app.routes.sync import sync_bp
+from flask_app.routes.inbox import inbox_bp
+
+from flask_app import tracking
 
 import os
 
@@ -19,6 +25,13 @@ app.config.from_mapping(
     ENV=os.environ.get("FLASK_ENV", "production"),
     DEBUG=os.environ.get("FLASK_DEBUG", "0") == "1",
 )
+
+# Tracking links cannot be signed or verified without a secret; refuse to
+# start in production instead of failing every send and click
+if not tracking.is_configured():
+    if os.environ.get('FLASK_ENV') != 'development':
+        raise RuntimeError("TRACKING_SECRET (or SECRET_KEY) must be set")
+    app.logger.warning("TRACKING_SECRET is not set; tracking links will not work")
 # Configure CORS for production deployment
 # More permissive for debugging - can be restricted later
 if os.environ.get('FLASK_ENV') == 'development':
@@ -45,6 +58,10 @@ app.register_blueprint(email_servers_bp)
 app.register_blueprint(email_webhooks_bp)
 app.register_blueprint(stats_bp)
 app.register_blueprint(templates_bp)
+app.register_blueprint(tracking_bp)
+app.register_blueprint(live_bp)
+app.register_blueprint(sync_bp)
+app.register_blueprint(inbox_bp)
 
 # Health check and debug endpoints
 @app.route('/health')
@@ -0,0 +1,94 @@
+"""
+Partition maintenance and archival of old email_log rows.
+
+email_log is partitioned by month. maintain_partitions() pre-creates the
+coming months (of email_log and email_events) and moves every month that
+ended more than EMAIL_LOG_RETENTION_DAYS ago into email_log_archive by
+detaching its partition. Sends that landed in the default partition are
+moved row by row in batches by archive_email_log().
+
+Dashboard counters, rollups and campaign metrics keep counting archived
+sends; only late events for an archived email (an open months after the
+send) are no longer recorded.
+"""
+import os
+import logging
+from datetime import datetime, timedelta, timezone
+from flask_app.auth import create_supabase_client
+
+logger = logging.getLogger(__name__)
+
+RETENTION_DAYS = int(os.getenv("EMAIL_LOG_RETENTION_DAYS", "90"))
+ARCHIVE_BATCH_SIZE = int(os.getenv("EMAIL_LOG_ARCHIVE_BATCH_SIZE", "5000"))
+# Bound on one run; the next scheduled run continues the backlog
+MAX_BATCHES = int(os.getenv("EMAIL_LOG_ARCHIVE_MAX_BATCHES", "200"))
+PARTITION_MONTHS_AHEAD = int(os.getenv("EMAIL_LOG_PARTITION_MONTHS_AHEAD", "3"))
+
+
+def maintain_partitions(retention_days=RETENTION_DAYS, months_ahead=PARTITION_MONTHS_AHEAD):
+    """
+    Pre-create upcoming monthly partitions and archive expired months.
+
+    A month is archived once all of it is older than the retention window.
+
+    Args:
+        retention_days: Months that ended at least this long ago are archived
+        months_ahead: Months after the current one that must exist
+
+    Returns:
+        dict: {"partitions": email_log partitions ensured, "archived": archive partitions written}
+    """
+    cutoff = datetime.now(timezone.utc) - timedelta(days=retention_days)
+    supabase = create_supabase_client()
+
+    ensured = supabase.rpc("ensure_email_log_partitions", {"p_months_ahead": months_ahead}).execute()
+    supabase.rpc("ensure_email_events_partitions", {"p_months_ahead": months_ahead}).execute()
+    response = supabase.rpc("archive_email_log_partitions", {"p_before": cutoff.isoformat()}).execute()
+
+    archived = response.data or []
+    for name in archived:
+        logger.info(f"Archived email_log partition into {name}")
+    return {"partitions": len(ensured.data or []), "archived": archived}
+
+
+def archive_email_log(retention_days=RETENTION_DAYS, batch_size=ARCHIVE_BATCH_SIZE, max_batches=MAX_BATCHES):
+    """
+    Move sends older than the retention window into the archive.
+
+    Args:
+        retention_days: Sends at least this old are archived
+        batch_size: Rows moved per transaction
+        max_batches: Maximum number of batches in this run
+
+    Returns:
+        int: Number of rows archived
+    """
+    cutoff = datetime.now(timezone.utc) - timedelta(days=retention_days)
+    supabase = create_supabase_client()
+
+    archived = 0
+    for _ in range(max_batches):
+        response = supabase.rpc("archive_email_log", {
+            "p_before": cutoff.isoformat(),
+            "p_batch": batch_size,
+        }).execute()
+        moved = response.data or 0
+        archived += moved
+        if moved < batch_size:
+            break
+    else:
+        logger.info(f"Archive backlog remains after {max_batches} batches")
+
+    logger.info(f"Archived {archived} email_log rows sent before {cutoff.isoformat()}")
+    return archived
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    result = maintain_partitions()
+    count = archive_email_log()
+    print(f"\nArchival summary:")
+    print(f"-----------------")
+    print(f"Retention: {RETENTION_DAYS} days")
+    print(f"Archived partitions: {', '.join(result['archived']) or 'none'}")
+    print(f"Archived rows: {count}")
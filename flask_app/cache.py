@@ -0,0 +1,211 @@
+"""
+Per-owner response cache for read endpoints.
+
+Responses are cached per process, keyed by owner and request path
+(including the query string), and expire after STATS_CACHE_TTL seconds.
+Each owner has a generation counter that is part of the key: writes to the
+owner's data bump it, so every cached response for that owner is bypassed
+at once. Generations live in Redis when it is configured so invalidations
+from Celery workers and other web workers are seen everywhere; without
+Redis they are process-local.
+
+Concurrent identical requests are coalesced (single-flight): the first one
+computes the response and the others wait for its result.
+"""
+import os
+import logging
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from flask import current_app, g, request, Response
+from flask_app.redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+CACHE_TTL = float(os.getenv("STATS_CACHE_TTL", "30"))
+CACHE_MAX_ENTRIES = int(os.getenv("STATS_CACHE_MAX_ENTRIES", "1024"))
+GENERATION_KEY = "cache:gen:{owner}"
+# Generation keys outlive any cached entry by far
+GENERATION_KEY_TTL = 86400
+
+
+class _Flight:
+    """A computation in progress that other requests can wait on"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class ResponseCache:
+    """TTL + LRU cache with owner generations and single-flight computation"""
+
+    def __init__(self, ttl=CACHE_TTL, max_entries=CACHE_MAX_ENTRIES, redis_getter=get_redis):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._redis_getter = redis_getter
+        self._entries = OrderedDict()
+        self._flights = {}
+        self._local_generations = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.invalidations = 0
+
+    def generation(self, owner):
+        """Current generation of an owner's cached data"""
+        local = self._local_generations.get(owner, 0)
+        client = self._redis_getter()
+        if client is None:
+            return local
+        try:
+            return f"{local}.{int(client.get(GENERATION_KEY.format(owner=owner)) or 0)}"
+        except Exception as e:
+            # Without the shared generation we cannot trust cached entries
+            logger.debug(f"Cache generation unavailable for {owner}: {e}")
+            return None
+
+    def invalidate(self, owners):
+        """
+        Invalidate every cached response of the given owners.
+
+        Args:
+            owners: Iterable of owner IDs
+        """
+        owners = {owner for owner in owners if owner}
+        if not owners:
+            return
+        with self._lock:
+            for owner in owners:
+                self._local_generations[owner] = self._local_generations.get(owner, 0) + 1
+            self.invalidations += len(owners)
+
+        client = self._redis_getter()
+        if client is None:
+            return
+        try:
+            pipe = client.pipeline(transaction=False)
+            for owner in owners:
+                key = GENERATION_KEY.format(owner=owner)
+                pipe.incr(key)
+                pipe.expire(key, GENERATION_KEY_TTL)
+            pipe.execute()
+        except Exception as e:
+            logger.warning(f"Failed to publish cache invalidation for {len(owners)} owner(s): {e}")
+
+    def get_or_compute(self, owner, key, compute):
+        """
+        Return the cached value for (owner, key) or compute it once.
+
+        Args:
+            owner: Owner the value belongs to
+            key: Request-specific part of the cache key
+            compute: Callable returning (value, cacheable)
+
+        Returns:
+            tuple: (value, hit) where hit is True when no computation was done
+        """
+        generation = self.generation(owner)
+        if generation is None:
+            value, _ = compute()
+            return value, False
+
+        full_key = (owner, generation, key)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(full_key)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(full_key)
+                self.hits += 1
+                return entry[1], True
+
+            flight = self._flights.get(full_key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[full_key] = _Flight()
+                self.misses += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value, True
+
+        try:
+            value, cacheable = compute()
+            flight.value = value
+            if cacheable:
+                with self._lock:
+                    self._entries[full_key] = (time.monotonic() + self.ttl, value)
+                    self._entries.move_to_end(full_key)
+                    while len(self._entries) > self.max_entries:
+                        self._entries.popitem(last=False)
+            return value, False
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                self._flights.pop(full_key, None)
+            flight.done.set()
+
+    def clear(self):
+        """Drop all cached entries and reset the counters"""
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = self.coalesced = self.invalidations = 0
+
+    def stats(self):
+        """Hit/miss counters and hit rate of this process's cache"""
+        served = self.hits + self.misses + self.coalesced
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "invalidations": self.invalidations,
+            "hit_rate": round((self.hits + self.coalesced) / served, 4) if served else 0.0,
+            "ttl": self.ttl,
+        }
+
+
+response_cache = ResponseCache()
+
+
+def invalidate_owners(owners):
+    """Invalidate cached responses of the given owners"""
+    response_cache.invalidate(owners)
+
+
+def cached_response(view):
+    """
+    Cache a read endpoint's successful responses per owner and request path.
+
+    Must be applied inside @require_user so g.user_id is set.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        def compute():
+            response = current_app.make_response(view(*args, **kwargs))
+            cached = (response.get_data(), response.status_code, response.mimetype)
+            return cached, response.status_code == 200
+
+        (body, status, mimetype), hit = response_cache.get_or_compute(g.user_id, request.full_path, compute)
+        response = Response(body, status=status, mimetype=mimetype)
+        response.headers["X-Cache"] = "HIT" if hit else "MISS"
+        return response
+    return wrapper
+
+
+def invalidate_after_write(response):
+    """after_request hook: successful writes invalidate the owner's cached reads"""
+    if request.method not in ("GET", "HEAD", "OPTIONS") and response.status_code < 400:
+        owner = getattr(g, "user_id", None)
+        if owner:
+            invalidate_owners([owner])
+    return response
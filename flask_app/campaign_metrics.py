@@ -0,0 +1,57 @@
+"""
+Denormalized per-campaign metrics for the campaign list.
+
+Database triggers mark a campaign dirty when its emails are sent or change
+status; refresh() recomputes the dirty campaigns in bulk. The Celery beat
+schedule runs it every CAMPAIGN_METRICS_MAX_STALENESS seconds, so the
+metrics shown next to a campaign are never older than that. Cached
+responses of the owners whose campaigns were refreshed are invalidated.
+"""
+import os
+import logging
+from flask_app.auth import create_supabase_client
+from flask_app.cache import invalidate_owners
+
+logger = logging.getLogger(__name__)
+
+MAX_STALENESS = float(os.getenv("CAMPAIGN_METRICS_MAX_STALENESS", "30"))
+REFRESH_BATCH_SIZE = int(os.getenv("CAMPAIGN_METRICS_REFRESH_BATCH_SIZE", "500"))
+# Bound on one refresh run so a backlog cannot hold a worker indefinitely
+MAX_BATCHES = 20
+
+# Columns embedded in each campaign of the list
+METRIC_COLUMNS = (
+    "leads", "sent", "bounced", "opened", "clicked", "replied",
+    "open_rate", "click_rate", "reply_rate", "last_sent_at", "dirty_since", "refreshed_at",
+)
+EMBED = f"metrics:campaign_metrics({','.join(METRIC_COLUMNS)})"
+
+
+def refresh(batch_size=REFRESH_BATCH_SIZE, max_batches=MAX_BATCHES):
+    """
+    Recompute the metrics of dirty campaigns.
+
+    Args:
+        batch_size: Campaigns recomputed per database call
+        max_batches: Maximum number of calls in this run
+
+    Returns:
+        int: Number of campaigns refreshed
+    """
+    supabase = create_supabase_client()
+    refreshed = 0
+    for _ in range(max_batches):
+        response = supabase.rpc("refresh_campaign_metrics", {"p_limit": batch_size}).execute()
+        rows = response.data or []
+        # Cached campaign lists of these owners still embed the old metrics
+        invalidate_owners(row["owner"] for row in rows)
+        count = sum(row["campaigns"] for row in rows)
+        refreshed += count
+        if count < batch_size:
+            break
+    else:
+        logger.warning(f"Campaign metrics backlog remains after refreshing {refreshed} campaigns")
+
+    if refreshed:
+        logger.info(f"Refreshed metrics of {refreshed} campaign(s)")
+    return refreshed
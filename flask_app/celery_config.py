@@ -0,0 +1,150 @@
+"""
+Celery configuration for the email event workers.
+
+Loaded by flask_app.celery_tasks through config_from_object. Every event type
+gets its own queue so replies, which users act on, never wait behind a flood
+of opens. Workers list the queues in priority order and, with the
+"priority" queue order strategy, always drain events.reply first:
+
+    celery -A flask_app.celery_tasks worker -Q events.reply,events.click,events.open
+
+For the lowest reply latency run a dedicated reply worker as well:
+
+    celery -A flask_app.celery_tasks worker -Q events.reply
+
+Periodic jobs (dead-letter replay, reconciles, rollups, scoring, archival,
+reply matching) are queued by a single beat process on the maintenance
+queue, which needs its own worker so they never wait behind events:
+
+    celery -A flask_app.celery_tasks beat
+    celery -A flask_app.celery_tasks worker -Q maintenance,default
+"""
+import os
+from kombu import Queue
+
+# Queue names per event type
+REPLY_QUEUE = "events.reply"
+CLICK_QUEUE = "events.click"
+OPEN_QUEUE = "events.open"
+DEFAULT_QUEUE = "default"
+MAINTENANCE_QUEUE = "maintenance"
+
+EVENT_QUEUES = {
+    "reply": REPLY_QUEUE,
+    "click": CLICK_QUEUE,
+    "open": OPEN_QUEUE,
+}
+
+# Message priority per event type. The Redis transport treats 0 as the
+# highest priority.
+EVENT_PRIORITIES = {
+    "reply": 0,
+    "click": 3,
+    "open": 6,
+}
+
+# Maximum number of events carried by one batch task
+EVENT_BATCH_SIZE = int(os.getenv("CELERY_EVENT_BATCH_SIZE", 500))
+
+# Retries (with exponential backoff) before a batch is dead-lettered
+BATCH_MAX_RETRIES = int(os.getenv("CELERY_BATCH_MAX_RETRIES", 5))
+
+# Broker
+broker_url = os.getenv("CELERY_BROKER_URL", os.getenv("REDIS_URL", "redis://localhost:6379/0"))
+broker_transport_options = {
+    "priority_steps": list(range(10)),
+    "sep": ":",
+    "queue_order_strategy": "priority",
+    "visibility_timeout": 3600,
+}
+broker_connection_retry_on_startup = True
+
+# Event tasks are fire-and-forget: no result backend round trips
+result_backend = os.getenv("CELERY_RESULT_BACKEND")
+task_ignore_result = True
+task_store_errors_even_if_ignored = False
+
+# Serialization
+task_serializer = "json"
+result_serializer = "json"
+accept_content = ["json"]
+
+# Queues and routing
+task_queues = (
+    Queue(REPLY_QUEUE, queue_arguments={"x-max-priority": 10}),
+    Queue(CLICK_QUEUE, queue_arguments={"x-max-priority": 10}),
+    Queue(OPEN_QUEUE, queue_arguments={"x-max-priority": 10}),
+    Queue(DEFAULT_QUEUE),
+)
+task_default_queue = DEFAULT_QUEUE
+task_default_priority = 5
+task_routes = {
+    "flask_app.celery_tasks.process_email_reply_event": {"queue": REPLY_QUEUE, "priority": EVENT_PRIORITIES["reply"]},
+    "flask_app.celery_tasks.process_email_click_event": {"queue": CLICK_QUEUE, "priority": EVENT_PRIORITIES["click"]},
+    "flask_app.celery_tasks.process_email_open_event": {"queue": OPEN_QUEUE, "priority": EVENT_PRIORITIES["open"]},
+}
+
+# Worker tuning. Batch tasks already carry many events per message, so each
+# worker process reserves one message at a time and queued replies never
+# sit in another worker's prefetch buffer.
+worker_prefetch_multiplier = int(os.getenv("CELERY_PREFETCH_MULTIPLIER", 1))
+task_acks_late = True
+task_reject_on_worker_lost = True
+worker_max_tasks_per_child = int(os.getenv("CELERY_MAX_TASKS_PER_CHILD", 10000))
+worker_disable_rate_limits = True
+
+# Periodic jobs (celery -A flask_app.celery_tasks beat)
+beat_schedule = {
+    "replay-email-event-dead-letters": {
+        "task": "flask_app.celery_tasks.replay_email_event_dead_letters",
+        "schedule": float(os.getenv("DEAD_LETTER_REPLAY_INTERVAL", 60)),
+    },
+    "reconcile-owner-stats": {
+        "task": "flask_app.celery_tasks.reconcile_owner_stats",
+        "schedule": float(os.getenv("STATS_RECONCILE_INTERVAL", 3600)),
+    },
+    "prune-hourly-rollups": {
+        "task": "flask_app.celery_tasks.prune_hourly_rollups",
+        "schedule": float(os.getenv("ROLLUP_PRUNE_INTERVAL", 86400)),
+    },
+    "reconcile-email-rollups": {
+        "task": "flask_app.celery_tasks.reconcile_email_rollups",
+        "schedule": float(os.getenv("ROLLUP_RECONCILE_INTERVAL", 3600)),
+    },
+    # The refresh interval is the staleness bound of the campaign list metrics
+    "refresh-campaign-metrics": {
+        "task": "flask_app.celery_tasks.refresh_campaign_metrics",
+        "schedule": float(os.getenv("CAMPAIGN_METRICS_MAX_STALENESS", 30)),
+        "options": {"expires": float(os.getenv("CAMPAIGN_METRICS_MAX_STALENESS", 30))},
+    },
+    "score-all-leads": {
+        "task": "flask_app.celery_tasks.score_all_leads",
+        "schedule": float(os.getenv("LEAD_SCORE_INTERVAL", 3600)),
+    },
+    "archive-email-log": {
+        "task": "flask_app.celery_tasks.archive_email_log",
+        "schedule": float(os.getenv("EMAIL_LOG_ARCHIVE_INTERVAL", 3600)),
+    },
+    "maintain-email-log-partitions": {
+        "task": "flask_app.celery_tasks.maintain_email_log_partitions",
+        "schedule": float(os.getenv("EMAIL_LOG_PARTITION_INTERVAL", 86400)),
+    },
+    "prune-sync-tombstones": {
+        "task": "flask_app.celery_tasks.prune_sync_tombstones",
+        "schedule": float(os.getenv("SYNC_TOMBSTONE_PRUNE_INTERVAL", 86400)),
+    },
+    # The interval bounds how long a reply can go unnoticed by the sequence scheduler
+    "match-inbox-replies": {
+        "task": "flask_app.celery_tasks.match_inbox_replies",
+        "schedule": float(os.getenv("REPLY_MATCH_INTERVAL", 15)),
+        "options": {"expires": float(os.getenv("REPLY_MATCH_INTERVAL", 15))},
+    },
+    "reconcile-inbox-counters": {
+        "task": "flask_app.celery_tasks.reconcile_inbox_counters",
+        "schedule": float(os.getenv("INBOX_COUNTERS_RECONCILE_INTERVAL", 3600)),
+    },
+}
+
+# Periodic jobs and the per-owner rescoring run on the maintenance worker
+task_routes.update({entry["task"]: {"queue": MAINTENANCE_QUEUE} for entry in beat_schedule.values()})
+task_routes["flask_app.celery_tasks.score_owner_leads"] = {"queue": MAINTENANCE_QUEUE}
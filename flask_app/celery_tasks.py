@@ -2,24 +2,30 @@
 Celery tasks for processing email events and notifications.
 
 This module contains Celery tasks for handling email events such as
-opens, clicks, and replies asynchronously.
+opens, clicks, and replies asynchronously. Queues, priorities and worker
+tuning live in flask_app.celery_config.
 """
 import logging
+from datetime import datetime, timezone
 from celery import Celery
-from flask_app.email_events import handle_open_event, handle_click_event, handle_reply_event
-from flask_app.auth import create_supabase_client
+from flask_app.email_events import handle_open_event, handle_click_event, handle_reply_event, record_events
+from flask_app.celery_config import EVENT_QUEUES, EVENT_PRIORITIES, EVENT_BATCH_SIZE, BATCH_MAX_RETRIES
+from flask_app.admission import record_worker_lag
+from flask_app.dead_letters import store_dead_letters, replay_dead_letters
+from flask_app import stats_engine, rollups, campaign_metrics, lead_scoring, archival, sync, reply_matching, inbox
 
 # Configure Celery
 celery_app = Celery('email_tasks')
+celery_app.config_from_object('flask_app.celery_config')
 
 # Configure logging
 logger = logging.getLogger(__name__)
 
-@celery_app.task
+@celery_app.task(ignore_result=True)
 def process_email_open_event(email_id, timestamp=None, metadata=None):
     """
     Process an email open event asynchronously.
-    
+
     Args:
         email_id: The ID of the email that was opened
         timestamp: When the email was opened (optional)
@@ -28,11 +34,11 @@ def process_email_open_event(email_id, timestamp=None, metadata=None):
     logger.info(f"Processing open event for email {email_id}")
     return handle_open_event(email_id, timestamp, metadata)
 
-@celery_app.task
+@celery_app.task(ignore_result=True)
 def process_email_click_event(email_id, link_url=None, timestamp=None, metadata=None):
     """
     Process an email click event asynchronously.
-    
+
     Args:
         email_id: The ID of the email that was clicked
         link_url: The URL that was clicked (optional)
@@ -42,11 +48,11 @@ def process_email_click_event(email_id, link_url=None, timestamp=None, metadata=
     logger.info(f"Processing click event for email {email_id}")
     return handle_click_event(email_id, link_url, timestamp, metadata)
 
-@celery_app.task
+@celery_app.task(ignore_result=True)
 def process_email_reply_event(email_id, reply_content=None, timestamp=None, metadata=None):
     """
     Process an email reply event asynchronously.
-    
+
     Args:
         email_id: The ID of the email that was replied to
         reply_content: The content of the reply (optional)
@@ -55,3 +61,120 @@ def process_email_reply_event(email_id, reply_content=None, timestamp=None, meta
     """
     logger.info(f"Processing reply event for email {email_id}")
     return handle_reply_event(email_id, reply_content, timestamp, metadata)
+
+@celery_app.task(bind=True, ignore_result=True, max_retries=BATCH_MAX_RETRIES)
+def process_email_events_batch(self, events, enqueued_at=None):
+    """
+    Process a batch of events of one type with a single database call.
+
+    Failed batches are retried with exponential backoff (2s, 4s, 8s, ...);
+    after the last retry the events go to the dead-letter store.
+
+    Args:
+        events: List of event dicts as built by email_events.build_event
+        enqueued_at: ISO time enqueue_events queued the batch
+    """
+    logger.info(f"Processing batch of {len(events)} email events")
+    if events and not self.request.retries:
+        # Lets the webhook's admission control see how far behind we are
+        record_worker_lag(enqueued_at)
+    try:
+        record_events(events)
+    except Exception as e:
+        if self.request.retries >= self.max_retries:
+            logger.error(f"Giving up on batch of {len(events)} events after {self.request.retries + 1} attempts: {str(e)}")
+            store_dead_letters(events, e, attempts=self.request.retries + 1)
+            return
+        raise self.retry(exc=e, countdown=2 ** (self.request.retries + 1))
+
+@celery_app.task(ignore_result=True)
+def replay_email_event_dead_letters():
+    """Periodically replay dead letters whose next attempt is due"""
+    return replay_dead_letters()
+
+@celery_app.task(ignore_result=True)
+def reconcile_owner_stats():
+    """Periodically recompute the dashboard counters to fix drift"""
+    return stats_engine.reconcile()
+
+@celery_app.task(ignore_result=True)
+def prune_hourly_rollups():
+    """Drop hourly rollups past their retention; daily rollups keep the history"""
+    return rollups.prune_hourly()
+
+@celery_app.task(ignore_result=True)
+def reconcile_email_rollups():
+    """Periodically recompute recent rollup buckets to fix drift"""
+    return rollups.reconcile()
+
+@celery_app.task(ignore_result=True)
+def refresh_campaign_metrics():
+    """Recompute the metrics of campaigns whose emails changed"""
+    return campaign_metrics.refresh()
+
+@celery_app.task(ignore_result=True)
+def score_all_leads():
+    """Periodically rescore every owner's leads as engagement ages"""
+    return lead_scoring.score_all()
+
+@celery_app.task(ignore_result=True)
+def score_owner_leads(owner):
+    """Rescore one owner's leads"""
+    return lead_scoring.score_owner(owner)
+
+@celery_app.task(ignore_result=True)
+def archive_email_log():
+    """Move sends past the retention window into the archive"""
+    return archival.archive_email_log()
+
+@celery_app.task(ignore_result=True)
+def maintain_email_log_partitions():
+    """Pre-create upcoming partitions and archive expired months"""
+    return archival.maintain_partitions()
+
+@celery_app.task(ignore_result=True)
+def prune_sync_tombstones():
+    """Drop delete tombstones older than any cursor the sync API accepts"""
+    return sync.prune_tombstones()
+
+@celery_app.task(ignore_result=True)
+def match_inbox_replies():
+    """Turn synced inbox emails that answer a send into reply events"""
+    return reply_matching.match_replies()
+
+@celery_app.task(ignore_result=True)
+def reconcile_inbox_counters():
+    """Periodically recompute the inbox counters and thread summaries to fix drift"""
+    return inbox.reconcile_counters()
+
+def enqueue_events(events, batch_size=EVENT_BATCH_SIZE):
+    """
+    Queue events as chunked batch tasks, routed by event type.
+
+    Events are grouped per type so each chunk lands on the queue (and with
+    the priority) of its type: a burst of opens never delays replies.
+
+    Args:
+        events: List of event dicts as built by email_events.build_event
+        batch_size: Maximum number of events per task
+
+    Returns:
+        int: Number of batch tasks queued
+    """
+    by_type = {}
+    for event in events:
+        by_type.setdefault(event["event_type"], []).append(event)
+
+    # Worker lag is measured from here, not from the events' own timestamps
+    enqueued_at = datetime.now(timezone.utc).isoformat()
+    queued = 0
+    for event_type, typed_events in by_type.items():
+        for start in range(0, len(typed_events), batch_size):
+            process_email_events_batch.apply_async(
+                args=[typed_events[start:start + batch_size]],
+                kwargs={"enqueued_at": enqueued_at},
+                queue=EVENT_QUEUES[event_type],
+                priority=EVENT_PRIORITIES[event_type],
+            )
+            queued += 1
+    return queued
@@ -0,0 +1,195 @@
+"""
+Dead-letter store and bulk replay for email events that failed to record.
+
+Failed events are written to the email_event_dead_letters table together with
+the error and attempt count. When the database itself is down, they are
+appended to a local spill file instead and moved to the table on the next
+replay, so a burst of events survives an outage.
+
+Replay reprocesses due dead letters in bulk batches through record_events
+(one database call per batch). A batch rejected for the data of a row is
+bisected so a single bad event cannot block the rest. Any other failure
+(connection errors, database or gateway errors) stops the run and leaves
+the remaining dead letters due for the next one.
+
+Usage:
+    python -m flask_app.dead_letters
+"""
+import logging
+import os
+from datetime import datetime, timezone
+
+from flask_app.auth import create_supabase_client
+from flask_app.admission import SpillStore
+
+logger = logging.getLogger(__name__)
+
+# Events per replay batch
+REPLAY_BATCH_SIZE = int(os.getenv("DEAD_LETTER_BATCH_SIZE", 1000))
+
+# Attempts before a dead letter is parked for manual inspection
+MAX_ATTEMPTS = int(os.getenv("DEAD_LETTER_MAX_ATTEMPTS", 10))
+
+# SQLSTATE classes of errors caused by a row's data: data exceptions and
+# integrity constraint violations
+ROW_ERROR_CLASSES = ("22", "23")
+
+# Local fallback when the dead-letter table cannot be written
+spill_store = SpillStore(os.getenv("DEAD_LETTER_SPILL_DIR", "/tmp/email-event-dead-letters"))
+
+
+def store_dead_letters(events, error, attempts=1):
+    """
+    Persist failed events with the error that made them fail.
+
+    Never raises: if the table cannot be written the events go to the local
+    spill file.
+
+    Args:
+        events: List of event dicts as built by email_events.build_event
+        error: Error message or exception
+        attempts: Number of attempts already made
+
+    Returns:
+        int: Number of events stored
+    """
+    if not events:
+        return 0
+
+    rows = [{"event": event, "error": str(error), "attempts": attempts} for event in events]
+    try:
+        supabase = create_supabase_client()
+        supabase.table("email_event_dead_letters").insert(rows).execute()
+        logger.warning(f"Stored {len(events)} events in the dead-letter table: {error}")
+    except Exception as e:
+        logger.error(f"Dead-letter table unavailable ({str(e)}), spilling {len(events)} events to disk")
+        spill_store.write_batch(rows)
+    return len(events)
+
+
+def _import_spilled(supabase):
+    """Move locally spilled dead letters into the table"""
+    def insert(rows):
+        supabase.table("email_event_dead_letters").insert(rows).execute()
+    try:
+        return spill_store.drain(insert, batch_size=REPLAY_BATCH_SIZE)
+    except Exception as e:
+        # The rows not inserted went back to a spill file
+        logger.error(f"Importing spilled dead letters failed, will retry: {str(e)}")
+        return 0
+
+
+def _is_row_error(error):
+    """Whether the database rejected the data of a row rather than the call failing"""
+    code = getattr(error, "code", None)
+    return isinstance(code, str) and code[:2] in ROW_ERROR_CLASSES
+
+
+def _defer(supabase, row, error):
+    """Back off a dead letter whose event keeps failing; False if that failed too"""
+    try:
+        supabase.rpc("defer_email_event_dead_letters", {
+            "p_ids": [row["id"]],
+            "p_error": str(error),
+            "p_max_attempts": MAX_ATTEMPTS
+        }).execute()
+        return True
+    except Exception as e:
+        logger.error(f"Could not defer dead letter {row['id']}, it stays due: {str(e)}")
+        return False
+
+
+def _replay_batch(supabase, rows, record, replayed, deferred):
+    """
+    Replay a batch, bisecting on row errors.
+
+    Appends the ids replayed and deferred so far to the given lists.
+
+    Raises:
+        Exception: If the call failed for a reason other than a row's data
+    """
+    try:
+        record([row["event"] for row in rows])
+        replayed.extend(row["id"] for row in rows)
+        return
+    except Exception as e:
+        if not _is_row_error(e):
+            raise
+        if len(rows) == 1:
+            if _defer(supabase, rows[0], e):
+                deferred.append(rows[0]["id"])
+            return
+
+    middle = len(rows) // 2
+    _replay_batch(supabase, rows[:middle], record, replayed, deferred)
+    _replay_batch(supabase, rows[middle:], record, replayed, deferred)
+
+
+def replay_dead_letters(batch_size=REPLAY_BATCH_SIZE, max_batches=None):
+    """
+    Reprocess all due dead letters in bulk batches.
+
+    Args:
+        batch_size: Dead letters per batch
+        max_batches: Stop after this many batches (None for all)
+
+    Returns:
+        dict: Counts of imported, replayed and deferred dead letters
+    """
+    from flask_app.email_events import record_events
+
+    supabase = create_supabase_client()
+    imported = _import_spilled(supabase)
+    now = datetime.now(timezone.utc).isoformat()
+
+    replayed = deferred = batches = 0
+    last_id = 0
+    while max_batches is None or batches < max_batches:
+        response = supabase.table("email_event_dead_letters") \
+            .select("id,event") \
+            .is_("replayed_at", "null") \
+            .lte("next_attempt_at", now) \
+            .gt("id", last_id) \
+            .order("id") \
+            .limit(batch_size) \
+            .execute()
+
+        rows = response.data or []
+        if not rows:
+            break
+
+        ok_ids, failed_ids = [], []
+        try:
+            _replay_batch(supabase, rows, record_events, ok_ids, failed_ids)
+            stopped = None
+        except Exception as e:
+            stopped = e
+        if ok_ids:
+            supabase.table("email_event_dead_letters") \
+                .update({"replayed_at": datetime.now(timezone.utc).isoformat()}) \
+                .in_("id", ok_ids) \
+                .execute()
+
+        replayed += len(ok_ids)
+        deferred += len(failed_ids)
+        batches += 1
+        last_id = rows[-1]["id"]
+
+        if stopped is not None:
+            logger.error(f"Dead-letter replay stopped, the rest stay due: {str(stopped)}")
+            break
+        if len(rows) < batch_size:
+            break
+
+    logger.info(f"Dead-letter replay: {imported} imported, {replayed} replayed, {deferred} deferred")
+    return {"imported": imported, "replayed": replayed, "deferred": deferred}
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    result = replay_dead_letters()
+    print(f"\nDead-letter replay summary:")
+    print(f"--------------------------")
+    print(f"Imported from spill files: {result['imported']}")
+    print(f"Replayed: {result['replayed']}")
+    print(f"Deferred: {result['deferred']}")
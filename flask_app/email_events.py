@@ -2,114 +2,175 @@
 Email event handling module for processing email tracking events.
 
 This module handles various email events such as opens, clicks, and replies.
-Events are processed and stored in the email_log table with appropriate status.
+Every event is appended to the email_events table (one row per event, including
+the clicked URL, timestamp and metadata). The status of the matching email_log
+row is derived from that history by the record_email_events database function.
+Events that cannot be recorded are kept in the dead-letter store for retry.
 """
 import logging
-from flask import current_app
+from datetime import datetime, timezone
 from .auth import create_supabase_client
+from .cache import invalidate_owners
+from .live_events import publish_email_updates
 
 logger = logging.getLogger(__name__)
 
+# Event types accepted by the email_events table
+EVENT_TYPES = ("open", "click", "reply")
+
+
+def normalize_timestamp(timestamp=None):
+    """
+    Convert an event timestamp to an ISO 8601 string in UTC.
+
+    Providers send ISO strings or unix epoch seconds. A missing timestamp
+    means "now".
+    """
+    if timestamp is None or timestamp == "":
+        return datetime.now(timezone.utc).isoformat()
+    if isinstance(timestamp, datetime):
+        if timestamp.tzinfo is None:
+            timestamp = timestamp.replace(tzinfo=timezone.utc)
+        return timestamp.astimezone(timezone.utc).isoformat()
+    if isinstance(timestamp, (int, float)):
+        return datetime.fromtimestamp(timestamp, tz=timezone.utc).isoformat()
+    return str(timestamp)
+
+
+def build_event(event_type, email_id, url=None, timestamp=None, metadata=None):
+    """
+    Build an email_events row for record_events.
+
+    Args:
+        event_type: One of 'open', 'click' or 'reply'
+        email_id: The ID of the email_log row the event belongs to
+        url: The clicked URL (click events only)
+        timestamp: When the event happened (defaults to now)
+        metadata: Additional provider metadata
+
+    Returns:
+        dict: The event payload
+    """
+    if event_type not in EVENT_TYPES:
+        raise ValueError(f"Unknown email event type: {event_type}")
+    return {
+        "email_id": str(email_id),
+        "event_type": event_type,
+        "url": url,
+        "ts": normalize_timestamp(timestamp),
+        "metadata": metadata,
+    }
+
+
+def record_events(events):
+    """
+    Append a batch of events and derive email_log statuses in one round trip.
+
+    Args:
+        events: List of event dicts as returned by build_event
+
+    Returns:
+        list: The email_log rows whose status was derived, as
+        {email_id, owner, campaign_id, status} dicts
+
+    Raises:
+        Exception: If the database call fails
+    """
+    if not events:
+        return []
+
+    supabase = create_supabase_client()
+    response = supabase.rpc("record_email_events", {"p_events": events}).execute()
+    rows = response.data or []
+    # Cached stats of the owners whose emails changed are now stale
+    invalidate_owners(row.get("owner") for row in rows)
+    try:
+        publish_email_updates(rows)
+    except Exception as e:
+        # Live updates are best effort; the events are already recorded
+        logger.warning(f"Failed to publish live updates for {len(rows)} email(s): {e}")
+    return rows
+
+
+def _dead_letter(event, error):
+    """Keep a failed event for retry instead of dropping it"""
+    from .dead_letters import store_dead_letters
+    store_dead_letters([event], error)
+
+
 def handle_open_event(email_id, timestamp=None, metadata=None):
     """
     Handle an email open event.
-    
+
     Args:
         email_id: The ID of the email that was opened
         timestamp: When the email was opened (optional)
         metadata: Additional metadata about the open event (optional)
-    
+
     Returns:
         bool: True if the event was successfully processed
     """
+    event = None
     try:
-        supabase = create_supabase_client()
-        
-        # Update the email status in the database
-        response = supabase.table("email_log") \
-            .update({"status": "opened"}) \
-            .eq("id", email_id) \
-            .execute()
-            
+        event = build_event("open", email_id, timestamp=timestamp, metadata=metadata)
+        record_events([event])
         logger.info(f"Processed open event for email {email_id}")
         return True
     except Exception as e:
         logger.error(f"Error processing open event for email {email_id}: {str(e)}")
+        if event is not None:
+            _dead_letter(event, e)
         return False
 
 def handle_click_event(email_id, link_url=None, timestamp=None, metadata=None):
     """
     Handle an email click event.
-    
+
     Args:
         email_id: The ID of the email that was clicked
         link_url: The URL that was clicked (optional)
         timestamp: When the click occurred (optional)
         metadata: Additional metadata about the click event (optional)
-    
+
     Returns:
         bool: True if the event was successfully processed
     """
+    event = None
     try:
-        supabase = create_supabase_client()
-        
-        # Update the email status in the database to 'clicked'
-        # Note: Previously this was using 'replied' status for click events
-        # We only update the status field since the table doesn't have URL columns yet
-        update_data = {"status": "clicked"}
-        
-        # Note: The clicked_url and clicked_at columns don't exist in the current schema
-        # If they're added in the future (via the migration script), uncomment these lines
-        # if link_url is not None:
-        #     update_data["clicked_url"] = link_url
-        # if timestamp is not None:
-        #     update_data["clicked_at"] = timestamp
-        
-        response = supabase.table("email_log") \
-            .update(update_data) \
-            .eq("id", email_id) \
-            .execute()
-            
-        # Log additional information that we can't store in the database yet
-        if link_url:
-            logger.info(f"Click URL (not stored in DB): {link_url}")
-        if timestamp:
-            logger.info(f"Click timestamp (not stored in DB): {timestamp}")
-            
+        event = build_event("click", email_id, url=link_url, timestamp=timestamp, metadata=metadata)
+        record_events([event])
         logger.info(f"Processed click event for email {email_id}")
         return True
     except Exception as e:
         logger.error(f"Error processing click event for email {email_id}: {str(e)}")
+        if event is not None:
+            _dead_letter(event, e)
         return False
 
 def handle_reply_event(email_id, reply_content=None, timestamp=None, metadata=None):
     """
     Handle an email reply event.
-    
+
     Args:
         email_id: The ID of the email that was replied to
         reply_content: The content of the reply (optional)
         timestamp: When the reply was received (optional)
         metadata: Additional metadata about the reply event (optional)
-    
+
     Returns:
         bool: True if the event was successfully processed
     """
+    event = None
     try:
-        supabase = create_supabase_client()
-        
-        # Update the email status in the database
-        response = supabase.table("email_log") \
-            .update({
-                "status": "replied",
-                "reply_content": reply_content,
-                "replied_at": timestamp
-            }) \
-            .eq("id", email_id) \
-            .execute()
-            
+        # The reply body travels in the event metadata
+        if reply_content is not None:
+            metadata = {**(metadata or {}), "reply_content": reply_content}
+        event = build_event("reply", email_id, timestamp=timestamp, metadata=metadata)
+        record_events([event])
         logger.info(f"Processed reply event for email {email_id}")
         return True
     except Exception as e:
         logger.error(f"Error processing reply event for email {email_id}: {str(e)}")
+        if event is not None:
+            _dead_letter(event, e)
         return False
@@ -0,0 +1,114 @@
+"""
+Partition-aware access to email_log.
+
+email_log is range partitioned by month on sent_at, so a query that does
+not constrain sent_at probes every partition. These helpers always add the
+partition key:
+
+- email_log ids are UUIDv7 (the first 48 bits are the creation time in
+  milliseconds) and a check constraint keeps sent_at within ID_SLACK of
+  that time, so a lookup by id is narrowed to one or two months.
+- Time-range reads must give both ends of the range.
+
+Ids from before the conversion are random UUIDs and cannot be narrowed;
+lookups of those still work but scan all partitions.
+"""
+import os
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+# Must match email_log_sent_at_from/_to in the database
+ID_SLACK = timedelta(days=7)
+
+
+def uuid7(timestamp=None) -> uuid.UUID:
+    """
+    Generate a time-ordered UUID (version 7).
+
+    Args:
+        timestamp: Creation time in seconds since the epoch (default: now)
+
+    Returns:
+        uuid.UUID: The new id
+    """
+    ms = int((time.time() if timestamp is None else timestamp) * 1000)
+    rand = int.from_bytes(os.urandom(10), "big")
+    value = (ms & 0xFFFF_FFFF_FFFF) << 80
+    value |= 0x7 << 76 | (rand >> 68) << 64          # version, 12 random bits
+    value |= 0b10 << 62 | rand & 0x3FFF_FFFF_FFFF_FFFF  # variant, 62 random bits
+    return uuid.UUID(int=value)
+
+
+def id_time(email_id):
+    """
+    Creation time of a UUIDv7 email id.
+
+    Returns:
+        datetime: UTC creation time, or None for ids of any other version
+    """
+    value = uuid.UUID(str(email_id))
+    if value.version != 7:
+        return None
+    return datetime.fromtimestamp((value.int >> 80) / 1000, tz=timezone.utc)
+
+
+def sent_at_bounds(email_id):
+    """
+    The sent_at range [start, end) a row with this id can have.
+
+    Returns:
+        tuple: (start, end) datetimes, or (None, None) if the id is not time-ordered
+    """
+    created = id_time(email_id)
+    if created is None:
+        return None, None
+    return created - ID_SLACK, created + ID_SLACK
+
+
+def by_id(query, email_id):
+    """
+    Filter a PostgREST email_log query to one email, with the partition key.
+
+    Args:
+        query: e.g. supabase.table("email_log").select("*")
+        email_id: The email_log id
+
+    Returns:
+        The filtered query
+    """
+    query = query.eq("id", str(email_id))
+    start, end = sent_at_bounds(email_id)
+    if start is not None:
+        query = query.gte("sent_at", start.isoformat()).lt("sent_at", end.isoformat())
+    return query
+
+
+def by_ids(query, email_ids):
+    """
+    Filter a PostgREST email_log query to a set of emails.
+
+    The sent_at range spans all ids; it is only added when every id is
+    time-ordered.
+    """
+    email_ids = [str(email_id) for email_id in email_ids]
+    query = query.in_("id", email_ids)
+    bounds = [sent_at_bounds(email_id) for email_id in email_ids]
+    if bounds and all(start is not None for start, _ in bounds):
+        query = query.gte("sent_at", min(start for start, _ in bounds).isoformat())
+        query = query.lt("sent_at", max(end for _, end in bounds).isoformat())
+    return query
+
+
+def in_range(query, start, end):
+    """
+    Filter a PostgREST email_log query to sends in [start, end).
+
+    Raises:
+        ValueError: If either end is missing or the range is empty
+    """
+    if start is None or end is None:
+        raise ValueError("email_log time-range reads need both start and end")
+    if start >= end:
+        raise ValueError("start must be before end")
+    return query.gte("sent_at", start.isoformat()).lt("sent_at", end.isoformat())
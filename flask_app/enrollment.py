@@ -0,0 +1,80 @@
+"""
+Campaign enrollment.
+
+Enrolling schedules every step of a campaign for a set of leads. The
+expansion (leads x steps x variant assignment) happens in the database
+in one statement per chunk (enroll_leads), so 100k leads cost a few
+round trips instead of one insert per lead per step. Enrolling again is
+a no-op for (lead, step) pairs that already exist, whatever their state.
+"""
+import os
+import logging
+import uuid
+from flask_app.auth import create_supabase_client
+
+logger = logging.getLogger(__name__)
+
+# Lead ids per enroll_leads call; bounds request size and statement time
+CHUNK_SIZE = int(os.getenv("ENROLL_CHUNK_SIZE", "20000"))
+
+
+class CampaignNotFound(Exception):
+    """Raised when the campaign does not exist or belongs to someone else"""
+
+
+def enroll(campaign_id, owner, lead_ids=None, start_at=None, email_server_id=None, chunk_size=CHUNK_SIZE):
+    """
+    Schedule a campaign's steps for leads.
+
+    Args:
+        campaign_id: The campaign
+        owner: The owner's user ID
+        lead_ids: Leads to enroll, or None for all of the owner's leads
+        start_at: When the first step is due (datetime, default now)
+        email_server_id: Server to send through (default: the owner's default server)
+        chunk_size: Lead ids per database call
+
+    Returns:
+        dict: {"leads": leads enrolled, "steps": steps per lead,
+               "scheduled": new (lead, step) rows, "skipped": rows that already existed}
+
+    Raises:
+        ValueError: If a lead id is not a UUID, or the email server is not the owner's
+        CampaignNotFound: If the campaign is not the owner's
+    """
+    if lead_ids is not None:
+        try:
+            lead_ids = list(dict.fromkeys(str(uuid.UUID(str(lead_id))) for lead_id in lead_ids))
+        except ValueError:
+            raise ValueError("lead_ids must be UUIDs")
+        chunks = [lead_ids[i:i + chunk_size] for i in range(0, len(lead_ids), chunk_size)]
+    else:
+        chunks = [None]
+
+    supabase = create_supabase_client()
+    totals = {"leads": 0, "steps": 0, "scheduled": 0, "skipped": 0}
+    for chunk in chunks:
+        try:
+            response = supabase.rpc("enroll_leads", {
+                "p_campaign_id": str(campaign_id),
+                "p_owner": owner,
+                "p_lead_ids": chunk,
+                "p_start_at": start_at.isoformat() if start_at else None,
+                "p_email_server_id": email_server_id,
+            }).execute()
+        except Exception as e:
+            if "Campaign not found" in str(e):
+                raise CampaignNotFound(f"Campaign {campaign_id} not found")
+            if "Email server not found" in str(e):
+                raise ValueError("Email server not found")
+            raise
+        counts = (response.data or [{}])[0]
+        totals["steps"] = counts.get("steps", totals["steps"])
+        for key in ("leads", "scheduled", "skipped"):
+            totals[key] += counts.get(key, 0)
+
+    logger.info(
+        f"Enrolled {totals['leads']} leads in campaign {campaign_id}: "
+        f"{totals['scheduled']} steps scheduled, {totals['skipped']} already scheduled"
+    )
+    return totals
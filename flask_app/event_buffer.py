@@ -0,0 +1,90 @@
+"""
+In-process event buffer for request paths that must not wait on I/O.
+
+Request handlers add events to a buffer and return immediately. A background
+thread hands the collected events off in batches, either as Celery batch
+tasks or, when Celery is not installed, directly to record_email_events.
+"""
+import atexit
+import logging
+import os
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+def dispatch_events(events):
+    """
+    Hand a batch of events to the event pipeline.
+
+    Uses the Celery batch tasks when available and falls back to a direct
+    bulk write otherwise.
+    """
+    try:
+        from flask_app.celery_tasks import enqueue_events
+    except ImportError:
+        from flask_app.email_events import record_events
+        record_events(events)
+        return
+    enqueue_events(events)
+
+
+class EventBuffer:
+    """
+    Collects events in memory and flushes them in batches.
+
+    A batch is flushed when it reaches max_batch events or after
+    flush_interval seconds, whichever comes first. The flush thread is
+    started lazily so it survives gunicorn's fork after preload.
+    """
+
+    def __init__(self, flush=dispatch_events, max_batch=500, flush_interval=0.5):
+        self._flush = flush
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self._events = []
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._worker = None
+        self._worker_pid = None
+        atexit.register(self.flush)
+
+    def add(self, event):
+        """Add an event; never blocks on I/O."""
+        with self._lock:
+            self._events.append(event)
+            self._ensure_worker()
+            if len(self._events) >= self.max_batch:
+                self._wakeup.set()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._events)
+
+    def flush(self):
+        """Hand off everything buffered so far. Returns the batch size."""
+        with self._lock:
+            batch, self._events = self._events, []
+        if not batch:
+            return 0
+        try:
+            self._flush(batch)
+        except Exception as e:
+            logger.exception(f"Error flushing {len(batch)} buffered events: {str(e)}")
+            from flask_app.dead_letters import store_dead_letters
+            store_dead_letters(batch, e)
+        return len(batch)
+
+    def _ensure_worker(self):
+        # Called with the lock held
+        if self._worker is not None and self._worker_pid == os.getpid():
+            return
+        self._worker_pid = os.getpid()
+        self._worker = threading.Thread(target=self._run, name="event-buffer", daemon=True)
+        self._worker.start()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
@@ -0,0 +1,488 @@
+"""
+Incremental IMAP sync of email_servers mailboxes into inbox_emails.
+
+Each mailbox keeps a UIDVALIDITY and the highest UID it has stored
+(mailbox_sync_state). A sync cycle asks the server only for UIDs above
+that mark (UID SEARCH UID n:*). It fetches them in batches of
+IMAP_BATCH_SIZE without setting \\Seen, and stores each batch together
+with the new mark (store_inbox_batch). Messages are parsed as they stream
+in (flask_app.mime_stream): the first IMAP_FETCH_CHUNK_BYTES of each come
+with the batch. The rest of a larger message is fetched chunk by chunk,
+and only while the parser still needs it. When UIDVALIDITY changes, the
+mark no longer means anything, and the mailbox is read again from
+IMAP_LOOKBACK_DAYS ago. Emails already stored are then re-keyed to
+their new UIDs, matched by Message-ID, instead of stored twice. A first sync also starts there, not at the
+mailbox's first message.
+
+Connections stay open between cycles. Servers that announce IDLE are not
+polled. After a cycle the connection goes into IDLE, and the worker waits
+on all idle sockets with one selector. A mailbox is synced as soon as
+its server pushes new mail, and IDLE is renewed every IMAP_IDLE_REFRESH
+seconds. Other servers are polled every IMAP_POLL_INTERVAL seconds.
+Cycles run on a pool of IMAP_WORKERS threads, one mailbox per thread at
+a time. A failing mailbox backs off exponentially and reconnects.
+"""
+import heapq
+import imaplib
+import itertools
+import logging
+import os
+import re
+import selectors
+import socket
+import ssl
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+from flask_app.auth import create_supabase_client
+from flask_app.mime_stream import MimeStreamParser, default_store
+
+logger = logging.getLogger(__name__)
+
+WORKERS = int(os.getenv("IMAP_WORKERS", "16"))
+BATCH_SIZE = int(os.getenv("IMAP_BATCH_SIZE", "100"))
+# Messages per mailbox per cycle, so one large backlog does not hold a worker
+MAX_PER_CYCLE = int(os.getenv("IMAP_MAX_PER_CYCLE", "2000"))
+LOOKBACK_DAYS = int(os.getenv("IMAP_LOOKBACK_DAYS", "30"))
+# Messages are fetched and parsed in chunks of this size
+FETCH_CHUNK_BYTES = int(os.getenv("IMAP_FETCH_CHUNK_BYTES", "65536"))
+# Bytes of each message read at most; the rest of very large messages is not read
+MAX_MESSAGE_BYTES = int(os.getenv("IMAP_MAX_MESSAGE_BYTES", "26214400"))
+POLL_INTERVAL = float(os.getenv("IMAP_POLL_INTERVAL", "60"))
+# Servers drop IDLE after 30 minutes; renew well before
+IDLE_REFRESH = float(os.getenv("IMAP_IDLE_REFRESH", "600"))
+REFRESH_SERVERS_INTERVAL = float(os.getenv("IMAP_REFRESH_SERVERS_INTERVAL", "60"))
+RETRY_BASE_SECONDS = float(os.getenv("IMAP_RETRY_BASE_SECONDS", "30"))
+RETRY_MAX_SECONDS = float(os.getenv("IMAP_RETRY_MAX_SECONDS", "1800"))
+CONNECT_TIMEOUT = float(os.getenv("IMAP_CONNECT_TIMEOUT", "30"))
+FOLDER = "INBOX"
+
+_FETCH_UID = re.compile(rb"UID (\d+)")
+_FETCH_SIZE = re.compile(rb"RFC822\.SIZE (\d+)")
+_FETCH_DATE = re.compile(rb'INTERNALDATE "([^"]+)"')
+
+
+def connect(server, timeout=CONNECT_TIMEOUT):
+    """
+    Open an authenticated IMAP session for an email_servers row.
+
+    pop_imap_server may carry a port ("imap.example.com:1993"). Without one,
+    use_ssl means implicit TLS on 993; otherwise port 143 is upgraded with
+    STARTTLS when use_tls is set.
+
+    Returns:
+        imaplib.IMAP4: A logged-in session
+    """
+    host, _, port = server["pop_imap_server"].partition(":")
+    use_ssl = bool(server.get("use_ssl"))
+    port = int(port) if port else 993 if use_ssl else 143
+    if use_ssl:
+        imap = imaplib.IMAP4_SSL(host, port, ssl_context=ssl.create_default_context(), timeout=timeout)
+    else:
+        imap = imaplib.IMAP4(host, port, timeout=timeout)
+    try:
+        if not use_ssl and server.get("use_tls"):
+            imap.starttls(ssl_context=ssl.create_default_context())
+        imap.login(server["email_address"], server["password"])
+    except Exception:
+        imap.shutdown()
+        raise
+    return imap
+
+
+def _internaldate(header):
+    match = _FETCH_DATE.search(header)
+    if not match:
+        return None
+    try:
+        return datetime.strptime(match.group(1).decode(), "%d-%b-%Y %H:%M:%S %z").astimezone(timezone.utc)
+    except ValueError:
+        return None
+
+
+class MailboxSync:
+    """The connection and high-water mark of one mailbox folder"""
+
+    def __init__(self, server, supabase, folder=FOLDER, connector=connect, batch_size=BATCH_SIZE,
+                 max_per_cycle=MAX_PER_CYCLE, lookback_days=LOOKBACK_DAYS, max_bytes=MAX_MESSAGE_BYTES,
+                 chunk_bytes=FETCH_CHUNK_BYTES, attachments=None):
+        self.server = server
+        self.folder = folder
+        self._supabase = supabase
+        self._connector = connector
+        self.batch_size = batch_size
+        self.max_per_cycle = max_per_cycle
+        self.lookback_days = lookback_days
+        self.max_bytes = max_bytes
+        self.chunk_bytes = chunk_bytes
+        self.attachments = attachments if attachments is not None else default_store()
+        self.imap = None
+        self.idle_supported = False
+        self.idling = False
+        self.uidvalidity = None
+        self.state = None
+        self.backlog = False
+        self.failures = 0
+        self._idle_tag = None
+        self._idle_tags = itertools.count(1)
+
+    @property
+    def server_id(self):
+        return self.server["id"]
+
+    def cycle(self):
+        """
+        Leave IDLE, store new messages, and go back into IDLE if supported.
+
+        Returns:
+            int: Messages stored
+        """
+        try:
+            if self.idling:
+                self._end_idle()
+            self._ensure_selected()
+            stored = self.sync()
+            if self.idle_supported and not self.backlog:
+                self._start_idle()
+            return stored
+        except Exception:
+            self.close()
+            raise
+
+    def sync(self):
+        """Fetch and store the UIDs above the mark, up to max_per_cycle"""
+        state = self._load_state()
+        if state["uidvalidity"] != self.uidvalidity:
+            if state["uidvalidity"] is not None:
+                logger.info(f"UIDVALIDITY of {self.server['email_address']} changed; re-keying its emails")
+            state.update(uidvalidity=self.uidvalidity, last_uid=0)
+
+        if state["last_uid"]:
+            typ, data = self.imap.uid("SEARCH", "UID", f"{state['last_uid'] + 1}:*")
+        else:
+            since = (datetime.now(timezone.utc) - timedelta(days=self.lookback_days)).strftime("%d-%b-%Y")
+            typ, data = self.imap.uid("SEARCH", "SINCE", since)
+        if typ != "OK":
+            raise imaplib.IMAP4.error(f"UID SEARCH failed: {data}")
+        # "n:*" always matches the highest UID, even when it is not above n
+        uids = sorted(uid for uid in map(int, (data[0] or b"").split()) if uid > state["last_uid"])
+        self.backlog = len(uids) > self.max_per_cycle
+        uids = uids[:self.max_per_cycle]
+
+        stored = 0
+        for start in range(0, len(uids), self.batch_size):
+            batch = uids[start:start + self.batch_size]
+            messages = self._fetch(batch)
+            response = self._supabase.rpc("store_inbox_batch", {
+                "p_email_server_id": self.server_id,
+                "p_folder": self.folder,
+                "p_uidvalidity": self.uidvalidity,
+                "p_last_uid": batch[-1],
+                "p_messages": messages,
+            }).execute()
+            stored += response.data or 0
+            state["last_uid"] = batch[-1]
+        self.failures = 0
+        return stored
+
+    def idle_socket(self):
+        return self.imap.socket() if self.imap is not None else None
+
+    def close(self):
+        """Leave IDLE and log out, ignoring a connection that is already gone"""
+        imap, self.imap = self.imap, None
+        self.idling = False
+        self.uidvalidity = None
+        if imap is None:
+            return
+        try:
+            if self._idle_tag:
+                imap.send(b"DONE\r\n")
+            imap.logout()
+        except Exception:
+            try:
+                imap.shutdown()
+            except Exception:
+                pass
+        finally:
+            self._idle_tag = None
+
+    def _ensure_selected(self):
+        if self.imap is not None:
+            return
+        self.imap = self._connector(self.server)
+        self.idle_supported = "IDLE" in self.imap.capabilities
+        typ, data = self.imap.select(self.folder, readonly=True)
+        if typ != "OK":
+            raise imaplib.IMAP4.error(f"EXAMINE {self.folder} failed: {data}")
+        _, values = self.imap.response("UIDVALIDITY")
+        self.uidvalidity = int(values[-1]) if values and values[-1] else 0
+
+    def _load_state(self):
+        if self.state is None:
+            response = self._supabase.table("mailbox_sync_state") \
+                .select("uidvalidity, last_uid") \
+                .eq("email_server_id", self.server_id) \
+                .eq("folder", self.folder) \
+                .execute()
+            row = (response.data or [{}])[0]
+            self.state = {"uidvalidity": row.get("uidvalidity"), "last_uid": row.get("last_uid") or 0}
+        return self.state
+
+    def _fetch(self, uids):
+        typ, data = self.imap.uid("FETCH", ",".join(map(str, uids)),
+                                  f"(UID RFC822.SIZE INTERNALDATE BODY.PEEK[]<0.{self.chunk_bytes}>)")
+        if typ != "OK":
+            raise imaplib.IMAP4.error(f"UID FETCH failed: {data}")
+        messages = []
+        for item in data:
+            if not isinstance(item, tuple):
+                continue
+            header, raw = item
+            uid = _FETCH_UID.search(header)
+            if not uid:
+                continue
+            size = _FETCH_SIZE.search(header)
+            message = self._parse(int(uid.group(1)), raw, int(size.group(1)) if size else len(raw))
+            message["uid"] = int(uid.group(1))
+            internaldate = _internaldate(header)
+            if internaldate:
+                message["received_at"] = internaldate.isoformat()
+            messages.append(message)
+        return messages
+
+    def _parse(self, uid, first, size):
+        """Stream a message through the parser, fetching the rest of a large one chunk by chunk"""
+        parser = MimeStreamParser(store=self.attachments)
+        parser.feed(first)
+        offset, end = len(first), min(size, self.max_bytes)
+        while offset < end and parser.needs_more:
+            typ, data = self.imap.uid("FETCH", str(uid),
+                                      f"(BODY.PEEK[]<{offset}.{min(self.chunk_bytes, end - offset)}>)")
+            if typ != "OK":
+                raise imaplib.IMAP4.error(f"UID FETCH failed: {data}")
+            chunk = next((item[1] for item in data if isinstance(item, tuple)), b"")
+            if not chunk:
+                break
+            parser.feed(chunk)
+            offset += len(chunk)
+        return parser.close()
+
+    def _start_idle(self):
+        self._idle_tag = f"I{next(self._idle_tags)}".encode()
+        self.imap.send(self._idle_tag + b" IDLE\r\n")
+        while True:
+            line = self.imap.readline()
+            if not line:
+                raise imaplib.IMAP4.abort("Connection closed entering IDLE")
+            if line.startswith(b"+"):
+                break
+            if line.startswith(self._idle_tag):
+                raise imaplib.IMAP4.error(f"IDLE refused: {line!r}")
+        self.idling = True
+
+    def _end_idle(self):
+        self.imap.send(b"DONE\r\n")
+        while True:
+            line = self.imap.readline()
+            if not line:
+                raise imaplib.IMAP4.abort("Connection closed leaving IDLE")
+            if line.startswith(self._idle_tag + b" "):
+                break
+        self._idle_tag = None
+        self.idling = False
+
+
+class ImapSyncWorker:
+    """Keeps every email server's inbox synced, many mailboxes at once"""
+
+    def __init__(self, workers=WORKERS, supabase=None, poll_interval=POLL_INTERVAL, idle_refresh=IDLE_REFRESH,
+                 refresh_servers_interval=REFRESH_SERVERS_INTERVAL, mailbox_factory=MailboxSync):
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.idle_refresh = idle_refresh
+        self.refresh_servers_interval = refresh_servers_interval
+        self._supabase = supabase or create_supabase_client()
+        self._mailbox_factory = mailbox_factory
+        self.mailboxes = {}
+        self.stats = {"cycles": 0, "stored": 0, "errors": 0, "idle_wakeups": 0}
+        # Heap of (due time, token, server id); a mailbox's newest token is its only live entry
+        self._due = []
+        self._tokens = {}
+        self._sequence = itertools.count()
+        self._running = set()
+        self._done = deque()
+        self._selector = selectors.DefaultSelector()
+        self._wake_r, self._wake_w = socket.socketpair()
+        self._wake_r.setblocking(False)
+        self._selector.register(self._wake_r, selectors.EVENT_READ, None)
+        self._stop = threading.Event()
+        self._executor = None
+        self._next_refresh = 0.0
+
+    def stop(self):
+        """Ask run() to finish running cycles, close every connection and return"""
+        self._stop.set()
+        self._wake()
+
+    def run(self):
+        """Sync until stop() is called"""
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="imap")
+        logger.info(f"IMAP sync started with {self.workers} workers")
+        try:
+            while not self._stop.is_set():
+                now = time.monotonic()
+                if now >= self._next_refresh:
+                    self._refresh_mailboxes(now)
+                self._collect_done()
+                for key, _ in self._selector.select(self._timeout()):
+                    if key.data is None:
+                        self._drain_wake()
+                        continue
+                    self.stats["idle_wakeups"] += 1
+                    self._submit(key.data)
+                now = time.monotonic()
+                while self._due and self._due[0][0] <= now:
+                    _, token, server_id = heapq.heappop(self._due)
+                    mailbox = self.mailboxes.get(server_id)
+                    if mailbox is not None and self._tokens.get(server_id) == token:
+                        self._submit(mailbox)
+        finally:
+            self._shutdown()
+        return dict(self.stats, mailboxes=len(self.mailboxes))
+
+    def _refresh_mailboxes(self, now):
+        self._next_refresh = now + self.refresh_servers_interval
+        try:
+            response = self._supabase.table("email_servers").select("*").execute()
+        except Exception as e:
+            logger.warning(f"Loading email servers failed: {e}")
+            return
+        servers = {server["id"]: server for server in response.data or [] if server.get("pop_imap_server")}
+        for server_id in list(self.mailboxes):
+            current = servers.get(server_id)
+            if current is None or current != self.mailboxes[server_id].server:
+                self._remove(server_id)
+        for server_id, server in servers.items():
+            if server_id not in self.mailboxes:
+                self.mailboxes[server_id] = self._mailbox_factory(server, self._supabase)
+                self._schedule(server_id, now)
+
+    def _remove(self, server_id):
+        mailbox = self.mailboxes.pop(server_id)
+        self._tokens.pop(server_id, None)
+        if server_id in self._running:
+            return  # closed by _collect_done
+        self._unregister(mailbox)
+        mailbox.close()
+
+    def _submit(self, mailbox):
+        self._unregister(mailbox)
+        self._tokens.pop(mailbox.server_id, None)
+        self._running.add(mailbox.server_id)
+        self._executor.submit(self._cycle, mailbox)
+
+    def _cycle(self, mailbox):
+        try:
+            stored = mailbox.cycle()
+            self._done.append((mailbox, stored, None))
+        except Exception as e:
+            self._done.append((mailbox, 0, e))
+        finally:
+            self._wake()
+
+    def _collect_done(self):
+        now = time.monotonic()
+        while self._done:
+            mailbox, stored, error = self._done.popleft()
+            self._running.discard(mailbox.server_id)
+            if self.mailboxes.get(mailbox.server_id) is not mailbox:
+                mailbox.close()
+                continue
+            self.stats["cycles"] += 1
+            self.stats["stored"] += stored
+            if error is not None:
+                self.stats["errors"] += 1
+                mailbox.failures += 1
+                delay = min(RETRY_BASE_SECONDS * 2 ** (mailbox.failures - 1), RETRY_MAX_SECONDS)
+                logger.warning(f"Syncing {mailbox.server['email_address']} failed "
+                               f"(retry in {delay:.0f}s): {error}")
+                self._record_error(mailbox, error)
+                self._schedule(mailbox.server_id, now + delay)
+            elif mailbox.backlog:
+                self._schedule(mailbox.server_id, now)
+            elif mailbox.idling:
+                self._selector.register(mailbox.idle_socket(), selectors.EVENT_READ, mailbox)
+                self._schedule(mailbox.server_id, now + self.idle_refresh)
+            else:
+                self._schedule(mailbox.server_id, now + self.poll_interval)
+
+    def _record_error(self, mailbox, error):
+        try:
+            self._supabase.table("mailbox_sync_state").upsert({
+                "email_server_id": mailbox.server_id, "folder": mailbox.folder, "last_error": str(error)[:500],
+            }).execute()
+        except Exception as e:
+            logger.warning(f"Recording the sync error of {mailbox.server['email_address']} failed: {e}")
+
+    def _schedule(self, server_id, at):
+        token = next(self._sequence)
+        self._tokens[server_id] = token
+        heapq.heappush(self._due, (at, token, server_id))
+
+    def _unregister(self, mailbox):
+        try:
+            self._selector.unregister(mailbox.idle_socket())
+        except (KeyError, ValueError, OSError):
+            pass
+
+    def _timeout(self):
+        if self._done:
+            return 0
+        deadlines = [self._next_refresh]
+        if self._due:
+            deadlines.append(self._due[0][0])
+        return max(min(deadlines) - time.monotonic(), 0)
+
+    def _wake(self):
+        try:
+            self._wake_w.send(b"\0")
+        except OSError:
+            pass
+
+    def _drain_wake(self):
+        try:
+            while self._wake_r.recv(4096):
+                pass
+        except (BlockingIOError, OSError):
+            pass
+
+    def _shutdown(self):
+        self._executor.shutdown(wait=True)
+        self._collect_done()
+        for mailbox in self.mailboxes.values():
+            self._unregister(mailbox)
+            mailbox.close()
+        self._selector.close()
+        self._wake_r.close()
+        self._wake_w.close()
+        logger.info(f"IMAP sync stopped: {self.stats['stored']} messages stored in {self.stats['cycles']} cycles")
+
+
+if __name__ == "__main__":
+    import signal
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    worker = ImapSyncWorker()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(signum, lambda *_: worker.stop())
+    final = worker.run()
+    print(f"\nIMAP sync summary:")
+    print(f"------------------")
+    print(f"Mailboxes: {final['mailboxes']}")
+    print(f"Cycles: {final['cycles']}")
+    print(f"Messages stored: {final['stored']}")
+    print(f"Errors: {final['errors']}")
@@ -0,0 +1,256 @@
+"""
+Inbox pages, conversations and unread counters.
+
+Emails are listed newest first in (received_at, id) keyset order and
+conversations by their latest email, each page carrying an opaque cursor
+for the next one. The triggers on inbox_emails keep per-owner and
+per-mailbox counters in inbox_counters and one summary row per
+conversation in inbox_threads, so neither the unread badge nor the thread
+list counts the inbox. mark_read() changes any selection of emails in one
+UPDATE; reconcile_counters() recomputes both to fix drift.
+"""
+import base64
+import binascii
+import json
+import logging
+import uuid
+from datetime import datetime
+from flask_app.auth import create_supabase_client
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 200
+# Largest list of ids accepted by one mark_read call
+MAX_MARK_IDS = 1000
+# Columns of a thread's emails; full_body is left to the single-email read
+THREAD_COLUMNS = ("id, email_server_id, thread_key, sender_email, sender_name, recipient_email, "
+                  "subject, body_preview, received_at, is_read, reply_to_email_id")
+
+
+def encode_cursor(timestamp, key) -> str:
+    """Pack a keyset position into an opaque URL-safe cursor"""
+    payload = json.dumps([timestamp, str(key)], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(payload).rstrip(b"=").decode("ascii")
+
+
+def decode_cursor(cursor):
+    """
+    Unpack a cursor.
+
+    Returns:
+        tuple: (timestamp datetime, key string), or (None, None) for an empty cursor
+
+    Raises:
+        ValueError: If the cursor is malformed
+    """
+    if not cursor:
+        return None, None
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        timestamp, key = json.loads(base64.urlsafe_b64decode(padded))
+        timestamp = datetime.fromisoformat(timestamp)
+    except (binascii.Error, TypeError, ValueError) as e:
+        raise ValueError(f"Invalid inbox cursor: {cursor}") from e
+    if timestamp.tzinfo is None or not isinstance(key, str) or not key:
+        raise ValueError(f"Invalid inbox cursor: {cursor}")
+    return timestamp, key
+
+
+def _check_limit(limit):
+    if not 1 <= limit <= MAX_LIMIT:
+        raise ValueError(f"limit must be between 1 and {MAX_LIMIT}")
+
+
+def _check_uuid(value, name):
+    try:
+        return str(uuid.UUID(str(value)))
+    except ValueError as e:
+        raise ValueError(f"{name} must be a UUID") from e
+
+
+def _page(rows, limit, cursor, timestamp_column, key_column):
+    """Cut one extra fetched row off a page and derive the next cursor"""
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if rows:
+        cursor = encode_cursor(rows[-1][timestamp_column], rows[-1][key_column])
+    return rows, cursor, has_more
+
+
+def list_emails(owner, cursor=None, limit=DEFAULT_LIMIT, unread_only=False, email_server_id=None):
+    """
+    One page of inbox emails, newest first, without their full bodies.
+
+    Args:
+        owner: The owner's user ID
+        cursor: Cursor from the previous page, or None for the first page
+        limit: Maximum number of emails returned
+        unread_only: Only list unread emails
+        email_server_id: Only list emails of this mailbox
+
+    Returns:
+        dict: {"emails": rows, "cursor": next cursor, "has_more": bool}
+
+    Raises:
+        ValueError: For a bad limit, mailbox id or cursor
+    """
+    _check_limit(limit)
+    if email_server_id is not None:
+        email_server_id = _check_uuid(email_server_id, "email_server_id")
+    before_ts, before_id = decode_cursor(cursor)
+    if before_id is not None:
+        before_id = _check_uuid(before_id, "cursor id")
+
+    supabase = create_supabase_client()
+    response = supabase.rpc("inbox_page", {
+        "p_owner": owner,
+        "p_before_ts": before_ts.isoformat() if before_ts else None,
+        "p_before_id": before_id,
+        "p_limit": limit + 1,
+        "p_unread_only": unread_only,
+        "p_email_server_id": email_server_id,
+    }).execute()
+
+    emails, cursor, has_more = _page(response.data or [], limit, cursor, "received_at", "id")
+    return {"emails": emails, "cursor": cursor, "has_more": has_more}
+
+
+def list_threads(owner, cursor=None, limit=DEFAULT_LIMIT, unread_only=False):
+    """
+    One page of conversations, most recently active first.
+
+    Each thread carries its subject, message and unread counts, and the
+    sender, preview and time of its latest email.
+
+    Returns:
+        dict: {"threads": rows, "cursor": next cursor, "has_more": bool}
+
+    Raises:
+        ValueError: For a bad limit or cursor
+    """
+    _check_limit(limit)
+    before_ts, before_key = decode_cursor(cursor)
+
+    supabase = create_supabase_client()
+    response = supabase.rpc("inbox_threads_page", {
+        "p_owner": owner,
+        "p_before_ts": before_ts.isoformat() if before_ts else None,
+        "p_before_key": before_key,
+        "p_limit": limit + 1,
+        "p_unread_only": unread_only,
+    }).execute()
+
+    threads, cursor, has_more = _page(response.data or [], limit, cursor, "last_received_at", "thread_key")
+    return {"threads": threads, "cursor": cursor, "has_more": has_more}
+
+
+def thread_messages(owner, thread_key):
+    """The emails of one conversation, oldest first"""
+    supabase = create_supabase_client()
+    response = supabase.table("inbox_emails") \
+        .select(THREAD_COLUMNS) \
+        .eq("owner", owner) \
+        .eq("thread_key", thread_key) \
+        .order("received_at") \
+        .order("id") \
+        .execute()
+    return response.data or []
+
+
+def get_email(owner, email_id):
+    """
+    One inbox email with its full body, or None if the owner has no such email.
+
+    Raises:
+        ValueError: If email_id is not a UUID
+    """
+    email_id = _check_uuid(email_id, "email id")
+    supabase = create_supabase_client()
+    response = supabase.table("inbox_emails").select("*").eq("id", email_id).eq("owner", owner).execute()
+    return response.data[0] if response.data else None
+
+
+def counters(owner):
+    """
+    Total and unread emails of an owner, overall and per mailbox.
+
+    Returns:
+        dict: {"total": int, "unread": int, "mailboxes": [{"email_server_id", "total", "unread"}]}
+    """
+    supabase = create_supabase_client()
+    response = supabase.table("inbox_counters") \
+        .select("email_server_id, total, unread") \
+        .eq("owner", owner) \
+        .execute()
+    mailboxes = [{"email_server_id": row["email_server_id"], "total": row["total"] or 0, "unread": row["unread"] or 0}
+                 for row in response.data or []]
+    return {
+        "total": sum(mailbox["total"] for mailbox in mailboxes),
+        "unread": sum(mailbox["unread"] for mailbox in mailboxes),
+        "mailboxes": mailboxes,
+    }
+
+
+def mark_read(owner, is_read=True, ids=None, email_server_id=None, thread_key=None, before=None, everything=False):
+    """
+    Set the read state of a selection of emails in one statement.
+
+    The selectors combine: ids, a mailbox, a conversation and a received
+    cutoff. At least one is required unless everything is set, so an empty
+    request can never mark the whole inbox by accident.
+
+    Args:
+        owner: The owner's user ID
+        is_read: The read state to set
+        ids: Inbox email ids
+        email_server_id: Emails of this mailbox
+        thread_key: Emails of this conversation
+        before: Emails received at or before this datetime
+        everything: Select all of the owner's emails
+
+    Returns:
+        int: Number of emails whose read state changed
+
+    Raises:
+        ValueError: If nothing is selected or a selector is malformed
+    """
+    if ids is not None:
+        if not ids or len(ids) > MAX_MARK_IDS:
+            raise ValueError(f"ids must list between 1 and {MAX_MARK_IDS} emails")
+        ids = [_check_uuid(email_id, "ids") for email_id in ids]
+    if email_server_id is not None:
+        email_server_id = _check_uuid(email_server_id, "email_server_id")
+    if before is not None and before.tzinfo is None:
+        raise ValueError("before must include a timezone")
+    if not everything and ids is None and email_server_id is None and thread_key is None and before is None:
+        raise ValueError("Select emails with ids, email_server_id, thread_key or before, or set all")
+
+    supabase = create_supabase_client()
+    response = supabase.rpc("mark_inbox_read", {
+        "p_owner": owner,
+        "p_is_read": is_read,
+        "p_ids": ids,
+        "p_email_server_id": email_server_id,
+        "p_thread_key": thread_key,
+        "p_before": before.isoformat() if before else None,
+    }).execute()
+    return response.data or 0
+
+
+def reconcile_counters(owner=None):
+    """
+    Recompute inbox counters and thread summaries from inbox_emails.
+
+    Args:
+        owner: Only reconcile this owner (all owners when None)
+
+    Returns:
+        int: Number of counter and thread rows that had drifted
+    """
+    supabase = create_supabase_client()
+    response = supabase.rpc("reconcile_inbox_counters", {"p_owner": owner}).execute()
+    fixed = response.data or 0
+    if fixed:
+        logger.warning(f"Reconciled {fixed} drifted inbox counter and thread row(s)")
+    return fixed
@@ -0,0 +1,137 @@
+"""
+Lead engagement scoring.
+
+A lead's score is the recency-weighted sum of its opens, clicks and replies
+over the last LEAD_SCORE_WINDOW_DAYS, boosted by how many distinct days it
+engaged on, squashed into 0-100:
+
+    raw   = sum over days of (w_open*opens + w_click*clicks + w_reply*replies)
+            * 0.5 ** (age_days / half_life)
+    raw  *= 1 + FREQUENCY_BOOST * log(active_days)
+    score = 100 * (1 - exp(-raw / SCORE_SCALE))
+
+Leads are walked in keyset chunks. Each chunk arrives as parallel arrays
+(one element per lead-day), is scored with NumPy in a handful of array
+operations and written back with one UPDATE.
+"""
+import os
+import logging
+import numpy as np
+from flask_app.auth import create_supabase_client
+
+logger = logging.getLogger(__name__)
+
+EVENT_WEIGHTS = {"opens": 1.0, "clicks": 3.0, "replies": 10.0}
+HALF_LIFE_DAYS = float(os.getenv("LEAD_SCORE_HALF_LIFE_DAYS", "14"))
+WINDOW_DAYS = int(os.getenv("LEAD_SCORE_WINDOW_DAYS", "180"))
+CHUNK_SIZE = int(os.getenv("LEAD_SCORE_CHUNK_SIZE", "50000"))
+FREQUENCY_BOOST = 0.25
+# Raw engagement at which a lead scores ~63
+SCORE_SCALE = 10.0
+
+
+def score_arrays(lead_idx, age_days, opens, clicks, replies, n_leads, half_life=HALF_LIFE_DAYS):
+    """
+    Score leads from per lead-day engagement arrays.
+
+    Args:
+        lead_idx: Lead index (0..n_leads-1) of each lead-day
+        age_days: Age in days of each lead-day
+        opens, clicks, replies: Event counts of each lead-day
+        n_leads: Number of leads indexed by lead_idx
+        half_life: Days after which an event counts half
+
+    Returns:
+        numpy.ndarray: float32 scores (0-100), one per lead
+    """
+    lead_idx = np.asarray(lead_idx, dtype=np.intp)
+    if n_leads == 0:
+        return np.zeros(0, dtype=np.float32)
+
+    weighted = (
+        EVENT_WEIGHTS["opens"] * np.asarray(opens, dtype=np.float64)
+        + EVENT_WEIGHTS["clicks"] * np.asarray(clicks, dtype=np.float64)
+        + EVENT_WEIGHTS["replies"] * np.asarray(replies, dtype=np.float64)
+    )
+    decay = np.exp2(-np.asarray(age_days, dtype=np.float64) / half_life)
+
+    raw = np.bincount(lead_idx, weights=weighted * decay, minlength=n_leads)
+    active_days = np.bincount(lead_idx, weights=weighted > 0, minlength=n_leads)
+    raw *= 1 + FREQUENCY_BOOST * np.log(np.maximum(active_days, 1))
+
+    scores = 100 * -np.expm1(-raw / SCORE_SCALE)
+    return np.round(scores, 2).astype(np.float32)
+
+
+def score_owner(owner, chunk_size=CHUNK_SIZE, window_days=WINDOW_DAYS):
+    """
+    Rescore all leads of an owner.
+
+    Args:
+        owner: The owner's user ID
+        chunk_size: Leads scored per chunk
+        window_days: Only engagement this recent counts
+
+    Returns:
+        dict: {"leads": leads scored, "updated": leads whose score changed}
+    """
+    supabase = create_supabase_client()
+    after = None
+    scored = updated = 0
+
+    while True:
+        response = supabase.rpc("lead_engagement_chunk", {
+            "p_owner": owner,
+            "p_after": after,
+            "p_limit": chunk_size,
+            "p_window_days": window_days,
+        }).execute()
+        chunk = response.data[0] if response.data else {}
+        last_id = chunk.get("last_id")
+        if not last_id:
+            break
+
+        lead_ids = chunk.get("lead_ids") or []
+        scores = score_arrays(
+            chunk.get("lead_idx") or [],
+            chunk.get("age_days") or [],
+            chunk.get("opens") or [],
+            chunk.get("clicks") or [],
+            chunk.get("replies") or [],
+            n_leads=len(lead_ids),
+        )
+
+        result = supabase.rpc("apply_lead_scores", {
+            "p_owner": owner,
+            "p_after": after,
+            "p_until": last_id,
+            "p_lead_ids": lead_ids,
+            "p_scores": scores.tolist(),
+        }).execute()
+
+        scored += len(lead_ids)
+        updated += result.data or 0
+        after = last_id
+
+    logger.info(f"Scored leads of owner {owner}: {scored} engaged, {updated} changed")
+    return {"leads": scored, "updated": updated}
+
+
+def score_all(chunk_size=CHUNK_SIZE):
+    """
+    Rescore the leads of every owner that has leads.
+
+    Returns:
+        int: Number of leads whose score changed
+    """
+    supabase = create_supabase_client()
+    response = supabase.table("owner_stats").select("owner").gt("leads", 0).execute()
+
+    updated = 0
+    for row in response.data or []:
+        try:
+            updated += score_owner(row["owner"], chunk_size=chunk_size)["updated"]
+        except Exception as e:
+            # One owner's failure must not stop the others
+            logger.exception(f"Failed to score leads of owner {row['owner']}: {e}")
+    return updated
@@ -0,0 +1,198 @@
+"""
+Live per-owner updates pushed to dashboards over Server-Sent Events.
+
+The event pipeline publishes small per-owner messages (email status
+changes and the owner's fresh counters) to Redis pub/sub. Each web process
+holds a single pattern subscription and fans messages out to the in-memory
+queues of its connected clients, so the cost of a message is one Redis
+delivery per process plus a queue put per client, and an idle client costs
+nothing but its open connection.
+
+Streams are long-lived, so /live is served by a separate gunicorn service
+with gevent workers (see gunicorn.live.conf.py): a waiting client is a
+parked greenlet, not a blocked worker. The rest of the API keeps its sync
+workers. Without Redis, messages are delivered within the publishing
+process only, which is enough for local development.
+"""
+import os
+import json
+import logging
+import queue
+import threading
+from flask_app.redis_client import get_redis
+from flask_app import stats_engine
+
+logger = logging.getLogger(__name__)
+
+CHANNEL_PREFIX = "live:"
+HEARTBEAT_SECONDS = float(os.getenv("LIVE_HEARTBEAT_SECONDS", "15"))
+CLIENT_QUEUE_SIZE = int(os.getenv("LIVE_CLIENT_QUEUE_SIZE", "100"))
+# Browsers reconnect after this many milliseconds when a stream drops
+RECONNECT_MS = 5000
+
+
+def format_sse(event_type, data):
+    """Format one Server-Sent Events message"""
+    return f"event: {event_type}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n"
+
+
+class Broadcaster:
+    """Fans out published messages to the queues of connected clients"""
+
+    def __init__(self, redis_getter=get_redis, queue_size=CLIENT_QUEUE_SIZE):
+        self._redis_getter = redis_getter
+        self._queue_size = queue_size
+        self._clients = {}
+        self._lock = threading.Lock()
+        self._listener = None
+        self._listener_pid = None
+
+    def subscribe(self, owner):
+        """
+        Register a client of an owner's stream.
+
+        Returns:
+            queue.Queue: Receives (event_type, data) tuples
+        """
+        client_queue = queue.Queue(maxsize=self._queue_size)
+        with self._lock:
+            self._clients.setdefault(owner, set()).add(client_queue)
+        self._ensure_listener()
+        return client_queue
+
+    def unsubscribe(self, owner, client_queue):
+        """Remove a client registered with subscribe()"""
+        with self._lock:
+            clients = self._clients.get(owner)
+            if clients is not None:
+                clients.discard(client_queue)
+                if not clients:
+                    del self._clients[owner]
+
+    def client_count(self):
+        """Number of connected clients in this process"""
+        with self._lock:
+            return sum(len(clients) for clients in self._clients.values())
+
+    def deliver(self, owner, event_type, data):
+        """Put a message on the queue of every local client of an owner"""
+        with self._lock:
+            clients = list(self._clients.get(owner, ()))
+        for client_queue in clients:
+            try:
+                client_queue.put_nowait((event_type, data))
+            except queue.Full:
+                # A slow client loses its oldest message rather than
+                # holding up everyone else
+                try:
+                    client_queue.get_nowait()
+                    client_queue.put_nowait((event_type, data))
+                except (queue.Empty, queue.Full):
+                    pass
+
+    def publish(self, owner, event_type, data):
+        """
+        Publish a message to every client of an owner, in all processes.
+
+        Args:
+            owner: Owner whose clients receive the message
+            event_type: SSE event name
+            data: JSON-serialisable payload
+        """
+        client = self._redis_getter()
+        if client is None:
+            self.deliver(owner, event_type, data)
+            return
+        message = json.dumps({"type": event_type, "data": data})
+        client.publish(f"{CHANNEL_PREFIX}{owner}", message)
+
+    def _ensure_listener(self):
+        client = self._redis_getter()
+        if client is None:
+            return
+        with self._lock:
+            if self._listener is not None and self._listener.is_alive() and self._listener_pid == os.getpid():
+                return
+            self._listener = threading.Thread(target=self._listen, name="live-events-listener", daemon=True)
+            self._listener_pid = os.getpid()
+            self._listener.start()
+
+    def _listen(self):
+        client = self._redis_getter()
+        pubsub = client.pubsub(ignore_subscribe_messages=True)
+        try:
+            pubsub.psubscribe(f"{CHANNEL_PREFIX}*")
+            while True:
+                # Poll instead of listen(): the shared client's short socket
+                # timeout would otherwise end the subscription when idle
+                message = pubsub.get_message(timeout=1.0)
+                if message is None:
+                    continue
+                channel = message["channel"]
+                if isinstance(channel, bytes):
+                    channel = channel.decode()
+                try:
+                    payload = json.loads(message["data"])
+                except (TypeError, ValueError):
+                    continue
+                self.deliver(channel[len(CHANNEL_PREFIX):], payload.get("type"), payload.get("data"))
+        except Exception as e:
+            logger.warning(f"Live events listener stopped: {e}")
+        finally:
+            pubsub.close()
+            with self._lock:
+                self._listener = None
+
+    def stream(self, owner, heartbeat=HEARTBEAT_SECONDS):
+        """
+        Generate the SSE stream of an owner's messages.
+
+        Comment lines are sent every heartbeat seconds so proxies keep the
+        connection open and disconnected clients are noticed.
+        """
+        client_queue = self.subscribe(owner)
+        try:
+            yield f"retry: {RECONNECT_MS}\n\n"
+            while True:
+                try:
+                    event_type, data = client_queue.get(timeout=heartbeat)
+                except queue.Empty:
+                    yield ": keepalive\n\n"
+                    # The listener may have died with a Redis hiccup
+                    self._ensure_listener()
+                    continue
+                yield format_sse(event_type, data)
+        finally:
+            self.unsubscribe(owner, client_queue)
+
+
+broadcaster = Broadcaster()
+
+
+def publish_email_updates(rows):
+    """
+    Push the email status changes of a recorded batch to their owners.
+
+    Each owner receives one "emails" message with the changed emails and
+    one "stats" message with their refreshed dashboard counters (read in a
+    single query for all owners of the batch).
+
+    Args:
+        rows: {email_id, owner, campaign_id, status} dicts as returned by
+            email_events.record_events
+    """
+    by_owner = {}
+    for row in rows:
+        if row.get("owner"):
+            by_owner.setdefault(row["owner"], []).append({
+                "email_id": row.get("email_id"),
+                "campaign_id": row.get("campaign_id"),
+                "status": row.get("status"),
+            })
+    if not by_owner:
+        return
+
+    overviews = stats_engine.get_overviews(by_owner)
+    for owner, emails in by_owner.items():
+        broadcaster.publish(owner, "emails", {"emails": emails})
+        broadcaster.publish(owner, "stats", overviews.get(owner))
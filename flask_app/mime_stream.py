@@ -0,0 +1,518 @@
+"""
+Streaming MIME parsing of inbound mail with bounded memory.
+
+MimeStreamParser is fed a raw message in chunks of any size. It holds at
+most one line of it (MIME_MAX_LINE_BYTES) plus the header block being read
+(MIME_MAX_HEADER_BYTES). Header blocks are parsed with the email package
+once complete. Bodies are decoded as they stream past (base64,
+quoted-printable, 7bit/8bit), and runs of lines that cannot hold a
+boundary are passed on in one piece.
+
+- The first text/plain and text/html parts are kept up to
+  MIME_MAX_TEXT_CHARS characters each. The rest of them is not decoded.
+- Attachments and every other leaf part are written to an attachment
+  store as they are decoded, or only counted when there is none.
+  SpillDirectory stores them as files under INBOX_ATTACHMENT_DIR.
+
+close() returns the inbox_emails fields. full_body is the plain text, or
+the HTML as text when there is no plain part, and body_preview is its
+first PREVIEW_CHARS characters.
+
+Usage (benchmark of throughput and peak memory against the email package):
+    python -m flask_app.mime_stream [messages] [attachment MB]
+"""
+import binascii
+import codecs
+import logging
+import os
+import re
+import time
+import tracemalloc
+import uuid
+from email import message_from_bytes, policy
+from email.parser import BytesHeaderParser
+from email.utils import getaddresses, parsedate_to_datetime
+
+from flask_app.rendering import html_to_text
+
+logger = logging.getLogger(__name__)
+
+MAX_TEXT_CHARS = int(os.getenv("MIME_MAX_TEXT_CHARS", "65536"))
+MAX_HEADER_BYTES = int(os.getenv("MIME_MAX_HEADER_BYTES", "65536"))
+MAX_LINE_BYTES = int(os.getenv("MIME_MAX_LINE_BYTES", "65536"))
+ATTACHMENT_DIR = os.getenv("INBOX_ATTACHMENT_DIR")
+PREVIEW_CHARS = 200
+CHUNK_BYTES = 65536
+
+_HEADER_PARSER = BytesHeaderParser(policy=policy.default)
+_NOT_BASE64 = bytes(set(range(256)) - set(b"ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789+/="))
+_UNSAFE_FILENAME = re.compile(r"[^\w.-]+")
+
+
+class SpillDirectory:
+    """Attachment store writing each attachment to its own file under a directory"""
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def open(self, attachment):
+        """
+        Open the file of an attachment and record its path.
+
+        Args:
+            attachment: Attachment metadata (filename, content_type); gets a "path"
+
+        Returns:
+            file: Binary file the decoded attachment is written to
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        name = _UNSAFE_FILENAME.sub("_", attachment.get("filename") or "attachment")[-100:]
+        attachment["path"] = os.path.join(self.directory, f"{uuid.uuid4().hex}-{name}")
+        return open(attachment["path"], "wb")
+
+
+class _Text:
+    """Sink keeping the decoded text of a part up to a character limit"""
+
+    def __init__(self, charset, limit):
+        try:
+            if not codecs.lookup(charset or "utf-8")._is_text_encoding:
+                raise LookupError(charset)
+            self._decoder = codecs.getincrementaldecoder(charset or "utf-8")(errors="replace")
+        except LookupError:
+            self._decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        self.limit = limit
+        self.chunks = []
+        self.length = 0
+        self.truncated = False
+        self.closed = False
+
+    @property
+    def done(self):
+        return self.closed or self.truncated
+
+    def write(self, data):
+        if self.truncated:
+            return
+        text = self._decoder.decode(data)
+        room = self.limit - self.length
+        if len(text) > room:
+            text = text[:room]
+            self.truncated = True
+        self.chunks.append(text)
+        self.length += len(text)
+
+    def close(self):
+        if not self.truncated:
+            self.chunks.append(self._decoder.decode(b"", final=True)[:self.limit - self.length])
+        self.closed = True
+
+    @property
+    def text(self):
+        return "".join(self.chunks)
+
+
+class _Attachment:
+    """Sink counting the decoded bytes of a part and writing them to a store file"""
+
+    def __init__(self, meta, file):
+        self.meta = meta
+        self.file = file
+        self.done = False
+
+    def write(self, data):
+        self.meta["size"] += len(data)
+        if self.file is not None:
+            self.file.write(data)
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+        self.done = True
+
+
+class _Part:
+    """
+    Decoder of one leaf part.
+
+    write() takes encoded content and the line ending after it. The ending
+    is held back until more content follows, because the one before a
+    boundary belongs to the boundary.
+    """
+
+    def __init__(self, encoding, sink):
+        self.encoding = encoding
+        self.sink = sink
+        self._eol = b""
+        self._carry = b""
+
+    def write(self, content, eol):
+        sink = self.sink
+        if sink is None or sink.done:
+            return
+        if self.encoding == "base64":
+            data = self._carry + content.translate(None, _NOT_BASE64)
+            cut = len(data) - len(data) % 4
+            self._carry = data[cut:]
+            try:
+                decoded = binascii.a2b_base64(data[:cut]) if cut else b""
+            except binascii.Error:
+                decoded = b""
+        elif self.encoding == "quoted-printable":
+            decoded = self._eol + binascii.a2b_qp(content)
+            # A line ending in "=" is a soft break, as is a line cut for length
+            self._eol = eol if eol and not content.rstrip(b" \t").endswith(b"=") else b""
+        else:
+            decoded = self._eol + content
+            self._eol = eol
+        if decoded:
+            sink.write(decoded)
+
+    def close(self):
+        if self.sink is None or self.sink.done:
+            return
+        if self._carry:
+            try:
+                self.sink.write(binascii.a2b_base64(self._carry + b"=" * (-len(self._carry) % 4)))
+            except binascii.Error:
+                pass
+        self.sink.close()
+
+
+class MimeStreamParser:
+    """
+    Incremental parser of one message.
+
+    Args:
+        max_text_chars: Characters kept of the text/plain and of the text/html part
+        store: Attachment store with open(attachment) -> binary file or None;
+               attachments are only counted without one
+        max_header_bytes: Bytes kept of one header block; the rest is ignored
+        max_line_bytes: Longest line held before it is passed on in pieces
+    """
+
+    def __init__(self, max_text_chars=MAX_TEXT_CHARS, store=None, max_header_bytes=MAX_HEADER_BYTES,
+                 max_line_bytes=MAX_LINE_BYTES):
+        self.max_text_chars = max_text_chars
+        self.store = store
+        self.max_header_bytes = max_header_bytes
+        self.max_line_bytes = max_line_bytes
+        self.headers = None
+        self.plain = None
+        self.html = None
+        self.attachments = []
+        self.bytes = 0
+        self._buffer = bytearray()
+        self._line_start = True
+        self._in_headers = True
+        self._header_lines = []
+        self._header_size = 0
+        # Delimiters (b"--" + boundary) of the open multiparts, innermost last
+        self._boundaries = []
+        self._part = None
+
+    @property
+    def needs_more(self):
+        """False once the rest of the message would only be skipped"""
+        return self.store is not None or self.plain is None or not self.plain.done
+
+    def feed(self, data):
+        """Parse the next chunk of the message"""
+        self.bytes += len(data)
+        buffer = self._buffer
+        buffer += data
+        start = 0
+        while start < len(buffer):
+            if self._in_headers or (self._boundaries and self._line_start):
+                if self._in_headers or buffer.startswith(b"--", start):
+                    end = buffer.find(b"\n", start)
+                    if end < 0:
+                        break
+                    self._line(bytes(buffer[start:end + 1]))
+                    start = end + 1
+                    continue
+                if len(buffer) - start < 2:
+                    break
+            # Lines up to the next one starting with "--" cannot hold a boundary
+            end = buffer.find(b"\n--", start) if self._boundaries else -1
+            end = buffer.rfind(b"\n", start) if end < 0 else end
+            if end < 0:
+                break
+            self._body(bytes(buffer[start:end + 1]))
+            self._line_start = True
+            start = end + 1
+        del buffer[:start]
+
+        if len(buffer) > self.max_line_bytes:
+            cut = self.max_line_bytes
+            # Never split a quoted-printable escape
+            escape = buffer.rfind(b"=", cut - 2, cut)
+            cut = escape if escape > 0 else cut
+            fragment = bytes(buffer[:cut])
+            del buffer[:cut]
+            if self._in_headers:
+                self._header_size += len(fragment)
+            else:
+                self._body(fragment)
+                self._line_start = False
+
+    def close(self):
+        """
+        Finish the message, also when it was cut short.
+
+        Returns:
+            dict: sender_email, sender_name, recipient_email, subject,
+                  body_preview, full_body, received_at (from Date), message_id,
+                  in_reply_to, references, attachments, truncated
+        """
+        if self._buffer:
+            rest = bytes(self._buffer)
+            self._buffer.clear()
+            # The last line may be a closing boundary without a line ending
+            if self._in_headers or self._line_start:
+                self._line(rest)
+            else:
+                self._body(rest)
+        if self._in_headers:
+            self._end_headers()
+        truncated = bool(self._boundaries) or any(text.truncated for text in (self.plain, self.html) if text)
+        if self._part is not None:
+            self._part.close()
+            self._part = None
+
+        headers = self.headers
+        senders = getaddresses([str(headers.get("From", ""))])
+        recipients = getaddresses([str(headers.get("To", ""))])
+        sender_name, sender_email = senders[0] if senders else ("", "")
+        if self.plain is not None and self.plain.text.strip():
+            text = self.plain.text
+        else:
+            text = html_to_text(self.html.text) if self.html is not None else ""
+
+        received = None
+        try:
+            received = parsedate_to_datetime(str(headers["Date"])) if headers["Date"] else None
+        except (TypeError, ValueError):
+            pass
+
+        return {
+            "sender_email": sender_email.lower(),
+            "sender_name": sender_name or None,
+            "recipient_email": recipients[0][1].lower() if recipients and recipients[0][1] else None,
+            "subject": str(headers.get("Subject", "")),
+            "body_preview": " ".join(text[:PREVIEW_CHARS * 4].split())[:PREVIEW_CHARS],
+            "full_body": text,
+            "received_at": received.isoformat() if received and received.tzinfo else None,
+            "message_id": str(headers["Message-ID"]).strip() if headers["Message-ID"] else None,
+            "in_reply_to": str(headers["In-Reply-To"]).strip() if headers["In-Reply-To"] else None,
+            "references": " ".join(str(headers["References"]).split()) if headers["References"] else None,
+            "attachments": self.attachments,
+            "truncated": truncated,
+        }
+
+    def _line(self, line):
+        """A whole line in a header block, or one that may be a boundary"""
+        content = line.rstrip(b"\r\n")
+        if self._in_headers:
+            if content:
+                self._header_size += len(line)
+                if self._header_size <= self.max_header_bytes:
+                    self._header_lines.append(line)
+                return
+            self._end_headers()
+            return
+
+        delimiter = content.rstrip(b" \t")
+        for depth in range(len(self._boundaries) - 1, -1, -1):
+            boundary = self._boundaries[depth]
+            if delimiter == boundary:
+                self._end_part()
+                del self._boundaries[depth + 1:]
+                self._in_headers = True
+                return
+            if delimiter == boundary + b"--":
+                self._end_part()
+                del self._boundaries[depth:]
+                return
+        self._body(line)
+
+    def _body(self, data):
+        """Body content: whole lines, or a piece of an overlong line"""
+        if self._part is None:
+            return
+        if data.endswith(b"\r\n"):
+            self._part.write(data[:-2], b"\r\n")
+        elif data.endswith(b"\n"):
+            self._part.write(data[:-1], b"\n")
+        else:
+            self._part.write(data, b"")
+
+    def _end_part(self):
+        if self._part is not None:
+            self._part.close()
+            self._part = None
+
+    def _end_headers(self):
+        headers = _HEADER_PARSER.parsebytes(b"".join(self._header_lines))
+        self._header_lines = []
+        self._header_size = 0
+        self._in_headers = False
+        self._line_start = True
+        if self.headers is None:
+            self.headers = headers
+
+        boundary = headers.get_boundary() if headers.get_content_maintype() == "multipart" else None
+        if boundary:
+            # The preamble up to the first boundary is skipped
+            self._boundaries.append(b"--" + boundary.encode("ascii", "replace"))
+            return
+
+        content_type = headers.get_content_type()
+        encoding = str(headers.get("Content-Transfer-Encoding", "")).strip().lower()
+        filename = headers.get_filename()
+        inline = headers.get_content_disposition() != "attachment" and not filename
+        sink = None
+        if inline and content_type == "text/plain" and self.plain is None:
+            sink = self.plain = _Text(headers.get_content_charset(), self.max_text_chars)
+        elif inline and content_type == "text/html" and self.html is None:
+            sink = self.html = _Text(headers.get_content_charset(), self.max_text_chars)
+        elif not inline or headers.get_content_maintype() != "text":
+            attachment = {"filename": filename, "content_type": content_type, "size": 0}
+            self.attachments.append(attachment)
+            sink = _Attachment(attachment, self.store.open(attachment) if self.store is not None else None)
+        self._part = _Part(encoding, sink)
+
+
+def parse_stream(chunks, **kwargs):
+    """
+    Parse a message given as an iterable of byte chunks.
+
+    Args:
+        chunks: Iterable of bytes (a file opened "rb" iterates by line; prefer iter(partial(f.read, n), b""))
+        **kwargs: MimeStreamParser options
+
+    Returns:
+        dict: The parsed fields, as MimeStreamParser.close()
+    """
+    parser = MimeStreamParser(**kwargs)
+    for chunk in chunks:
+        parser.feed(chunk)
+    return parser.close()
+
+
+def parse_message(raw, **kwargs):
+    """The inbox_emails fields of a raw message in memory, parsed in CHUNK_BYTES pieces"""
+    view = memoryview(raw)
+    return parse_stream((view[i:i + CHUNK_BYTES] for i in range(0, len(view), CHUNK_BYTES)), **kwargs)
+
+
+def default_store():
+    """SpillDirectory of INBOX_ATTACHMENT_DIR, or None to only count attachments"""
+    return SpillDirectory(ATTACHMENT_DIR) if ATTACHMENT_DIR else None
+
+
+def synthetic_message(attachment_bytes=0, text_lines=40):
+    """
+    A multipart/mixed reply for the benchmark and tests.
+
+    It holds a quoted-printable text part, a base64 HTML part, and an
+    optional base64 attachment of attachment_bytes random bytes.
+    """
+    boundary, inner = "=_outer", "=_inner"
+    text = "".join(f"Line {i}: thanks for reaching out, café at 10 works for me.\r\n" for i in range(text_lines))
+    html = "".join(f"<p>Line {i}: thanks for reaching out</p>" for i in range(text_lines))
+    parts = [
+        "From: Lead <lead@example.org>\r\nTo: box@example.com\r\nSubject: Re: Offer\r\n"
+        "Message-ID: <reply@example.org>\r\n"
+        "In-Reply-To: <0190b3a0-0000-7000-8000-000000000001@example.com>\r\n"
+        "Date: Mon, 19 Oct 2026 10:00:00 +0000\r\nMIME-Version: 1.0\r\n"
+        f'Content-Type: multipart/mixed; boundary="{boundary}"\r\n\r\n'
+        f"This is a multi-part message.\r\n--{boundary}\r\n"
+        f'Content-Type: multipart/alternative; boundary="{inner}"\r\n\r\n'
+        f"--{inner}\r\nContent-Type: text/plain; charset=utf-8\r\nContent-Transfer-Encoding: quoted-printable\r\n\r\n",
+    ]
+    parts.append(binascii.b2a_qp(text.encode("utf-8")).decode("ascii"))
+    parts.append(f"\r\n--{inner}\r\nContent-Type: text/html; charset=utf-8\r\nContent-Transfer-Encoding: base64\r\n\r\n")
+    encoded = binascii.b2a_base64(html.encode("utf-8"), newline=False).decode("ascii")
+    parts.append("\r\n".join(encoded[i:i + 76] for i in range(0, len(encoded), 76)))
+    parts.append(f"\r\n--{inner}--\r\n")
+    if attachment_bytes:
+        parts.append(f"--{boundary}\r\nContent-Type: application/pdf\r\nContent-Transfer-Encoding: base64\r\n"
+                     f'Content-Disposition: attachment; filename="offer.pdf"\r\n\r\n')
+        raw = os.urandom(attachment_bytes)
+        lines = (binascii.b2a_base64(raw[i:i + 57]) for i in range(0, len(raw), 57))
+        parts.append(b"".join(line[:-1] + b"\r\n" for line in lines).decode("ascii"))
+    parts.append(f"--{boundary}--\r\n")
+    return "".join(parts).encode("ascii")
+
+
+def _parse_with_email_package(raw):
+    message = message_from_bytes(raw, policy=policy.default)
+    body = message.get_body(preferencelist=("plain", "html"))
+    text = body.get_content() if body is not None else ""
+    for part in message.iter_attachments():
+        part.get_content()
+    return text
+
+
+def benchmark(messages=200, attachment_mb=5.0, every=10, chunk_bytes=CHUNK_BYTES):
+    """
+    Measure streaming throughput and peak memory on synthetic messages.
+
+    Every every-th message carries an attachment of attachment_mb MB. Peak
+    memory is traced for one message with the attachment, fed in
+    chunk_bytes chunks, and compared with the email package parsing it
+    whole.
+
+    Returns:
+        dict: messages, megabytes, seconds, messages_per_second,
+              megabytes_per_second, peak_bytes, email_package_peak_bytes
+    """
+    small = synthetic_message()
+    large = synthetic_message(int(attachment_mb * 1024 * 1024))
+
+    def chunks(raw):
+        view = memoryview(raw)
+        return (view[i:i + chunk_bytes] for i in range(0, len(view), chunk_bytes))
+
+    total = 0
+    started = time.perf_counter()
+    for i in range(messages):
+        raw = large if attachment_mb and i % every == 0 else small
+        parse_stream(chunks(raw))
+        total += len(raw)
+    seconds = time.perf_counter() - started
+
+    tracemalloc.start()
+    parse_stream(chunks(large))
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.reset_peak()
+    _parse_with_email_package(large)
+    _, package_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "messages": messages,
+        "megabytes": total / 1024 / 1024,
+        "seconds": seconds,
+        "messages_per_second": messages / seconds if seconds else 0.0,
+        "megabytes_per_second": total / 1024 / 1024 / seconds if seconds else 0.0,
+        "peak_bytes": peak,
+        "email_package_peak_bytes": package_peak,
+    }
+
+
+if __name__ == "__main__":
+    import sys
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    result = benchmark(
+        messages=int(sys.argv[1]) if len(sys.argv) > 1 else 200,
+        attachment_mb=float(sys.argv[2]) if len(sys.argv) > 2 else 5.0,
+    )
+    print(f"\nMIME stream benchmark summary:")
+    print(f"------------------------------")
+    print(f"Messages: {result['messages']} ({result['megabytes']:.1f} MB)")
+    print(f"Throughput: {result['messages_per_second']:.0f} messages/s, {result['megabytes_per_second']:.1f} MB/s")
+    print(f"Peak memory (streaming): {result['peak_bytes'] / 1024:.0f} KiB")
+    print(f"Peak memory (email package): {result['email_package_peak_bytes'] / 1024:.0f} KiB")
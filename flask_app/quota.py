@@ -0,0 +1,185 @@
+"""
+Sender quota: daily caps, warm-up ramps and leased counters.
+
+A sender's cap for a day is its daily_quota, or during warm-up the entry
+of its ramp for that day. Ramps are computed once, when the sender is
+saved (ramp_schedule), and stored on the row. Looking up a cap is then an
+array index, in SQL (sender_daily_cap) and here (daily_cap).
+
+Quota is counted in sender_quota_usage, one row per sender per UTC day.
+A send engine does not touch that row per message. It leases a block of
+QUOTA_LEASE_BLOCK sends (lease_quota, which never grants past the cap)
+and counts the block down in memory. When the block runs out it leases
+the next one. Leftovers are returned on shutdown (release). If an engine
+dies, its leftovers are lost for the day, so the cap is never exceeded.
+"""
+import logging
+import math
+import os
+import threading
+import time
+from datetime import date, datetime, timezone
+from functools import lru_cache
+
+from flask_app.auth import create_supabase_client
+
+logger = logging.getLogger(__name__)
+
+LEASE_BLOCK = int(os.getenv("QUOTA_LEASE_BLOCK", "50"))
+# How long a sender whose cap is used up is not asked about again
+EXHAUSTED_RECHECK_SECONDS = float(os.getenv("QUOTA_EXHAUSTED_RECHECK_SECONDS", "300"))
+
+CURVES = ("linear", "exponential")
+
+
+@lru_cache(maxsize=1024)
+def _ramp(target, days, start, curve):
+    if days == 1:
+        return (target,)
+    ramp = []
+    for day in range(days):
+        progress = day / (days - 1)
+        if curve == "exponential":
+            value = start * (target / start) ** progress
+        else:
+            value = start + (target - start) * progress
+        ramp.append(max(int(math.floor(value + 0.5)), ramp[-1] if ramp else 1))
+    return tuple(ramp)
+
+
+def ramp_schedule(target, days, start=None, curve="linear"):
+    """
+    Daily caps of a warm-up, from start on the first day to target on the last.
+
+    Args:
+        target: Cap at the end of the warm-up (the sender's daily_quota)
+        days: Length of the warm-up in days
+        start: Cap on the first day (default: a tenth of target, at least 1)
+        curve: "linear" adds the same amount each day, "exponential"
+            multiplies by the same factor
+
+    Returns:
+        list: One cap per day, never decreasing
+
+    Raises:
+        ValueError: For a curve that does not exist or numbers out of range
+    """
+    if curve not in CURVES:
+        raise ValueError(f"warmup_curve must be one of {', '.join(CURVES)}")
+    if target < 1 or days < 1:
+        raise ValueError("daily_quota and warmup_days must be at least 1")
+    start = max(target // 10, 1) if start is None else start
+    if not 1 <= start <= target:
+        raise ValueError("warmup_start_quota must be between 1 and daily_quota")
+    return list(_ramp(target, days, start, curve))
+
+
+def daily_cap(sender, day):
+    """A sender row's cap on a day (None is unlimited); mirrors sender_daily_cap"""
+    ramp, start = sender.get("ramp"), sender.get("warmup_start_date")
+    if ramp and start:
+        if isinstance(start, str):
+            start = date.fromisoformat(start)
+        offset = (day - start).days
+        if offset < len(ramp):
+            return ramp[max(offset, 0)]
+    return sender.get("daily_quota")
+
+
+def utc_today():
+    return datetime.now(timezone.utc).date()
+
+
+class _Lease:
+    """Sends left of one sender's current block"""
+
+    __slots__ = ("lock", "day", "left", "exhausted_at")
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.day = None
+        self.left = 0
+        self.exhausted_at = None
+
+
+class QuotaStore:
+    """Per-sender daily quota, leased from the database in blocks"""
+
+    def __init__(self, supabase=None, block=LEASE_BLOCK, recheck=EXHAUSTED_RECHECK_SECONDS,
+                 today=utc_today, clock=time.monotonic):
+        self._supabase = supabase
+        self.block = block
+        self.recheck = recheck
+        self._today = today
+        self._clock = clock
+        self._leases = {}
+        self._lock = threading.Lock()
+        self.leases = 0
+
+    def take(self, sender_id):
+        """
+        Use one send of the sender's quota for today.
+
+        Only leasing a new block goes to the database.
+
+        Returns:
+            bool: False if the sender's cap for today is used up
+        """
+        lease = self._lease_of(sender_id)
+        with lease.lock:
+            day = self._today()
+            if lease.day != day:
+                lease.day, lease.left, lease.exhausted_at = day, 0, None
+            if not lease.left:
+                if lease.exhausted_at is not None and self._clock() - lease.exhausted_at < self.recheck:
+                    return False
+                granted = self._client().rpc("lease_quota", {
+                    "p_sender_id": sender_id, "p_day": day.isoformat(), "p_amount": self.block,
+                }).execute().data or 0
+                self.leases += 1
+                if not granted:
+                    lease.exhausted_at = self._clock()
+                    return False
+                lease.left, lease.exhausted_at = granted, None
+            lease.left -= 1
+            return True
+
+    def refund(self, sender_id):
+        """Give back one send taken today that did not go out"""
+        lease = self._lease_of(sender_id)
+        with lease.lock:
+            if lease.day == self._today():
+                lease.left += 1
+
+    def release(self):
+        """Return the unused part of every lease to the database"""
+        today = self._today()
+        for sender_id, lease in list(self._leases.items()):
+            with lease.lock:
+                left, lease.left = (lease.left, 0) if lease.day == today else (0, 0)
+            if not left:
+                continue
+            try:
+                self._client().rpc("return_quota", {
+                    "p_sender_id": sender_id, "p_day": today.isoformat(), "p_amount": left,
+                }).execute()
+            except Exception as e:
+                logger.warning(f"Returning {left} leased sends of sender {sender_id} failed: {e}")
+
+    def snapshot(self):
+        """Sends left in the current block, by sender id"""
+        return {sender_id: {"day": lease.day.isoformat() if lease.day else None, "left": lease.left,
+                            "exhausted": lease.exhausted_at is not None}
+                for sender_id, lease in list(self._leases.items())}
+
+    def _lease_of(self, sender_id):
+        lease = self._leases.get(sender_id)
+        if lease is None:
+            with self._lock:
+                lease = self._leases.setdefault(sender_id, _Lease())
+        return lease
+
+    def _client(self):
+        if self._supabase is None:
+            self._supabase = create_supabase_client()
+        return self._supabase
@@ -0,0 +1,34 @@
+"""
+Shared Redis client for the web and worker processes.
+
+Redis is optional: when REDIS_URL is not set or the redis package is not
+installed, get_redis() returns None and callers fall back to local behaviour.
+"""
+import logging
+import os
+
+try:
+    import redis
+    HAS_REDIS = True
+except ImportError:
+    HAS_REDIS = False
+
+logger = logging.getLogger(__name__)
+
+_client = None
+_client_pid = None
+
+
+def get_redis():
+    """Return a process-wide Redis client, or None if Redis is not configured"""
+    global _client, _client_pid
+
+    url = os.getenv("REDIS_URL") or os.getenv("CELERY_BROKER_URL")
+    if not HAS_REDIS or not url or not url.startswith(("redis://", "rediss://")):
+        return None
+
+    # Connections must not be shared across gunicorn's fork
+    if _client is None or _client_pid != os.getpid():
+        _client = redis.Redis.from_url(url, socket_timeout=0.5, socket_connect_timeout=0.5)
+        _client_pid = os.getpid()
+    return _client
@@ -0,0 +1,91 @@
+"""
+Match inbound replies in inbox_emails to the sends they answer.
+
+Each send stores its Message-ID, <email_id@domain>, in email_log. A reply
+names it in In-Reply-To or References, and the IMAP sync stores both
+headers. match_inbox_replies takes a batch of inbox emails that have not
+been checked yet. It reads the email_log ids out of those headers and
+looks each one up by primary key, in the single partition the UUIDv7 id
+points to. Every matched email becomes a reply event, and the events go
+into the event pipeline in one batch per round. Recording a reply sets
+the send's status to replied. The email_events trigger cancels the lead's
+pending sequence steps.
+
+Late replies to sends already moved to email_log_archive are matched too
+and linked through inbox_emails.reply_to_email_id. They are not recorded
+as events: archived sends are final and record_email_events only updates
+email_log.
+
+Usage:
+    python -m flask_app.reply_matching
+"""
+import logging
+import os
+
+from flask_app.auth import create_supabase_client
+from flask_app.dead_letters import store_dead_letters
+from flask_app.email_events import build_event
+from flask_app.event_buffer import dispatch_events
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = int(os.getenv("REPLY_MATCH_BATCH_SIZE", "500"))
+# Bound on one run; the next scheduled run continues the backlog
+MAX_BATCHES = int(os.getenv("REPLY_MATCH_MAX_BATCHES", "20"))
+
+
+def reply_event(row):
+    """The reply event of a matched match_inbox_replies row"""
+    metadata = {
+        "inbox_email_id": row["inbox_email_id"],
+        "from": row.get("sender_email"),
+        "subject": row.get("subject"),
+        "reply_content": row.get("body_preview"),
+    }
+    return build_event("reply", row["email_id"], timestamp=row.get("received_at"), metadata=metadata)
+
+
+def match_replies(batch_size=BATCH_SIZE, max_batches=MAX_BATCHES, supabase=None, dispatch=dispatch_events):
+    """
+    Match unchecked inbox emails to sends and record the replies.
+
+    Args:
+        batch_size: Inbox emails checked per database round trip
+        max_batches: Maximum number of batches in one run
+        supabase: Client to use (defaults to a new service client)
+        dispatch: Hands a batch of events to the event pipeline
+
+    Returns:
+        dict: {"checked": inbox emails checked, "matched": replies recorded,
+               "archived": replies linked to archived sends}
+    """
+    supabase = supabase or create_supabase_client()
+    checked = matched = archived = 0
+    for _ in range(max_batches):
+        rows = supabase.rpc("match_inbox_replies", {"p_limit": batch_size}).execute().data or []
+        checked += len(rows)
+        archived += sum(1 for row in rows if row.get("email_id") and row.get("archived"))
+        events = [reply_event(row) for row in rows if row.get("email_id") and not row.get("archived")]
+        if events:
+            try:
+                dispatch(events)
+            except Exception as e:
+                # The inbox emails are already marked; the dead letters keep the replies
+                logger.error(f"Recording {len(events)} matched replies failed: {e}")
+                store_dead_letters(events, e)
+            matched += len(events)
+        if len(rows) < batch_size:
+            break
+    if checked:
+        logger.info(f"Matched {matched} of {checked} inbox emails to sends, {archived} to archived sends")
+    return {"checked": checked, "matched": matched, "archived": archived}
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    result = match_replies()
+    print(f"\nReply matching summary:")
+    print(f"-----------------------")
+    print(f"Inbox emails checked: {result['checked']}")
+    print(f"Replies matched: {result['matched']}")
+    print(f"Replies to archived sends: {result['archived']}")
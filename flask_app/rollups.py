@@ -0,0 +1,149 @@
+"""
+Time series of email metrics read from the hourly and daily rollup tables.
+
+The rollups are maintained by database triggers as emails are sent and
+events are recorded, so a chart over any range reads one pre-aggregated row
+per bucket. Hourly buckets are only kept for ROLLUP_HOURLY_RETENTION_DAYS;
+older parts of an hourly range are served from the daily rollups.
+reconcile() recomputes the last ROLLUP_RECONCILE_DAYS of buckets from
+email_log and email_events to fix drift.
+"""
+import os
+import logging
+from datetime import datetime, timedelta, timezone
+from flask_app.auth import create_supabase_client
+
+logger = logging.getLogger(__name__)
+
+GRANULARITIES = {"hour": timedelta(hours=1), "day": timedelta(days=1)}
+METRIC_COLUMNS = ("sent", "opens", "clicks", "replies", "opened", "clicked", "replied")
+HOURLY_RETENTION_DAYS = int(os.getenv("ROLLUP_HOURLY_RETENTION_DAYS", "14"))
+# Upper bound on the number of buckets in one response
+MAX_BUCKETS = int(os.getenv("ROLLUP_MAX_BUCKETS", "2000"))
+# Days of buckets the periodic reconcile recomputes
+RECONCILE_DAYS = int(os.getenv("ROLLUP_RECONCILE_DAYS", "7"))
+
+
+def parse_time(value, default=None):
+    """
+    Parse an ISO 8601 date or datetime into an aware UTC datetime.
+
+    Args:
+        value: ISO string, or None to use the default
+        default: Returned when value is empty
+
+    Returns:
+        datetime: Timezone-aware datetime in UTC
+    """
+    if not value:
+        return default
+    parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.astimezone(timezone.utc)
+
+
+def truncate(moment, granularity):
+    """Truncate a UTC datetime to the start of its hour or day bucket."""
+    moment = moment.replace(minute=0, second=0, microsecond=0)
+    if granularity == "day":
+        moment = moment.replace(hour=0)
+    return moment
+
+
+def _bucket_starts(start, end, granularity, hourly_floor):
+    """Bucket starts covering [start, end), day-sized before the hourly floor."""
+    current = truncate(start, "day" if granularity == "day" or start < hourly_floor else granularity)
+    while current < end:
+        yield current
+        step = "day" if granularity == "day" or current < hourly_floor else "hour"
+        current += GRANULARITIES[step]
+
+
+def get_series(owner, start, end, granularity="day", campaign_id=None):
+    """
+    Get a zero-filled time series of email metrics for an owner.
+
+    Args:
+        owner: The owner's user ID
+        start: Range start (aware datetime, inclusive)
+        end: Range end (aware datetime, exclusive)
+        granularity: "hour" or "day"
+        campaign_id: Optional campaign filter
+
+    Returns:
+        list: One dict per bucket with bucket, granularity and METRIC_COLUMNS
+    """
+    if granularity not in GRANULARITIES:
+        raise ValueError(f"Unsupported granularity: {granularity}")
+    if end <= start:
+        raise ValueError("Range end must be after its start")
+
+    hourly_floor = truncate(datetime.now(timezone.utc) - timedelta(days=HOURLY_RETENTION_DAYS), "day")
+    buckets = list(_bucket_starts(start, end, granularity, hourly_floor))
+    if len(buckets) > MAX_BUCKETS:
+        raise ValueError(f"Range spans {len(buckets)} buckets, the maximum is {MAX_BUCKETS}")
+
+    supabase = create_supabase_client()
+    response = supabase.rpc("email_rollup_series", {
+        "p_owner": owner,
+        "p_from": start.isoformat(),
+        "p_to": end.isoformat(),
+        "p_grain": granularity,
+        "p_campaign_id": campaign_id,
+        "p_hourly_retention": f"{HOURLY_RETENTION_DAYS} days",
+    }).execute()
+
+    rows = {parse_time(row["bucket"]): row for row in response.data or []}
+    series = []
+    for bucket in buckets:
+        row = rows.get(bucket, {})
+        point = {
+            "bucket": bucket.isoformat(),
+            "granularity": "day" if granularity == "day" or bucket < hourly_floor else "hour",
+        }
+        point.update({column: row.get(column) or 0 for column in METRIC_COLUMNS})
+        series.append(point)
+    return series
+
+
+def prune_hourly():
+    """
+    Drop hourly rollups older than the retention window.
+
+    Returns:
+        int: Number of hourly rows removed
+    """
+    supabase = create_supabase_client()
+    response = supabase.rpc("prune_email_rollups_hourly", {
+        "p_keep": f"{HOURLY_RETENTION_DAYS} days",
+    }).execute()
+    removed = response.data or 0
+    logger.info(f"Pruned {removed} hourly rollup rows")
+    return removed
+
+
+def reconcile(days=RECONCILE_DAYS, owner=None):
+    """
+    Recompute recent rollup buckets from email_log and email_events.
+
+    Args:
+        days: Number of days back to recompute (all history when None)
+        owner: Only reconcile this owner (all owners when None)
+
+    Returns:
+        int: Number of hourly and daily rollup rows that had drifted
+    """
+    since = None
+    if days is not None:
+        since = (datetime.now(timezone.utc) - timedelta(days=days)).isoformat()
+    supabase = create_supabase_client()
+    response = supabase.rpc("reconcile_email_rollups", {
+        "p_since": since,
+        "p_owner": owner,
+        "p_hourly_retention": f"{HOURLY_RETENTION_DAYS} days",
+    }).execute()
+    fixed = response.data or 0
+    if fixed:
+        logger.warning(f"Reconciled {fixed} drifted rollup row(s)")
+    return fixed
@@ -1,10 +1,16 @@
+from datetime import datetime
 from flask import Blueprint, jsonify, request, current_app, g
 from pydantic import BaseModel, ValidationError
 from typing import List, Dict, Any, Optional
 from flask_app.auth import require_user, create_supabase_client, AuthError
+from flask_app.cache import cached_response, invalidate_after_write
+from flask_app.campaign_metrics import EMBED as METRICS_EMBED
+from flask_app import enrollment
+from flask_app.routes.senders import _check_email_server
 
 # Create blueprint with url_prefix
 campaigns_bp = Blueprint("campaigns", __name__, url_prefix="/campaigns")
+campaigns_bp.after_request(invalidate_after_write)
 
 
 # Pydantic models for validation
@@ -18,17 +24,25 @@ class CampaignUpdate(BaseModel):
     description: str | None = None
 
 
+class CampaignEnroll(BaseModel):
+    lead_ids: List[str] | None = None
+    all_leads: bool = False
+    start_at: datetime | None = None
+    email_server_id: str | None = None
+
+
 @campaigns_bp.route("/", methods=["GET"])
 @campaigns_bp.route("", methods=["GET"])  # Also handle without trailing slash
 @require_user
+@cached_response
 def list_campaigns():
-    """List all campaigns for the authenticated user"""
+    """List all campaigns for the authenticated user, each with its metrics"""
     try:
         # Get Supabase client
         supabase = create_supabase_client()
         
-        # Query campaigns table
-        query = supabase.table("campaigns").select("*")
+        # Query campaigns table, embedding the denormalized metrics row
+        query = supabase.table("campaigns").select(f"*, {METRICS_EMBED}")
         
         # In production, filter by owner (current user)
         # In development, don't filter by owner since RLS is disabled with service role
@@ -180,3 +194,45 @@ def delete_campaign(id: str):
             return jsonify({"error": "Campaign not found"}), 404
         current_app.logger.exception(f"Error deleting campaign {id}: {str(e)}")
         return jsonify({"error": "Failed to delete campaign"}), 500
+
+
+@campaigns_bp.route("/<uuid:id>/enroll", methods=["POST"])
+@require_user
+def enroll_leads(id: str):
+    """
+    Schedule the campaign's steps for leads
+    Body:
+        lead_ids: Leads to enroll, or all_leads: true for all of the user's leads
+        start_at: Optional ISO 8601 time the first step is due (default now)
+        email_server_id: Optional server to send through; must be one of the user's
+    Returns:
+        JSON with leads, steps, scheduled and skipped counts
+    """
+    try:
+        enroll_data = CampaignEnroll.parse_obj(request.json or {})
+        if enroll_data.lead_ids is None and not enroll_data.all_leads:
+            return jsonify({"error": "Provide lead_ids or all_leads"}), 400
+
+        if enroll_data.email_server_id is not None:
+            error = _check_email_server(create_supabase_client(), enroll_data.email_server_id)
+            if error:
+                return jsonify({"error": error}), 400
+
+        counts = enrollment.enroll(
+            id, g.user_id,
+            lead_ids=None if enroll_data.all_leads else enroll_data.lead_ids,
+            start_at=enroll_data.start_at,
+            email_server_id=enroll_data.email_server_id
+        )
+        return jsonify(counts), 200
+
+    except ValidationError as e:
+        current_app.logger.warning(f"Campaign enroll validation error: {str(e)}")
+        return jsonify({"error": e.errors()}), 400
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except enrollment.CampaignNotFound:
+        return jsonify({"error": "Campaign not found"}), 404
+    except Exception as e:
+        current_app.logger.exception(f"Error enrolling leads in campaign {id}: {str(e)}")
+        return jsonify({"error": "Failed to enroll leads"}), 500
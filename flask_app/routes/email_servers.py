@@ -1,10 +1,24 @@
 
 from flask import Blueprint, jsonify, request, current_app, g
 from flask_app.auth import require_user, create_supabase_client
+from flask_app.smtp_pool import smtp_pools
+from flask_app import send_engine
+from flask_app.sender_pool import merge_health
 
 # Create blueprint with url_prefix
 email_servers_bp = Blueprint("email_servers", __name__, url_prefix="/email-servers")
 
+# Bounds of the per-server SMTP connection limit
+MAX_CONNECTIONS_RANGE = (1, 50)
+
+
+def _invalid_max_connections(value):
+    """Error message for a bad max_connections value, or None"""
+    low, high = MAX_CONNECTIONS_RANGE
+    if value is None or (isinstance(value, int) and not isinstance(value, bool) and low <= value <= high):
+        return None
+    return f"max_connections must be an integer between {low} and {high}"
+
 
 @email_servers_bp.route("/", methods=["GET"])
 @email_servers_bp.route("", methods=["GET"])
@@ -24,6 +38,31 @@ def get_email_servers():
         return jsonify({"error": "Failed to retrieve email servers"}), 500
 
 
+@email_servers_bp.route("/utilization", methods=["GET"])
+@require_user
+def get_email_server_utilization():
+    """
+    Per-server sends against daily quota, pinned lead threads, and the
+    health and latency the running send engines see
+    """
+    try:
+        days = request.args.get("days", default=7, type=int)
+        if not 1 <= days <= 90:
+            return jsonify({"error": "days must be between 1 and 90"}), 400
+        
+        supabase = create_supabase_client()
+        response = supabase.rpc("email_server_utilization", {"p_owner": g.user_id, "p_days": days}).execute()
+        
+        health = merge_health(send_engine.published_stats())
+        servers = [dict(row, health=health.get(row["id"])) for row in response.data or []]
+        
+        return jsonify({"days": days, "servers": servers}), 200
+        
+    except Exception as e:
+        current_app.logger.exception(f"Error retrieving email server utilization: {str(e)}")
+        return jsonify({"error": "Failed to retrieve email server utilization"}), 500
+
+
 @email_servers_bp.route("/", methods=["POST"])
 @email_servers_bp.route("", methods=["POST"])
 @require_user
@@ -41,6 +80,10 @@ def create_email_server():
             if not data.get(field):
                 return jsonify({"error": f"Missing required field: {field}"}), 400
         
+        error = _invalid_max_connections(data.get("max_connections"))
+        if error:
+            return jsonify({"error": error}), 400
+        
         supabase = create_supabase_client()
         
         # If this is set as default, unset all other defaults first
@@ -57,7 +100,8 @@ def create_email_server():
             "smtp_port": data.get("smtp_port", 587),
             "use_ssl": data.get("use_ssl", True),
             "use_tls": data.get("use_tls", True),
-            "is_default": data.get("is_default", False)
+            "is_default": data.get("is_default", False),
+            "max_connections": data.get("max_connections", 3)
         }
         
         response = supabase.table("email_servers").insert(server_data).execute()
@@ -79,6 +123,10 @@ def update_email_server(server_id):
         if not data:
             return jsonify({"error": "No data provided"}), 400
         
+        error = _invalid_max_connections(data.get("max_connections"))
+        if error:
+            return jsonify({"error": error}), 400
+        
         supabase = create_supabase_client()
         
         # Check if server exists and belongs to user
@@ -100,7 +148,8 @@ def update_email_server(server_id):
             "smtp_port": data.get("smtp_port", 587),
             "use_ssl": data.get("use_ssl", True),
             "use_tls": data.get("use_tls", True),
-            "is_default": data.get("is_default", False)
+            "is_default": data.get("is_default", False),
+            "max_connections": data.get("max_connections")
         }
         
         # Remove None values
@@ -130,6 +179,7 @@ def delete_email_server(server_id):
         
         # Delete the server
         supabase.table("email_servers").delete().eq("id", server_id).eq("owner", g.user_id).execute()
+        smtp_pools.discard(server_id)
         
         return jsonify({"message": "Email server deleted successfully"}), 200
         
@@ -5,13 +5,17 @@ This module contains routes for handling webhook callbacks from email service pr
 that notify about email events such as opens, clicks, and replies.
 """
 import logging
+import os
+import threading
+import time
 from flask import Blueprint, request, jsonify, current_app
 # Try to import celery tasks, but make it optional for deployment
 try:
     from flask_app.celery_tasks import (
         process_email_open_event,
         process_email_click_event,
-        process_email_reply_event
+        process_email_reply_event,
+        enqueue_events
     )
     CELERY_AVAILABLE = True
 except ImportError:
@@ -19,6 +23,12 @@ except ImportError:
     process_email_open_event = None
     process_email_click_event = None
     process_email_reply_event = None
+    enqueue_events = None
+from flask_app.email_events import build_event, EVENT_TYPES
+from flask_app.event_buffer import EventBuffer, dispatch_events
+from flask_app.admission import AdmissionController, ACCEPT, SPILL, SHED
+from flask_app.auth import require_user
+from flask_app.dead_letters import replay_dead_letters
 
 # Create blueprint
 email_webhooks_bp = Blueprint("email_webhooks", __name__, url_prefix="/webhooks/email")
@@ -26,21 +36,109 @@ email_webhooks_bp = Blueprint("email_webhooks", __name__, url_prefix="/webhooks/
 # Configure logging
 logger = logging.getLogger(__name__)
 
+
+# Spill files of all workers, including recycled and dead ones, are replayed
+# on this timer while admission accepts, not only when the state recovers
+SPILL_DRAIN_INTERVAL = float(os.getenv("WEBHOOK_SPILL_DRAIN_INTERVAL", 30))
+_drain_timer_pid = None
+_drain_timer_lock = threading.Lock()
+
+
+def _replay_spill():
+    """Replay every spill file not claimed by another drain"""
+    try:
+        replayed = admission.spill_store.drain(dispatch_events)
+        if replayed:
+            logger.info(f"Replayed {replayed} spilled events")
+    except Exception as e:
+        logger.error(f"Replaying spilled events failed, will retry: {str(e)}")
+
+
+def _drain_spill():
+    """Replay spilled events in the background once the queues have recovered"""
+    threading.Thread(target=_replay_spill, name="spill-drain", daemon=True).start()
+
+
+def _drain_periodically():
+    while True:
+        time.sleep(SPILL_DRAIN_INTERVAL)
+        try:
+            if admission.state() == ACCEPT and admission.spill_store.pending():
+                _replay_spill()
+        except Exception as e:
+            logger.error(f"Spill drain timer failed: {str(e)}")
+
+
+# Admission control based on broker queue depth and worker lag
+admission = AdmissionController.from_env(on_recover=_drain_spill)
+
+# Events admitted while spilling are written to disk in batches
+spill_buffer = EventBuffer(flush=admission.spill_store.write_batch)
+
+
+@email_webhooks_bp.before_request
+def _start_drain_timer():
+    """Start this worker's drain timer; threads do not survive the fork of a preloaded app"""
+    global _drain_timer_pid
+    if _drain_timer_pid == os.getpid():
+        return
+    with _drain_timer_lock:
+        if _drain_timer_pid != os.getpid():
+            threading.Thread(target=_drain_periodically, name="spill-drain-timer", daemon=True).start()
+            _drain_timer_pid = os.getpid()
+
+
+def _event_from_payload(event_data):
+    """Build an email_events row from a webhook payload, or None if invalid"""
+    if not isinstance(event_data, dict):
+        return None
+    event_type = event_data.get("event")
+    email_id = event_data.get("email_id")
+    if event_type not in EVENT_TYPES or not email_id:
+        return None
+    metadata = event_data.get("metadata")
+    if event_type == "reply" and event_data.get("content") is not None:
+        metadata = {**(metadata or {}), "reply_content": event_data.get("content")}
+    return build_event(
+        event_type,
+        email_id,
+        url=event_data.get("url"),
+        timestamp=event_data.get("timestamp"),
+        metadata=metadata
+    )
+
+
+def _shed_response():
+    """429 telling the provider to retry later"""
+    response = jsonify({"error": "Too many events, retry later", "state": SHED})
+    response.status_code = 429
+    response.headers["Retry-After"] = str(admission.retry_after)
+    return response
+
 @email_webhooks_bp.route("/event", methods=["POST"])
 def handle_email_event():
     """
     Handle incoming email event webhooks.
     
     This endpoint receives webhook notifications from email service providers
-    about email events such as opens, clicks, and replies.
+    about email events such as opens, clicks, and replies. Providers that
+    batch their webhooks may post a JSON array of events instead.
     """
     try:
+        # Shed load before doing any work when workers are far behind
+        state = admission.state()
+        if state == SHED:
+            return _shed_response()
+        
         # Get event data from request
         event_data = request.json
         
         if not event_data:
             return jsonify({"error": "No event data provided"}), 400
             
+        if isinstance(event_data, list):
+            return handle_email_event_batch(event_data, state)
+            
         # Extract event type and email ID
         event_type = event_data.get("event")
         email_id = event_data.get("email_id")
@@ -48,6 +146,13 @@ def handle_email_event():
         if not event_type or not email_id:
             return jsonify({"error": "Missing required fields: event_type or email_id"}), 400
             
+        if state == SPILL:
+            event = _event_from_payload(event_data)
+            if event is None:
+                return jsonify({"error": f"Unhandled event type: {event_type}"}), 400
+            spill_buffer.add(event)
+            return jsonify({"status": "success", "message": f"Event {event_type} for email {email_id} accepted for delayed processing"}), 202
+            
         # Process event based on type
         if CELERY_AVAILABLE:
             # Process events asynchronously with Celery
@@ -85,3 +190,55 @@ def handle_email_event():
     except Exception as e:
         logger.exception(f"Error processing email event webhook: {str(e)}")
         return jsonify({"error": "Internal server error"}), 500
+
+
+def handle_email_event_batch(events_data, state=None):
+    """
+    Queue a batch of webhook events as chunked batch tasks.
+
+    Invalid entries are skipped and reported; valid ones are grouped per
+    event type and queued with one task per chunk, or spilled to disk when
+    admission control is in the spill state.
+    """
+    events = []
+    rejected = 0
+    for event_data in events_data:
+        event = _event_from_payload(event_data)
+        if event is None:
+            rejected += 1
+            continue
+        events.append(event)
+
+    if not events:
+        return jsonify({"error": "No valid events provided", "rejected": rejected}), 400
+
+    if state == SPILL:
+        for event in events:
+            spill_buffer.add(event)
+        return jsonify({"status": "success", "spilled": len(events), "rejected": rejected}), 202
+
+    if CELERY_AVAILABLE:
+        enqueue_events(events)
+    else:
+        logger.info(f"Received batch of {len(events)} events (Celery not available - not processed)")
+
+    return jsonify({"status": "success", "queued": len(events), "rejected": rejected}), 202
+
+
+@email_webhooks_bp.route("/admission", methods=["GET"])
+def get_admission_status():
+    """Report the webhook admission state, queue depth and worker lag"""
+    return jsonify(admission.status()), 200
+
+
+@email_webhooks_bp.route("/dead-letters/replay", methods=["POST"])
+@require_user
+def replay_email_event_dead_letters():
+    """Replay due dead-lettered events in bulk batches"""
+    try:
+        data = request.get_json(silent=True) or {}
+        result = replay_dead_letters(max_batches=data.get("max_batches"))
+        return jsonify(result), 200
+    except Exception as e:
+        current_app.logger.exception(f"Error replaying dead letters: {str(e)}")
+        return jsonify({"error": "Failed to replay dead letters"}), 500
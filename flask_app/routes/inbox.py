@@ -0,0 +1,164 @@
+from datetime import datetime
+from flask import Blueprint, current_app, g, jsonify, request
+from pydantic import BaseModel, Field, ValidationError
+from flask_app.auth import require_user
+from flask_app import inbox
+
+# Create blueprint with url_prefix
+inbox_bp = Blueprint('inbox', __name__, url_prefix='/inbox')
+
+
+# Pydantic models for validation
+class MarkRead(BaseModel):
+    is_read: bool = True
+    ids: list[str] | None = Field(None, max_length=inbox.MAX_MARK_IDS)
+    email_server_id: str | None = None
+    thread_key: str | None = None
+    before: datetime | None = None
+    all: bool = False
+
+
+def _unread_only():
+    return request.args.get('unread', 'false').lower() in ('1', 'true', 'yes')
+
+
+@inbox_bp.route('/', methods=['GET'])
+@inbox_bp.route('', methods=['GET'])  # Also handle without trailing slash
+@require_user
+def list_emails():
+    """
+    One page of inbox emails, newest first
+    Query params:
+        cursor: Cursor from the previous page (omit for the first page)
+        limit: Maximum number of emails (default 50, max 200)
+        unread: Only unread emails (true/false)
+        email_server_id: Only emails of this mailbox
+    Returns:
+        JSON with emails (without full_body), the next cursor and has_more
+    """
+    try:
+        page = inbox.list_emails(
+            g.user_id,
+            cursor=request.args.get('cursor'),
+            limit=request.args.get('limit', inbox.DEFAULT_LIMIT, type=int),
+            unread_only=_unread_only(),
+            email_server_id=request.args.get('email_server_id')
+        )
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        current_app.logger.exception(f"Error listing inbox emails: {str(e)}")
+        return jsonify({"error": "Failed to retrieve inbox"}), 500
+
+    return jsonify(page)
+
+
+@inbox_bp.route('/threads', methods=['GET'])
+@require_user
+def list_threads():
+    """
+    One page of conversations, most recently active first
+    Query params:
+        cursor, limit, unread: As for /inbox/
+    Returns:
+        JSON with threads, the next cursor and has_more
+    """
+    try:
+        page = inbox.list_threads(
+            g.user_id,
+            cursor=request.args.get('cursor'),
+            limit=request.args.get('limit', inbox.DEFAULT_LIMIT, type=int),
+            unread_only=_unread_only()
+        )
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        current_app.logger.exception(f"Error listing inbox threads: {str(e)}")
+        return jsonify({"error": "Failed to retrieve threads"}), 500
+
+    return jsonify(page)
+
+
+@inbox_bp.route('/thread', methods=['GET'])
+@require_user
+def get_thread():
+    """
+    The emails of one conversation, oldest first
+    Query params:
+        key: The thread_key of the conversation
+    """
+    thread_key = request.args.get('key')
+    if not thread_key:
+        return jsonify({"error": "key is required"}), 400
+    try:
+        emails = inbox.thread_messages(g.user_id, thread_key)
+    except Exception as e:
+        current_app.logger.exception(f"Error retrieving inbox thread: {str(e)}")
+        return jsonify({"error": "Failed to retrieve thread"}), 500
+
+    if not emails:
+        return jsonify({"error": "Thread not found"}), 404
+    return jsonify({"thread_key": thread_key, "emails": emails})
+
+
+@inbox_bp.route('/unread', methods=['GET'])
+@require_user
+def get_counters():
+    """Total and unread emails, overall and per mailbox, from the maintained counters"""
+    try:
+        return jsonify(inbox.counters(g.user_id))
+    except Exception as e:
+        current_app.logger.exception(f"Error retrieving inbox counters: {str(e)}")
+        return jsonify({"error": "Failed to retrieve inbox counters"}), 500
+
+
+@inbox_bp.route('/mark-read', methods=['POST'])
+@require_user
+def mark_read():
+    """
+    Mark a selection of emails read or unread in one statement
+    Body:
+        is_read: The state to set (default true)
+        ids, email_server_id, thread_key, before: Selectors; they combine
+        all: Set instead of selectors to mark the whole inbox
+    Returns:
+        JSON with the number of emails changed
+    """
+    try:
+        data = MarkRead.parse_obj(request.json or {})
+        changed = inbox.mark_read(
+            g.user_id,
+            is_read=data.is_read,
+            ids=data.ids,
+            email_server_id=data.email_server_id,
+            thread_key=data.thread_key,
+            before=data.before,
+            everything=data.all
+        )
+    except ValidationError as e:
+        current_app.logger.warning(f"Mark-read validation error: {str(e)}")
+        return jsonify({"error": e.errors()}), 400
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        current_app.logger.exception(f"Error marking inbox emails: {str(e)}")
+        return jsonify({"error": "Failed to update emails"}), 500
+
+    return jsonify({"changed": changed})
+
+
+@inbox_bp.route('/<email_id>', methods=['GET'])
+@require_user
+def get_email(email_id):
+    """One inbox email with its full body and attachments"""
+    try:
+        email = inbox.get_email(g.user_id, email_id)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        current_app.logger.exception(f"Error retrieving inbox email {email_id}: {str(e)}")
+        return jsonify({"error": "Failed to retrieve email"}), 500
+
+    if email is None:
+        return jsonify({"error": "Email not found"}), 404
+    return jsonify(email)
@@ -1,19 +1,24 @@
 from flask import Blueprint, jsonify, request, current_app, g
 from flask_app.auth import require_user, create_supabase_client
+from flask_app.cache import invalidate_after_write
 
 # Create blueprint with url_prefix
 leads_bp = Blueprint("leads", __name__, url_prefix="/leads")
+leads_bp.after_request(invalidate_after_write)
 
 
 @leads_bp.route("/", methods=["GET"])
 @leads_bp.route("", methods=["GET"])  # Also handle without trailing slash
 @require_user
 def list_leads():
-    """List leads with pagination support"""
+    """List leads with pagination support, newest first or by engagement score (sort=score)"""
     try:
         # Get pagination parameters
         page = request.args.get("page", default=1, type=int)
         size = request.args.get("size", default=50, type=int)
+        sort = request.args.get("sort", default="created_at")
+        if sort not in ("created_at", "score"):
+            return jsonify({"error": "sort must be created_at or score"}), 400
         
         # Ensure valid pagination values
         if page < 1:
@@ -34,7 +39,13 @@ def list_leads():
         total = count_response.count if count_response.count is not None else 0
         
         # Get paginated leads
-        leads_response = supabase.table("leads").select("*").eq("owner", user_id).order("created_at", desc=True).range(offset, offset + size - 1).execute()
+        query = supabase.table("leads").select("*").eq("owner", user_id)
+        if sort == "score":
+            # Served by the (owner, engagement_score DESC, id) index
+            query = query.order("engagement_score", desc=True).order("id")
+        else:
+            query = query.order("created_at", desc=True)
+        leads_response = query.range(offset, offset + size - 1).execute()
         
         leads = leads_response.data if leads_response.data else []
         
@@ -0,0 +1,29 @@
+from flask import Blueprint, Response, g, jsonify
+from flask_app.auth import require_user
+from flask_app.live_events import broadcaster
+
+# Create blueprint with url_prefix
+live_bp = Blueprint('live', __name__, url_prefix='/live')
+
+@live_bp.route('/stream', methods=['GET'])
+@require_user
+def stream():
+    """
+    Server-Sent Events stream of the current user's live updates
+    Events:
+        emails: Email status changes ({"emails": [{email_id, campaign_id, status}]})
+        stats: The refreshed /stats/overview payload
+    """
+    response = Response(broadcaster.stream(g.user_id), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    # Stop reverse proxies from buffering the stream
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+@live_bp.route('/clients', methods=['GET'])
+@require_user
+def clients():
+    """
+    Number of live streams connected to this worker process
+    """
+    return jsonify({"clients": broadcaster.client_count()})
@@ -1,20 +1,92 @@
+from datetime import date
+from typing import Literal
 from flask import Blueprint, jsonify, request, current_app, g
+from pydantic import BaseModel, Field, ValidationError
 from flask_app.auth import require_user, create_supabase_client
+from flask_app import quota
 
 # Create blueprint with url_prefix
 senders_bp = Blueprint("senders", __name__, url_prefix="/senders")
 
+# Fields the warm-up ramp is computed from
+RAMP_FIELDS = ("daily_quota", "warmup_days", "warmup_start_quota", "warmup_curve", "warmup_start_date")
+
+
+# Pydantic models for validation
+class SenderCreate(BaseModel):
+    email: str
+    display_name: str | None = None
+    email_server_id: str | None = None
+    daily_quota: int | None = Field(None, ge=1)
+    warmup_days: int | None = Field(None, ge=1, le=365)
+    warmup_start_quota: int | None = Field(None, ge=1)
+    warmup_curve: Literal["linear", "exponential"] | None = None
+    warmup_start_date: date | None = None
+
+
+class SenderUpdate(BaseModel):
+    email: str | None = None
+    display_name: str | None = None
+    email_server_id: str | None = None
+    daily_quota: int | None = Field(None, ge=1)
+    warmup_days: int | None = Field(None, ge=1, le=365)
+    warmup_start_quota: int | None = Field(None, ge=1)
+    warmup_curve: Literal["linear", "exponential"] | None = None
+    warmup_start_date: date | None = None
+
+
+def _with_ramp(fields):
+    """
+    Add the precomputed warm-up ramp to sender fields.
+
+    Raises:
+        ValueError: If a warm-up is asked for without a daily_quota, or its numbers do not fit
+    """
+    if not fields.get("warmup_days"):
+        fields.update(warmup_days=None, warmup_start_quota=None, warmup_curve=None,
+                      warmup_start_date=None, ramp=None)
+        return fields
+    if not fields.get("daily_quota"):
+        raise ValueError("A warm-up needs a daily_quota to ramp up to")
+    fields["warmup_curve"] = fields.get("warmup_curve") or "linear"
+    fields["ramp"] = quota.ramp_schedule(fields["daily_quota"], fields["warmup_days"],
+                                         fields.get("warmup_start_quota"), fields["warmup_curve"])
+    fields["warmup_start_quota"] = fields["ramp"][0]
+    start = fields.get("warmup_start_date") or quota.utc_today()
+    fields["warmup_start_date"] = start.isoformat() if isinstance(start, date) else start
+    return fields
+
+
+def _check_email_server(supabase, email_server_id):
+    """Error message if the email server is not the user's, else None"""
+    if email_server_id is None:
+        return None
+    response = supabase.table("email_servers").select("id") \
+        .eq("id", email_server_id).eq("owner", g.user_id).execute()
+    return None if response.data else "Email server not found"
+
+
+def _with_cap(sender):
+    """A sender row with its cap for today"""
+    return dict(sender, cap_today=quota.daily_cap(sender, quota.utc_today()))
+
 
 @senders_bp.route("/", methods=["GET"])
 @senders_bp.route("", methods=["GET"])  # Also handle without trailing slash
 @require_user
 def list_senders():
-    """List all senders for the authenticated user"""
+    """List all senders for the authenticated user, each with today's cap"""
     try:
-        # In a real implementation, this would query the database
-        # For now, return an empty array with 200 status code
-        return jsonify([]), 200
-        
+        supabase = create_supabase_client()
+
+        response = supabase.table("senders") \
+            .select("*") \
+            .eq("owner", g.user_id) \
+            .order("email") \
+            .execute()
+
+        return jsonify([_with_cap(sender) for sender in response.data or []]), 200
+
     except Exception as e:
         current_app.logger.exception(f"Error listing senders: {str(e)}")
         return jsonify({"error": "Failed to retrieve senders"}), 500
@@ -24,26 +96,151 @@ def list_senders():
 @senders_bp.route("", methods=["POST"])  # Also handle without trailing slash
 @require_user
 def create_sender():
-    """Create a new sender - Not implemented yet"""
-    return jsonify({"error": "Not implemented"}), 501
+    """
+    Create a new sender
+    Body:
+        email, display_name, email_server_id: The mailbox and the server it sends through
+        daily_quota: Sends per day after warm-up (omit for unlimited)
+        warmup_days, warmup_start_quota, warmup_curve, warmup_start_date: Optional warm-up ramp
+    """
+    try:
+        sender_data = SenderCreate.parse_obj(request.json)
+        insert_data = _with_ramp(sender_data.dict())
+        insert_data["owner"] = g.user_id
+
+        supabase = create_supabase_client()
+
+        error = _check_email_server(supabase, insert_data["email_server_id"])
+        if error:
+            return jsonify({"error": error}), 400
+
+        response = supabase.table("senders").insert(insert_data).execute()
+
+        if response and response.data and len(response.data) > 0:
+            return jsonify(_with_cap(response.data[0])), 201
+        else:
+            raise Exception("No data returned from insert operation")
+
+    except ValidationError as e:
+        current_app.logger.warning(f"Sender validation error: {str(e)}")
+        return jsonify({"error": e.errors()}), 400
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        if "duplicate key" in str(e):
+            return jsonify({"error": "That email server already has a sender"}), 409
+        current_app.logger.exception(f"Error creating sender: {str(e)}")
+        return jsonify({"error": "Failed to create sender"}), 500
 
 
 @senders_bp.route("/<uuid:id>", methods=["GET"])
 @require_user
 def get_sender(id: str):
-    """Get a specific sender by ID - Not implemented yet"""
-    return jsonify({"error": "Not implemented"}), 501
+    """Get a specific sender by ID, with today's cap and the sends leased against it"""
+    try:
+        supabase = create_supabase_client()
+
+        response = supabase.table("senders") \
+            .select("*") \
+            .eq("id", str(id)) \
+            .eq("owner", g.user_id) \
+            .execute()
+
+        if not response.data:
+            return jsonify({"error": "Sender not found"}), 404
+
+        today = quota.utc_today()
+        usage = supabase.table("sender_quota_usage") \
+            .select("leased") \
+            .eq("sender_id", str(id)) \
+            .eq("day", today.isoformat()) \
+            .execute()
+
+        sender = _with_cap(response.data[0])
+        sender["quota_today"] = {
+            "day": today.isoformat(),
+            "cap": sender["cap_today"],
+            "leased": usage.data[0]["leased"] if usage.data else 0,
+        }
+        return jsonify(sender), 200
+
+    except Exception as e:
+        current_app.logger.exception(f"Error retrieving sender {id}: {str(e)}")
+        return jsonify({"error": "Failed to retrieve sender"}), 500
 
 
 @senders_bp.route("/<uuid:id>", methods=["PATCH"])
 @require_user
 def update_sender(id: str):
-    """Update a specific sender by ID - Not implemented yet"""
-    return jsonify({"error": "Not implemented"}), 501
+    """Update a specific sender by ID; the ramp is recomputed when its inputs change"""
+    try:
+        update_data = SenderUpdate.parse_obj(request.json)
+        update_fields = update_data.dict(exclude_unset=True)
+
+        if not update_fields:
+            return jsonify({"error": "No fields to update"}), 400
+
+        supabase = create_supabase_client()
+
+        existing = supabase.table("senders") \
+            .select("*") \
+            .eq("id", str(id)) \
+            .eq("owner", g.user_id) \
+            .execute()
+
+        if not existing.data:
+            return jsonify({"error": "Sender not found"}), 404
+
+        if any(field in update_fields for field in RAMP_FIELDS):
+            merged = {field: existing.data[0].get(field) for field in RAMP_FIELDS}
+            merged.update({field: update_fields[field] for field in RAMP_FIELDS if field in update_fields})
+            if "warmup_days" in update_fields or "warmup_start_quota" in update_fields:
+                merged["warmup_start_quota"] = update_fields.get("warmup_start_quota")
+            update_fields.update(_with_ramp(merged))
+
+        if "email_server_id" in update_fields:
+            error = _check_email_server(supabase, update_fields["email_server_id"])
+            if error:
+                return jsonify({"error": error}), 400
+
+        response = supabase.table("senders") \
+            .update(update_fields) \
+            .eq("id", str(id)) \
+            .eq("owner", g.user_id) \
+            .execute()
+
+        return jsonify(_with_cap(response.data[0])), 200
+
+    except ValidationError as e:
+        current_app.logger.warning(f"Sender update validation error: {str(e)}")
+        return jsonify({"error": e.errors()}), 400
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        if "duplicate key" in str(e):
+            return jsonify({"error": "That email server already has a sender"}), 409
+        current_app.logger.exception(f"Error updating sender {id}: {str(e)}")
+        return jsonify({"error": "Failed to update sender"}), 500
 
 
 @senders_bp.route("/<uuid:id>", methods=["DELETE"])
 @require_user
 def delete_sender(id: str):
-    """Delete a specific sender by ID - Not implemented yet"""
-    return jsonify({"error": "Not implemented"}), 501
+    """Delete a specific sender by ID"""
+    try:
+        supabase = create_supabase_client()
+
+        response = supabase.table("senders") \
+            .delete() \
+            .eq("id", str(id)) \
+            .eq("owner", g.user_id) \
+            .execute()
+
+        if not response.data:
+            return jsonify({"error": "Sender not found"}), 404
+
+        return "", 204
+
+    except Exception as e:
+        current_app.logger.exception(f"Error deleting sender {id}: {str(e)}")
+        return jsonify({"error": "Failed to delete sender"}), 500
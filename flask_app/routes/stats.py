@@ -1,32 +1,117 @@
-from flask import Blueprint, jsonify
+from datetime import datetime, timedelta, timezone
+from flask import Blueprint, jsonify, current_app, g, request
 from flask_app.auth import require_user
-from datetime import datetime, timedelta
-import random
+from flask_app import stats_engine, rollups, analytics, send_engine
+from flask_app.cache import cached_response, response_cache
 
 # Create blueprint with url_prefix
 stats_bp = Blueprint('stats', __name__, url_prefix='/stats')
 
 @stats_bp.route('/overview/', methods=['GET'])
 @require_user
+@cached_response
 def get_overview():
     """
     Get overview statistics for the dashboard
     Returns:
         JSON with statistics data
     """
-    # Mock data - replace with actual database queries
-    stats = {
-        'leads': random.randint(100, 1000),
-        'campaigns': random.randint(1, 50),
-        'open_rate': round(random.uniform(0.1, 0.5), 2),
-        'reply_rate': round(random.uniform(0.01, 0.2), 2),
-        'opens': random.randint(500, 5000),
-        'replies': random.randint(10, 200),
-        'active_campaigns': random.randint(1, 10),
-        'delivery_rate': round(random.uniform(0.85, 0.99), 2),
-    }
-    
-    return jsonify(stats)
+    try:
+        # Single-row read of the incrementally maintained counters
+        stats = stats_engine.get_overview(g.user_id)
+        return jsonify(stats)
+
+    except Exception as e:
+        current_app.logger.exception(f"Error retrieving stats overview: {str(e)}")
+        return jsonify({"error": "Failed to retrieve statistics"}), 500
+
+@stats_bp.route('/series', methods=['GET'])
+@require_user
+@cached_response
+def get_series():
+    """
+    Get a time series of sends, opens, clicks and replies
+    Query params:
+        from, to: ISO 8601 range (defaults to the last 30 days)
+        granularity: hour or day (default day)
+        campaign_id: Optional campaign filter
+    Returns:
+        JSON with one point per bucket
+    """
+    try:
+        end = rollups.parse_time(request.args.get('to'), datetime.now(timezone.utc))
+        start = rollups.parse_time(request.args.get('from'), end - timedelta(days=30))
+        granularity = request.args.get('granularity', 'day')
+        series = rollups.get_series(
+            g.user_id, start, end,
+            granularity=granularity,
+            campaign_id=request.args.get('campaign_id')
+        )
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        current_app.logger.exception(f"Error retrieving stats series: {str(e)}")
+        return jsonify({"error": "Failed to retrieve statistics"}), 500
+
+    return jsonify({
+        "from": start.isoformat(),
+        "to": end.isoformat(),
+        "granularity": granularity,
+        "series": series
+    })
+
+@stats_bp.route('/variants', methods=['GET'])
+@require_user
+@cached_response
+def get_variants():
+    """
+    Compare step variants: funnels, confidence intervals and win probabilities
+    Query params:
+        campaign_id: Optional campaign filter
+        metric: opened, clicked or replied (default replied)
+        confidence: Confidence level of the intervals (default 0.95)
+    Returns:
+        JSON with one entry per variant
+    """
+    metric = request.args.get('metric', 'replied')
+    try:
+        confidence = float(request.args.get('confidence', 0.95))
+        variants = analytics.variant_report(
+            g.user_id,
+            campaign_id=request.args.get('campaign_id'),
+            metric=metric,
+            confidence=confidence
+        )
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        current_app.logger.exception(f"Error computing variant statistics: {str(e)}")
+        return jsonify({"error": "Failed to compute variant statistics"}), 500
+
+    return jsonify({"metric": metric, "confidence": confidence, "variants": variants})
+
+@stats_bp.route('/cache', methods=['GET'])
+@require_user
+def get_cache_stats():
+    """
+    Response cache counters and hit rate for this worker process
+    """
+    return jsonify(response_cache.stats())
+
+@stats_bp.route('/send-engine', methods=['GET'])
+@require_user
+def get_send_engine_stats():
+    """
+    Send queue depth and lag, and the latest stats of every running send engine
+    """
+    try:
+        return jsonify({
+            "queue": send_engine.queue_status(),
+            "engines": send_engine.published_stats()
+        })
+    except Exception as e:
+        current_app.logger.exception(f"Error retrieving send engine stats: {str(e)}")
+        return jsonify({"error": "Failed to retrieve send engine statistics"}), 500
 
 @stats_bp.route('/debug/', methods=['GET'])
 def get_debug_stats():
@@ -42,5 +127,5 @@ def get_debug_stats():
         'open_rate': 0.25,
         'reply_rate': 0.12
     }
-    
+
     return jsonify(stats)
@@ -0,0 +1,37 @@
+from flask import Blueprint, current_app, g, jsonify, request
+from flask_app.auth import require_user
+from flask_app import sync
+
+# Create blueprint with url_prefix
+sync_bp = Blueprint('sync', __name__, url_prefix='/sync')
+
+@sync_bp.route('/<resource>', methods=['GET'])
+@require_user
+def get_changes(resource):
+    """
+    Rows of a resource created, updated or deleted since a cursor
+    Path:
+        resource: leads, campaigns or templates
+    Query params:
+        since: Cursor from the previous response (omit for a full load)
+        limit: Maximum number of changes (default 500, max 1000)
+    Returns:
+        JSON with upserts (full rows), deleted (ids), the next cursor and has_more.
+        410 if the cursor is too old to be caught up; refetch the full list.
+    """
+    try:
+        changes = sync.get_changes(
+            resource,
+            g.user_id,
+            cursor=request.args.get('since'),
+            limit=request.args.get('limit', sync.DEFAULT_LIMIT, type=int)
+        )
+    except sync.CursorExpired as e:
+        return jsonify({"error": str(e)}), 410
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        current_app.logger.exception(f"Error syncing {resource}: {str(e)}")
+        return jsonify({"error": "Failed to retrieve changes"}), 500
+
+    return jsonify(changes)
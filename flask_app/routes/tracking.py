@@ -0,0 +1,78 @@
+"""
+Open-pixel and click-redirect tracking endpoints.
+
+These are the highest-volume endpoints of the platform, so they do no
+database I/O at all: the signed token carries the email id and target URL,
+and the event is buffered after the response has been sent.
+"""
+import base64
+import logging
+from flask import Blueprint, Response, request, redirect
+from flask_app.tracking import parse_token, InvalidToken, TrackingNotConfigured
+from flask_app.email_events import build_event
+from flask_app.event_buffer import EventBuffer
+
+# Create blueprint with url_prefix
+tracking_bp = Blueprint("tracking", __name__, url_prefix="/t")
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Transparent 1x1 GIF
+PIXEL_GIF = base64.b64decode("R0lGODlhAQABAIAAAAAAAP///yH5BAEAAAAALAAAAAABAAEAAAIBRAA7")
+
+# Events are handed to the pipeline in batches by a background thread
+event_buffer = EventBuffer()
+
+
+def _record_after_response(response, event_type, email_id, url=None):
+    """Queue the event once the response has been sent to the client"""
+    event = build_event(
+        event_type,
+        email_id,
+        url=url,
+        metadata={
+            "user_agent": request.headers.get("User-Agent"),
+            "ip": request.headers.get("X-Forwarded-For", request.remote_addr),
+        }
+    )
+    response.call_on_close(lambda: event_buffer.add(event))
+    return response
+
+
+@tracking_bp.route("/o/<token>.gif", methods=["GET"])
+def open_pixel(token: str):
+    """Serve the open pixel and record an open event"""
+    response = Response(PIXEL_GIF, mimetype="image/gif")
+    response.headers["Cache-Control"] = "no-store, no-cache, must-revalidate, max-age=0"
+
+    try:
+        email_id, _ = parse_token(token)
+    except InvalidToken:
+        # Always serve the image; just don't record anything
+        return response
+    except TrackingNotConfigured as e:
+        logger.error(f"Open not recorded: {str(e)}")
+        return response
+
+    return _record_after_response(response, "open", email_id)
+
+
+@tracking_bp.route("/c/<token>", methods=["GET"])
+def click_redirect(token: str):
+    """Redirect to the signed target URL and record a click event"""
+    try:
+        email_id, url = parse_token(token)
+    except InvalidToken:
+        return Response("Invalid link", status=404, mimetype="text/plain")
+    except TrackingNotConfigured as e:
+        # Without the secret the target cannot be verified; never redirect blindly
+        logger.error(f"Click not recorded: {str(e)}")
+        return Response("Invalid link", status=404, mimetype="text/plain")
+
+    if not url:
+        return Response("Invalid link", status=404, mimetype="text/plain")
+
+    response = redirect(url, code=302)
+    response.headers["Cache-Control"] = "no-store"
+    return _record_after_response(response, "click", email_id, url=url)
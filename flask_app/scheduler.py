@@ -0,0 +1,253 @@
+"""
+Sequence step scheduler.
+
+sequence_schedule holds a due time for every lead's every campaign step,
+which runs into millions of rows. The scheduler keeps only the next
+SCHEDULER_WINDOW_SECONDS of pending steps in memory, in a hierarchical
+timing wheel, and reloads the following window before the current one
+runs out. As steps come due they are promoted into send_queue in batches
+(promote_schedule), where the send engine claims them.
+
+Correctness does not depend on the wheel. Every SCHEDULER_SWEEP_INTERVAL
+seconds a sweep promotes whatever is overdue. That covers steps enrolled
+inside an already loaded window, steps held back because the lead's
+previous step was still queued, and everything that came due while the
+scheduler was down. Restarting is therefore just a sweep plus a window
+load.
+
+Cancellation happens in the database (a reply or bounce marks the lead's
+pending steps cancelled); a cancelled step left in the wheel is skipped
+by promote_schedule.
+"""
+import heapq
+import itertools
+import logging
+import math
+import os
+import threading
+import time
+from datetime import datetime, timezone
+
+from flask_app.auth import create_supabase_client
+
+logger = logging.getLogger(__name__)
+
+WINDOW_SECONDS = int(os.getenv("SCHEDULER_WINDOW_SECONDS", "900"))
+SWEEP_INTERVAL = float(os.getenv("SCHEDULER_SWEEP_INTERVAL", "30"))
+BATCH_SIZE = int(os.getenv("SCHEDULER_BATCH_SIZE", "1000"))
+LOAD_PAGE_SIZE = int(os.getenv("SCHEDULER_LOAD_PAGE_SIZE", "10000"))
+# Upper bound on steps held in memory; a denser window is loaded in parts
+MAX_LOADED = int(os.getenv("SCHEDULER_MAX_LOADED", "500000"))
+TICK_SECONDS = 1.0
+
+
+class TimingWheel:
+    """
+    Hierarchical timing wheel.
+
+    Level 0 has one slot per tick, each higher level one slot per full turn
+    of the level below. Adding an item is O(1); items move down one level
+    when their slot of a higher level comes up, so every item is touched at
+    most once per level. Items beyond the top level wait in an overflow heap.
+    """
+
+    def __init__(self, start, tick=TICK_SECONDS, sizes=(64, 64, 64)):
+        self.tick = tick
+        self.sizes = sizes
+        self.current = int(start // tick)
+        self._levels = [[[] for _ in range(size)] for size in sizes]
+        self._spans = [math.prod(sizes[:level]) for level in range(len(sizes))]
+        self._range = math.prod(sizes)
+        self._overflow = []
+        self._sequence = itertools.count()
+        self.count = 0
+
+    def add(self, item, due):
+        """Schedule item for time due (seconds); past times fire on the next unprocessed tick"""
+        self._place(max(math.ceil(due / self.tick), self.current), item)
+        self.count += 1
+
+    def advance(self, now):
+        """
+        Move the wheel to time now.
+
+        Returns:
+            list: Items that came due, in due order
+        """
+        target = int(now // self.tick)
+        due = []
+        while self.current <= target:
+            self._cascade()
+            slot = self._levels[0][self.current % self.sizes[0]]
+            if slot:
+                due.extend(item for _, item in slot)
+                slot.clear()
+            self.current += 1
+        self.count -= len(due)
+        return due
+
+    def _place(self, at, item):
+        delta = at - self.current
+        if delta >= self._range:
+            heapq.heappush(self._overflow, (at, next(self._sequence), item))
+            return
+        for level in range(len(self.sizes) - 1, -1, -1):
+            if level == 0 or delta >= self._spans[level]:
+                span, size = self._spans[level], self.sizes[level]
+                self._levels[level][(at // span) % size].append((at, item))
+                return
+
+    def _cascade(self):
+        # At a turn of level l, the level l+1 slot now starting moves down
+        for level in range(len(self.sizes) - 1, 0, -1):
+            span = self._spans[level]
+            if self.current % span == 0:
+                slot = self._levels[level][(self.current // span) % self.sizes[level]]
+                entries, slot[:] = list(slot), []
+                for at, item in entries:
+                    self._place(at, item)
+        while self._overflow and self._overflow[0][0] - self.current < self._range:
+            at, _, item = heapq.heappop(self._overflow)
+            self._place(at, item)
+
+
+def _parse_time(value):
+    return datetime.fromisoformat(value.replace("Z", "+00:00")) if isinstance(value, str) else value
+
+
+class SequenceScheduler:
+    """Loads upcoming steps into a timing wheel and promotes them when due"""
+
+    def __init__(self, supabase=None, window_seconds=WINDOW_SECONDS, sweep_interval=SWEEP_INTERVAL,
+                 batch_size=BATCH_SIZE, page_size=LOAD_PAGE_SIZE, max_loaded=MAX_LOADED, clock=time.time):
+        self._supabase = supabase or create_supabase_client()
+        self.window_seconds = window_seconds
+        self.sweep_interval = sweep_interval
+        self.batch_size = batch_size
+        self.page_size = page_size
+        self.max_loaded = max_loaded
+        self._clock = clock
+        self._stop = threading.Event()
+        self.wheel = None
+        self.loaded_until = None
+        self._next_sweep = 0.0
+        self.stats = {"loaded": 0, "promoted": 0, "swept": 0}
+
+    def stop(self):
+        self._stop.set()
+
+    def recover(self):
+        """Start over: promote everything overdue, then load the first window"""
+        now = self._clock()
+        self.wheel = TimingWheel(now)
+        self.loaded_until = now
+        self.sweep()
+        self._next_sweep = now + self.sweep_interval
+        self.load_window(now)
+
+    def sweep(self):
+        """
+        Promote every overdue pending step, in batches.
+
+        Returns:
+            int: Number of steps queued
+        """
+        total = 0
+        while True:
+            response = self._supabase.rpc("promote_schedule", {"p_ids": None, "p_limit": self.batch_size}).execute()
+            promoted = response.data or 0
+            total += promoted
+            if promoted < self.batch_size:
+                break
+        self.stats["swept"] += total
+        if total:
+            logger.info(f"Sweep queued {total} overdue steps")
+        return total
+
+    def load_window(self, now):
+        """
+        Load pending steps due before now + window that are not loaded yet.
+
+        Loading stops at max_loaded steps in memory; loaded_until then ends
+        at the last loaded due time and the rest follows on a later load.
+
+        Returns:
+            int: Number of steps added to the wheel
+        """
+        until = datetime.fromtimestamp(now + self.window_seconds, tz=timezone.utc)
+        start = datetime.fromtimestamp(self.loaded_until, tz=timezone.utc)
+        after_due, after_id, added = None, None, 0
+        while self.wheel.count < self.max_loaded:
+            limit = min(self.page_size, self.max_loaded - self.wheel.count)
+            response = self._supabase.rpc("schedule_window", {
+                "p_from": start.isoformat(),
+                "p_until": until.isoformat(),
+                "p_after_due": after_due,
+                "p_after_id": after_id,
+                "p_limit": limit,
+            }).execute()
+            rows = response.data or []
+            for row in rows:
+                self.wheel.add(row["id"], _parse_time(row["due_at"]).timestamp())
+            added += len(rows)
+            if len(rows) < limit:
+                self.loaded_until = until.timestamp()
+                break
+            after_due, after_id = rows[-1]["due_at"], rows[-1]["id"]
+        else:
+            # Full: the rest waits for the next load, which starts at the last
+            # loaded due time (a step loaded twice is only promoted once)
+            if after_due is not None:
+                self.loaded_until = _parse_time(after_due).timestamp()
+        self.stats["loaded"] += added
+        return added
+
+    def tick(self):
+        """
+        Promote the steps that came due since the last tick.
+
+        Returns:
+            int: Number of steps queued
+        """
+        now = self._clock()
+        due = self.wheel.advance(now)
+        promoted = 0
+        for i in range(0, len(due), self.batch_size):
+            batch = due[i:i + self.batch_size]
+            response = self._supabase.rpc("promote_schedule", {"p_ids": batch, "p_limit": len(batch)}).execute()
+            promoted += response.data or 0
+        self.stats["promoted"] += promoted
+        return promoted
+
+    def run(self):
+        """Run until stop() is called"""
+        self.recover()
+        logger.info(f"Scheduler started with {self.wheel.count} steps due within {self.window_seconds}s")
+        while not self._stop.is_set():
+            try:
+                self.tick()
+                now = self._clock()
+                if now >= self._next_sweep:
+                    self._next_sweep = now + self.sweep_interval
+                    self.sweep()
+                # Reload before half of the window has run out
+                if self.loaded_until - now < self.window_seconds / 2:
+                    self.load_window(now)
+            except Exception as e:
+                logger.warning(f"Scheduler cycle failed: {e}")
+            self._stop.wait(self.wheel.tick - (self._clock() % self.wheel.tick))
+
+
+if __name__ == "__main__":
+    import signal
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    scheduler = SequenceScheduler()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(signum, lambda *_: scheduler.stop())
+    scheduler.run()
+    print(f"\nScheduler summary:")
+    print(f"------------------")
+    print(f"Loaded: {scheduler.stats['loaded']}")
+    print(f"Promoted on time: {scheduler.stats['promoted']}")
+    print(f"Promoted by sweeps: {scheduler.stats['swept']}")
@@ -0,0 +1,605 @@
+"""
+Campaign send engine.
+
+Due messages are claimed from send_queue in batches (claim_send_batch uses
+SKIP LOCKED, so engines on several nodes can run side by side), rendered,
+and sent over pooled SMTP sessions (smtp_pool) by a pool of worker
+threads. Outcomes are written back in batches by complete_send_batch:
+
+- Accepted messages become email_log rows.
+- Permanent (5xx) refusals of the recipient or the message are logged as
+  bounced.
+- Temporary failures are rescheduled with exponential backoff, and become
+  bounced after SEND_MAX_ATTEMPTS attempts.
+
+Each message's server is chosen by sender_pool: messages pinned to a
+server or to a lead's thread stay there, the rest are spread over the
+owner's healthy servers by remaining quota and latency.
+
+Throttling uses token buckets, one per email server and one per
+recipient domain (limits apply per engine process). Claimed messages wait
+in one FIFO per (server, domain) pair; a heap orders the pairs by when
+their tokens next allow a send. A throttled sender or domain therefore
+never holds up messages that could go out now. A message that cannot go
+out within the claim lease, or whose server is taken out of rotation
+while it waits, is handed back to the queue without counting as an
+attempt.
+
+Delivery is at least once. If an engine dies after the SMTP server
+accepted a message but before the outcome was written back, that message
+is sent again once its lease expires. The window is at most
+SEND_FLUSH_INTERVAL seconds of sends. Outcomes written back after their
+lease expired are ignored by complete_send_batch when another claim has
+taken the row since (counted as stale).
+
+Throughput, queue lag (time from scheduled_at to dispatch), throttle
+waits and in-flight counts are logged every SEND_STATS_INTERVAL seconds
+and published to Redis for GET /stats/send-engine.
+"""
+import heapq
+import itertools
+import json
+import logging
+import os
+import smtplib
+import socket
+import threading
+import time
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+from flask_app import rendering
+from flask_app.auth import create_supabase_client
+from flask_app.redis_client import get_redis
+from flask_app.sender_pool import SenderPool, SenderUnavailable
+from flask_app.smtp_pool import PoolExhausted, smtp_pools
+
+logger = logging.getLogger(__name__)
+
+WORKERS = int(os.getenv("SEND_WORKERS", "16"))
+BATCH_SIZE = int(os.getenv("SEND_BATCH_SIZE", "500"))
+LEASE_SECONDS = int(os.getenv("SEND_LEASE_SECONDS", "300"))
+# Token buckets; a rate of 0 disables the limit
+SENDER_RATE_PER_MINUTE = float(os.getenv("SEND_SENDER_RATE_PER_MINUTE", "60"))
+SENDER_BURST = int(os.getenv("SEND_SENDER_BURST", "10"))
+DOMAIN_RATE_PER_MINUTE = float(os.getenv("SEND_DOMAIN_RATE_PER_MINUTE", "300"))
+DOMAIN_BURST = int(os.getenv("SEND_DOMAIN_BURST", "20"))
+POLL_INTERVAL = float(os.getenv("SEND_POLL_INTERVAL", "2"))
+FLUSH_INTERVAL = float(os.getenv("SEND_FLUSH_INTERVAL", "1"))
+FLUSH_SIZE = int(os.getenv("SEND_FLUSH_SIZE", "500"))
+MAX_ATTEMPTS = int(os.getenv("SEND_MAX_ATTEMPTS", "5"))
+RETRY_BASE_SECONDS = int(os.getenv("SEND_RETRY_BASE_SECONDS", "300"))
+RETRY_MAX_SECONDS = int(os.getenv("SEND_RETRY_MAX_SECONDS", "21600"))
+STATS_INTERVAL = float(os.getenv("SEND_STATS_INTERVAL", "30"))
+# Step and variant rows are re-read after this many seconds
+CONTENT_TTL = float(os.getenv("SEND_CONTENT_TTL", "60"))
+# Share of the lease a message may wait for tokens; the rest is margin for the send
+LEASE_HORIZON = 0.8
+STATS_KEY_PREFIX = "send_engine:stats:"
+
+
+class TokenBucket:
+    """
+    Token bucket in GCRA form: rate tokens per second, up to burst at once.
+
+    Instead of a token count it keeps the theoretical arrival time (tat) of
+    the next send, so both the check and the wait until the next token are
+    O(1) without a refill timer.
+    """
+
+    def __init__(self, rate, burst=1):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self.tolerance = self.interval * (max(burst, 1) - 1)
+        self.tat = float("-inf")
+
+    def earliest(self, now):
+        """Earliest time at or after now at which a send conforms"""
+        if not self.interval:
+            return now
+        return max(now, self.tat - self.tolerance)
+
+    def take(self, now):
+        """Spend a token at now (which must be >= earliest(now))"""
+        if self.interval:
+            self.tat = max(self.tat, now) + self.interval
+
+
+class Throttle:
+    """Token buckets per email server and per recipient domain"""
+
+    def __init__(self, sender_rate_per_minute=SENDER_RATE_PER_MINUTE, sender_burst=SENDER_BURST,
+                 domain_rate_per_minute=DOMAIN_RATE_PER_MINUTE, domain_burst=DOMAIN_BURST):
+        self._senders = defaultdict(lambda: TokenBucket(sender_rate_per_minute / 60, sender_burst))
+        self._domains = defaultdict(lambda: TokenBucket(domain_rate_per_minute / 60, domain_burst))
+
+    def acquire(self, sender, domain, now):
+        """
+        Take a token from both buckets if both have one.
+
+        Args:
+            sender: email_servers id
+            domain: Recipient domain
+            now: Current monotonic time
+
+        Returns:
+            float: 0 if the send may go now, else the seconds until it might
+            (nothing is taken then)
+        """
+        sender_bucket, domain_bucket = self._senders[sender], self._domains[domain]
+        wait = max(sender_bucket.earliest(now), domain_bucket.earliest(now)) - now
+        if wait > 0:
+            return wait
+        sender_bucket.take(now)
+        domain_bucket.take(now)
+        return 0.0
+
+    def projected(self, sender, domain, now, queued):
+        """Lower bound on when a send queued behind queued others for this pair can go"""
+        sender_bucket, domain_bucket = self._senders[sender], self._domains[domain]
+        start = max(sender_bucket.earliest(now), domain_bucket.earliest(now))
+        return start + queued * max(sender_bucket.interval, domain_bucket.interval)
+
+
+class _Pending:
+    """A claimed message waiting for its tokens"""
+
+    __slots__ = ("row", "server", "content", "deadline", "throttled")
+
+    def __init__(self, row, server, content, deadline):
+        self.row = row
+        self.server = server
+        self.content = content
+        self.deadline = deadline
+        self.throttled = False
+
+
+class EngineStats:
+    """Thread-safe counters of one engine"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started = time.monotonic()
+        self.counts = defaultdict(int)
+        self.in_flight = 0
+        self.pending = 0
+        self.throttle_wait = 0.0
+        self.throttled = 0
+        self.domain_waits = defaultdict(float)
+        self.lag_total = 0.0
+        self.lag_max = 0.0
+        self.lag_last = 0.0
+        self._window = deque([(self.started, 0)])
+
+    def count(self, key, n=1):
+        with self._lock:
+            self.counts[key] += n
+
+    def add_in_flight(self, n):
+        with self._lock:
+            self.in_flight += n
+
+    def throttle(self, domain, wait, first):
+        with self._lock:
+            self.throttle_wait += wait
+            self.throttled += first
+            self.domain_waits[domain] += wait
+
+    def lag(self, seconds):
+        with self._lock:
+            self.lag_total += seconds
+            self.lag_max = max(self.lag_max, seconds)
+            self.lag_last = seconds
+
+    def snapshot(self):
+        """Counters plus overall and recent (last minute) throughput per hour"""
+        now = time.monotonic()
+        with self._lock:
+            sent = self.counts["sent"]
+            self._window.append((now, sent))
+            while len(self._window) > 2 and now - self._window[1][0] >= 60:
+                self._window.popleft()
+            window_start, window_sent = self._window[0]
+            elapsed = max(now - self.started, 1e-9)
+            dispatched = self.counts["dispatched"]
+            top_domains = sorted(self.domain_waits.items(), key=lambda item: -item[1])[:5]
+            return {
+                "uptime_seconds": round(elapsed, 1),
+                **dict(self.counts),
+                "in_flight": self.in_flight,
+                "pending": self.pending,
+                "throughput_per_hour": round(sent / elapsed * 3600),
+                "recent_per_hour": round((sent - window_sent) / max(now - window_start, 1e-9) * 3600),
+                "queue_lag_seconds": {
+                    "last": round(self.lag_last, 3),
+                    "avg": round(self.lag_total / dispatched, 3) if dispatched else 0.0,
+                    "max": round(self.lag_max, 3),
+                },
+                "throttle_waits": {
+                    "throttled": self.throttled,
+                    "total_seconds": round(self.throttle_wait, 3),
+                    "avg_seconds": round(self.throttle_wait / self.throttled, 3) if self.throttled else 0.0,
+                    "top_domains": {domain: round(wait, 3) for domain, wait in top_domains},
+                },
+            }
+
+
+class _RowCache:
+    """Rows of one table by id, re-read after ttl seconds"""
+
+    def __init__(self, supabase, table, columns, ttl=CONTENT_TTL):
+        self._supabase = supabase
+        self._table = table
+        self._columns = columns
+        self._ttl = ttl
+        self._rows = {}
+
+    def get_many(self, ids):
+        now = time.monotonic()
+        missing = sorted({row_id for row_id in ids if row_id and (
+            row_id not in self._rows or now - self._rows[row_id][0] > self._ttl)})
+        if missing:
+            response = self._supabase.table(self._table).select(self._columns).in_("id", missing).execute()
+            for row in response.data or []:
+                self._rows[row["id"]] = (now, row)
+        return {row_id: self._rows[row_id][1] for row_id in ids if row_id in self._rows}
+
+
+def recipient_domain(address):
+    return address.rsplit("@", 1)[-1].strip().lower()
+
+
+def retry_delay(attempts):
+    """Backoff before attempt number attempts + 1"""
+    return min(RETRY_BASE_SECONDS * 2 ** max(attempts - 1, 0), RETRY_MAX_SECONDS)
+
+
+def classify_error(error):
+    """
+    Whether a send error is permanent for this message.
+
+    A 5xx refusal of the recipient or of the message content is permanent;
+    a refused sender is a mailbox problem, not the lead's, and is retried
+    like every temporary or connection-level failure.
+    """
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return all(code >= 500 for code, _ in error.recipients.values())
+    if isinstance(error, smtplib.SMTPSenderRefused):
+        return False
+    if isinstance(error, smtplib.SMTPResponseException):
+        return error.smtp_code >= 500
+    return False
+
+
+class SendEngine:
+    """Claims, throttles, sends and records campaign messages"""
+
+    def __init__(self, worker_id=None, workers=WORKERS, batch_size=BATCH_SIZE, lease_seconds=LEASE_SECONDS,
+                 throttle=None, pools=smtp_pools, supabase=None, poll_interval=POLL_INTERVAL,
+                 flush_interval=FLUSH_INTERVAL, flush_size=FLUSH_SIZE, stats_interval=STATS_INTERVAL,
+                 senders=None, redis_getter=get_redis):
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+        self.workers = workers
+        self.batch_size = batch_size
+        self.lease_seconds = lease_seconds
+        self.throttle = throttle or Throttle()
+        self.pools = pools
+        self.poll_interval = poll_interval
+        self.flush_interval = flush_interval
+        self.flush_size = flush_size
+        self.stats_interval = stats_interval
+        self.stats = EngineStats()
+        self._supabase = supabase or create_supabase_client()
+        self._redis_getter = redis_getter
+        self.senders = senders or SenderPool(self._supabase)
+        self._steps = _RowCache(self._supabase, "campaign_steps", "id, subject, html")
+        self._variants = _RowCache(self._supabase, "step_variants", "id, subject, html")
+        # (server id, domain) -> deque of _Pending, and a heap of (check time, seq, pair)
+        self._queues = {}
+        self._ready = []
+        self._sequence = itertools.count()
+        self._results = deque()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._executor = None
+        self._next_claim = 0.0
+        self._last_flush = time.monotonic()
+        self._last_report = time.monotonic()
+
+    def stop(self):
+        """Ask run() to finish in-flight sends, hand back pending ones and return"""
+        self._stop.set()
+        self._wake.set()
+
+    def run(self, until_idle=False):
+        """
+        Send until stop() is called.
+
+        Args:
+            until_idle: Return once the queue has nothing due and every claimed
+                message is done (for one-off runs and benchmarks)
+
+        Returns:
+            dict: Final stats snapshot
+        """
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="send")
+        logger.info(f"Send engine {self.worker_id} started with {self.workers} workers")
+        try:
+            while not self._stop.is_set():
+                claimed = self._maybe_claim()
+                self._dispatch_ready()
+                self._flush()
+                self._report()
+                if until_idle and not claimed and not self.stats.pending and not self.stats.in_flight:
+                    break
+                self._wait()
+        finally:
+            self._shutdown()
+        return self.stats.snapshot()
+
+    def _maybe_claim(self):
+        now = time.monotonic()
+        # Keep about one batch buffered; throttled messages must not pile up past that
+        if now < self._next_claim or self.stats.pending + self.stats.in_flight >= self.batch_size:
+            return 0
+        try:
+            response = self._supabase.rpc("claim_send_batch", {
+                "p_worker": self.worker_id,
+                "p_limit": self.batch_size,
+                "p_lease": f"{self.lease_seconds} seconds",
+            }).execute()
+        except Exception as e:
+            logger.warning(f"Claiming sends failed: {e}")
+            self._next_claim = now + self.poll_interval
+            return 0
+
+        rows = response.data or []
+        if not rows:
+            self._next_claim = now + self.poll_interval
+            return 0
+        self.stats.count("claimed", len(rows))
+        self._schedule(rows, now)
+        return len(rows)
+
+    def _schedule(self, rows, claimed_at):
+        steps = self._steps.get_many([row["step_id"] for row in rows])
+        variants = self._variants.get_many([row.get("variant_id") for row in rows])
+        deadline = claimed_at + self.lease_seconds * LEASE_HORIZON
+
+        for row in rows:
+            content = variants.get(row.get("variant_id")) or steps.get(row["step_id"])
+            to_addr = (row.get("lead") or {}).get("email")
+            if not content or not to_addr:
+                self._finish(row, "retry", error=f"Not sendable: {'no content' if not content else 'no recipient'}")
+                continue
+            try:
+                server = self.senders.choose(row)
+            except SenderUnavailable as e:
+                self._finish(row, "retry" if e.counts_attempt else "deferred", error=str(e), delay=e.retry_in)
+                continue
+            except Exception as e:
+                logger.warning(f"Choosing an email server for {row.get('id')} failed: {e}")
+                self._finish(row, "deferred", error=str(e), delay=self.poll_interval)
+                continue
+
+            pair = (server["id"], recipient_domain(to_addr))
+            queue = self._queues.get(pair)
+            if queue is None:
+                queue = self._queues[pair] = deque()
+                heapq.heappush(self._ready, (time.monotonic(), next(self._sequence), pair))
+            if self.throttle.projected(*pair, time.monotonic(), len(queue)) > deadline:
+                self.senders.release(server["id"])
+                self._finish(row, "deferred", delay=self.lease_seconds * (1 - LEASE_HORIZON))
+                continue
+            queue.append(_Pending(row, server, content, deadline))
+            self.stats.pending += 1
+
+    def _dispatch_ready(self):
+        now = time.monotonic()
+        # Bounded hand-off keeps the executor queue short, so throttling stays accurate
+        while self._ready and self._ready[0][0] <= now and self.stats.in_flight < self.workers * 2:
+            _, _, pair = heapq.heappop(self._ready)
+            queue = self._queues[pair]
+            while queue and queue[0].deadline < now:
+                self._hand_back(queue.popleft())
+            if queue and self.senders.is_open(pair[0]):
+                # The server went bad after these were routed to it; hand them back for another
+                while queue:
+                    self._hand_back(queue.popleft(), error="Email server unavailable")
+            if not queue:
+                del self._queues[pair]
+                continue
+
+            wait = self.throttle.acquire(*pair, now)
+            if wait:
+                self.stats.throttle(pair[1], wait, first=not queue[0].throttled)
+                queue[0].throttled = True
+                heapq.heappush(self._ready, (now + wait, next(self._sequence), pair))
+                continue
+
+            pending = queue.popleft()
+            self.stats.pending -= 1
+            if queue:
+                heapq.heappush(self._ready, (now, next(self._sequence), pair))
+            else:
+                del self._queues[pair]
+            scheduled = _parse_time(pending.row.get("scheduled_at"))
+            if scheduled:
+                self.stats.lag(max((datetime.now(timezone.utc) - scheduled).total_seconds(), 0.0))
+            self.stats.count("dispatched")
+            self.stats.add_in_flight(1)
+            self._executor.submit(self._send, pending.row, pending.server, pending.content)
+
+    def _send(self, row, server, content):
+        started = None
+        try:
+            to_addr = row["lead"]["email"]
+            message = rendering.build_message(
+                row["email_id"], server["email_address"], to_addr,
+                content.get("subject"), content.get("html"), row["lead"],
+            )
+            started = time.monotonic()
+            refused = self.pools.send(server, server["email_address"], [to_addr], message)
+            if refused:
+                raise smtplib.SMTPRecipientsRefused(refused)
+        except (PoolExhausted, smtplib.SMTPException, OSError) as e:
+            answered = started is not None and not isinstance(e, PoolExhausted)
+            self.senders.record(server["id"], latency=time.monotonic() - started if answered else None, error=e)
+            permanent = classify_error(e)
+            if not permanent:
+                self.senders.release(server["id"])
+            self._finish(row, "failed" if permanent else "retry", server=server, error=str(e))
+        except Exception as e:
+            logger.exception(f"Unexpected error sending {row.get('id')}: {e}")
+            self.senders.record(server["id"])
+            self.senders.release(server["id"])
+            self._finish(row, "retry", server=server, error=str(e))
+        else:
+            self.senders.record(server["id"], latency=time.monotonic() - started)
+            self._finish(row, "sent", server=server)
+        finally:
+            self.stats.add_in_flight(-1)
+            self._wake.set()
+
+    def _hand_back(self, pending, error=None):
+        """Return a message that was routed but not sent to the queue, and its quota"""
+        self.senders.release(pending.server["id"])
+        self._finish(pending.row, "deferred", delay=0, error=error)
+        self.stats.pending -= 1
+
+    def _finish(self, row, outcome, server=None, error=None, delay=None):
+        if outcome == "retry" and row.get("attempts", 1) >= MAX_ATTEMPTS:
+            outcome = "failed"
+        now = datetime.now(timezone.utc)
+        result = {
+            "id": row["id"],
+            "email_id": row.get("email_id"),
+            "outcome": outcome,
+            "email_server_id": server["id"] if server else row.get("email_server_id"),
+            "message_id": rendering.message_id(row.get("email_id"), server["email_address"]) if server else None,
+            "sent_at": now.isoformat(),
+            "retry_at": None,
+            "error": error[:500] if error else None,
+        }
+        if outcome in ("retry", "deferred"):
+            if delay is None:
+                delay = retry_delay(row.get("attempts", 1))
+            result["retry_at"] = (now + timedelta(seconds=delay)).isoformat()
+        self._results.append(result)
+        self.stats.count(outcome)
+
+    def _flush(self, force=False):
+        now = time.monotonic()
+        if not self._results or (not force and len(self._results) < self.flush_size
+                                 and now - self._last_flush < self.flush_interval):
+            return
+        self._last_flush = now
+        while self._results:
+            batch = []
+            while self._results and len(batch) < self.flush_size:
+                batch.append(self._results.popleft())
+            try:
+                response = self._supabase.rpc("complete_send_batch", {"p_results": batch}).execute()
+            except Exception as e:
+                # Keep the outcomes; a lost "sent" would be sent again after the lease
+                self._results.extendleft(reversed(batch))
+                logger.warning(f"Recording {len(batch)} send outcomes failed: {e}")
+                return
+            self.stats.count("recorded", len(batch))
+            stale = (response.data or [{}])[0].get("stale") or 0
+            if stale:
+                self.stats.count("stale", stale)
+                logger.warning(f"{stale} send outcomes arrived after their lease was claimed again; ignored")
+            if not force:
+                return
+
+    def _report(self, force=False):
+        now = time.monotonic()
+        if not force and now - self._last_report < self.stats_interval:
+            return
+        self._last_report = now
+        snapshot = self.stats.snapshot()
+        logger.info(
+            f"Send engine {self.worker_id}: {snapshot.get('sent', 0)} sent, "
+            f"{snapshot['throughput_per_hour']}/h, {snapshot['in_flight']} in flight, "
+            f"{snapshot['pending']} pending, lag {snapshot['queue_lag_seconds']['last']}s, "
+            f"throttle wait {snapshot['throttle_waits']['total_seconds']}s"
+        )
+        client = self._redis_getter()
+        if client is not None:
+            try:
+                client.setex(STATS_KEY_PREFIX + self.worker_id, int(self.stats_interval * 3) or 1,
+                             json.dumps({"worker": self.worker_id, **snapshot, "senders": self.senders.snapshot(),
+                                         "quota": self.senders.quota.snapshot()}))
+            except Exception as e:
+                logger.warning(f"Publishing send engine stats failed: {e}")
+
+    def _wait(self):
+        now = time.monotonic()
+        timeouts = [self.flush_interval, max(self._next_claim - now, 0.0)]
+        if self._ready and self.stats.in_flight < self.workers * 2:
+            timeouts.append(max(self._ready[0][0] - now, 0.0))
+        timeout = min(timeouts)
+        if timeout > 0:
+            self._wake.wait(timeout)
+        self._wake.clear()
+
+    def _shutdown(self):
+        self._executor.shutdown(wait=True)
+        # Hand unsent messages back so another engine can take them now
+        for queue in self._queues.values():
+            for pending in queue:
+                self._hand_back(pending)
+        self._queues, self._ready = {}, []
+        self.senders.close()
+        self._flush(force=True)
+        self._report(force=True)
+        if self._results:
+            logger.error(f"{len(self._results)} send outcomes could not be recorded; "
+                         f"those messages are sent again after their lease")
+
+
+def _parse_time(value):
+    if not value:
+        return None
+    if isinstance(value, datetime):
+        return value
+    return datetime.fromisoformat(value.replace("Z", "+00:00"))
+
+
+def published_stats(redis_getter=get_redis):
+    """Latest stats of every running engine, as published to Redis"""
+    client = redis_getter()
+    if client is None:
+        return []
+    keys = sorted(client.scan_iter(match=STATS_KEY_PREFIX + "*", count=100))
+    values = client.mget(keys) if keys else []
+    return [json.loads(value) for value in values if value]
+
+
+def queue_status():
+    """Queue depth and the age of the oldest due message"""
+    supabase = create_supabase_client()
+    response = supabase.rpc("send_queue_status", {}).execute()
+    rows = response.data or []
+    status = rows[0] if rows else {"queued": 0, "due": 0, "claimed": 0, "oldest_due_at": None}
+    oldest = _parse_time(status.get("oldest_due_at"))
+    status["lag_seconds"] = round((datetime.now(timezone.utc) - oldest).total_seconds(), 1) if oldest else 0.0
+    return status
+
+
+if __name__ == "__main__":
+    import signal
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    engine = SendEngine()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(signum, lambda *_: engine.stop())
+    final = engine.run()
+    print(f"\nSend engine summary:")
+    print(f"--------------------")
+    print(f"Sent: {final.get('sent', 0)}")
+    print(f"Failed: {final.get('failed', 0)}")
+    print(f"Retried: {final.get('retry', 0)}")
+    print(f"Deferred: {final.get('deferred', 0)}")
+    print(f"Throughput: {final['throughput_per_hour']}/h")
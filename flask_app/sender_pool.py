@@ -0,0 +1,348 @@
+"""
+Sender rotation across an owner's email servers.
+
+The send engine asks the pool which server a claimed message goes out
+through:
+
+- A message whose queue row names a server is pinned to it. While that
+  server is unhealthy the message is deferred, never moved.
+- A follow-up to a lead that one of the servers already wrote to in the
+  campaign stays on that server (sender_assignments), so the thread and
+  its replies stay in one mailbox. If the server stays unhealthy for
+  SENDER_FAILOVER_ATTEMPTS attempts, the thread moves to another server.
+- Anything else is spread over the owner's healthy servers with quota
+  left, by weighted rendezvous hashing on (campaign, lead). The weight is
+  the share of today's quota that is still left, times a latency factor
+  from an average of the server's recent send times.
+
+Health is a circuit breaker per server. SENDER_FAILURE_THRESHOLD server
+errors in a row (connection, authentication, sender or 4xx failures, not
+refused recipients) open it. It stays open for a cooldown that doubles
+each time it reopens, up to SENDER_MAX_COOLDOWN_SECONDS. After that a
+single probe message decides whether it closes again.
+
+Health and latency are per engine process and published with the engine
+stats. The weights use the cap of the server's sender for today and the
+server's usage, re-read every SENDER_POOL_TTL seconds, plus the sends
+this process has assigned since. The cap itself is enforced by quota
+leases (flask_app/quota.py): a server whose sender has no quota left is
+skipped.
+"""
+import hashlib
+import logging
+import math
+import os
+import smtplib
+import threading
+import time
+
+from flask_app.quota import QuotaStore
+from flask_app.smtp_pool import PoolExhausted
+
+logger = logging.getLogger(__name__)
+
+POOL_TTL = float(os.getenv("SENDER_POOL_TTL", "60"))
+FAILURE_THRESHOLD = int(os.getenv("SENDER_FAILURE_THRESHOLD", "5"))
+COOLDOWN_SECONDS = float(os.getenv("SENDER_COOLDOWN_SECONDS", "60"))
+MAX_COOLDOWN_SECONDS = float(os.getenv("SENDER_MAX_COOLDOWN_SECONDS", "900"))
+FAILOVER_ATTEMPTS = int(os.getenv("SENDER_FAILOVER_ATTEMPTS", "2"))
+# Send time (seconds) at which a server's latency factor is 0.5
+LATENCY_REFERENCE = float(os.getenv("SENDER_LATENCY_REFERENCE", "1.0"))
+# How long messages wait when every server of the owner is out of quota
+QUOTA_DEFER_SECONDS = int(os.getenv("SENDER_QUOTA_DEFER_SECONDS", "900"))
+LATENCY_ALPHA = 0.2
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+
+class SenderUnavailable(Exception):
+    """
+    No server can take the message now.
+
+    Attributes:
+        counts_attempt: Whether the wait uses up one of the message's attempts
+        retry_in: Seconds to wait, or None for the engine's backoff
+    """
+
+    def __init__(self, message, counts_attempt=False, retry_in=None):
+        super().__init__(message)
+        self.counts_attempt = counts_attempt
+        self.retry_in = retry_in
+
+
+def is_server_error(error):
+    """
+    Whether a send error says something about the server rather than the lead.
+
+    Refused recipients and 5xx refusals of the message are the lead's or
+    the content's problem; a busy pool is back-pressure, not ill health.
+    """
+    if isinstance(error, (PoolExhausted, smtplib.SMTPRecipientsRefused)):
+        return False
+    if isinstance(error, (smtplib.SMTPSenderRefused, smtplib.SMTPAuthenticationError)):
+        return True
+    if isinstance(error, smtplib.SMTPResponseException):
+        return error.smtp_code < 500
+    return isinstance(error, (smtplib.SMTPException, OSError))
+
+
+class SenderHealth:
+    """Circuit breaker and latency average of one server"""
+
+    __slots__ = ("state", "failures", "opened", "open_until", "probing", "latency", "sends", "errors")
+
+    def __init__(self):
+        self.state = CLOSED
+        self.failures = 0
+        self.opened = 0
+        self.open_until = 0.0
+        self.probing = False
+        self.latency = None
+        self.sends = 0
+        self.errors = 0
+
+    def available(self, now):
+        """Whether the server may take a message at now"""
+        if self.state == OPEN and now >= self.open_until:
+            self.state, self.probing = HALF_OPEN, False
+        if self.state == HALF_OPEN:
+            return not self.probing
+        return self.state == CLOSED
+
+    def success(self, latency):
+        self.sends += 1
+        self.latency = latency if self.latency is None else \
+            self.latency + LATENCY_ALPHA * (latency - self.latency)
+        self.state, self.failures, self.opened, self.probing = CLOSED, 0, 0, False
+
+    def failure(self, now, threshold, cooldown, max_cooldown):
+        """Count a server error; returns True if it opened the breaker"""
+        self.errors += 1
+        self.failures += 1
+        if self.state == OPEN or (self.state == CLOSED and self.failures < threshold):
+            return False
+        self.opened += 1
+        self.state, self.probing = OPEN, False
+        self.open_until = now + min(cooldown * 2 ** (self.opened - 1), max_cooldown)
+        return True
+
+
+class _Member:
+    """One server in an owner's pool, with its sender's cap for today"""
+
+    __slots__ = ("server", "sender_id", "quota", "used")
+
+    def __init__(self, server, sender_id, quota, used):
+        self.server = server
+        self.sender_id = sender_id
+        self.quota = quota
+        self.used = used
+
+    def remaining(self):
+        return None if self.quota is None else self.quota - self.used
+
+
+def _unit_hash(key, server_id):
+    """Uniform value in (0, 1) for a (key, server) pair"""
+    digest = hashlib.blake2b(f"{key}|{server_id}".encode(), digest_size=8).digest()
+    return (int.from_bytes(digest, "big") + 0.5) / 2 ** 64
+
+
+class SenderPool:
+    """Chooses servers for messages and tracks their health"""
+
+    def __init__(self, supabase, ttl=POOL_TTL, failure_threshold=FAILURE_THRESHOLD, cooldown=COOLDOWN_SECONDS,
+                 max_cooldown=MAX_COOLDOWN_SECONDS, failover_attempts=FAILOVER_ATTEMPTS,
+                 latency_reference=LATENCY_REFERENCE, quota=None, clock=time.monotonic):
+        self._supabase = supabase
+        self.quota = quota or QuotaStore(supabase)
+        self.ttl = ttl
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.failover_attempts = failover_attempts
+        self.latency_reference = latency_reference
+        self._clock = clock
+        self._lock = threading.Lock()
+        # owner -> (loaded at, {server id: _Member})
+        self._owners = {}
+        self._servers = {}
+        self._health = {}
+
+    def members(self, owner):
+        """The owner's servers by id, re-read after ttl seconds"""
+        now = self._clock()
+        loaded = self._owners.get(owner)
+        if loaded and now - loaded[0] <= self.ttl:
+            return loaded[1]
+        response = self._supabase.rpc("sender_pool", {"p_owner": owner}).execute()
+        members = {entry["server"]["id"]: _Member(entry["server"], entry.get("sender_id"),
+                                                  entry.get("daily_quota"), entry.get("used_today") or 0)
+                   for entry in response.data or []}
+        self._owners[owner] = (now, members)
+        self._servers.update(members)
+        return members
+
+    def choose(self, row):
+        """
+        Pick the server a claimed message is sent through.
+
+        Args:
+            row: A claim_send_batch row (owner, campaign_id, lead_id,
+                email_server_id, pinned, attempts)
+
+        Returns:
+            dict: The email_servers row
+
+        Raises:
+            SenderUnavailable: If no server may take the message now
+        """
+        members = self.members(row["owner"])
+        pinned = members.get(row.get("email_server_id")) if row.get("pinned") else None
+        now = self._clock()
+        with self._lock:
+            if pinned is not None:
+                health = self._health_of(pinned.server["id"])
+                if health.available(now):
+                    if self._take(pinned, health):
+                        return pinned.server
+                    raise SenderUnavailable(f"Email server {pinned.server['email_address']} reached its daily cap",
+                                            retry_in=QUOTA_DEFER_SECONDS)
+                if row["pinned"] == "queue":
+                    raise SenderUnavailable(f"Email server {pinned.server['email_address']} is unavailable",
+                                            retry_in=max(health.open_until - now, 1.0))
+                if row.get("attempts", 1) < self.failover_attempts:
+                    raise SenderUnavailable(f"Email server {pinned.server['email_address']} is unavailable",
+                                            counts_attempt=True)
+            elif row.get("pinned") == "queue":
+                raise SenderUnavailable("Email server not found", counts_attempt=True)
+
+            key = f"{row.get('campaign_id')}:{row.get('lead_id')}"
+            ranked, waiting = [], None
+            for server_id, member in members.items():
+                health = self._health_of(server_id)
+                if member is pinned or not health.available(now):
+                    if member is not pinned:
+                        waiting = health.open_until if waiting is None else min(waiting, health.open_until)
+                    continue
+                weight = self._weight(member, health)
+                if weight > 0:
+                    ranked.append((-weight / math.log(_unit_hash(key, server_id)), server_id, member, health))
+            # Highest score first; the next one takes over if a cap turns out to be used up
+            for _, _, member, health in sorted(ranked, key=lambda item: item[:2], reverse=True):
+                if self._take(member, health):
+                    return member.server
+
+        if not members:
+            raise SenderUnavailable("No email server", counts_attempt=True)
+        if waiting is not None:
+            raise SenderUnavailable("All email servers are unavailable", retry_in=max(waiting - now, 1.0))
+        raise SenderUnavailable("All email servers are out of quota for today", retry_in=QUOTA_DEFER_SECONDS)
+
+    def release(self, server_id):
+        """Give back the quota taken for a message that was chosen but not sent"""
+        member = self._servers.get(server_id)
+        if member is None:
+            return
+        with self._lock:
+            member.used = max(member.used - 1, 0)
+        if member.sender_id:
+            self.quota.refund(member.sender_id)
+
+    def close(self):
+        """Return unused leased quota"""
+        self.quota.release()
+
+    def is_open(self, server_id):
+        """Whether the server's breaker is open (it takes no messages)"""
+        health = self._health.get(server_id)
+        return health is not None and health.state == OPEN and self._clock() < health.open_until
+
+    def record(self, server_id, latency=None, error=None):
+        """
+        Record the outcome of a send for the server's health.
+
+        Args:
+            server_id: email_servers id
+            latency: Seconds the send took, if the server answered it
+            error: The exception, if it failed
+        """
+        with self._lock:
+            health = self._health_of(server_id)
+            if error is None or not is_server_error(error):
+                if latency is not None:
+                    health.success(latency)
+                else:
+                    health.probing = False
+                return
+            if health.failure(self._clock(), self.failure_threshold, self.cooldown, self.max_cooldown):
+                logger.warning(f"Email server {server_id} taken out of rotation for "
+                               f"{health.open_until - self._clock():.0f}s after {health.failures} errors: {error}")
+
+    def snapshot(self):
+        """Health, latency and quota of every server seen, by server id"""
+        now = self._clock()
+        with self._lock:
+            members = {server_id: member for _, owned in self._owners.values() for server_id, member in owned.items()}
+            return {server_id: {
+                "state": health.state,
+                "latency_ms": round(health.latency * 1000, 1) if health.latency is not None else None,
+                "sends": health.sends,
+                "errors": health.errors,
+                "consecutive_failures": health.failures,
+                "open_for_seconds": round(max(health.open_until - now, 0.0), 1) if health.state == OPEN else 0.0,
+                "remaining_today": members[server_id].remaining() if server_id in members else None,
+            } for server_id, health in self._health.items()}
+
+    def _health_of(self, server_id):
+        health = self._health.get(server_id)
+        if health is None:
+            health = self._health[server_id] = SenderHealth()
+        return health
+
+    def _take(self, member, health):
+        if member.sender_id and not self.quota.take(member.sender_id):
+            member.used = max(member.used, member.quota or 0)
+            return False
+        member.used += 1
+        if health.state == HALF_OPEN:
+            health.probing = True
+        return True
+
+    def _weight(self, member, health):
+        remaining = member.remaining()
+        if remaining is None:
+            share = 1.0
+        elif remaining <= 0:
+            return 0.0
+        else:
+            share = remaining / max(member.quota, 1)
+        latency = health.latency if health.latency is not None else self.latency_reference
+        return share * self.latency_reference / (self.latency_reference + latency)
+
+
+def merge_health(engine_snapshots):
+    """
+    Combine the published sender health of several engines by server id.
+
+    The worst state wins, latency is averaged over the engines' sends and
+    counts are added up.
+    """
+    order = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+    merged = {}
+    for snapshot in engine_snapshots:
+        for server_id, health in (snapshot.get("senders") or {}).items():
+            total = merged.setdefault(server_id, {"state": CLOSED, "latency_ms": None, "sends": 0, "errors": 0})
+            if order.get(health.get("state"), 0) > order[total["state"]]:
+                total["state"] = health["state"]
+            sends = health.get("sends", 0)
+            if health.get("latency_ms") is not None and sends:
+                timed = total.pop("_timed", 0)
+                previous = (total["latency_ms"] or 0.0) * timed
+                total["latency_ms"] = round((previous + health["latency_ms"] * sends) / (timed + sends), 1)
+                total["_timed"] = timed + sends
+            total["sends"] += sends
+            total["errors"] += health.get("errors", 0)
+    for total in merged.values():
+        total.pop("_timed", None)
+    return merged
@@ -0,0 +1,354 @@
+"""
+Pooled, authenticated SMTP sessions per email_servers row.
+
+Opening a session costs a TCP connect, the greeting, EHLO, TLS (implicit
+or STARTTLS, followed by a second EHLO) and AUTH. A pool keeps finished
+sessions warm so the next message only pays the MAIL/RCPT/DATA exchange.
+
+Each email server (keyed by email_servers.id) gets its own pool:
+
+- At most max_connections sessions are open or in use at once
+  (email_servers.max_connections, else SMTP_POOL_MAX_CONNECTIONS); callers
+  beyond that wait up to SMTP_POOL_ACQUIRE_TIMEOUT seconds.
+- Idle sessions are reused newest first and closed after
+  SMTP_POOL_IDLE_TIMEOUT seconds; a session idle for more than
+  SMTP_POOL_CHECK_INTERVAL seconds is checked with NOOP before reuse.
+- A session is retired after SMTP_POOL_MAX_MESSAGES messages (providers
+  cap messages per session) or after any connection-level error.
+- A send that fails because a reused session was dropped by the server is
+  retried once on another session.
+
+The manager replaces a server's pool when its row changes (host, port,
+credentials or TLS settings), starts over after a fork, and runs a
+background reaper so idle sessions are closed even without traffic.
+"""
+import os
+import logging
+import smtplib
+import ssl
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+MAX_CONNECTIONS = int(os.getenv("SMTP_POOL_MAX_CONNECTIONS", "3"))
+IDLE_TIMEOUT = float(os.getenv("SMTP_POOL_IDLE_TIMEOUT", "60"))
+CHECK_INTERVAL = float(os.getenv("SMTP_POOL_CHECK_INTERVAL", "10"))
+MAX_MESSAGES = int(os.getenv("SMTP_POOL_MAX_MESSAGES", "100"))
+ACQUIRE_TIMEOUT = float(os.getenv("SMTP_POOL_ACQUIRE_TIMEOUT", "30"))
+CONNECT_TIMEOUT = float(os.getenv("SMTP_POOL_CONNECT_TIMEOUT", "15"))
+# Row fields that define a session; a change in any of them replaces the pool
+SERVER_FIELDS = ("smtp_server", "smtp_port", "email_address", "password", "use_ssl", "use_tls")
+
+
+class PoolExhausted(Exception):
+    """Raised when no session of a server became free within the timeout"""
+
+
+def is_connection_error(error):
+    """
+    Whether a session cannot be trusted for another message after error.
+
+    smtplib's errors are OSErrors too; only a dropped connection, a failed
+    EHLO or a socket-level error breaks the session. A refused sender or
+    recipient does not (smtplib resets the transaction itself).
+    """
+    if isinstance(error, (smtplib.SMTPServerDisconnected, smtplib.SMTPHeloError)):
+        return True
+    return isinstance(error, OSError) and not isinstance(error, smtplib.SMTPException)
+
+
+def connect(server, timeout=CONNECT_TIMEOUT):
+    """
+    Open an authenticated SMTP session for an email_servers row.
+
+    Port 465, or use_ssl without use_tls, means implicit TLS; otherwise
+    use_tls upgrades the connection with STARTTLS.
+
+    Args:
+        server: email_servers row
+        timeout: Socket timeout in seconds
+
+    Returns:
+        smtplib.SMTP: A session ready for MAIL FROM
+    """
+    host, port = server["smtp_server"], int(server.get("smtp_port") or 587)
+    implicit_tls = port == 465 or (server.get("use_ssl") and not server.get("use_tls"))
+
+    if implicit_tls:
+        smtp = smtplib.SMTP_SSL(host, port, timeout=timeout, context=ssl.create_default_context())
+    else:
+        smtp = smtplib.SMTP(host, port, timeout=timeout)
+    try:
+        smtp.ehlo()
+        if not implicit_tls and server.get("use_tls"):
+            smtp.starttls(context=ssl.create_default_context())
+            smtp.ehlo()
+        if server.get("password") and smtp.has_extn("auth"):
+            smtp.login(server["email_address"], server["password"])
+    except Exception:
+        smtp.close()
+        raise
+    return smtp
+
+
+class _Session:
+    """A pooled SMTP session and its bookkeeping"""
+
+    def __init__(self, smtp):
+        self.smtp = smtp
+        self.created = time.monotonic()
+        self.last_used = self.created
+        self.checkouts = 0
+        self.messages = 0
+        self.broken = False
+
+
+class SMTPConnectionPool:
+    """Warm SMTP sessions of one email server with a concurrency limit"""
+
+    def __init__(self, server, max_connections=None, idle_timeout=IDLE_TIMEOUT,
+                 check_interval=CHECK_INTERVAL, max_messages=MAX_MESSAGES,
+                 acquire_timeout=ACQUIRE_TIMEOUT, connector=connect):
+        self.server = dict(server)
+        self.max_connections = max_connections or server.get("max_connections") or MAX_CONNECTIONS
+        self.idle_timeout = idle_timeout
+        self.check_interval = check_interval
+        self.max_messages = max_messages
+        self.acquire_timeout = acquire_timeout
+        self._connector = connector
+        self._slots = threading.BoundedSemaphore(self.max_connections)
+        self._idle = deque()
+        self._lock = threading.Lock()
+        self._closed = False
+        self.opened = 0
+        self.reused = 0
+        self.evicted = 0
+        self.sent = 0
+
+    @contextmanager
+    def session(self, timeout=None):
+        """
+        Borrow a session for one or more messages.
+
+        A connection-level error inside the block retires the session.
+
+        Raises:
+            PoolExhausted: If every session stays busy for the whole timeout
+        """
+        timeout = self.acquire_timeout if timeout is None else timeout
+        if not self._slots.acquire(timeout=timeout):
+            raise PoolExhausted(f"No SMTP session free for server {self.server.get('id')} within {timeout}s")
+        session = None
+        try:
+            session = self._checkout()
+            yield session
+        except Exception as e:
+            if session is not None and is_connection_error(e):
+                session.broken = True
+            raise
+        finally:
+            if session is not None:
+                self._checkin(session)
+            self._slots.release()
+
+    def send(self, from_addr, to_addrs, message):
+        """
+        Send one message over a pooled session.
+
+        Args:
+            from_addr: Envelope sender
+            to_addrs: Envelope recipients (string or list)
+            message: The message as bytes or str, headers included
+
+        Returns:
+            dict: Refused recipients, as returned by smtplib.SMTP.sendmail
+        """
+        for attempt in (1, 2):
+            with self.session() as session:
+                try:
+                    refused = session.smtp.sendmail(from_addr, to_addrs, message)
+                except smtplib.SMTPServerDisconnected:
+                    # A reused session may have been dropped by the server
+                    # since its last check; a fresh one gets a second chance
+                    session.broken = True
+                    if attempt == 2 or session.checkouts == 1:
+                        raise
+                    logger.info(f"SMTP session of server {self.server.get('id')} was dropped, retrying")
+                    continue
+                session.messages += 1
+                with self._lock:
+                    self.sent += 1
+                return refused
+
+    def evict_idle(self):
+        """
+        Close sessions idle for longer than idle_timeout.
+
+        Returns:
+            int: Number of sessions closed
+        """
+        cutoff = time.monotonic() - self.idle_timeout
+        with self._lock:
+            expired = [session for session in self._idle if session.last_used < cutoff]
+            for session in expired:
+                self._idle.remove(session)
+            self.evicted += len(expired)
+        for session in expired:
+            self._close(session)
+        return len(expired)
+
+    def close(self):
+        """Close all idle sessions; sessions in use are closed when returned"""
+        with self._lock:
+            self._closed = True
+            idle, self._idle = list(self._idle), deque()
+        for session in idle:
+            self._close(session)
+
+    def stats(self):
+        """Counters and current occupancy of this pool"""
+        with self._lock:
+            idle = len(self._idle)
+        return {
+            "max_connections": self.max_connections,
+            "idle": idle,
+            "opened": self.opened,
+            "reused": self.reused,
+            "evicted": self.evicted,
+            "sent": self.sent,
+        }
+
+    def _checkout(self):
+        self.evict_idle()
+        while True:
+            with self._lock:
+                session = self._idle.pop() if self._idle else None
+            if session is None:
+                break
+            if time.monotonic() - session.last_used <= self.check_interval or self._healthy(session):
+                session.checkouts += 1
+                with self._lock:
+                    self.reused += 1
+                return session
+            with self._lock:
+                self.evicted += 1
+            self._close(session)
+
+        session = _Session(self._connector(self.server))
+        session.checkouts = 1
+        with self._lock:
+            self.opened += 1
+        return session
+
+    def _checkin(self, session):
+        session.last_used = time.monotonic()
+        retire = session.broken or session.messages >= self.max_messages
+        with self._lock:
+            if not retire and not self._closed:
+                self._idle.append(session)
+                return
+        self._close(session, quit=not session.broken)
+
+    def _healthy(self, session):
+        try:
+            return session.smtp.noop()[0] == 250
+        except (smtplib.SMTPException, OSError):
+            return False
+
+    def _close(self, session, quit=True):
+        try:
+            if quit:
+                session.smtp.quit()
+            else:
+                session.smtp.close()
+        except (smtplib.SMTPException, OSError):
+            session.smtp.close()
+
+
+class SMTPPoolManager:
+    """One SMTPConnectionPool per email server, keyed by email_servers.id"""
+
+    def __init__(self, reap_interval=IDLE_TIMEOUT / 2, **pool_options):
+        self._pool_options = pool_options
+        self._reap_interval = reap_interval
+        self._pools = {}
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        self._reaper = None
+
+    def pool(self, server):
+        """
+        The pool of an email_servers row, replacing it if the row changed.
+
+        Args:
+            server: email_servers row (needs id and the SERVER_FIELDS)
+
+        Returns:
+            SMTPConnectionPool
+        """
+        fingerprint = tuple(server.get(field) for field in SERVER_FIELDS) + (server.get("max_connections"),)
+        stale = None
+        with self._lock:
+            if self._pid != os.getpid():
+                # Sockets inherited over fork belong to the parent
+                self._pools, self._pid = {}, os.getpid()
+            entry = self._pools.get(server["id"])
+            if entry is None or entry[0] != fingerprint:
+                stale = entry[1] if entry else None
+                entry = (fingerprint, SMTPConnectionPool(server, **self._pool_options))
+                self._pools[server["id"]] = entry
+            self._ensure_reaper()
+        if stale is not None:
+            stale.close()
+        return entry[1]
+
+    def send(self, server, from_addr, to_addrs, message):
+        """Send one message through the pool of an email server"""
+        return self.pool(server).send(from_addr, to_addrs, message)
+
+    def discard(self, server_id):
+        """Close and forget the pool of a deleted or disabled server"""
+        with self._lock:
+            entry = self._pools.pop(server_id, None)
+        if entry:
+            entry[1].close()
+
+    def evict_idle(self):
+        """Close idle-expired sessions in every pool"""
+        with self._lock:
+            pools = [entry[1] for entry in self._pools.values()]
+        return sum(pool.evict_idle() for pool in pools)
+
+    def close(self):
+        """Close every pool"""
+        with self._lock:
+            pools, self._pools = [entry[1] for entry in self._pools.values()], {}
+        for pool in pools:
+            pool.close()
+
+    def stats(self):
+        """Per-server pool stats"""
+        with self._lock:
+            pools = dict(self._pools)
+        return {server_id: entry[1].stats() for server_id, entry in pools.items()}
+
+    def _ensure_reaper(self):
+        # Called with the lock held
+        if self._reap_interval and (self._reaper is None or not self._reaper.is_alive()):
+            self._reaper = threading.Thread(target=self._reap, name="smtp-pool-reaper", daemon=True)
+            self._reaper.start()
+
+    def _reap(self):
+        while True:
+            time.sleep(self._reap_interval)
+            try:
+                self.evict_idle()
+            except Exception as e:
+                logger.warning(f"SMTP pool reaper failed: {e}")
+
+
+# Process-wide pools used by senders
+smtp_pools = SMTPPoolManager()
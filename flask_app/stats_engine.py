@@ -0,0 +1,101 @@
+"""
+Dashboard statistics backed by the owner_stats counter table.
+
+Counters are maintained incrementally by database triggers as leads,
+campaigns and email events are written, so reading the overview is a single
+primary-key lookup. reconcile() recomputes them from the base tables and is
+run periodically to fix any drift.
+"""
+import logging
+from flask_app.auth import create_supabase_client
+
+logger = logging.getLogger(__name__)
+
+COUNTER_COLUMNS = ("leads", "campaigns", "active_campaigns", "sent", "bounced", "opened", "clicked", "replied")
+
+
+def _rate(numerator, denominator):
+    return round(numerator / denominator, 4) if denominator else 0.0
+
+
+def _overview_from_row(row):
+    counters = {column: row.get(column) or 0 for column in COUNTER_COLUMNS}
+    sent = counters["sent"]
+    delivered = sent - counters["bounced"]
+
+    return {
+        "leads": counters["leads"],
+        "campaigns": counters["campaigns"],
+        "active_campaigns": counters["active_campaigns"],
+        "sent": sent,
+        "opens": counters["opened"],
+        "clicks": counters["clicked"],
+        "replies": counters["replied"],
+        "open_rate": _rate(counters["opened"], delivered),
+        "click_rate": _rate(counters["clicked"], delivered),
+        "reply_rate": _rate(counters["replied"], delivered),
+        "delivery_rate": _rate(delivered, sent),
+        "updated_at": row.get("updated_at"),
+    }
+
+
+def get_overview(owner):
+    """
+    Get the dashboard overview for an owner.
+
+    Args:
+        owner: The owner's user ID
+
+    Returns:
+        dict: Counters and derived rates
+    """
+    supabase = create_supabase_client()
+    response = supabase.table("owner_stats") \
+        .select(",".join(COUNTER_COLUMNS) + ",updated_at") \
+        .eq("owner", owner) \
+        .limit(1) \
+        .execute()
+
+    return _overview_from_row(response.data[0] if response.data else {})
+
+
+def get_overviews(owners):
+    """
+    Get the dashboard overviews of several owners in one query.
+
+    Args:
+        owners: Iterable of owner IDs
+
+    Returns:
+        dict: Owner ID -> overview as returned by get_overview
+    """
+    owners = sorted({owner for owner in owners if owner})
+    if not owners:
+        return {}
+
+    supabase = create_supabase_client()
+    response = supabase.table("owner_stats") \
+        .select("owner," + ",".join(COUNTER_COLUMNS) + ",updated_at") \
+        .in_("owner", owners) \
+        .execute()
+
+    rows = {row["owner"]: row for row in response.data or []}
+    return {owner: _overview_from_row(rows.get(owner, {})) for owner in owners}
+
+
+def reconcile(owner=None):
+    """
+    Recompute counters from leads, campaigns and email_log.
+
+    Args:
+        owner: Only reconcile this owner (all owners when None)
+
+    Returns:
+        int: Number of owners whose counters had drifted
+    """
+    supabase = create_supabase_client()
+    response = supabase.rpc("reconcile_owner_stats", {"p_owner": owner}).execute()
+    fixed = response.data or 0
+    if fixed:
+        logger.warning(f"Reconciled drifted stats counters for {fixed} owner(s)")
+    return fixed
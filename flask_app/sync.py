@@ -0,0 +1,144 @@
+"""
+Delta sync of leads, campaigns and templates.
+
+A client keeps one opaque cursor per resource. get_changes() returns the
+rows created or updated after the cursor and the ids deleted after it
+(tombstones), in (updated_at, id) keyset order, plus the cursor to send
+next time. An empty cursor starts from the beginning, which is a full
+load in pages.
+
+Besides the keyset position, a cursor carries the time up to which the
+client is known to be caught up: the server's read time when a page came
+back short (nothing left to read), else the time of its last change. An
+empty page advances that time. Tombstones are kept for
+TOMBSTONE_RETENTION_DAYS; a cursor whose sync time is older than that may
+have missed deletes and is rejected with CursorExpired, after which the
+client refetches the resource from scratch. A resource that simply has
+not changed stays valid as long as the client keeps syncing it.
+"""
+import base64
+import binascii
+import json
+import os
+import logging
+import uuid
+from datetime import datetime, timedelta, timezone
+from flask_app.auth import create_supabase_client
+
+logger = logging.getLogger(__name__)
+
+RESOURCES = ("leads", "campaigns", "templates")
+DEFAULT_LIMIT = 500
+MAX_LIMIT = 1000
+# Changes younger than this are held back until concurrent writes have committed
+SYNC_LAG_SECONDS = int(os.getenv("SYNC_LAG_SECONDS", "10"))
+TOMBSTONE_RETENTION_DAYS = int(os.getenv("SYNC_TOMBSTONE_RETENTION_DAYS", "30"))
+
+
+class CursorExpired(Exception):
+    """Raised when a cursor is older than the tombstone retention"""
+
+
+def encode_cursor(changed_at, record_id, synced_at=None) -> str:
+    """Pack a keyset position and the time the client is caught up to into an opaque URL-safe cursor"""
+    payload = json.dumps([changed_at, str(record_id), synced_at or changed_at], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(payload).rstrip(b"=").decode("ascii")
+
+
+def decode_cursor(cursor):
+    """
+    Unpack a cursor.
+
+    Returns:
+        tuple: (changed_at datetime, record id string, synced_at datetime),
+        or (None, None, None) for an empty cursor
+
+    Raises:
+        ValueError: If the cursor is malformed
+    """
+    if not cursor:
+        return None, None, None
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        fields = json.loads(base64.urlsafe_b64decode(padded))
+        # Cursors issued before the sync time was added have two fields
+        changed_at, record_id, synced_at = fields if len(fields) == 3 else (*fields, fields[0])
+        timestamp = datetime.fromisoformat(changed_at)
+        synced = datetime.fromisoformat(synced_at)
+        uuid.UUID(record_id)
+    except (binascii.Error, TypeError, ValueError) as e:
+        raise ValueError(f"Invalid sync cursor: {cursor}") from e
+    if timestamp.tzinfo is None or synced.tzinfo is None:
+        raise ValueError(f"Invalid sync cursor: {cursor}")
+    return timestamp, record_id, synced
+
+
+def get_changes(resource, owner, cursor=None, limit=DEFAULT_LIMIT):
+    """
+    Changes of one resource after a cursor.
+
+    Args:
+        resource: One of RESOURCES
+        owner: The owner's user ID
+        cursor: Cursor from the previous call, or None to start from the beginning
+        limit: Maximum number of changes returned
+
+    Returns:
+        dict: {"upserts": rows, "deleted": ids, "cursor": next cursor, "has_more": bool}
+
+    Raises:
+        ValueError: For an unknown resource, a bad limit or a malformed cursor
+        CursorExpired: If deletes after the cursor may have been pruned
+    """
+    if resource not in RESOURCES:
+        raise ValueError(f"resource must be one of {', '.join(RESOURCES)}")
+    if not 1 <= limit <= MAX_LIMIT:
+        raise ValueError(f"limit must be between 1 and {MAX_LIMIT}")
+
+    after_ts, after_id, synced_at = decode_cursor(cursor)
+    if synced_at is not None and synced_at < datetime.now(timezone.utc) - timedelta(days=TOMBSTONE_RETENTION_DAYS):
+        raise CursorExpired(f"Cursor is older than {TOMBSTONE_RETENTION_DAYS} days; refetch {resource}")
+
+    # Everything up to this time is visible to the read below
+    read_at = (datetime.now(timezone.utc) - timedelta(seconds=SYNC_LAG_SECONDS)).isoformat()
+    supabase = create_supabase_client()
+    response = supabase.rpc("sync_changes", {
+        "p_resource": resource,
+        "p_owner": owner,
+        "p_after_ts": after_ts.isoformat() if after_ts else None,
+        "p_after_id": after_id,
+        "p_limit": limit,
+        "p_lag": f"{SYNC_LAG_SECONDS} seconds",
+    }).execute()
+    changes = response.data or []
+
+    upserts = [change["record"] for change in changes if change["op"] == "upsert"]
+    deleted = [change["id"] for change in changes if change["op"] == "delete"]
+    has_more = len(changes) == limit
+    if changes:
+        # A short page read everything up to read_at
+        cursor = encode_cursor(changes[-1]["changed_at"], changes[-1]["id"],
+                               None if has_more else read_at)
+    elif after_ts is not None:
+        cursor = encode_cursor(after_ts.isoformat(), after_id, read_at)
+
+    return {
+        "upserts": upserts,
+        "deleted": deleted,
+        "cursor": cursor,
+        "has_more": has_more,
+    }
+
+
+def prune_tombstones(retention_days=TOMBSTONE_RETENTION_DAYS):
+    """
+    Delete tombstones no valid cursor can still need.
+
+    Returns:
+        int: Number of tombstones deleted
+    """
+    supabase = create_supabase_client()
+    response = supabase.rpc("prune_deleted_records", {"p_keep": f"{retention_days} days"}).execute()
+    deleted = response.data or 0
+    logger.info(f"Pruned {deleted} sync tombstones older than {retention_days} days")
+    return deleted
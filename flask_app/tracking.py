@@ -0,0 +1,98 @@
+"""
+Stateless signed tokens for open-pixel and click-redirect tracking URLs.
+
+A token carries the email_log id (16 raw bytes) and, for clicks, the target
+URL, followed by a truncated HMAC-SHA256 signature. Everything is packed into
+one URL-safe base64 string, so the tracking endpoints can verify and redirect
+without any database lookup.
+"""
+import base64
+import hashlib
+import hmac
+import os
+import uuid
+from urllib.parse import urlparse
+
+# Bytes of HMAC-SHA256 kept in the token (96 bits)
+SIGNATURE_BYTES = 12
+
+
+class InvalidToken(Exception):
+    """Raised when a tracking token is malformed or its signature is wrong"""
+
+
+class TrackingNotConfigured(RuntimeError):
+    """Raised when neither TRACKING_SECRET nor SECRET_KEY is set"""
+
+
+def is_configured() -> bool:
+    """Whether a secret to sign and verify tracking tokens is set"""
+    return bool(os.getenv("TRACKING_SECRET") or os.getenv("SECRET_KEY"))
+
+
+def _secret() -> bytes:
+    secret = os.getenv("TRACKING_SECRET") or os.getenv("SECRET_KEY")
+    if not secret:
+        raise TrackingNotConfigured("TRACKING_SECRET is not configured")
+    return secret.encode()
+
+
+def _sign(payload: bytes) -> bytes:
+    return hmac.new(_secret(), payload, hashlib.sha256).digest()[:SIGNATURE_BYTES]
+
+
+def _encode(payload: bytes) -> str:
+    return base64.urlsafe_b64encode(_sign(payload) + payload).rstrip(b"=").decode("ascii")
+
+
+def make_open_token(email_id) -> str:
+    """Create the token for an email's open pixel"""
+    return _encode(uuid.UUID(str(email_id)).bytes)
+
+
+def make_click_token(email_id, url: str) -> str:
+    """Create the token for a tracked link to url"""
+    if urlparse(url).scheme not in ("http", "https"):
+        raise ValueError(f"Only http(s) links can be tracked: {url}")
+    return _encode(uuid.UUID(str(email_id)).bytes + url.encode("utf-8"))
+
+
+def parse_token(token: str):
+    """
+    Verify a tracking token.
+
+    Returns:
+        tuple: (email_id, url) where url is None for open tokens
+
+    Raises:
+        InvalidToken: If the token is malformed or was not signed by us
+    """
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+    except (ValueError, TypeError):
+        raise InvalidToken("Malformed token")
+
+    if len(raw) < SIGNATURE_BYTES + 16:
+        raise InvalidToken("Token too short")
+
+    signature, payload = raw[:SIGNATURE_BYTES], raw[SIGNATURE_BYTES:]
+    if not hmac.compare_digest(signature, _sign(payload)):
+        raise InvalidToken("Bad signature")
+
+    email_id = str(uuid.UUID(bytes=payload[:16]))
+    url = payload[16:].decode("utf-8") if len(payload) > 16 else None
+    return email_id, url
+
+
+def _base_url() -> str:
+    return os.getenv("TRACKING_BASE_URL", "").rstrip("/")
+
+
+def open_pixel_url(email_id) -> str:
+    """Absolute URL of the open pixel for an email"""
+    return f"{_base_url()}/t/o/{make_open_token(email_id)}.gif"
+
+
+def click_url(email_id, url: str) -> str:
+    """Absolute tracked URL that redirects to url"""
+    return f"{_base_url()}/t/c/{make_click_token(email_id, url)}"
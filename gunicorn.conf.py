@@ -8,6 +8,7 @@ backlog = 2048
 
 # Worker processes
 workers = os.environ.get('WEB_CONCURRENCY', 4)
+# /live/stream is served by separate gevent workers (gunicorn.live.conf.py)
 worker_class = 'sync'
 worker_connections = 1000
 timeout = 30
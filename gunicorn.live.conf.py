@@ -0,0 +1,37 @@
+"""Gunicorn configuration for the /live Server-Sent Events service."""
+
+import os
+
+# Patch before preload_app imports the app (ssl, threading, redis). Only
+# this service runs gevent; the main API keeps sync workers.
+from gevent import monkey
+monkey.patch_all()
+
+# Server socket
+bind = f"0.0.0.0:{os.environ.get('PORT', 5001)}"
+backlog = 2048
+
+# Worker processes: a waiting /live/stream client is a parked greenlet
+workers = os.environ.get('LIVE_WEB_CONCURRENCY', 2)
+worker_class = 'gevent'
+worker_connections = 1000
+# Streams send a heartbeat well within the timeout
+timeout = 30
+keepalive = 2
+
+# Streams are long-lived; recycling a worker after N requests would drop
+# every open stream at once
+max_requests = 0
+
+# Logging
+loglevel = 'info'
+accesslog = '-'
+errorlog = '-'
+access_log_format = '%(h)s %(l)s %(u)s %(t)s "%(r)s" %(s)s %(b)s "%(f)s" "%(a)s"'
+
+# Process naming
+proc_name = 'cozy-react-blueprint-box-live'
+
+# Server mechanics
+preload_app = True
+daemon = False
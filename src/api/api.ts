@@ -3,18 +3,39 @@ const base = import.meta.env.DEV
   ? '/api'  // Development: use Vite proxy
   : import.meta.env.VITE_API_URL || 'https://cold-outreach-tool.onrender.com';  // Production: direct to Render
 
+// Live streams go to the gevent service when it has its own URL
+const liveBase = import.meta.env.DEV
+  ? base
+  : import.meta.env.VITE_LIVE_API_URL || base;
+
 // Add dev API key header in development mode
 const devHeaders: HeadersInit = import.meta.env.DEV
   ? { 'X-API-Key': 'dev-secret' }   // matches .env in Flask backend
   : {};
 
 // Campaign type definition
+export interface CampaignMetrics {
+  leads: number;
+  sent: number;
+  bounced: number;
+  opened: number;
+  clicked: number;
+  replied: number;
+  open_rate: number;
+  click_rate: number;
+  reply_rate: number;
+  last_sent_at: string | null;
+  dirty_since: string | null;   // set while a refresh is pending
+  refreshed_at: string | null;
+}
+
 export interface Campaign {
   id: string;
   name: string;
   description: string | null;
   created_at: string;   // ISO
   updated_at: string;   // ISO
+  metrics?: CampaignMetrics | null;   // included by the list endpoint
 }
 
 export async function apiRequest<T>(
@@ -66,3 +87,89 @@ export const updateCampaign = (id: string, body: Partial<Pick<Campaign, 'name' |
     apiRequest<Campaign>(`/campaigns/${id}`, { method: 'PATCH', body: JSON.stringify(body) });
 export const deleteCampaign = (id: string) =>
     apiRequest<void>(`/campaigns/${id}`, { method: 'DELETE' });
+
+export interface EnrollResult {
+    leads: number;
+    steps: number;
+    scheduled: number;
+    skipped: number;
+}
+
+// Schedule every step of a campaign for the given leads (or all leads); safe to repeat
+export const enrollLeads = (id: string, body: { lead_ids?: string[]; all_leads?: boolean; start_at?: string }) =>
+    apiRequest<EnrollResult>(`/campaigns/${id}/enroll`, { method: 'POST', body: JSON.stringify(body) });
+
+// Delta sync: rows created or updated since a cursor, plus deleted ids.
+// A 410 means the cursor is too old; refetch the full list instead.
+export type SyncResource = 'leads' | 'campaigns' | 'templates';
+
+export interface SyncPage<T> {
+  upserts: T[];
+  deleted: string[];
+  cursor: string | null;   // send as `since` next time
+  has_more: boolean;
+}
+
+export const getChanges = <T>(resource: SyncResource, since?: string | null, limit?: number) => {
+  const params = new URLSearchParams();
+  if (since) params.set('since', since);
+  if (limit) params.set('limit', String(limit));
+  const query = params.toString();
+  return apiRequest<SyncPage<T>>(`/sync/${resource}${query ? `?${query}` : ''}`);
+};
+
+// Bring a cached list up to date: applies every page of changes after
+// `since` and returns the merged list with the cursor to store.
+export async function syncList<T extends { id: string }>(
+  resource: SyncResource,
+  items: T[],
+  since: string | null
+): Promise<{ items: T[]; cursor: string | null }> {
+  const byId = new Map(items.map(item => [item.id, item]));
+  let cursor = since;
+  let page: SyncPage<T>;
+  do {
+    page = await getChanges<T>(resource, cursor);
+    page.upserts.forEach(item => byId.set(item.id, item));
+    page.deleted.forEach(id => byId.delete(id));
+    cursor = page.cursor;
+  } while (page.has_more);
+  return { items: Array.from(byId.values()), cursor };
+}
+
+// Live updates (Server-Sent Events). fetch() is used instead of EventSource
+// so the same auth headers as every other request can be sent.
+export type LiveEvent = { event: string; data: any };
+
+export async function streamLiveEvents(
+  onEvent: (event: LiveEvent) => void,
+  signal: AbortSignal
+): Promise<void> {
+  const authHeaders = await getAuthHeaders();
+  const res = await fetch(`${liveBase}/live/stream`, {
+    credentials: 'include',
+    headers: { Accept: 'text/event-stream', ...devHeaders, ...authHeaders },
+    signal,
+  });
+  if (!res.ok || !res.body) throw new Error(`Live stream failed: ${res.status}`);
+
+  const reader = res.body.pipeThrough(new TextDecoderStream()).getReader();
+  let buffer = '';
+  for (;;) {
+    const { value, done } = await reader.read();
+    if (done) return;
+    buffer += value;
+    let end;
+    while ((end = buffer.indexOf('\n\n')) !== -1) {
+      const message = buffer.slice(0, end);
+      buffer = buffer.slice(end + 2);
+      let event = 'message';
+      let data = '';
+      for (const line of message.split('\n')) {
+        if (line.startsWith('event: ')) event = line.slice(7);
+        else if (line.startsWith('data: ')) data += line.slice(6);
+      }
+      if (data) onEvent({ event, data: JSON.parse(data) });
+    }
+  }
+}
@@ -4,12 +4,15 @@ import { useQuery } from "@tanstack/react-query";
 import { StatsCard } from "@/components/StatsCard";
 import { PerformanceChart } from "@/components/PerformanceChart";
 import { dashboardApi } from "@/services/api";
+import { useLiveUpdates } from "@/hooks/useLiveUpdates";
 
 export function DashboardContent() {
   const { data: stats, isLoading } = useQuery({
     queryKey: ['dashboard-overview'],
     queryFn: dashboardApi.getOverview,
   });
+  // Counters are pushed over SSE; no polling needed
+  useLiveUpdates();
 
   return (
     <div className="p-6">
@@ -1 +1,2 @@
 export * from './useCampaigns';
+export * from './useLiveUpdates';
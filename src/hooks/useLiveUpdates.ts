@@ -0,0 +1,41 @@
+import { useEffect } from 'react';
+import { useQueryClient } from '@tanstack/react-query';
+import { streamLiveEvents } from '@/api/api';
+
+const RECONNECT_MS = 5000;
+
+/**
+ * Keep dashboard queries fresh from the /live/stream SSE endpoint instead of
+ * polling: counters are written straight into the cache and email status
+ * changes mark the campaign queries stale.
+ */
+export const useLiveUpdates = () => {
+  const qc = useQueryClient();
+
+  useEffect(() => {
+    const controller = new AbortController();
+    let timer: ReturnType<typeof setTimeout> | undefined;
+
+    const connect = () => {
+      streamLiveEvents(({ event, data }) => {
+        if (event === 'stats' && data) {
+          qc.setQueryData(['dashboard-overview'], data);
+        } else if (event === 'emails') {
+          qc.invalidateQueries({ queryKey: ['campaigns'] });
+        }
+      }, controller.signal)
+        .catch((error) => {
+          if (!controller.signal.aborted) console.warn('Live updates disconnected:', error);
+        })
+        .finally(() => {
+          if (!controller.signal.aborted) timer = setTimeout(connect, RECONNECT_MS);
+        });
+    };
+
+    connect();
+    return () => {
+      controller.abort();
+      clearTimeout(timer);
+    };
+  }, [qc]);
+};
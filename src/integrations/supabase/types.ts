@@ -146,6 +146,7 @@ export type Database = {
           email_address: string
           id: string
           is_default: boolean
+          max_connections: number
           owner: string
           password: string
           pop_imap_server: string
@@ -160,6 +161,7 @@ export type Database = {
           email_address: string
           id?: string
           is_default?: boolean
+          max_connections?: number
           owner: string
           password: string
           pop_imap_server: string
@@ -174,6 +176,7 @@ export type Database = {
           email_address?: string
           id?: string
           is_default?: boolean
+          max_connections?: number
           owner?: string
           password?: string
           pop_imap_server?: string
@@ -187,43 +190,73 @@ export type Database = {
       }
       inbox_emails: {
         Row: {
+          attachments: Json
           body_preview: string | null
           created_at: string
+          email_server_id: string | null
           full_body: string | null
           id: string
+          in_reply_to: string | null
           is_read: boolean
+          message_id: string | null
+          message_references: string | null
           owner: string
           received_at: string
           recipient_email: string
+          reply_checked_at: string | null
+          reply_to_email_id: string | null
           sender_email: string
           sender_name: string | null
           subject: string
+          thread_key: string
+          uid: number | null
+          uidvalidity: number | null
         }
         Insert: {
+          attachments?: Json
           body_preview?: string | null
           created_at?: string
+          email_server_id?: string | null
           full_body?: string | null
           id?: string
+          in_reply_to?: string | null
           is_read?: boolean
+          message_id?: string | null
+          message_references?: string | null
           owner: string
           received_at?: string
           recipient_email: string
+          reply_checked_at?: string | null
+          reply_to_email_id?: string | null
           sender_email: string
           sender_name?: string | null
           subject: string
+          thread_key?: never
+          uid?: number | null
+          uidvalidity?: number | null
         }
         Update: {
+          attachments?: Json
           body_preview?: string | null
           created_at?: string
+          email_server_id?: string | null
           full_body?: string | null
           id?: string
+          in_reply_to?: string | null
           is_read?: boolean
+          message_id?: string | null
+          message_references?: string | null
           owner?: string
           received_at?: string
           recipient_email?: string
+          reply_checked_at?: string | null
+          reply_to_email_id?: string | null
           sender_email?: string
           sender_name?: string | null
           subject?: string
+          thread_key?: never
+          uid?: number | null
+          uidvalidity?: number | null
         }
         Relationships: []
       }
@@ -262,27 +295,59 @@ export type Database = {
       }
       senders: {
         Row: {
+          created_at: string | null
           daily_quota: number | null
           display_name: string | null
           email: string | null
+          email_server_id: string | null
           id: string
           owner: string | null
+          ramp: number[] | null
+          updated_at: string | null
+          warmup_curve: string | null
+          warmup_days: number | null
+          warmup_start_date: string | null
+          warmup_start_quota: number | null
         }
         Insert: {
+          created_at?: string | null
           daily_quota?: number | null
           display_name?: string | null
           email?: string | null
+          email_server_id?: string | null
           id?: string
           owner?: string | null
+          ramp?: number[] | null
+          updated_at?: string | null
+          warmup_curve?: string | null
+          warmup_days?: number | null
+          warmup_start_date?: string | null
+          warmup_start_quota?: number | null
         }
         Update: {
+          created_at?: string | null
           daily_quota?: number | null
           display_name?: string | null
           email?: string | null
+          email_server_id?: string | null
           id?: string
           owner?: string | null
+          ramp?: number[] | null
+          updated_at?: string | null
+          warmup_curve?: string | null
+          warmup_days?: number | null
+          warmup_start_date?: string | null
+          warmup_start_quota?: number | null
         }
-        Relationships: []
+        Relationships: [
+          {
+            foreignKeyName: "senders_email_server_id_fkey"
+            columns: ["email_server_id"]
+            isOneToOne: true
+            referencedRelation: "email_servers"
+            referencedColumns: ["id"]
+          },
+        ]
       }
       step_variants: {
         Row: {
@@ -1,6 +1,6 @@
 import { toast } from "@/components/ui/sonner";
 import { apiRequest as baseApiRequest, getAuthHeaders } from "@/api/api";
-import { Lead, LeadListResponse, TemplateListResponse } from '@/types/api';
+import { Lead, LeadListResponse, Sender, TemplateListResponse } from '@/types/api';
 
 const handleApiError = (error: any) => {
   console.error('API Error:', error);
@@ -61,6 +61,21 @@ export const templatesApi = {
 // Senders API
 export const sendersApi = {
   getAll: () => apiRequest('/senders/'),
+  getById: (id: string) => apiRequest(`/senders/${id}`),
+  create: (data: Partial<Sender>) =>
+    apiRequest('/senders/', {
+      method: 'POST',
+      body: JSON.stringify(data),
+    }),
+  update: (id: string, data: Partial<Sender>) =>
+    apiRequest(`/senders/${id}`, {
+      method: 'PATCH',
+      body: JSON.stringify(data),
+    }),
+  delete: (id: string) =>
+    apiRequest(`/senders/${id}`, {
+      method: 'DELETE',
+    }),
 };
 
 // Leads API
@@ -39,3 +39,18 @@ export interface Template {
 
 // Template list response type
 export type TemplateListResponse = PaginatedResponse<Template>;
+
+// Sender type definition; ramp holds the warm-up's daily caps
+export interface Sender {
+  id: string;
+  email: string;
+  display_name: string | null;
+  email_server_id: string | null;
+  daily_quota: number | null;
+  warmup_days: number | null;
+  warmup_start_quota: number | null;
+  warmup_curve: 'linear' | 'exponential' | null;
+  warmup_start_date: string | null;
+  ramp: number[] | null;
+  cap_today: number | null;
+}
@@ -3,6 +3,8 @@
 interface ImportMetaEnv {
     readonly VITE_SUPABASE_URL: string;
     readonly VITE_SUPABASE_ANON_KEY: string;
+    readonly VITE_API_URL?: string;
+    readonly VITE_LIVE_API_URL?: string;
     // voeg hier meer VITE_... var's toe als je ze later nodig hebt
   }
   
@@ -0,0 +1,140 @@
+-- Append-only log of email tracking events (opens, clicks, replies).
+-- One row per event, range-partitioned by month on ts. email_log.status is
+-- derived from this table by record_email_events() instead of being
+-- overwritten by each webhook.
+CREATE TABLE IF NOT EXISTS public.email_events (
+  id          BIGINT GENERATED ALWAYS AS IDENTITY,
+  email_id    UUID NOT NULL,
+  owner       UUID,
+  campaign_id UUID,
+  lead_id     UUID,
+  step_id     UUID,
+  event_type  TEXT NOT NULL CHECK (event_type IN ('open', 'click', 'reply')),
+  url         TEXT,
+  ts          TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW(),
+  metadata    JSONB,
+  created_at  TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW(),
+  PRIMARY KEY (id, ts)
+) PARTITION BY RANGE (ts);
+
+-- Catch-all for events outside the pre-created monthly partitions
+CREATE TABLE IF NOT EXISTS public.email_events_default
+  PARTITION OF public.email_events DEFAULT;
+
+-- Indexes are created on every partition
+CREATE INDEX IF NOT EXISTS idx_email_events_email_ts ON public.email_events(email_id, ts);
+CREATE INDEX IF NOT EXISTS idx_email_events_campaign_ts ON public.email_events(campaign_id, ts);
+CREATE INDEX IF NOT EXISTS idx_email_events_owner_ts ON public.email_events(owner, ts);
+
+ALTER TABLE public.email_events ENABLE ROW LEVEL SECURITY;
+
+CREATE POLICY "Users can view their own email events"
+  ON public.email_events
+  FOR SELECT
+  USING (auth.uid() = owner);
+
+-- Create the monthly partition containing p_month (no-op if it exists)
+CREATE OR REPLACE FUNCTION public.create_email_events_partition(p_month DATE)
+RETURNS TEXT
+LANGUAGE plpgsql
+AS $$
+DECLARE
+  v_start DATE := date_trunc('month', p_month)::DATE;
+  v_end   DATE := (date_trunc('month', p_month) + INTERVAL '1 month')::DATE;
+  v_name  TEXT := format('email_events_y%sm%s', to_char(v_start, 'YYYY'), to_char(v_start, 'MM'));
+BEGIN
+  EXECUTE format(
+    'CREATE TABLE IF NOT EXISTS public.%I PARTITION OF public.email_events FOR VALUES FROM (%L) TO (%L)',
+    v_name, v_start, v_end
+  );
+  RETURN v_name;
+END;
+$$;
+
+-- Make sure the current month and the next p_months_ahead months exist
+CREATE OR REPLACE FUNCTION public.ensure_email_events_partitions(p_months_ahead INT DEFAULT 3)
+RETURNS SETOF TEXT
+LANGUAGE plpgsql
+AS $$
+DECLARE
+  i INT;
+BEGIN
+  FOR i IN 0..p_months_ahead LOOP
+    RETURN NEXT public.create_email_events_partition((date_trunc('month', NOW()) + make_interval(months => i))::DATE);
+  END LOOP;
+END;
+$$;
+
+SELECT public.ensure_email_events_partitions(3);
+
+-- Precedence used when deriving email_log.status: a later open never
+-- downgrades a clicked or replied email.
+CREATE OR REPLACE FUNCTION public.email_status_rank(p_status TEXT)
+RETURNS INT
+LANGUAGE sql
+IMMUTABLE
+AS $$
+  SELECT CASE p_status
+    WHEN 'opened'  THEN 1
+    WHEN 'clicked' THEN 2
+    WHEN 'replied' THEN 3
+    ELSE 0
+  END;
+$$;
+
+-- Append a batch of events with one multi-row insert, then derive the status
+-- of every touched email_log row from its event history. p_events is a JSON
+-- array of {email_id, event_type, url, ts, metadata}. Events for unknown
+-- emails are dropped. Returns the email_log rows whose derived state changed.
+CREATE OR REPLACE FUNCTION public.record_email_events(p_events JSONB)
+RETURNS TABLE (email_id UUID, owner UUID, campaign_id UUID, status TEXT)
+LANGUAGE plpgsql
+AS $$
+DECLARE
+  v_email_ids UUID[];
+BEGIN
+  WITH incoming AS (
+    SELECT e.email_id, e.event_type, e.url, COALESCE(e.ts, NOW()) AS ts, e.metadata
+    FROM jsonb_to_recordset(p_events)
+      AS e(email_id UUID, event_type TEXT, url TEXT, ts TIMESTAMPTZ, metadata JSONB)
+  ),
+  inserted AS (
+    INSERT INTO public.email_events (email_id, owner, campaign_id, lead_id, step_id, event_type, url, ts, metadata)
+    SELECT i.email_id, l.owner, l.campaign_id, l.lead_id, l.step_id, i.event_type, i.url, i.ts, i.metadata
+    FROM incoming i
+    JOIN public.email_log l ON l.id = i.email_id
+    RETURNING email_events.email_id
+  )
+  SELECT array_agg(DISTINCT inserted.email_id) INTO v_email_ids FROM inserted;
+
+  IF v_email_ids IS NULL THEN
+    RETURN;
+  END IF;
+
+  RETURN QUERY
+  WITH derived AS (
+    SELECT ev.email_id,
+           MAX(CASE ev.event_type WHEN 'open' THEN 1 WHEN 'click' THEN 2 ELSE 3 END) AS rank,
+           (array_agg(ev.url ORDER BY ev.ts DESC) FILTER (WHERE ev.event_type = 'click'))[1] AS clicked_url,
+           MAX(ev.ts) FILTER (WHERE ev.event_type = 'click') AS clicked_at
+    FROM public.email_events ev
+    WHERE ev.email_id = ANY(v_email_ids)
+    GROUP BY ev.email_id
+  )
+  UPDATE public.email_log AS l
+     SET status = CASE GREATEST(public.email_status_rank(l.status::TEXT), d.rank)
+                    WHEN 1 THEN 'opened'
+                    WHEN 2 THEN 'clicked'
+                    ELSE 'replied'
+                  END::public.email_status,
+         clicked_url = COALESCE(d.clicked_url, l.clicked_url),
+         clicked_at  = COALESCE(d.clicked_at, l.clicked_at)
+    FROM derived d
+   WHERE l.id = d.email_id
+  RETURNING l.id, l.owner, l.campaign_id, l.status::TEXT;
+END;
+$$;
+
+COMMENT ON TABLE public.email_events IS 'Append-only email tracking events, one row per open, click or reply';
+COMMENT ON COLUMN public.email_events.url IS 'Clicked URL for click events';
+COMMENT ON COLUMN public.email_events.metadata IS 'Provider metadata; reply events carry reply_content here';
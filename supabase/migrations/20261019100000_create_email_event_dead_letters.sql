@@ -0,0 +1,49 @@
+-- Dead-letter store for email events that could not be recorded.
+-- Rows are retried with exponential backoff until they are replayed or
+-- parked (next_attempt_at NULL) after too many attempts.
+CREATE TABLE IF NOT EXISTS public.email_event_dead_letters (
+  id              BIGINT GENERATED ALWAYS AS IDENTITY PRIMARY KEY,
+  event           JSONB NOT NULL,
+  error           TEXT,
+  attempts        INT NOT NULL DEFAULT 1,
+  first_failed_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW(),
+  last_failed_at  TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW(),
+  next_attempt_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+  replayed_at     TIMESTAMP WITH TIME ZONE
+);
+
+-- Replay scans only the pending rows that are due
+CREATE INDEX IF NOT EXISTS idx_email_event_dead_letters_due
+  ON public.email_event_dead_letters(next_attempt_at, id)
+  WHERE replayed_at IS NULL;
+
+-- Service role only
+ALTER TABLE public.email_event_dead_letters ENABLE ROW LEVEL SECURITY;
+
+-- Record another failed attempt for a set of dead letters and schedule the
+-- next one: 30s, 1m, 2m, ... capped at 1 hour. After p_max_attempts the
+-- rows are parked with next_attempt_at NULL.
+CREATE OR REPLACE FUNCTION public.defer_email_event_dead_letters(
+  p_ids BIGINT[],
+  p_error TEXT,
+  p_max_attempts INT DEFAULT 10
+)
+RETURNS INT
+LANGUAGE sql
+AS $$
+  WITH deferred AS (
+    UPDATE public.email_event_dead_letters
+       SET attempts = attempts + 1,
+           error = p_error,
+           last_failed_at = NOW(),
+           next_attempt_at = CASE
+             WHEN attempts + 1 >= p_max_attempts THEN NULL
+             ELSE NOW() + LEAST(INTERVAL '1 hour', INTERVAL '30 seconds' * power(2, attempts - 1))
+           END
+     WHERE id = ANY(p_ids)
+    RETURNING 1
+  )
+  SELECT COUNT(*)::INT FROM deferred;
+$$;
+
+COMMENT ON TABLE public.email_event_dead_letters IS 'Email events that failed to record, kept for retry and bulk replay';
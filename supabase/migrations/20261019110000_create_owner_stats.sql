@@ -0,0 +1,239 @@
+-- Per-owner dashboard counters, maintained incrementally by statement-level
+-- triggers so /stats/overview is a single-row read instead of COUNTs over
+-- leads, campaigns and email_log. reconcile_owner_stats() recomputes the
+-- counters from the base tables to fix any drift.
+CREATE TABLE IF NOT EXISTS public.owner_stats (
+  owner            UUID PRIMARY KEY,
+  leads            BIGINT NOT NULL DEFAULT 0,
+  campaigns        BIGINT NOT NULL DEFAULT 0,
+  active_campaigns BIGINT NOT NULL DEFAULT 0,
+  sent             BIGINT NOT NULL DEFAULT 0,
+  bounced          BIGINT NOT NULL DEFAULT 0,
+  opened           BIGINT NOT NULL DEFAULT 0,
+  clicked          BIGINT NOT NULL DEFAULT 0,
+  replied          BIGINT NOT NULL DEFAULT 0,
+  updated_at       TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW(),
+  reconciled_at    TIMESTAMP WITH TIME ZONE
+);
+
+ALTER TABLE public.owner_stats ENABLE ROW LEVEL SECURITY;
+
+CREATE POLICY "Users can view their own stats"
+  ON public.owner_stats
+  FOR SELECT
+  USING (auth.uid() = owner);
+
+-- Add deltas to an owner's counters, creating the row on first use
+CREATE OR REPLACE FUNCTION public.bump_owner_stats(
+  p_owner UUID,
+  p_leads BIGINT DEFAULT 0,
+  p_campaigns BIGINT DEFAULT 0,
+  p_active_campaigns BIGINT DEFAULT 0,
+  p_sent BIGINT DEFAULT 0,
+  p_bounced BIGINT DEFAULT 0,
+  p_opened BIGINT DEFAULT 0,
+  p_clicked BIGINT DEFAULT 0,
+  p_replied BIGINT DEFAULT 0
+)
+RETURNS VOID
+LANGUAGE sql
+AS $$
+  INSERT INTO public.owner_stats AS s
+    (owner, leads, campaigns, active_campaigns, sent, bounced, opened, clicked, replied)
+  VALUES
+    (p_owner, p_leads, p_campaigns, p_active_campaigns, p_sent, p_bounced, p_opened, p_clicked, p_replied)
+  ON CONFLICT (owner) DO UPDATE SET
+    leads            = s.leads + EXCLUDED.leads,
+    campaigns        = s.campaigns + EXCLUDED.campaigns,
+    active_campaigns = s.active_campaigns + EXCLUDED.active_campaigns,
+    sent             = s.sent + EXCLUDED.sent,
+    bounced          = s.bounced + EXCLUDED.bounced,
+    opened           = s.opened + EXCLUDED.opened,
+    clicked          = s.clicked + EXCLUDED.clicked,
+    replied          = s.replied + EXCLUDED.replied,
+    updated_at       = NOW();
+$$;
+
+-- leads: one counter update per owner per statement
+CREATE OR REPLACE FUNCTION public.owner_stats_leads_changed()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+  IF TG_OP = 'INSERT' THEN
+    PERFORM public.bump_owner_stats(owner, p_leads => COUNT(*))
+      FROM new_rows WHERE owner IS NOT NULL GROUP BY owner;
+  ELSE
+    PERFORM public.bump_owner_stats(owner, p_leads => -COUNT(*))
+      FROM old_rows WHERE owner IS NOT NULL GROUP BY owner;
+  END IF;
+  RETURN NULL;
+END;
+$$;
+
+CREATE TRIGGER owner_stats_leads_inserted
+  AFTER INSERT ON public.leads
+  REFERENCING NEW TABLE AS new_rows
+  FOR EACH STATEMENT EXECUTE FUNCTION public.owner_stats_leads_changed();
+
+CREATE TRIGGER owner_stats_leads_deleted
+  AFTER DELETE ON public.leads
+  REFERENCING OLD TABLE AS old_rows
+  FOR EACH STATEMENT EXECUTE FUNCTION public.owner_stats_leads_changed();
+
+-- campaigns
+CREATE OR REPLACE FUNCTION public.owner_stats_campaigns_changed()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+  IF TG_OP = 'INSERT' THEN
+    PERFORM public.bump_owner_stats(owner, p_campaigns => COUNT(*))
+      FROM new_rows WHERE owner IS NOT NULL GROUP BY owner;
+  ELSE
+    -- A deleted campaign that had sends was counted as active
+    PERFORM public.bump_owner_stats(
+        o.owner,
+        p_campaigns => -COUNT(*),
+        p_active_campaigns => -COUNT(*) FILTER (
+          WHERE EXISTS (SELECT 1 FROM public.email_log l WHERE l.campaign_id = o.id)
+        )
+      )
+      FROM old_rows o WHERE o.owner IS NOT NULL GROUP BY o.owner;
+  END IF;
+  RETURN NULL;
+END;
+$$;
+
+CREATE TRIGGER owner_stats_campaigns_inserted
+  AFTER INSERT ON public.campaigns
+  REFERENCING NEW TABLE AS new_rows
+  FOR EACH STATEMENT EXECUTE FUNCTION public.owner_stats_campaigns_changed();
+
+CREATE TRIGGER owner_stats_campaigns_deleted
+  AFTER DELETE ON public.campaigns
+  REFERENCING OLD TABLE AS old_rows
+  FOR EACH STATEMENT EXECUTE FUNCTION public.owner_stats_campaigns_changed();
+
+-- email_log inserts are sends; a campaign becomes active with its first send
+CREATE OR REPLACE FUNCTION public.owner_stats_email_log_inserted()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+  PERFORM public.bump_owner_stats(
+      n.owner,
+      p_sent => COUNT(*),
+      p_active_campaigns => COUNT(DISTINCT n.campaign_id) FILTER (
+        WHERE n.campaign_id IS NOT NULL AND NOT EXISTS (
+          SELECT 1 FROM public.email_log l
+          WHERE l.campaign_id = n.campaign_id
+            AND l.id NOT IN (SELECT id FROM new_rows)
+        )
+      )
+    )
+    FROM new_rows n WHERE n.owner IS NOT NULL GROUP BY n.owner;
+  RETURN NULL;
+END;
+$$;
+
+CREATE TRIGGER owner_stats_email_log_inserted
+  AFTER INSERT ON public.email_log
+  REFERENCING NEW TABLE AS new_rows
+  FOR EACH STATEMENT EXECUTE FUNCTION public.owner_stats_email_log_inserted();
+
+-- Status transitions: count each email once when it first reaches
+-- opened, clicked or replied (unique opens/clicks/replies)
+CREATE OR REPLACE FUNCTION public.owner_stats_email_log_updated()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+  PERFORM public.bump_owner_stats(
+      n.owner,
+      p_opened  => COUNT(*) FILTER (WHERE public.email_status_rank(n.status::TEXT) >= 1 AND public.email_status_rank(o.status::TEXT) < 1),
+      p_clicked => COUNT(*) FILTER (WHERE public.email_status_rank(n.status::TEXT) >= 2 AND public.email_status_rank(o.status::TEXT) < 2),
+      p_replied => COUNT(*) FILTER (WHERE public.email_status_rank(n.status::TEXT) >= 3 AND public.email_status_rank(o.status::TEXT) < 3),
+      p_bounced => COUNT(*) FILTER (WHERE n.status::TEXT = 'bounced' AND o.status::TEXT IS DISTINCT FROM 'bounced')
+    )
+    FROM new_rows n
+    JOIN old_rows o ON o.id = n.id
+    WHERE n.owner IS NOT NULL
+      AND n.status IS DISTINCT FROM o.status
+    GROUP BY n.owner;
+  RETURN NULL;
+END;
+$$;
+
+CREATE TRIGGER owner_stats_email_log_updated
+  AFTER UPDATE ON public.email_log
+  REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+  FOR EACH STATEMENT EXECUTE FUNCTION public.owner_stats_email_log_updated();
+
+-- Recompute counters from the base tables. Returns the number of owners
+-- whose counters had drifted.
+CREATE OR REPLACE FUNCTION public.reconcile_owner_stats(p_owner UUID DEFAULT NULL)
+RETURNS INT
+LANGUAGE plpgsql
+AS $$
+DECLARE
+  v_fixed INT;
+BEGIN
+  WITH owners AS (
+    SELECT owner FROM public.leads WHERE owner IS NOT NULL AND (p_owner IS NULL OR owner = p_owner)
+    UNION
+    SELECT owner FROM public.campaigns WHERE owner IS NOT NULL AND (p_owner IS NULL OR owner = p_owner)
+    UNION
+    SELECT owner FROM public.email_log WHERE owner IS NOT NULL AND (p_owner IS NULL OR owner = p_owner)
+  ),
+  actual AS (
+    SELECT o.owner,
+           (SELECT COUNT(*) FROM public.leads x WHERE x.owner = o.owner) AS leads,
+           (SELECT COUNT(*) FROM public.campaigns x WHERE x.owner = o.owner) AS campaigns,
+           (SELECT COUNT(DISTINCT x.campaign_id) FROM public.email_log x
+             JOIN public.campaigns c ON c.id = x.campaign_id
+             WHERE x.owner = o.owner) AS active_campaigns,
+           e.sent, e.bounced, e.opened, e.clicked, e.replied
+    FROM owners o
+    CROSS JOIN LATERAL (
+      SELECT COUNT(*) AS sent,
+             COUNT(*) FILTER (WHERE l.status::TEXT = 'bounced') AS bounced,
+             COUNT(*) FILTER (WHERE public.email_status_rank(l.status::TEXT) >= 1) AS opened,
+             COUNT(*) FILTER (WHERE public.email_status_rank(l.status::TEXT) >= 2) AS clicked,
+             COUNT(*) FILTER (WHERE public.email_status_rank(l.status::TEXT) >= 3) AS replied
+      FROM public.email_log l
+      WHERE l.owner = o.owner
+    ) e
+  ),
+  fixed AS (
+    INSERT INTO public.owner_stats AS s
+      (owner, leads, campaigns, active_campaigns, sent, bounced, opened, clicked, replied, reconciled_at)
+    SELECT owner, leads, campaigns, active_campaigns, sent, bounced, opened, clicked, replied, NOW()
+    FROM actual
+    ON CONFLICT (owner) DO UPDATE SET
+      leads            = EXCLUDED.leads,
+      campaigns        = EXCLUDED.campaigns,
+      active_campaigns = EXCLUDED.active_campaigns,
+      sent             = EXCLUDED.sent,
+      bounced          = EXCLUDED.bounced,
+      opened           = EXCLUDED.opened,
+      clicked          = EXCLUDED.clicked,
+      replied          = EXCLUDED.replied,
+      reconciled_at    = NOW(),
+      updated_at       = NOW()
+    WHERE (s.leads, s.campaigns, s.active_campaigns, s.sent, s.bounced, s.opened, s.clicked, s.replied)
+          IS DISTINCT FROM
+          (EXCLUDED.leads, EXCLUDED.campaigns, EXCLUDED.active_campaigns, EXCLUDED.sent,
+           EXCLUDED.bounced, EXCLUDED.opened, EXCLUDED.clicked, EXCLUDED.replied)
+    RETURNING s.owner
+  )
+  SELECT COUNT(*) INTO v_fixed FROM fixed;
+
+  RETURN v_fixed;
+END;
+$$;
+
+-- Initial fill
+SELECT public.reconcile_owner_stats();
+
+COMMENT ON TABLE public.owner_stats IS 'Incrementally maintained dashboard counters per owner';
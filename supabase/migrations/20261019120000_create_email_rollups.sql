@@ -0,0 +1,459 @@
+-- Hourly and daily rollups of sends, opens, clicks and replies per owner,
+-- campaign, sequence step and variant, fed by triggers on the event
+-- pipeline. Charts read a few hundred pre-aggregated rows instead of
+-- scanning email_events.
+--
+-- Raw counters (opens, clicks, replies) count events; the unique counters
+-- (opened, clicked, replied) count emails on their first transition to
+-- that status and feed the funnels.
+--
+-- The rollups are filled from the existing history when created, and
+-- reconcile_email_rollups() recomputes recent buckets to fix any drift.
+
+-- Variant sent with each email
+ALTER TABLE public.email_log
+  ADD COLUMN IF NOT EXISTS variant_id UUID REFERENCES public.step_variants(id) ON DELETE SET NULL;
+
+ALTER TABLE public.email_events
+  ADD COLUMN IF NOT EXISTS variant_id UUID;
+
+CREATE TABLE IF NOT EXISTS public.email_rollups_hourly (
+  owner       UUID NOT NULL,
+  campaign_id UUID,
+  step_id     UUID,
+  variant_id  UUID,
+  bucket      TIMESTAMP WITH TIME ZONE NOT NULL,
+  sent        BIGINT NOT NULL DEFAULT 0,
+  opens       BIGINT NOT NULL DEFAULT 0,
+  clicks      BIGINT NOT NULL DEFAULT 0,
+  replies     BIGINT NOT NULL DEFAULT 0,
+  opened      BIGINT NOT NULL DEFAULT 0,
+  clicked     BIGINT NOT NULL DEFAULT 0,
+  replied     BIGINT NOT NULL DEFAULT 0
+);
+
+CREATE TABLE IF NOT EXISTS public.email_rollups_daily (
+  LIKE public.email_rollups_hourly INCLUDING DEFAULTS
+);
+
+-- One row per dimension combination and bucket (NULL campaign/step/variant
+-- are distinct dimension values, not unknowns)
+CREATE UNIQUE INDEX IF NOT EXISTS ux_email_rollups_hourly
+  ON public.email_rollups_hourly(owner, bucket, campaign_id, step_id, variant_id) NULLS NOT DISTINCT;
+CREATE UNIQUE INDEX IF NOT EXISTS ux_email_rollups_daily
+  ON public.email_rollups_daily(owner, bucket, campaign_id, step_id, variant_id) NULLS NOT DISTINCT;
+CREATE INDEX IF NOT EXISTS idx_email_rollups_daily_campaign
+  ON public.email_rollups_daily(campaign_id, bucket);
+
+ALTER TABLE public.email_rollups_hourly ENABLE ROW LEVEL SECURITY;
+ALTER TABLE public.email_rollups_daily ENABLE ROW LEVEL SECURITY;
+
+CREATE POLICY "Users can view their own hourly rollups"
+  ON public.email_rollups_hourly FOR SELECT USING (auth.uid() = owner);
+CREATE POLICY "Users can view their own daily rollups"
+  ON public.email_rollups_daily FOR SELECT USING (auth.uid() = owner);
+
+-- Add a JSON array of deltas {owner, campaign_id, step_id, variant_id, ts,
+-- sent, opens, clicks, replies, opened, clicked, replied} to both grains
+CREATE OR REPLACE FUNCTION public.apply_email_rollup_deltas(p_deltas JSONB)
+RETURNS VOID
+LANGUAGE sql
+AS $$
+  INSERT INTO public.email_rollups_hourly AS r
+    (owner, campaign_id, step_id, variant_id, bucket, sent, opens, clicks, replies, opened, clicked, replied)
+  SELECT d.owner, d.campaign_id, d.step_id, d.variant_id, date_trunc('hour', d.ts, 'UTC'),
+         COALESCE(SUM(d.sent), 0), COALESCE(SUM(d.opens), 0), COALESCE(SUM(d.clicks), 0), COALESCE(SUM(d.replies), 0),
+         COALESCE(SUM(d.opened), 0), COALESCE(SUM(d.clicked), 0), COALESCE(SUM(d.replied), 0)
+  FROM jsonb_to_recordset(COALESCE(p_deltas, '[]'::JSONB)) AS d(
+    owner UUID, campaign_id UUID, step_id UUID, variant_id UUID, ts TIMESTAMPTZ,
+    sent BIGINT, opens BIGINT, clicks BIGINT, replies BIGINT,
+    opened BIGINT, clicked BIGINT, replied BIGINT
+  )
+  WHERE d.owner IS NOT NULL
+  GROUP BY 1, 2, 3, 4, 5
+  ON CONFLICT (owner, bucket, campaign_id, step_id, variant_id) DO UPDATE SET
+    sent    = r.sent + EXCLUDED.sent,
+    opens   = r.opens + EXCLUDED.opens,
+    clicks  = r.clicks + EXCLUDED.clicks,
+    replies = r.replies + EXCLUDED.replies,
+    opened  = r.opened + EXCLUDED.opened,
+    clicked = r.clicked + EXCLUDED.clicked,
+    replied = r.replied + EXCLUDED.replied;
+
+  INSERT INTO public.email_rollups_daily AS r
+    (owner, campaign_id, step_id, variant_id, bucket, sent, opens, clicks, replies, opened, clicked, replied)
+  SELECT d.owner, d.campaign_id, d.step_id, d.variant_id, date_trunc('day', d.ts, 'UTC'),
+         COALESCE(SUM(d.sent), 0), COALESCE(SUM(d.opens), 0), COALESCE(SUM(d.clicks), 0), COALESCE(SUM(d.replies), 0),
+         COALESCE(SUM(d.opened), 0), COALESCE(SUM(d.clicked), 0), COALESCE(SUM(d.replied), 0)
+  FROM jsonb_to_recordset(COALESCE(p_deltas, '[]'::JSONB)) AS d(
+    owner UUID, campaign_id UUID, step_id UUID, variant_id UUID, ts TIMESTAMPTZ,
+    sent BIGINT, opens BIGINT, clicks BIGINT, replies BIGINT,
+    opened BIGINT, clicked BIGINT, replied BIGINT
+  )
+  WHERE d.owner IS NOT NULL
+  GROUP BY 1, 2, 3, 4, 5
+  ON CONFLICT (owner, bucket, campaign_id, step_id, variant_id) DO UPDATE SET
+    sent    = r.sent + EXCLUDED.sent,
+    opens   = r.opens + EXCLUDED.opens,
+    clicks  = r.clicks + EXCLUDED.clicks,
+    replies = r.replies + EXCLUDED.replies,
+    opened  = r.opened + EXCLUDED.opened,
+    clicked = r.clicked + EXCLUDED.clicked,
+    replied = r.replied + EXCLUDED.replied;
+$$;
+
+-- Rollup inputs recomputed from the history, from p_from on: one row per
+-- send (by sent_at), per event (by event time) and per unique transition.
+-- A transition is dated by the first event that reached it; emails whose
+-- status has no events behind it are dated by their send.
+CREATE OR REPLACE FUNCTION public.email_rollup_facts(p_from TIMESTAMPTZ, p_owner UUID DEFAULT NULL)
+RETURNS TABLE (
+  owner UUID, campaign_id UUID, step_id UUID, variant_id UUID, ts TIMESTAMPTZ,
+  sent INT, opens INT, clicks INT, replies INT, opened INT, clicked INT, replied INT
+)
+LANGUAGE sql
+STABLE
+AS $$
+  WITH touched AS (
+    SELECT DISTINCT e.email_id
+    FROM public.email_events e
+    WHERE e.ts >= p_from AND (p_owner IS NULL OR e.owner = p_owner)
+  ),
+  firsts AS (
+    SELECT e.email_id,
+           MIN(e.ts) AS opened_at,
+           MIN(e.ts) FILTER (WHERE e.event_type IN ('click', 'reply')) AS clicked_at,
+           MIN(e.ts) FILTER (WHERE e.event_type = 'reply') AS replied_at
+    FROM public.email_events e
+    JOIN touched t ON t.email_id = e.email_id
+    GROUP BY e.email_id
+  )
+  SELECT l.owner, l.campaign_id, l.step_id, l.variant_id, l.sent_at, 1, 0, 0, 0, 0, 0, 0
+  FROM public.email_log l
+  WHERE l.sent_at >= p_from AND l.owner IS NOT NULL AND (p_owner IS NULL OR l.owner = p_owner)
+  UNION ALL
+  SELECT e.owner, e.campaign_id, e.step_id, e.variant_id, e.ts, 0,
+         (e.event_type = 'open')::INT, (e.event_type = 'click')::INT, (e.event_type = 'reply')::INT, 0, 0, 0
+  FROM public.email_events e
+  WHERE e.ts >= p_from AND e.owner IS NOT NULL AND (p_owner IS NULL OR e.owner = p_owner)
+  UNION ALL
+  SELECT l.owner, l.campaign_id, l.step_id, l.variant_id, x.ts, 0, 0, 0, 0, x.opened, x.clicked, x.replied
+  FROM public.email_log l
+  LEFT JOIN firsts f ON f.email_id = l.id
+  CROSS JOIN LATERAL (VALUES
+    (COALESCE(f.opened_at, l.sent_at), 1, 0, 0, 1),
+    (COALESCE(f.clicked_at, f.opened_at, l.sent_at), 0, 1, 0, 2),
+    (COALESCE(f.replied_at, f.clicked_at, f.opened_at, l.sent_at), 0, 0, 1, 3)
+  ) AS x(ts, opened, clicked, replied, rank)
+  WHERE l.owner IS NOT NULL AND (p_owner IS NULL OR l.owner = p_owner)
+    AND (l.sent_at >= p_from OR f.email_id IS NOT NULL)
+    AND public.email_status_rank(l.status::TEXT) >= x.rank
+    AND x.ts >= p_from;
+$$;
+
+-- Recompute the rollup buckets from p_since on (all history when NULL)
+-- and replace the rows that had drifted; hourly buckets only within the
+-- hourly retention. Returns the number of rollup rows fixed. Increments
+-- made by the triggers while it runs may be overwritten; the next run
+-- restores them.
+CREATE OR REPLACE FUNCTION public.reconcile_email_rollups(
+  p_since TIMESTAMPTZ DEFAULT NULL,
+  p_owner UUID DEFAULT NULL,
+  p_hourly_retention INTERVAL DEFAULT INTERVAL '14 days'
+)
+RETURNS INT
+LANGUAGE plpgsql
+AS $$
+DECLARE
+  v_day_from TIMESTAMPTZ := COALESCE(date_trunc('day', p_since, 'UTC'), '-infinity');
+  v_hour_from TIMESTAMPTZ := GREATEST(v_day_from, date_trunc('day', NOW() - p_hourly_retention, 'UTC'));
+  v_hourly INT;
+  v_daily INT;
+BEGIN
+  WITH actual AS (
+    SELECT f.owner, f.campaign_id, f.step_id, f.variant_id, date_trunc('hour', f.ts, 'UTC') AS bucket,
+           SUM(f.sent) AS sent, SUM(f.opens) AS opens, SUM(f.clicks) AS clicks, SUM(f.replies) AS replies,
+           SUM(f.opened) AS opened, SUM(f.clicked) AS clicked, SUM(f.replied) AS replied
+    FROM public.email_rollup_facts(v_hour_from, p_owner) f
+    GROUP BY 1, 2, 3, 4, 5
+  ),
+  cleared AS (
+    DELETE FROM public.email_rollups_hourly r
+    WHERE r.bucket >= v_hour_from
+      AND (p_owner IS NULL OR r.owner = p_owner)
+      AND NOT EXISTS (
+        SELECT 1 FROM actual a
+        WHERE a.owner = r.owner AND a.bucket = r.bucket
+          AND a.campaign_id IS NOT DISTINCT FROM r.campaign_id
+          AND a.step_id IS NOT DISTINCT FROM r.step_id
+          AND a.variant_id IS NOT DISTINCT FROM r.variant_id
+      )
+    RETURNING 1
+  ),
+  fixed AS (
+    INSERT INTO public.email_rollups_hourly AS r
+      (owner, campaign_id, step_id, variant_id, bucket, sent, opens, clicks, replies, opened, clicked, replied)
+    SELECT owner, campaign_id, step_id, variant_id, bucket, sent, opens, clicks, replies, opened, clicked, replied
+    FROM actual
+    ON CONFLICT (owner, bucket, campaign_id, step_id, variant_id) DO UPDATE SET
+      sent    = EXCLUDED.sent,
+      opens   = EXCLUDED.opens,
+      clicks  = EXCLUDED.clicks,
+      replies = EXCLUDED.replies,
+      opened  = EXCLUDED.opened,
+      clicked = EXCLUDED.clicked,
+      replied = EXCLUDED.replied
+    WHERE (r.sent, r.opens, r.clicks, r.replies, r.opened, r.clicked, r.replied)
+          IS DISTINCT FROM
+          (EXCLUDED.sent, EXCLUDED.opens, EXCLUDED.clicks, EXCLUDED.replies,
+           EXCLUDED.opened, EXCLUDED.clicked, EXCLUDED.replied)
+    RETURNING 1
+  )
+  SELECT (SELECT COUNT(*) FROM fixed) + (SELECT COUNT(*) FROM cleared) INTO v_hourly;
+
+  WITH actual AS (
+    SELECT f.owner, f.campaign_id, f.step_id, f.variant_id, date_trunc('day', f.ts, 'UTC') AS bucket,
+           SUM(f.sent) AS sent, SUM(f.opens) AS opens, SUM(f.clicks) AS clicks, SUM(f.replies) AS replies,
+           SUM(f.opened) AS opened, SUM(f.clicked) AS clicked, SUM(f.replied) AS replied
+    FROM public.email_rollup_facts(v_day_from, p_owner) f
+    GROUP BY 1, 2, 3, 4, 5
+  ),
+  cleared AS (
+    DELETE FROM public.email_rollups_daily r
+    WHERE r.bucket >= v_day_from
+      AND (p_owner IS NULL OR r.owner = p_owner)
+      AND NOT EXISTS (
+        SELECT 1 FROM actual a
+        WHERE a.owner = r.owner AND a.bucket = r.bucket
+          AND a.campaign_id IS NOT DISTINCT FROM r.campaign_id
+          AND a.step_id IS NOT DISTINCT FROM r.step_id
+          AND a.variant_id IS NOT DISTINCT FROM r.variant_id
+      )
+    RETURNING 1
+  ),
+  fixed AS (
+    INSERT INTO public.email_rollups_daily AS r
+      (owner, campaign_id, step_id, variant_id, bucket, sent, opens, clicks, replies, opened, clicked, replied)
+    SELECT owner, campaign_id, step_id, variant_id, bucket, sent, opens, clicks, replies, opened, clicked, replied
+    FROM actual
+    ON CONFLICT (owner, bucket, campaign_id, step_id, variant_id) DO UPDATE SET
+      sent    = EXCLUDED.sent,
+      opens   = EXCLUDED.opens,
+      clicks  = EXCLUDED.clicks,
+      replies = EXCLUDED.replies,
+      opened  = EXCLUDED.opened,
+      clicked = EXCLUDED.clicked,
+      replied = EXCLUDED.replied
+    WHERE (r.sent, r.opens, r.clicks, r.replies, r.opened, r.clicked, r.replied)
+          IS DISTINCT FROM
+          (EXCLUDED.sent, EXCLUDED.opens, EXCLUDED.clicks, EXCLUDED.replies,
+           EXCLUDED.opened, EXCLUDED.clicked, EXCLUDED.replied)
+    RETURNING 1
+  )
+  SELECT (SELECT COUNT(*) FROM fixed) + (SELECT COUNT(*) FROM cleared) INTO v_daily;
+
+  RETURN v_hourly + v_daily;
+END;
+$$;
+
+-- Initial fill from the existing history, before the triggers exist
+SELECT public.reconcile_email_rollups();
+
+-- Raw event counts, bucketed by event time
+CREATE OR REPLACE FUNCTION public.email_rollups_events_inserted()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+  PERFORM public.apply_email_rollup_deltas((
+    SELECT jsonb_agg(jsonb_build_object(
+      'owner', owner, 'campaign_id', campaign_id, 'step_id', step_id, 'variant_id', variant_id,
+      'ts', hour, 'opens', opens, 'clicks', clicks, 'replies', replies
+    ))
+    FROM (
+      SELECT owner, campaign_id, step_id, variant_id, date_trunc('hour', ts, 'UTC') AS hour,
+             COUNT(*) FILTER (WHERE event_type = 'open') AS opens,
+             COUNT(*) FILTER (WHERE event_type = 'click') AS clicks,
+             COUNT(*) FILTER (WHERE event_type = 'reply') AS replies
+      FROM new_rows
+      GROUP BY 1, 2, 3, 4, 5
+    ) grouped
+  ));
+  RETURN NULL;
+END;
+$$;
+
+CREATE TRIGGER email_rollups_events_inserted
+  AFTER INSERT ON public.email_events
+  REFERENCING NEW TABLE AS new_rows
+  FOR EACH STATEMENT EXECUTE FUNCTION public.email_rollups_events_inserted();
+
+-- Sends, bucketed by send time
+CREATE OR REPLACE FUNCTION public.email_rollups_email_log_inserted()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+  PERFORM public.apply_email_rollup_deltas((
+    SELECT jsonb_agg(jsonb_build_object(
+      'owner', owner, 'campaign_id', campaign_id, 'step_id', step_id, 'variant_id', variant_id,
+      'ts', hour, 'sent', sent
+    ))
+    FROM (
+      SELECT owner, campaign_id, step_id, variant_id, date_trunc('hour', COALESCE(sent_at, NOW()), 'UTC') AS hour,
+             COUNT(*) AS sent
+      FROM new_rows
+      GROUP BY 1, 2, 3, 4, 5
+    ) grouped
+  ));
+  RETURN NULL;
+END;
+$$;
+
+CREATE TRIGGER email_rollups_email_log_inserted
+  AFTER INSERT ON public.email_log
+  REFERENCING NEW TABLE AS new_rows
+  FOR EACH STATEMENT EXECUTE FUNCTION public.email_rollups_email_log_inserted();
+
+-- Unique transitions, bucketed by the time the status changed
+CREATE OR REPLACE FUNCTION public.email_rollups_email_log_updated()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+  PERFORM public.apply_email_rollup_deltas((
+    SELECT jsonb_agg(jsonb_build_object(
+      'owner', owner, 'campaign_id', campaign_id, 'step_id', step_id, 'variant_id', variant_id,
+      'ts', NOW(), 'opened', opened, 'clicked', clicked, 'replied', replied
+    ))
+    FROM (
+      SELECT n.owner, n.campaign_id, n.step_id, n.variant_id,
+             COUNT(*) FILTER (WHERE public.email_status_rank(n.status::TEXT) >= 1 AND public.email_status_rank(o.status::TEXT) < 1) AS opened,
+             COUNT(*) FILTER (WHERE public.email_status_rank(n.status::TEXT) >= 2 AND public.email_status_rank(o.status::TEXT) < 2) AS clicked,
+             COUNT(*) FILTER (WHERE public.email_status_rank(n.status::TEXT) >= 3 AND public.email_status_rank(o.status::TEXT) < 3) AS replied
+      FROM new_rows n
+      JOIN old_rows o ON o.id = n.id
+      WHERE n.status IS DISTINCT FROM o.status
+      GROUP BY 1, 2, 3, 4
+    ) grouped
+  ));
+  RETURN NULL;
+END;
+$$;
+
+CREATE TRIGGER email_rollups_email_log_updated
+  AFTER UPDATE ON public.email_log
+  REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+  FOR EACH STATEMENT EXECUTE FUNCTION public.email_rollups_email_log_updated();
+
+-- Events now carry the variant of the email they belong to
+CREATE OR REPLACE FUNCTION public.record_email_events(p_events JSONB)
+RETURNS TABLE (email_id UUID, owner UUID, campaign_id UUID, status TEXT)
+LANGUAGE plpgsql
+AS $$
+DECLARE
+  v_email_ids UUID[];
+BEGIN
+  WITH incoming AS (
+    SELECT e.email_id, e.event_type, e.url, COALESCE(e.ts, NOW()) AS ts, e.metadata
+    FROM jsonb_to_recordset(p_events)
+      AS e(email_id UUID, event_type TEXT, url TEXT, ts TIMESTAMPTZ, metadata JSONB)
+  ),
+  inserted AS (
+    INSERT INTO public.email_events (email_id, owner, campaign_id, lead_id, step_id, variant_id, event_type, url, ts, metadata)
+    SELECT i.email_id, l.owner, l.campaign_id, l.lead_id, l.step_id, l.variant_id, i.event_type, i.url, i.ts, i.metadata
+    FROM incoming i
+    JOIN public.email_log l ON l.id = i.email_id
+    RETURNING email_events.email_id
+  )
+  SELECT array_agg(DISTINCT inserted.email_id) INTO v_email_ids FROM inserted;
+
+  IF v_email_ids IS NULL THEN
+    RETURN;
+  END IF;
+
+  RETURN QUERY
+  WITH derived AS (
+    SELECT ev.email_id,
+           MAX(CASE ev.event_type WHEN 'open' THEN 1 WHEN 'click' THEN 2 ELSE 3 END) AS rank,
+           (array_agg(ev.url ORDER BY ev.ts DESC) FILTER (WHERE ev.event_type = 'click'))[1] AS clicked_url,
+           MAX(ev.ts) FILTER (WHERE ev.event_type = 'click') AS clicked_at
+    FROM public.email_events ev
+    WHERE ev.email_id = ANY(v_email_ids)
+    GROUP BY ev.email_id
+  )
+  UPDATE public.email_log AS l
+     SET status = CASE GREATEST(public.email_status_rank(l.status::TEXT), d.rank)
+                    WHEN 1 THEN 'opened'
+                    WHEN 2 THEN 'clicked'
+                    ELSE 'replied'
+                  END::public.email_status,
+         clicked_url = COALESCE(d.clicked_url, l.clicked_url),
+         clicked_at  = COALESCE(d.clicked_at, l.clicked_at)
+    FROM derived d
+   WHERE l.id = d.email_id
+  RETURNING l.id, l.owner, l.campaign_id, l.status::TEXT;
+END;
+$$;
+
+-- Time series for one owner (optionally one campaign). Hourly buckets
+-- older than the hourly retention window are served from the daily
+-- rollups, so long hourly ranges degrade to day resolution at the far end.
+CREATE OR REPLACE FUNCTION public.email_rollup_series(
+  p_owner UUID,
+  p_from TIMESTAMPTZ,
+  p_to TIMESTAMPTZ,
+  p_grain TEXT DEFAULT 'day',
+  p_campaign_id UUID DEFAULT NULL,
+  p_hourly_retention INTERVAL DEFAULT INTERVAL '14 days'
+)
+RETURNS TABLE (
+  bucket TIMESTAMPTZ, grain TEXT,
+  sent BIGINT, opens BIGINT, clicks BIGINT, replies BIGINT,
+  opened BIGINT, clicked BIGINT, replied BIGINT
+)
+LANGUAGE sql
+STABLE
+AS $$
+  WITH bounds AS (
+    SELECT CASE WHEN p_grain = 'hour'
+                THEN date_trunc('day', NOW() - p_hourly_retention, 'UTC')
+                ELSE 'infinity'::TIMESTAMPTZ
+           END AS hourly_floor
+  )
+  SELECT r.bucket, 'hour', SUM(r.sent)::BIGINT, SUM(r.opens)::BIGINT, SUM(r.clicks)::BIGINT, SUM(r.replies)::BIGINT,
+         SUM(r.opened)::BIGINT, SUM(r.clicked)::BIGINT, SUM(r.replied)::BIGINT
+  FROM public.email_rollups_hourly r, bounds b
+  WHERE r.owner = p_owner
+    AND r.bucket >= GREATEST(p_from, b.hourly_floor)
+    AND r.bucket < p_to
+    AND (p_campaign_id IS NULL OR r.campaign_id = p_campaign_id)
+  GROUP BY r.bucket
+  UNION ALL
+  SELECT r.bucket, 'day', SUM(r.sent)::BIGINT, SUM(r.opens)::BIGINT, SUM(r.clicks)::BIGINT, SUM(r.replies)::BIGINT,
+         SUM(r.opened)::BIGINT, SUM(r.clicked)::BIGINT, SUM(r.replied)::BIGINT
+  FROM public.email_rollups_daily r, bounds b
+  WHERE r.owner = p_owner
+    AND r.bucket >= date_trunc('day', p_from, 'UTC')
+    AND r.bucket < LEAST(p_to, b.hourly_floor)
+    AND (p_campaign_id IS NULL OR r.campaign_id = p_campaign_id)
+  GROUP BY r.bucket
+  ORDER BY 1;
+$$;
+
+-- Drop hourly buckets older than the retention window; daily rollups keep
+-- the history
+CREATE OR REPLACE FUNCTION public.prune_email_rollups_hourly(p_keep INTERVAL DEFAULT INTERVAL '14 days')
+RETURNS INT
+LANGUAGE sql
+AS $$
+  WITH pruned AS (
+    DELETE FROM public.email_rollups_hourly
+    WHERE bucket < date_trunc('day', NOW() - p_keep, 'UTC')
+    RETURNING 1
+  )
+  SELECT COUNT(*)::INT FROM pruned;
+$$;
+
+COMMENT ON TABLE public.email_rollups_hourly IS 'Hourly email metrics per owner, campaign, step and variant';
+COMMENT ON TABLE public.email_rollups_daily IS 'Daily email metrics per owner, campaign, step and variant';
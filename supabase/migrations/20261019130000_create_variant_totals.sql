@@ -0,0 +1,27 @@
+-- Lifetime funnel totals per step variant, summed from the daily rollups.
+-- Feeds the vectorized variant analytics behind /stats/variants: one row
+-- per variant regardless of how many events it has.
+CREATE OR REPLACE FUNCTION public.email_variant_totals(
+  p_owner UUID,
+  p_campaign_id UUID DEFAULT NULL
+)
+RETURNS TABLE (
+  campaign_id UUID, step_id UUID, variant_id UUID, variant_idx INT,
+  sent BIGINT, opened BIGINT, clicked BIGINT, replied BIGINT
+)
+LANGUAGE sql
+STABLE
+AS $$
+  SELECT r.campaign_id, r.step_id, r.variant_id, v.variant_idx,
+         SUM(r.sent)::BIGINT, SUM(r.opened)::BIGINT, SUM(r.clicked)::BIGINT, SUM(r.replied)::BIGINT
+  FROM public.email_rollups_daily r
+  LEFT JOIN public.step_variants v ON v.id = r.variant_id
+  WHERE r.owner = p_owner
+    AND r.step_id IS NOT NULL
+    AND (p_campaign_id IS NULL OR r.campaign_id = p_campaign_id)
+  GROUP BY r.campaign_id, r.step_id, r.variant_id, v.variant_idx
+  ORDER BY r.campaign_id, r.step_id, v.variant_idx;
+$$;
+
+CREATE INDEX IF NOT EXISTS idx_email_rollups_daily_owner_step
+  ON public.email_rollups_daily(owner, step_id);
@@ -0,0 +1,161 @@
+-- Per-campaign metrics embedded in the campaign list, so one query returns
+-- every campaign with its numbers instead of N follow-up COUNTs.
+--
+-- Sends and status changes in email_log only mark the campaign dirty (one
+-- small upsert per campaign per statement); refresh_campaign_metrics()
+-- recomputes dirty campaigns in bulk. It runs every
+-- CAMPAIGN_METRICS_MAX_STALENESS seconds, which bounds how far behind the
+-- list can be.
+CREATE TABLE IF NOT EXISTS public.campaign_metrics (
+  campaign_id  UUID PRIMARY KEY REFERENCES public.campaigns(id) ON DELETE CASCADE,
+  owner        UUID,
+  leads        BIGINT NOT NULL DEFAULT 0,
+  sent         BIGINT NOT NULL DEFAULT 0,
+  bounced      BIGINT NOT NULL DEFAULT 0,
+  opened       BIGINT NOT NULL DEFAULT 0,
+  clicked      BIGINT NOT NULL DEFAULT 0,
+  replied      BIGINT NOT NULL DEFAULT 0,
+  open_rate    NUMERIC GENERATED ALWAYS AS (
+    CASE WHEN sent > bounced THEN round(opened::NUMERIC / (sent - bounced), 4) ELSE 0 END
+  ) STORED,
+  click_rate   NUMERIC GENERATED ALWAYS AS (
+    CASE WHEN sent > bounced THEN round(clicked::NUMERIC / (sent - bounced), 4) ELSE 0 END
+  ) STORED,
+  reply_rate   NUMERIC GENERATED ALWAYS AS (
+    CASE WHEN sent > bounced THEN round(replied::NUMERIC / (sent - bounced), 4) ELSE 0 END
+  ) STORED,
+  last_sent_at TIMESTAMP WITH TIME ZONE,
+  dirty_since  TIMESTAMP WITH TIME ZONE,
+  refreshed_at TIMESTAMP WITH TIME ZONE
+);
+
+-- The refresh job scans only dirty campaigns, oldest first
+CREATE INDEX IF NOT EXISTS idx_campaign_metrics_dirty
+  ON public.campaign_metrics(dirty_since)
+  WHERE dirty_since IS NOT NULL;
+
+-- Per-campaign recompute reads email_log by campaign
+CREATE INDEX IF NOT EXISTS idx_email_log_campaign
+  ON public.email_log(campaign_id);
+
+ALTER TABLE public.campaign_metrics ENABLE ROW LEVEL SECURITY;
+
+CREATE POLICY "Users can view their own campaign metrics"
+  ON public.campaign_metrics
+  FOR SELECT
+  USING (auth.uid() = owner);
+
+-- New campaigns start with an empty, clean metrics row
+CREATE OR REPLACE FUNCTION public.campaign_metrics_campaigns_inserted()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+  INSERT INTO public.campaign_metrics (campaign_id, owner, refreshed_at)
+  SELECT id, owner, NOW() FROM new_rows
+  ON CONFLICT (campaign_id) DO NOTHING;
+  RETURN NULL;
+END;
+$$;
+
+CREATE TRIGGER campaign_metrics_campaigns_inserted
+  AFTER INSERT ON public.campaigns
+  REFERENCING NEW TABLE AS new_rows
+  FOR EACH STATEMENT EXECUTE FUNCTION public.campaign_metrics_campaigns_inserted();
+
+-- Sends and status changes mark their campaigns dirty
+CREATE OR REPLACE FUNCTION public.campaign_metrics_mark_dirty()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+  INSERT INTO public.campaign_metrics AS m (campaign_id, owner, dirty_since)
+  SELECT DISTINCT n.campaign_id, n.owner, NOW()
+  FROM new_rows n
+  JOIN public.campaigns c ON c.id = n.campaign_id
+  ON CONFLICT (campaign_id) DO UPDATE
+    SET dirty_since = COALESCE(m.dirty_since, EXCLUDED.dirty_since)
+    WHERE m.dirty_since IS NULL;
+  RETURN NULL;
+END;
+$$;
+
+CREATE TRIGGER campaign_metrics_email_log_inserted
+  AFTER INSERT ON public.email_log
+  REFERENCING NEW TABLE AS new_rows
+  FOR EACH STATEMENT EXECUTE FUNCTION public.campaign_metrics_mark_dirty();
+
+CREATE TRIGGER campaign_metrics_email_log_updated
+  AFTER UPDATE ON public.email_log
+  REFERENCING NEW TABLE AS new_rows
+  FOR EACH STATEMENT EXECUTE FUNCTION public.campaign_metrics_mark_dirty();
+
+-- Recompute up to p_limit dirty campaigns (all when NULL), oldest first.
+-- Rows being refreshed by another worker are skipped. Returns the number
+-- of campaigns refreshed per owner, so the caller can invalidate those
+-- owners' cached responses.
+CREATE OR REPLACE FUNCTION public.refresh_campaign_metrics(p_limit INT DEFAULT 500)
+RETURNS TABLE (owner UUID, campaigns INT)
+LANGUAGE plpgsql
+AS $$
+DECLARE
+  v_ids UUID[];
+BEGIN
+  SELECT array_agg(campaign_id) INTO v_ids
+  FROM (
+    SELECT campaign_id
+    FROM public.campaign_metrics
+    WHERE dirty_since IS NOT NULL
+    ORDER BY dirty_since
+    LIMIT p_limit
+    FOR UPDATE SKIP LOCKED
+  ) dirty;
+
+  IF v_ids IS NULL THEN
+    RETURN;
+  END IF;
+
+  RETURN QUERY
+  WITH refreshed AS (
+    UPDATE public.campaign_metrics AS m
+       SET leads        = a.leads,
+           sent         = a.sent,
+           bounced      = a.bounced,
+           opened       = a.opened,
+           clicked      = a.clicked,
+           replied      = a.replied,
+           last_sent_at = a.last_sent_at,
+           dirty_since  = NULL,
+           refreshed_at = NOW()
+      FROM (
+        SELECT c.id AS campaign_id,
+               COUNT(DISTINCT l.lead_id) AS leads,
+               COUNT(l.id) AS sent,
+               COUNT(l.id) FILTER (WHERE l.status::TEXT = 'bounced') AS bounced,
+               COUNT(l.id) FILTER (WHERE public.email_status_rank(l.status::TEXT) >= 1) AS opened,
+               COUNT(l.id) FILTER (WHERE public.email_status_rank(l.status::TEXT) >= 2) AS clicked,
+               COUNT(l.id) FILTER (WHERE public.email_status_rank(l.status::TEXT) >= 3) AS replied,
+               MAX(l.sent_at) AS last_sent_at
+        FROM unnest(v_ids) AS c(id)
+        LEFT JOIN public.email_log l ON l.campaign_id = c.id
+        GROUP BY c.id
+      ) a
+     WHERE m.campaign_id = a.campaign_id
+    RETURNING m.owner
+  )
+  SELECT r.owner, COUNT(*)::INT
+  FROM refreshed r
+  GROUP BY r.owner;
+END;
+$$;
+
+-- Backfill every existing campaign
+INSERT INTO public.campaign_metrics (campaign_id, owner, dirty_since)
+SELECT id, owner, NOW() FROM public.campaigns
+ON CONFLICT (campaign_id) DO NOTHING;
+
+SELECT public.refresh_campaign_metrics(NULL);
+
+COMMENT ON TABLE public.campaign_metrics IS 'Denormalized per-campaign metrics, refreshed from email_log when dirty';
+COMMENT ON COLUMN public.campaign_metrics.leads IS 'Distinct leads emailed in the campaign';
+COMMENT ON COLUMN public.campaign_metrics.dirty_since IS 'Set when email_log changes; cleared by refresh_campaign_metrics()';
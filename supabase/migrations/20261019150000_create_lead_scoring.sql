@@ -0,0 +1,159 @@
+-- Lead engagement scoring.
+--
+-- lead_event_rollups_daily keeps opens, clicks and replies per lead per
+-- day, fed by the email_events insert trigger. The scoring job pulls it in
+-- keyset chunks of leads as column arrays (lead_engagement_chunk), scores
+-- a chunk with vectorized math in Python and writes all scores of the
+-- chunk back in one UPDATE (apply_lead_scores).
+CREATE TABLE IF NOT EXISTS public.lead_event_rollups_daily (
+  lead_id UUID NOT NULL,
+  day     DATE NOT NULL,
+  owner   UUID NOT NULL,
+  opens   INT NOT NULL DEFAULT 0,
+  clicks  INT NOT NULL DEFAULT 0,
+  replies INT NOT NULL DEFAULT 0,
+  PRIMARY KEY (lead_id, day)
+);
+
+ALTER TABLE public.lead_event_rollups_daily ENABLE ROW LEVEL SECURITY;
+
+CREATE POLICY "Users can view their own lead rollups"
+  ON public.lead_event_rollups_daily FOR SELECT USING (auth.uid() = owner);
+
+ALTER TABLE public.leads
+  ADD COLUMN IF NOT EXISTS engagement_score REAL NOT NULL DEFAULT 0,
+  ADD COLUMN IF NOT EXISTS engagement_scored_at TIMESTAMP WITH TIME ZONE;
+
+-- /leads?sort=score and the scoring job's keyset walk over an owner's leads
+CREATE INDEX IF NOT EXISTS idx_leads_owner_score ON public.leads(owner, engagement_score DESC, id);
+CREATE INDEX IF NOT EXISTS idx_leads_owner_id ON public.leads(owner, id);
+
+-- Rescoring must not look like an edit of the lead. The whole row is
+-- compared without the scoring columns, so columns added later still
+-- bump updated_at (and reach delta sync).
+DROP TRIGGER IF EXISTS update_leads_updated_at ON public.leads;
+CREATE TRIGGER update_leads_updated_at
+  BEFORE UPDATE ON public.leads
+  FOR EACH ROW
+  WHEN ((to_jsonb(OLD) - 'engagement_score' - 'engagement_scored_at' - 'updated_at')
+        IS DISTINCT FROM
+        (to_jsonb(NEW) - 'engagement_score' - 'engagement_scored_at' - 'updated_at'))
+  EXECUTE FUNCTION update_updated_at_column();
+
+CREATE OR REPLACE FUNCTION public.lead_event_rollups_events_inserted()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+  INSERT INTO public.lead_event_rollups_daily AS r (lead_id, day, owner, opens, clicks, replies)
+  SELECT lead_id, (ts AT TIME ZONE 'UTC')::DATE, owner,
+         COUNT(*) FILTER (WHERE event_type = 'open'),
+         COUNT(*) FILTER (WHERE event_type = 'click'),
+         COUNT(*) FILTER (WHERE event_type = 'reply')
+  FROM new_rows
+  WHERE lead_id IS NOT NULL AND owner IS NOT NULL
+  GROUP BY 1, 2, 3
+  ON CONFLICT (lead_id, day) DO UPDATE SET
+    opens   = r.opens + EXCLUDED.opens,
+    clicks  = r.clicks + EXCLUDED.clicks,
+    replies = r.replies + EXCLUDED.replies;
+  RETURN NULL;
+END;
+$$;
+
+CREATE TRIGGER lead_event_rollups_events_inserted
+  AFTER INSERT ON public.email_events
+  REFERENCING NEW TABLE AS new_rows
+  FOR EACH STATEMENT EXECUTE FUNCTION public.lead_event_rollups_events_inserted();
+
+-- Backfill from the event log
+INSERT INTO public.lead_event_rollups_daily (lead_id, day, owner, opens, clicks, replies)
+SELECT lead_id, (ts AT TIME ZONE 'UTC')::DATE, owner,
+       COUNT(*) FILTER (WHERE event_type = 'open'),
+       COUNT(*) FILTER (WHERE event_type = 'click'),
+       COUNT(*) FILTER (WHERE event_type = 'reply')
+FROM public.email_events
+WHERE lead_id IS NOT NULL AND owner IS NOT NULL
+GROUP BY 1, 2, 3
+ON CONFLICT (lead_id, day) DO NOTHING;
+
+-- Next chunk of an owner's leads (ordered by id, after p_after) with their
+-- daily engagement inside the window, as parallel arrays. lead_idx indexes
+-- into lead_ids; last_id is the keyset cursor for the next call and NULL
+-- when there are no more leads.
+CREATE OR REPLACE FUNCTION public.lead_engagement_chunk(
+  p_owner UUID,
+  p_after UUID DEFAULT NULL,
+  p_limit INT DEFAULT 50000,
+  p_window_days INT DEFAULT 180
+)
+RETURNS TABLE (
+  last_id UUID, lead_ids UUID[], lead_idx INT[], age_days INT[],
+  opens INT[], clicks INT[], replies INT[]
+)
+LANGUAGE sql
+STABLE
+AS $$
+  WITH chunk AS (
+    SELECT id FROM public.leads
+    WHERE owner = p_owner AND (p_after IS NULL OR id > p_after)
+    ORDER BY id
+    LIMIT p_limit
+  ),
+  active AS (
+    SELECT r.lead_id,
+           (dense_rank() OVER (ORDER BY r.lead_id) - 1)::INT AS idx,
+           (CURRENT_DATE - r.day)::INT AS age,
+           r.opens, r.clicks, r.replies
+    FROM chunk c
+    JOIN public.lead_event_rollups_daily r ON r.lead_id = c.id
+    WHERE r.day > CURRENT_DATE - p_window_days
+  )
+  SELECT (SELECT id FROM chunk ORDER BY id DESC LIMIT 1),
+         (SELECT array_agg(DISTINCT lead_id ORDER BY lead_id) FROM active),
+         array_agg(idx ORDER BY idx),
+         array_agg(age ORDER BY idx),
+         array_agg(opens ORDER BY idx),
+         array_agg(clicks ORDER BY idx),
+         array_agg(replies ORDER BY idx)
+  FROM active;
+$$;
+
+-- Write the scores of one chunk (p_after, p_until]: leads missing from
+-- p_lead_ids have no engagement in the window and score 0. Unchanged
+-- scores are not rewritten. Returns the number of leads updated.
+CREATE OR REPLACE FUNCTION public.apply_lead_scores(
+  p_owner UUID,
+  p_after UUID,
+  p_until UUID,
+  p_lead_ids UUID[],
+  p_scores REAL[]
+)
+RETURNS INT
+LANGUAGE plpgsql
+AS $$
+DECLARE
+  v_updated INT;
+BEGIN
+  UPDATE public.leads AS l
+     SET engagement_score = x.score,
+         engagement_scored_at = NOW()
+    FROM (
+      SELECT r.id, COALESCE(s.score, 0)::REAL AS score
+      FROM public.leads r
+      LEFT JOIN unnest(COALESCE(p_lead_ids, '{}'), COALESCE(p_scores, '{}')) AS s(lead_id, score)
+        ON s.lead_id = r.id
+      WHERE r.owner = p_owner
+        AND (p_after IS NULL OR r.id > p_after)
+        AND r.id <= p_until
+    ) x
+   WHERE l.id = x.id
+     AND l.engagement_score IS DISTINCT FROM x.score;
+
+  GET DIAGNOSTICS v_updated = ROW_COUNT;
+  RETURN v_updated;
+END;
+$$;
+
+COMMENT ON TABLE public.lead_event_rollups_daily IS 'Opens, clicks and replies per lead per day (UTC), input of lead scoring';
+COMMENT ON COLUMN public.leads.engagement_score IS 'Recency and frequency weighted engagement, 0-100';
@@ -0,0 +1,330 @@
+-- Cold storage for finished sends.
+--
+-- archive_email_log() moves email_log rows older than the retention window
+-- into email_log_archive in batches (DELETE ... RETURNING feeding an
+-- INSERT, so a row is never in both or neither). The archive is range
+-- partitioned by month of sent_at and append-only, and the hot table
+-- keeps only recent sends so its indexes stay small.
+--
+-- Rollups and owner_stats are untouched by archival (email_log deletes do
+-- not decrement them). Everything that recomputes from email_log reads the
+-- email_log_all view instead, so archived sends still count.
+CREATE TABLE IF NOT EXISTS public.email_log_archive (
+  id          UUID NOT NULL,
+  owner       UUID,
+  campaign_id UUID,
+  lead_id     UUID,
+  step_id     UUID,
+  variant_id  UUID,
+  status      public.email_status,
+  sent_at     TIMESTAMP WITH TIME ZONE,
+  clicked_url TEXT,
+  clicked_at  TIMESTAMP WITH TIME ZONE,
+  archived_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW()
+) PARTITION BY RANGE (sent_at);
+
+CREATE TABLE IF NOT EXISTS public.email_log_archive_default
+  PARTITION OF public.email_log_archive DEFAULT;
+
+CREATE INDEX IF NOT EXISTS idx_email_log_archive_id ON public.email_log_archive(id);
+CREATE INDEX IF NOT EXISTS idx_email_log_archive_owner_sent ON public.email_log_archive(owner, sent_at);
+CREATE INDEX IF NOT EXISTS idx_email_log_archive_campaign ON public.email_log_archive(campaign_id);
+
+ALTER TABLE public.email_log_archive ENABLE ROW LEVEL SECURITY;
+
+CREATE POLICY "Users can view their own archived emails"
+  ON public.email_log_archive FOR SELECT USING (auth.uid() = owner);
+
+-- Archival candidates are found by send time
+CREATE INDEX IF NOT EXISTS idx_email_log_sent_at ON public.email_log(sent_at);
+
+-- Reclaim space of archived rows promptly so the hot heap stays compact
+ALTER TABLE public.email_log SET (
+  autovacuum_vacuum_scale_factor = 0.02,
+  autovacuum_vacuum_insert_scale_factor = 0.05
+);
+
+-- Create the monthly archive partition containing p_month (no-op if it exists)
+CREATE OR REPLACE FUNCTION public.create_email_log_archive_partition(p_month DATE)
+RETURNS TEXT
+LANGUAGE plpgsql
+AS $$
+DECLARE
+  v_start DATE := date_trunc('month', p_month)::DATE;
+  v_end   DATE := (date_trunc('month', p_month) + INTERVAL '1 month')::DATE;
+  v_name  TEXT := format('email_log_archive_y%sm%s', to_char(v_start, 'YYYY'), to_char(v_start, 'MM'));
+BEGIN
+  EXECUTE format(
+    'CREATE TABLE IF NOT EXISTS public.%I PARTITION OF public.email_log_archive FOR VALUES FROM (%L) TO (%L) WITH (fillfactor = 100)',
+    v_name, v_start, v_end
+  );
+  RETURN v_name;
+END;
+$$;
+
+-- Hot and archived sends together, for recomputation and reporting
+CREATE OR REPLACE VIEW public.email_log_all
+WITH (security_invoker = true) AS
+  SELECT id, owner, campaign_id, lead_id, step_id, variant_id, status, sent_at, clicked_url, clicked_at, FALSE AS archived
+  FROM public.email_log
+  UNION ALL
+  SELECT id, owner, campaign_id, lead_id, step_id, variant_id, status, sent_at, clicked_url, clicked_at, TRUE AS archived
+  FROM public.email_log_archive;
+
+-- Move up to p_batch sends older than p_before into the archive, oldest
+-- first. Rows locked by a concurrent status update are left for the next
+-- run. Returns the number of rows moved.
+CREATE OR REPLACE FUNCTION public.archive_email_log(p_before TIMESTAMPTZ, p_batch INT DEFAULT 5000)
+RETURNS INT
+LANGUAGE plpgsql
+AS $$
+DECLARE
+  v_moved INT;
+BEGIN
+  PERFORM public.create_email_log_archive_partition(month)
+  FROM (
+    SELECT DISTINCT date_trunc('month', sent_at)::DATE AS month
+    FROM (
+      SELECT sent_at FROM public.email_log
+      WHERE sent_at < p_before
+      ORDER BY sent_at
+      LIMIT p_batch
+    ) candidates
+  ) months;
+
+  WITH batch AS (
+    SELECT id FROM public.email_log
+    WHERE sent_at < p_before
+    ORDER BY sent_at
+    LIMIT p_batch
+    FOR UPDATE SKIP LOCKED
+  ),
+  moved AS (
+    DELETE FROM public.email_log l
+    USING batch
+    WHERE l.id = batch.id
+    RETURNING l.id, l.owner, l.campaign_id, l.lead_id, l.step_id, l.variant_id,
+              l.status, l.sent_at, l.clicked_url, l.clicked_at
+  ),
+  inserted AS (
+    INSERT INTO public.email_log_archive
+      (id, owner, campaign_id, lead_id, step_id, variant_id, status, sent_at, clicked_url, clicked_at)
+    SELECT * FROM moved
+    RETURNING 1
+  )
+  SELECT COUNT(*) INTO v_moved FROM inserted;
+
+  RETURN v_moved;
+END;
+$$;
+
+-- Recomputations include archived sends
+
+CREATE OR REPLACE FUNCTION public.owner_stats_email_log_inserted()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+  PERFORM public.bump_owner_stats(
+      n.owner,
+      p_sent => COUNT(*),
+      p_active_campaigns => COUNT(DISTINCT n.campaign_id) FILTER (
+        WHERE n.campaign_id IS NOT NULL AND NOT EXISTS (
+          SELECT 1 FROM public.email_log_all l
+          WHERE l.campaign_id = n.campaign_id
+            AND l.id NOT IN (SELECT id FROM new_rows)
+        )
+      )
+    )
+    FROM new_rows n WHERE n.owner IS NOT NULL GROUP BY n.owner;
+  RETURN NULL;
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION public.owner_stats_campaigns_changed()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+  IF TG_OP = 'INSERT' THEN
+    PERFORM public.bump_owner_stats(owner, p_campaigns => COUNT(*))
+      FROM new_rows WHERE owner IS NOT NULL GROUP BY owner;
+  ELSE
+    -- A deleted campaign that had sends was counted as active
+    PERFORM public.bump_owner_stats(
+        o.owner,
+        p_campaigns => -COUNT(*),
+        p_active_campaigns => -COUNT(*) FILTER (
+          WHERE EXISTS (SELECT 1 FROM public.email_log_all l WHERE l.campaign_id = o.id)
+        )
+      )
+      FROM old_rows o WHERE o.owner IS NOT NULL GROUP BY o.owner;
+  END IF;
+  RETURN NULL;
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION public.reconcile_owner_stats(p_owner UUID DEFAULT NULL)
+RETURNS INT
+LANGUAGE plpgsql
+AS $$
+DECLARE
+  v_fixed INT;
+BEGIN
+  WITH owners AS (
+    SELECT owner FROM public.leads WHERE owner IS NOT NULL AND (p_owner IS NULL OR owner = p_owner)
+    UNION
+    SELECT owner FROM public.campaigns WHERE owner IS NOT NULL AND (p_owner IS NULL OR owner = p_owner)
+    UNION
+    SELECT owner FROM public.email_log_all WHERE owner IS NOT NULL AND (p_owner IS NULL OR owner = p_owner)
+  ),
+  actual AS (
+    SELECT o.owner,
+           (SELECT COUNT(*) FROM public.leads x WHERE x.owner = o.owner) AS leads,
+           (SELECT COUNT(*) FROM public.campaigns x WHERE x.owner = o.owner) AS campaigns,
+           (SELECT COUNT(DISTINCT x.campaign_id) FROM public.email_log_all x
+             JOIN public.campaigns c ON c.id = x.campaign_id
+             WHERE x.owner = o.owner) AS active_campaigns,
+           e.sent, e.bounced, e.opened, e.clicked, e.replied
+    FROM owners o
+    CROSS JOIN LATERAL (
+      SELECT COUNT(*) AS sent,
+             COUNT(*) FILTER (WHERE l.status::TEXT = 'bounced') AS bounced,
+             COUNT(*) FILTER (WHERE public.email_status_rank(l.status::TEXT) >= 1) AS opened,
+             COUNT(*) FILTER (WHERE public.email_status_rank(l.status::TEXT) >= 2) AS clicked,
+             COUNT(*) FILTER (WHERE public.email_status_rank(l.status::TEXT) >= 3) AS replied
+      FROM public.email_log_all l
+      WHERE l.owner = o.owner
+    ) e
+  ),
+  fixed AS (
+    INSERT INTO public.owner_stats AS s
+      (owner, leads, campaigns, active_campaigns, sent, bounced, opened, clicked, replied, reconciled_at)
+    SELECT owner, leads, campaigns, active_campaigns, sent, bounced, opened, clicked, replied, NOW()
+    FROM actual
+    ON CONFLICT (owner) DO UPDATE SET
+      leads            = EXCLUDED.leads,
+      campaigns        = EXCLUDED.campaigns,
+      active_campaigns = EXCLUDED.active_campaigns,
+      sent             = EXCLUDED.sent,
+      bounced          = EXCLUDED.bounced,
+      opened           = EXCLUDED.opened,
+      clicked          = EXCLUDED.clicked,
+      replied          = EXCLUDED.replied,
+      reconciled_at    = NOW(),
+      updated_at       = NOW()
+    WHERE (s.leads, s.campaigns, s.active_campaigns, s.sent, s.bounced, s.opened, s.clicked, s.replied)
+          IS DISTINCT FROM
+          (EXCLUDED.leads, EXCLUDED.campaigns, EXCLUDED.active_campaigns, EXCLUDED.sent,
+           EXCLUDED.bounced, EXCLUDED.opened, EXCLUDED.clicked, EXCLUDED.replied)
+    RETURNING s.owner
+  )
+  SELECT COUNT(*) INTO v_fixed FROM fixed;
+
+  RETURN v_fixed;
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION public.refresh_campaign_metrics(p_limit INT DEFAULT 500)
+RETURNS TABLE (owner UUID, campaigns INT)
+LANGUAGE plpgsql
+AS $$
+DECLARE
+  v_ids UUID[];
+BEGIN
+  SELECT array_agg(campaign_id) INTO v_ids
+  FROM (
+    SELECT campaign_id
+    FROM public.campaign_metrics
+    WHERE dirty_since IS NOT NULL
+    ORDER BY dirty_since
+    LIMIT p_limit
+    FOR UPDATE SKIP LOCKED
+  ) dirty;
+
+  IF v_ids IS NULL THEN
+    RETURN;
+  END IF;
+
+  RETURN QUERY
+  WITH refreshed AS (
+    UPDATE public.campaign_metrics AS m
+       SET leads        = a.leads,
+           sent         = a.sent,
+           bounced      = a.bounced,
+           opened       = a.opened,
+           clicked      = a.clicked,
+           replied      = a.replied,
+           last_sent_at = a.last_sent_at,
+           dirty_since  = NULL,
+           refreshed_at = NOW()
+      FROM (
+        SELECT c.id AS campaign_id,
+               COUNT(DISTINCT l.lead_id) AS leads,
+               COUNT(l.id) AS sent,
+               COUNT(l.id) FILTER (WHERE l.status::TEXT = 'bounced') AS bounced,
+               COUNT(l.id) FILTER (WHERE public.email_status_rank(l.status::TEXT) >= 1) AS opened,
+               COUNT(l.id) FILTER (WHERE public.email_status_rank(l.status::TEXT) >= 2) AS clicked,
+               COUNT(l.id) FILTER (WHERE public.email_status_rank(l.status::TEXT) >= 3) AS replied,
+               MAX(l.sent_at) AS last_sent_at
+        FROM unnest(v_ids) AS c(id)
+        LEFT JOIN public.email_log_all l ON l.campaign_id = c.id
+        GROUP BY c.id
+      ) a
+     WHERE m.campaign_id = a.campaign_id
+    RETURNING m.owner
+  )
+  SELECT r.owner, COUNT(*)::INT
+  FROM refreshed r
+  GROUP BY r.owner;
+END;
+$$;
+
+-- Archived sends keep counting when the rollups are reconciled
+CREATE OR REPLACE FUNCTION public.email_rollup_facts(p_from TIMESTAMPTZ, p_owner UUID DEFAULT NULL)
+RETURNS TABLE (
+  owner UUID, campaign_id UUID, step_id UUID, variant_id UUID, ts TIMESTAMPTZ,
+  sent INT, opens INT, clicks INT, replies INT, opened INT, clicked INT, replied INT
+)
+LANGUAGE sql
+STABLE
+AS $$
+  WITH touched AS (
+    SELECT DISTINCT e.email_id
+    FROM public.email_events e
+    WHERE e.ts >= p_from AND (p_owner IS NULL OR e.owner = p_owner)
+  ),
+  firsts AS (
+    SELECT e.email_id,
+           MIN(e.ts) AS opened_at,
+           MIN(e.ts) FILTER (WHERE e.event_type IN ('click', 'reply')) AS clicked_at,
+           MIN(e.ts) FILTER (WHERE e.event_type = 'reply') AS replied_at
+    FROM public.email_events e
+    JOIN touched t ON t.email_id = e.email_id
+    GROUP BY e.email_id
+  )
+  SELECT l.owner, l.campaign_id, l.step_id, l.variant_id, l.sent_at, 1, 0, 0, 0, 0, 0, 0
+  FROM public.email_log_all l
+  WHERE l.sent_at >= p_from AND l.owner IS NOT NULL AND (p_owner IS NULL OR l.owner = p_owner)
+  UNION ALL
+  SELECT e.owner, e.campaign_id, e.step_id, e.variant_id, e.ts, 0,
+         (e.event_type = 'open')::INT, (e.event_type = 'click')::INT, (e.event_type = 'reply')::INT, 0, 0, 0
+  FROM public.email_events e
+  WHERE e.ts >= p_from AND e.owner IS NOT NULL AND (p_owner IS NULL OR e.owner = p_owner)
+  UNION ALL
+  SELECT l.owner, l.campaign_id, l.step_id, l.variant_id, x.ts, 0, 0, 0, 0, x.opened, x.clicked, x.replied
+  FROM public.email_log_all l
+  LEFT JOIN firsts f ON f.email_id = l.id
+  CROSS JOIN LATERAL (VALUES
+    (COALESCE(f.opened_at, l.sent_at), 1, 0, 0, 1),
+    (COALESCE(f.clicked_at, f.opened_at, l.sent_at), 0, 1, 0, 2),
+    (COALESCE(f.replied_at, f.clicked_at, f.opened_at, l.sent_at), 0, 0, 1, 3)
+  ) AS x(ts, opened, clicked, replied, rank)
+  WHERE l.owner IS NOT NULL AND (p_owner IS NULL OR l.owner = p_owner)
+    AND (l.sent_at >= p_from OR f.email_id IS NOT NULL)
+    AND public.email_status_rank(l.status::TEXT) >= x.rank
+    AND x.ts >= p_from;
+$$;
+
+COMMENT ON TABLE public.email_log_archive IS 'Archived email_log rows older than the retention window, partitioned by month';
+COMMENT ON VIEW public.email_log_all IS 'email_log plus email_log_archive';
@@ -0,0 +1,391 @@
+-- email_log as a monthly range-partitioned table on sent_at.
+--
+-- Vacuum, index maintenance and time-range scans now work per month, and
+-- old months leave the hot table by detaching their partition instead of
+-- deleting rows. The unique key becomes (id, sent_at).
+--
+-- Downtime: the conversion holds an ACCESS EXCLUSIVE lock on email_log
+-- while every row is copied, so sends, tracking events and dashboards
+-- wait for it. Indexes are built after the copy to keep it short; expect
+-- roughly a minute per few million rows and run it in a quiet window.
+--
+-- New ids are UUIDv7: the first 48 bits are the creation time in
+-- milliseconds. A check constraint keeps sent_at within 7 days of that
+-- time, so a lookup by id can always add a sent_at range and touch one or
+-- two partitions. Legacy (random) ids are left unbounded.
+
+-- Time-ordered UUID (RFC 9562 version 7)
+CREATE OR REPLACE FUNCTION public.uuid_generate_v7()
+RETURNS UUID
+LANGUAGE plpgsql
+VOLATILE
+AS $$
+DECLARE
+  v_ms    BIGINT := floor(extract(epoch FROM clock_timestamp()) * 1000);
+  v_bytes BYTEA := uuid_send(gen_random_uuid());
+BEGIN
+  v_bytes := overlay(v_bytes PLACING substring(int8send(v_ms) FROM 3) FROM 1 FOR 6);
+  -- Version 7; the variant bits of the random v4 bytes are already right
+  v_bytes := set_byte(v_bytes, 6, (get_byte(v_bytes, 6) & 15) | 112);
+  RETURN encode(v_bytes, 'hex')::UUID;
+END;
+$$;
+
+-- Creation time of a UUIDv7, NULL for any other version
+CREATE OR REPLACE FUNCTION public.email_log_id_time(p_id UUID)
+RETURNS TIMESTAMPTZ
+LANGUAGE sql
+IMMUTABLE
+PARALLEL SAFE
+AS $$
+  SELECT CASE WHEN substr(p_id::TEXT, 15, 1) = '7'
+              THEN to_timestamp(('x' || substr(replace(p_id::TEXT, '-', ''), 1, 12))::BIT(48)::BIGINT / 1000.0)
+         END;
+$$;
+
+-- sent_at range [from, to) a row with this id can have
+CREATE OR REPLACE FUNCTION public.email_log_sent_at_from(p_id UUID)
+RETURNS TIMESTAMPTZ
+LANGUAGE sql
+IMMUTABLE
+PARALLEL SAFE
+AS $$
+  SELECT COALESCE(public.email_log_id_time(p_id) - INTERVAL '7 days', '-infinity'::TIMESTAMPTZ);
+$$;
+
+CREATE OR REPLACE FUNCTION public.email_log_sent_at_to(p_id UUID)
+RETURNS TIMESTAMPTZ
+LANGUAGE sql
+IMMUTABLE
+PARALLEL SAFE
+AS $$
+  SELECT COALESCE(public.email_log_id_time(p_id) + INTERVAL '7 days', 'infinity'::TIMESTAMPTZ);
+$$;
+
+-- Convert: the old heap is renamed, its rows are copied into the
+-- partitioned table and it is dropped. Triggers are created after the
+-- copy so counters and rollups are not counted twice.
+LOCK TABLE public.email_log IN ACCESS EXCLUSIVE MODE;
+
+ALTER TABLE public.email_log RENAME TO email_log_legacy;
+
+DROP TRIGGER IF EXISTS owner_stats_email_log_inserted ON public.email_log_legacy;
+DROP TRIGGER IF EXISTS owner_stats_email_log_updated ON public.email_log_legacy;
+DROP TRIGGER IF EXISTS email_rollups_email_log_inserted ON public.email_log_legacy;
+DROP TRIGGER IF EXISTS email_rollups_email_log_updated ON public.email_log_legacy;
+DROP TRIGGER IF EXISTS campaign_metrics_email_log_inserted ON public.email_log_legacy;
+DROP TRIGGER IF EXISTS campaign_metrics_email_log_updated ON public.email_log_legacy;
+
+ALTER TABLE public.email_log_legacy DROP CONSTRAINT IF EXISTS email_log_pkey;
+DROP INDEX IF EXISTS public.idx_email_log_sent_at;
+DROP INDEX IF EXISTS public.idx_email_log_campaign;
+
+-- Rows never sent keep their NULL sent_at and live in the default
+-- partition, which is why the key is a unique constraint: a primary key
+-- would force sent_at NOT NULL. New sends always get a sent_at.
+CREATE TABLE public.email_log (
+  LIKE public.email_log_legacy INCLUDING DEFAULTS INCLUDING COMMENTS,
+  CONSTRAINT email_log_id_sent_at_key UNIQUE (id, sent_at),
+  CONSTRAINT email_log_sent_at_matches_id
+    CHECK (sent_at >= public.email_log_sent_at_from(id) AND sent_at < public.email_log_sent_at_to(id))
+) PARTITION BY RANGE (sent_at);
+
+ALTER TABLE public.email_log
+  ALTER COLUMN id SET DEFAULT public.uuid_generate_v7(),
+  ALTER COLUMN sent_at SET DEFAULT NOW();
+
+ALTER TABLE public.email_log
+  ADD CONSTRAINT email_log_campaign_id_fkey FOREIGN KEY (campaign_id) REFERENCES public.campaigns(id),
+  ADD CONSTRAINT email_log_lead_id_fkey FOREIGN KEY (lead_id) REFERENCES public.leads(id),
+  ADD CONSTRAINT email_log_step_id_fkey FOREIGN KEY (step_id) REFERENCES public.campaign_steps(id),
+  ADD CONSTRAINT email_log_variant_id_fkey FOREIGN KEY (variant_id) REFERENCES public.step_variants(id) ON DELETE SET NULL;
+
+-- Catch-all for sends outside the pre-created monthly partitions and
+-- for rows that were never sent
+CREATE TABLE public.email_log_default PARTITION OF public.email_log DEFAULT;
+
+ALTER TABLE public.email_log ENABLE ROW LEVEL SECURITY;
+
+CREATE POLICY "Users can view their own emails"
+  ON public.email_log FOR SELECT USING (auth.uid() = owner);
+
+-- Create the monthly partition containing p_month (no-op if it exists).
+-- Rows that went to the default partition before the month existed are
+-- moved into it, so the attach never conflicts with the default.
+CREATE OR REPLACE FUNCTION public.create_email_log_partition(p_month DATE)
+RETURNS TEXT
+LANGUAGE plpgsql
+AS $$
+DECLARE
+  v_start DATE := date_trunc('month', p_month)::DATE;
+  v_end   DATE := (date_trunc('month', p_month) + INTERVAL '1 month')::DATE;
+  v_name  TEXT := format('email_log_y%sm%s', to_char(v_start, 'YYYY'), to_char(v_start, 'MM'));
+BEGIN
+  IF to_regclass(format('public.%I', v_name)) IS NOT NULL THEN
+    RETURN v_name;
+  END IF;
+
+  EXECUTE format(
+    'CREATE TABLE public.%I (LIKE public.email_log INCLUDING DEFAULTS INCLUDING CONSTRAINTS)
+       WITH (autovacuum_vacuum_scale_factor = 0.02, autovacuum_vacuum_insert_scale_factor = 0.05)',
+    v_name
+  );
+  EXECUTE format(
+    'WITH moved AS (DELETE FROM public.email_log_default WHERE sent_at >= %L AND sent_at < %L RETURNING *)
+     INSERT INTO public.%I SELECT * FROM moved',
+    v_start, v_end, v_name
+  );
+  EXECUTE format(
+    'ALTER TABLE public.email_log ATTACH PARTITION public.%I FOR VALUES FROM (%L) TO (%L)',
+    v_name, v_start, v_end
+  );
+  RETURN v_name;
+END;
+$$;
+
+-- Make sure the current month and the next p_months_ahead months exist
+CREATE OR REPLACE FUNCTION public.ensure_email_log_partitions(p_months_ahead INT DEFAULT 3)
+RETURNS SETOF TEXT
+LANGUAGE plpgsql
+AS $$
+DECLARE
+  i INT;
+BEGIN
+  FOR i IN 0..p_months_ahead LOOP
+    RETURN NEXT public.create_email_log_partition((date_trunc('month', NOW()) + make_interval(months => i))::DATE);
+  END LOOP;
+END;
+$$;
+
+-- Partitions for every month with existing sends, then copy
+SELECT public.create_email_log_partition(month::DATE)
+FROM generate_series(
+  date_trunc('month', LEAST((SELECT MIN(sent_at) FROM public.email_log_legacy), NOW())),
+  date_trunc('month', NOW()),
+  INTERVAL '1 month'
+) AS month;
+
+SELECT public.ensure_email_log_partitions(3);
+
+INSERT INTO public.email_log SELECT * FROM public.email_log_legacy;
+
+-- Indexes are built once over the copied rows, on every partition
+CREATE INDEX idx_email_log_sent_at ON public.email_log(sent_at);
+CREATE INDEX idx_email_log_campaign ON public.email_log(campaign_id);
+CREATE INDEX idx_email_log_owner_sent ON public.email_log(owner, sent_at);
+
+-- Hot and archived sends together, now over the partitioned table
+CREATE OR REPLACE VIEW public.email_log_all
+WITH (security_invoker = true) AS
+  SELECT id, owner, campaign_id, lead_id, step_id, variant_id, status, sent_at, clicked_url, clicked_at, FALSE AS archived
+  FROM public.email_log
+  UNION ALL
+  SELECT id, owner, campaign_id, lead_id, step_id, variant_id, status, sent_at, clicked_url, clicked_at, TRUE AS archived
+  FROM public.email_log_archive;
+
+-- Unused since owner_stats; it would keep the old heap alive
+DROP VIEW IF EXISTS public.vw_stats_overview;
+DROP TABLE public.email_log_legacy;
+
+CREATE TRIGGER owner_stats_email_log_inserted
+  AFTER INSERT ON public.email_log
+  REFERENCING NEW TABLE AS new_rows
+  FOR EACH STATEMENT EXECUTE FUNCTION public.owner_stats_email_log_inserted();
+
+CREATE TRIGGER owner_stats_email_log_updated
+  AFTER UPDATE ON public.email_log
+  REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+  FOR EACH STATEMENT EXECUTE FUNCTION public.owner_stats_email_log_updated();
+
+CREATE TRIGGER email_rollups_email_log_inserted
+  AFTER INSERT ON public.email_log
+  REFERENCING NEW TABLE AS new_rows
+  FOR EACH STATEMENT EXECUTE FUNCTION public.email_rollups_email_log_inserted();
+
+CREATE TRIGGER email_rollups_email_log_updated
+  AFTER UPDATE ON public.email_log
+  REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+  FOR EACH STATEMENT EXECUTE FUNCTION public.email_rollups_email_log_updated();
+
+CREATE TRIGGER campaign_metrics_email_log_inserted
+  AFTER INSERT ON public.email_log
+  REFERENCING NEW TABLE AS new_rows
+  FOR EACH STATEMENT EXECUTE FUNCTION public.campaign_metrics_mark_dirty();
+
+CREATE TRIGGER campaign_metrics_email_log_updated
+  AFTER UPDATE ON public.email_log
+  REFERENCING NEW TABLE AS new_rows
+  FOR EACH STATEMENT EXECUTE FUNCTION public.campaign_metrics_mark_dirty();
+
+-- Move every email_log partition whose month ended before p_before into
+-- email_log_archive. The partition is prepared while still attached (only
+-- that month is locked), then detached and attached to the archive, which
+-- is catalog work only. A month the row-by-row archival already started
+-- is copied into the existing archive partition instead. Returns the
+-- archive partitions written.
+CREATE OR REPLACE FUNCTION public.archive_email_log_partitions(p_before TIMESTAMPTZ)
+RETURNS SETOF TEXT
+LANGUAGE plpgsql
+AS $$
+DECLARE
+  r       RECORD;
+  v_fk    TEXT;
+  v_end   DATE;
+  v_name  TEXT;
+BEGIN
+  FOR r IN
+    SELECT c.relname AS name, to_date(right(c.relname, 7), 'YYYY"m"MM') AS month
+    FROM pg_inherits i
+    JOIN pg_class c ON c.oid = i.inhrelid
+    WHERE i.inhparent = 'public.email_log'::REGCLASS
+      AND c.relname ~ '^email_log_y[0-9]{4}m[0-9]{2}$'
+    ORDER BY 2
+  LOOP
+    v_end := (r.month + INTERVAL '1 month')::DATE;
+    EXIT WHEN v_end > p_before;
+    v_name := format('email_log_archive_y%sm%s', to_char(r.month, 'YYYY'), to_char(r.month, 'MM'));
+
+    IF to_regclass(format('public.%I', v_name)) IS NULL THEN
+      -- Matches the archive's id index and proves the range, so the
+      -- attach below neither builds an index nor scans the rows
+      EXECUTE format('CREATE INDEX IF NOT EXISTS %I ON public.%I (id)', r.name || '_id_idx', r.name);
+      EXECUTE format(
+        'ALTER TABLE public.%I ADD CONSTRAINT %I CHECK (sent_at >= %L AND sent_at < %L)',
+        r.name, r.name || '_range', r.month, v_end
+      );
+      EXECUTE format('ALTER TABLE public.email_log DETACH PARTITION public.%I', r.name);
+
+      -- Archived sends outlive their campaigns and leads
+      FOR v_fk IN
+        SELECT conname FROM pg_constraint
+        WHERE conrelid = format('public.%I', r.name)::REGCLASS AND contype = 'f'
+      LOOP
+        EXECUTE format('ALTER TABLE public.%I DROP CONSTRAINT %I', r.name, v_fk);
+      END LOOP;
+
+      EXECUTE format('ALTER TABLE public.%I ADD COLUMN archived_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW()', r.name);
+      EXECUTE format('ALTER TABLE public.%I RENAME TO %I', r.name, v_name);
+      EXECUTE format(
+        'ALTER TABLE public.email_log_archive ATTACH PARTITION public.%I FOR VALUES FROM (%L) TO (%L)',
+        v_name, r.month, v_end
+      );
+    ELSE
+      EXECUTE format('ALTER TABLE public.email_log DETACH PARTITION public.%I', r.name);
+      EXECUTE format(
+        'INSERT INTO public.%I (id, owner, campaign_id, lead_id, step_id, variant_id, status, sent_at, clicked_url, clicked_at)
+         SELECT id, owner, campaign_id, lead_id, step_id, variant_id, status, sent_at, clicked_url, clicked_at
+         FROM public.%I',
+        v_name, r.name
+      );
+      EXECUTE format('DROP TABLE public.%I', r.name);
+    END IF;
+
+    RETURN NEXT v_name;
+  END LOOP;
+END;
+$$;
+
+-- Row-by-row archival is left for sends in the default partition; whole
+-- months go through archive_email_log_partitions()
+CREATE OR REPLACE FUNCTION public.archive_email_log(p_before TIMESTAMPTZ, p_batch INT DEFAULT 5000)
+RETURNS INT
+LANGUAGE plpgsql
+AS $$
+DECLARE
+  v_moved INT;
+BEGIN
+  PERFORM public.create_email_log_archive_partition(month)
+  FROM (
+    SELECT DISTINCT date_trunc('month', sent_at)::DATE AS month
+    FROM (
+      SELECT sent_at FROM public.email_log_default
+      WHERE sent_at < p_before
+      ORDER BY sent_at
+      LIMIT p_batch
+    ) candidates
+  ) months;
+
+  WITH batch AS (
+    SELECT id, sent_at FROM public.email_log_default
+    WHERE sent_at < p_before
+    ORDER BY sent_at
+    LIMIT p_batch
+    FOR UPDATE SKIP LOCKED
+  ),
+  moved AS (
+    DELETE FROM public.email_log_default l
+    USING batch
+    WHERE l.id = batch.id AND l.sent_at = batch.sent_at
+    RETURNING l.id, l.owner, l.campaign_id, l.lead_id, l.step_id, l.variant_id,
+              l.status, l.sent_at, l.clicked_url, l.clicked_at
+  ),
+  inserted AS (
+    INSERT INTO public.email_log_archive
+      (id, owner, campaign_id, lead_id, step_id, variant_id, status, sent_at, clicked_url, clicked_at)
+    SELECT * FROM moved
+    RETURNING 1
+  )
+  SELECT COUNT(*) INTO v_moved FROM inserted;
+
+  RETURN v_moved;
+END;
+$$;
+
+-- Event lookups carry the partition key derived from the email id
+CREATE OR REPLACE FUNCTION public.record_email_events(p_events JSONB)
+RETURNS TABLE (email_id UUID, owner UUID, campaign_id UUID, status TEXT)
+LANGUAGE plpgsql
+AS $$
+DECLARE
+  v_email_ids UUID[];
+BEGIN
+  WITH incoming AS (
+    SELECT e.email_id, e.event_type, e.url, COALESCE(e.ts, NOW()) AS ts, e.metadata
+    FROM jsonb_to_recordset(p_events)
+      AS e(email_id UUID, event_type TEXT, url TEXT, ts TIMESTAMPTZ, metadata JSONB)
+  ),
+  inserted AS (
+    INSERT INTO public.email_events (email_id, owner, campaign_id, lead_id, step_id, variant_id, event_type, url, ts, metadata)
+    SELECT i.email_id, l.owner, l.campaign_id, l.lead_id, l.step_id, l.variant_id, i.event_type, i.url, i.ts, i.metadata
+    FROM incoming i
+    JOIN public.email_log l
+      ON l.id = i.email_id
+     AND l.sent_at >= public.email_log_sent_at_from(i.email_id)
+     AND l.sent_at < public.email_log_sent_at_to(i.email_id)
+    RETURNING email_events.email_id
+  )
+  SELECT array_agg(DISTINCT inserted.email_id) INTO v_email_ids FROM inserted;
+
+  IF v_email_ids IS NULL THEN
+    RETURN;
+  END IF;
+
+  RETURN QUERY
+  WITH derived AS (
+    SELECT ev.email_id,
+           MAX(CASE ev.event_type WHEN 'open' THEN 1 WHEN 'click' THEN 2 ELSE 3 END) AS rank,
+           (array_agg(ev.url ORDER BY ev.ts DESC) FILTER (WHERE ev.event_type = 'click'))[1] AS clicked_url,
+           MAX(ev.ts) FILTER (WHERE ev.event_type = 'click') AS clicked_at
+    FROM public.email_events ev
+    WHERE ev.email_id = ANY(v_email_ids)
+    GROUP BY ev.email_id
+  )
+  UPDATE public.email_log AS l
+     SET status = CASE GREATEST(public.email_status_rank(l.status::TEXT), d.rank)
+                    WHEN 1 THEN 'opened'
+                    WHEN 2 THEN 'clicked'
+                    ELSE 'replied'
+                  END::public.email_status,
+         clicked_url = COALESCE(d.clicked_url, l.clicked_url),
+         clicked_at  = COALESCE(d.clicked_at, l.clicked_at)
+    FROM derived d
+   WHERE l.id = d.email_id
+     AND l.sent_at >= public.email_log_sent_at_from(d.email_id)
+     AND l.sent_at < public.email_log_sent_at_to(d.email_id)
+  RETURNING l.id, l.owner, l.campaign_id, l.status::TEXT;
+END;
+$$;
+
+COMMENT ON TABLE public.email_log IS 'Sent emails, range partitioned by month of sent_at';
+COMMENT ON CONSTRAINT email_log_sent_at_matches_id ON public.email_log IS 'sent_at is within 7 days of a UUIDv7 id''s time, so lookups by id can prune partitions';
+COMMENT ON FUNCTION public.archive_email_log_partitions(TIMESTAMPTZ) IS 'Detach whole months of email_log into email_log_archive';
@@ -0,0 +1,149 @@
+-- Delta sync ("changes since") for leads, campaigns and templates.
+--
+-- A client keeps a cursor (updated_at, id) per resource and asks for the
+-- rows changed after it, in keyset order. Deletes leave a tombstone in
+-- deleted_records so they can be synced too; tombstones share the keyset
+-- (deleted_at, record_id) with the rows.
+--
+-- updated_at is the writer's transaction start, so a row can commit after
+-- rows with a later updated_at. sync_changes() therefore only returns
+-- changes older than p_lag: a cursor never moves past a write that is
+-- still in flight, as long as write transactions are shorter than p_lag.
+CREATE TABLE IF NOT EXISTS public.deleted_records (
+  resource   TEXT NOT NULL,
+  record_id  UUID NOT NULL,
+  owner      UUID,
+  deleted_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW(),
+  PRIMARY KEY (resource, record_id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_deleted_records_sync
+  ON public.deleted_records(resource, owner, deleted_at, record_id);
+
+ALTER TABLE public.deleted_records ENABLE ROW LEVEL SECURITY;
+
+CREATE POLICY "Users can view their own tombstones"
+  ON public.deleted_records FOR SELECT USING (auth.uid() = owner);
+
+-- Tombstones for deleted rows; TG_ARGV[0] is the table's owner column
+CREATE OR REPLACE FUNCTION public.record_deletions()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+  EXECUTE format(
+    'INSERT INTO public.deleted_records (resource, record_id, owner)
+     SELECT %L, id, %I FROM old_rows
+     ON CONFLICT (resource, record_id) DO UPDATE SET deleted_at = NOW(), owner = EXCLUDED.owner',
+    TG_TABLE_NAME, TG_ARGV[0]
+  );
+  RETURN NULL;
+END;
+$$;
+
+CREATE TRIGGER leads_record_deletions
+  AFTER DELETE ON public.leads
+  REFERENCING OLD TABLE AS old_rows
+  FOR EACH STATEMENT EXECUTE FUNCTION public.record_deletions('owner');
+
+CREATE TRIGGER campaigns_record_deletions
+  AFTER DELETE ON public.campaigns
+  REFERENCING OLD TABLE AS old_rows
+  FOR EACH STATEMENT EXECUTE FUNCTION public.record_deletions('owner');
+
+CREATE TRIGGER templates_record_deletions
+  AFTER DELETE ON public.templates
+  REFERENCING OLD TABLE AS old_rows
+  FOR EACH STATEMENT EXECUTE FUNCTION public.record_deletions('created_by');
+
+-- Every synced table needs a maintained, non-null updated_at
+DROP TRIGGER IF EXISTS update_campaigns_updated_at ON public.campaigns;
+CREATE TRIGGER update_campaigns_updated_at
+  BEFORE UPDATE ON public.campaigns
+  FOR EACH ROW
+  EXECUTE FUNCTION update_updated_at_column();
+
+UPDATE public.leads SET updated_at = COALESCE(created_at, NOW()) WHERE updated_at IS NULL;
+UPDATE public.campaigns SET updated_at = COALESCE(created_at, NOW()) WHERE updated_at IS NULL;
+
+ALTER TABLE public.leads
+  ALTER COLUMN updated_at SET DEFAULT NOW(),
+  ALTER COLUMN updated_at SET NOT NULL;
+ALTER TABLE public.campaigns
+  ALTER COLUMN updated_at SET DEFAULT NOW(),
+  ALTER COLUMN updated_at SET NOT NULL;
+
+-- Keyset scans per owner
+CREATE INDEX IF NOT EXISTS idx_leads_owner_sync ON public.leads(owner, updated_at, id);
+CREATE INDEX IF NOT EXISTS idx_campaigns_owner_sync ON public.campaigns(owner, updated_at, id);
+CREATE INDEX IF NOT EXISTS idx_templates_owner_sync ON public.templates(created_by, updated_at, id);
+
+-- Up to p_limit changes of one resource after the cursor (p_after_ts,
+-- p_after_id), oldest first. op is 'upsert' (record holds the row) or
+-- 'delete' (record is NULL).
+CREATE OR REPLACE FUNCTION public.sync_changes(
+  p_resource TEXT,
+  p_owner UUID,
+  p_after_ts TIMESTAMPTZ DEFAULT NULL,
+  p_after_id UUID DEFAULT NULL,
+  p_limit INT DEFAULT 500,
+  p_lag INTERVAL DEFAULT INTERVAL '10 seconds'
+)
+RETURNS TABLE (op TEXT, id UUID, changed_at TIMESTAMPTZ, record JSONB)
+LANGUAGE plpgsql
+STABLE
+AS $$
+DECLARE
+  v_owner_column TEXT;
+BEGIN
+  v_owner_column := CASE p_resource
+    WHEN 'leads' THEN 'owner'
+    WHEN 'campaigns' THEN 'owner'
+    WHEN 'templates' THEN 'created_by'
+  END;
+  IF v_owner_column IS NULL THEN
+    RAISE EXCEPTION 'Unknown sync resource: %', p_resource;
+  END IF;
+
+  RETURN QUERY EXECUTE format(
+    'SELECT * FROM (
+       (SELECT ''upsert''::TEXT, t.id, t.updated_at, to_jsonb(t)
+        FROM public.%1$I t
+        WHERE t.%2$I = $1 AND (t.updated_at, t.id) > ($2, $3) AND t.updated_at < $5
+        ORDER BY t.updated_at, t.id
+        LIMIT $4)
+       UNION ALL
+       (SELECT ''delete''::TEXT, d.record_id, d.deleted_at, NULL::JSONB
+        FROM public.deleted_records d
+        WHERE d.resource = %1$L AND d.owner = $1
+          AND (d.deleted_at, d.record_id) > ($2, $3) AND d.deleted_at < $5
+        ORDER BY d.deleted_at, d.record_id
+        LIMIT $4)
+     ) changes
+     ORDER BY 3, 2
+     LIMIT $4',
+    p_resource, v_owner_column
+  )
+  USING p_owner,
+        COALESCE(p_after_ts, '-infinity'::TIMESTAMPTZ),
+        COALESCE(p_after_id, '00000000-0000-0000-0000-000000000000'::UUID),
+        p_limit,
+        NOW() - p_lag;
+END;
+$$;
+
+-- Tombstones are only needed until every client has synced past them
+CREATE OR REPLACE FUNCTION public.prune_deleted_records(p_keep INTERVAL DEFAULT INTERVAL '30 days')
+RETURNS INT
+LANGUAGE plpgsql
+AS $$
+DECLARE
+  v_deleted INT;
+BEGIN
+  DELETE FROM public.deleted_records WHERE deleted_at < NOW() - p_keep;
+  GET DIAGNOSTICS v_deleted = ROW_COUNT;
+  RETURN v_deleted;
+END;
+$$;
+
+COMMENT ON TABLE public.deleted_records IS 'Tombstones of deleted leads, campaigns and templates for delta sync';
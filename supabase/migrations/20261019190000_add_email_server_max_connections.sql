@@ -0,0 +1,8 @@
+-- Per-server limit of concurrent SMTP sessions held by the sending pool
+-- (flask_app/smtp_pool.py). Providers throttle or block accounts that open
+-- too many parallel connections.
+ALTER TABLE public.email_servers
+  ADD COLUMN IF NOT EXISTS max_connections INTEGER NOT NULL DEFAULT 3
+  CHECK (max_connections BETWEEN 1 AND 50);
+
+COMMENT ON COLUMN public.email_servers.max_connections IS 'Maximum concurrent SMTP sessions to this server';
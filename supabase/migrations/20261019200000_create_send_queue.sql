@@ -0,0 +1,279 @@
+-- Durable queue of campaign messages for the send engine
+-- (flask_app/send_engine.py).
+--
+-- Engines claim due rows in batches with SKIP LOCKED, so any number of
+-- them can run side by side. A claim is a lease: it moves due_at to the
+-- end of the lease, so rows of a crashed engine become due again on their
+-- own. Each claim draws a fresh UUIDv7 that becomes the email_log id of
+-- the message (tracking links are signed with it before sending).
+-- complete_send_batch() writes outcomes back in one round trip.
+CREATE TABLE IF NOT EXISTS public.send_queue (
+  id              UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+  owner           UUID NOT NULL,
+  campaign_id     UUID NOT NULL REFERENCES public.campaigns(id) ON DELETE CASCADE,
+  lead_id         UUID NOT NULL REFERENCES public.leads(id) ON DELETE CASCADE,
+  step_id         UUID NOT NULL REFERENCES public.campaign_steps(id) ON DELETE CASCADE,
+  variant_id      UUID REFERENCES public.step_variants(id) ON DELETE SET NULL,
+  email_server_id UUID REFERENCES public.email_servers(id) ON DELETE SET NULL,
+  scheduled_at    TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW(),
+  due_at          TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW(),
+  attempts        INT NOT NULL DEFAULT 0,
+  email_id        UUID,
+  claimed_by      TEXT,
+  last_error      TEXT,
+  created_at      TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW(),
+  UNIQUE (lead_id, step_id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_send_queue_due ON public.send_queue(due_at);
+
+ALTER TABLE public.send_queue ENABLE ROW LEVEL SECURITY;
+
+CREATE POLICY "Users can view their own queued sends"
+  ON public.send_queue FOR SELECT USING (auth.uid() = owner);
+
+-- Which mailbox sent an email; the archive must keep the same columns so
+-- expired email_log partitions can be attached to it
+ALTER TABLE public.email_log
+  ADD COLUMN IF NOT EXISTS email_server_id UUID REFERENCES public.email_servers(id) ON DELETE SET NULL;
+ALTER TABLE public.email_log_archive
+  ADD COLUMN IF NOT EXISTS email_server_id UUID;
+
+-- Claim up to p_limit due messages for p_lease. Returns the lead fields
+-- needed for rendering; step and variant content is cached by the engine.
+-- A message without its own email_server_id goes out through the owner's
+-- default server.
+CREATE OR REPLACE FUNCTION public.claim_send_batch(
+  p_worker TEXT,
+  p_limit INT DEFAULT 500,
+  p_lease INTERVAL DEFAULT INTERVAL '5 minutes'
+)
+RETURNS TABLE (
+  id UUID, email_id UUID, owner UUID, campaign_id UUID, lead_id UUID,
+  step_id UUID, variant_id UUID, email_server_id UUID,
+  scheduled_at TIMESTAMPTZ, attempts INT, lead JSONB
+)
+LANGUAGE sql
+AS $$
+  WITH due AS (
+    SELECT q.id FROM public.send_queue q
+    WHERE q.due_at <= NOW()
+    ORDER BY q.due_at
+    LIMIT p_limit
+    FOR UPDATE SKIP LOCKED
+  ),
+  claimed AS (
+    UPDATE public.send_queue q
+       SET claimed_by = p_worker,
+           due_at     = NOW() + p_lease,
+           attempts   = q.attempts + 1,
+           email_id   = public.uuid_generate_v7()
+      FROM due
+     WHERE q.id = due.id
+    RETURNING q.*
+  )
+  SELECT c.id, c.email_id, c.owner, c.campaign_id, c.lead_id, c.step_id, c.variant_id,
+         COALESCE(c.email_server_id, s.id), c.scheduled_at, c.attempts,
+         jsonb_build_object(
+           'email', l.email, 'bedrijf', l.bedrijf, 'website', l.website,
+           'linkedin', l.linkedin, 'image_path', l.image_path
+         )
+  FROM claimed c
+  JOIN public.leads l ON l.id = c.lead_id
+  LEFT JOIN public.email_servers s
+    ON c.email_server_id IS NULL AND s.owner = c.owner AND s.is_default;
+$$;
+
+-- Write back the outcomes of claimed messages. p_results is a JSON array
+-- of {id, email_id, outcome, email_server_id, sent_at, retry_at, error}
+-- where outcome is:
+--   sent      logged to email_log as sent, removed from the queue
+--   failed    permanent refusal, logged as bounced, removed
+--   retry     temporary failure, due again at retry_at
+--   deferred  not attempted (throttled past the lease), due again at
+--             retry_at without counting as an attempt
+-- A result applies only while the row still carries its email_id: once
+-- the lease expired and another engine claimed the row, the late result
+-- is counted as stale and changes nothing.
+CREATE OR REPLACE FUNCTION public.complete_send_batch(p_results JSONB)
+RETURNS TABLE (logged INT, rescheduled INT, stale INT)
+LANGUAGE plpgsql
+AS $$
+DECLARE
+  v_logged INT;
+  v_rescheduled INT;
+  v_stale INT;
+BEGIN
+  CREATE TEMP TABLE IF NOT EXISTS send_results (
+    id UUID, email_id UUID, outcome TEXT, email_server_id UUID,
+    sent_at TIMESTAMPTZ, retry_at TIMESTAMPTZ, error TEXT
+  ) ON COMMIT DROP;
+
+  INSERT INTO send_results
+  SELECT * FROM jsonb_to_recordset(p_results)
+    AS r(id UUID, email_id UUID, outcome TEXT, email_server_id UUID,
+         sent_at TIMESTAMPTZ, retry_at TIMESTAMPTZ, error TEXT);
+
+  INSERT INTO public.email_log (id, owner, campaign_id, lead_id, step_id, variant_id, email_server_id, status, sent_at)
+  SELECT r.email_id, q.owner, q.campaign_id, q.lead_id, q.step_id, q.variant_id, r.email_server_id,
+         (CASE r.outcome WHEN 'sent' THEN 'sent' ELSE 'bounced' END)::public.email_status,
+         COALESCE(r.sent_at, NOW())
+  FROM send_results r
+  JOIN public.send_queue q ON q.id = r.id AND q.email_id = r.email_id
+  WHERE r.outcome IN ('sent', 'failed');
+  GET DIAGNOSTICS v_logged = ROW_COUNT;
+
+  DELETE FROM public.send_queue q
+  USING send_results r
+  WHERE q.id = r.id AND q.email_id = r.email_id AND r.outcome IN ('sent', 'failed');
+
+  UPDATE public.send_queue q
+     SET due_at       = r.retry_at,
+         scheduled_at = r.retry_at,
+         claimed_by   = NULL,
+         email_id     = NULL,
+         last_error   = COALESCE(r.error, q.last_error),
+         attempts     = q.attempts - (r.outcome = 'deferred')::INT
+    FROM send_results r
+   WHERE q.id = r.id AND q.email_id = r.email_id AND r.outcome IN ('retry', 'deferred');
+  GET DIAGNOSTICS v_rescheduled = ROW_COUNT;
+
+  -- Results of leases that expired and were claimed again (or completed)
+  -- are ignored: the row now belongs to the newer claim
+  v_stale := jsonb_array_length(p_results) - v_logged - v_rescheduled;
+
+  RETURN QUERY SELECT v_logged, v_rescheduled, v_stale;
+END;
+$$;
+
+-- Queue depth and lag for monitoring
+CREATE OR REPLACE FUNCTION public.send_queue_status()
+RETURNS TABLE (queued BIGINT, due BIGINT, claimed BIGINT, oldest_due_at TIMESTAMPTZ)
+LANGUAGE sql
+STABLE
+AS $$
+  SELECT COUNT(*),
+         COUNT(*) FILTER (WHERE due_at <= NOW()),
+         COUNT(*) FILTER (WHERE claimed_by IS NOT NULL AND due_at > NOW()),
+         MIN(scheduled_at) FILTER (WHERE due_at <= NOW() OR claimed_by IS NOT NULL)
+  FROM public.send_queue;
+$$;
+
+-- Archived sends keep their server: the view and both archival paths
+-- carry email_server_id (detached partitions already have it)
+CREATE OR REPLACE VIEW public.email_log_all
+WITH (security_invoker = true) AS
+  SELECT id, owner, campaign_id, lead_id, step_id, variant_id, status, sent_at, clicked_url, clicked_at, FALSE AS archived, email_server_id
+  FROM public.email_log
+  UNION ALL
+  SELECT id, owner, campaign_id, lead_id, step_id, variant_id, status, sent_at, clicked_url, clicked_at, TRUE AS archived, email_server_id
+  FROM public.email_log_archive;
+
+CREATE OR REPLACE FUNCTION public.archive_email_log(p_before TIMESTAMPTZ, p_batch INT DEFAULT 5000)
+RETURNS INT
+LANGUAGE plpgsql
+AS $$
+DECLARE
+  v_moved INT;
+BEGIN
+  PERFORM public.create_email_log_archive_partition(month)
+  FROM (
+    SELECT DISTINCT date_trunc('month', sent_at)::DATE AS month
+    FROM (
+      SELECT sent_at FROM public.email_log_default
+      WHERE sent_at < p_before
+      ORDER BY sent_at
+      LIMIT p_batch
+    ) candidates
+  ) months;
+
+  WITH batch AS (
+    SELECT id, sent_at FROM public.email_log_default
+    WHERE sent_at < p_before
+    ORDER BY sent_at
+    LIMIT p_batch
+    FOR UPDATE SKIP LOCKED
+  ),
+  moved AS (
+    DELETE FROM public.email_log_default l
+    USING batch
+    WHERE l.id = batch.id AND l.sent_at = batch.sent_at
+    RETURNING l.id, l.owner, l.campaign_id, l.lead_id, l.step_id, l.variant_id,
+              l.status, l.sent_at, l.clicked_url, l.clicked_at, l.email_server_id
+  ),
+  inserted AS (
+    INSERT INTO public.email_log_archive
+      (id, owner, campaign_id, lead_id, step_id, variant_id, status, sent_at, clicked_url, clicked_at, email_server_id)
+    SELECT * FROM moved
+    RETURNING 1
+  )
+  SELECT COUNT(*) INTO v_moved FROM inserted;
+
+  RETURN v_moved;
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION public.archive_email_log_partitions(p_before TIMESTAMPTZ)
+RETURNS SETOF TEXT
+LANGUAGE plpgsql
+AS $$
+DECLARE
+  r       RECORD;
+  v_fk    TEXT;
+  v_end   DATE;
+  v_name  TEXT;
+BEGIN
+  FOR r IN
+    SELECT c.relname AS name, to_date(right(c.relname, 7), 'YYYY"m"MM') AS month
+    FROM pg_inherits i
+    JOIN pg_class c ON c.oid = i.inhrelid
+    WHERE i.inhparent = 'public.email_log'::REGCLASS
+      AND c.relname ~ '^email_log_y[0-9]{4}m[0-9]{2}$'
+    ORDER BY 2
+  LOOP
+    v_end := (r.month + INTERVAL '1 month')::DATE;
+    EXIT WHEN v_end > p_before;
+    v_name := format('email_log_archive_y%sm%s', to_char(r.month, 'YYYY'), to_char(r.month, 'MM'));
+
+    IF to_regclass(format('public.%I', v_name)) IS NULL THEN
+      -- Matches the archive's id index and proves the range, so the
+      -- attach below neither builds an index nor scans the rows
+      EXECUTE format('CREATE INDEX IF NOT EXISTS %I ON public.%I (id)', r.name || '_id_idx', r.name);
+      EXECUTE format(
+        'ALTER TABLE public.%I ADD CONSTRAINT %I CHECK (sent_at >= %L AND sent_at < %L)',
+        r.name, r.name || '_range', r.month, v_end
+      );
+      EXECUTE format('ALTER TABLE public.email_log DETACH PARTITION public.%I', r.name);
+
+      -- Archived sends outlive their campaigns and leads
+      FOR v_fk IN
+        SELECT conname FROM pg_constraint
+        WHERE conrelid = format('public.%I', r.name)::REGCLASS AND contype = 'f'
+      LOOP
+        EXECUTE format('ALTER TABLE public.%I DROP CONSTRAINT %I', r.name, v_fk);
+      END LOOP;
+
+      EXECUTE format('ALTER TABLE public.%I ADD COLUMN archived_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW()', r.name);
+      EXECUTE format('ALTER TABLE public.%I RENAME TO %I', r.name, v_name);
+      EXECUTE format(
+        'ALTER TABLE public.email_log_archive ATTACH PARTITION public.%I FOR VALUES FROM (%L) TO (%L)',
+        v_name, r.month, v_end
+      );
+    ELSE
+      EXECUTE format('ALTER TABLE public.email_log DETACH PARTITION public.%I', r.name);
+      EXECUTE format(
+        'INSERT INTO public.%I (id, owner, campaign_id, lead_id, step_id, variant_id, status, sent_at, clicked_url, clicked_at, email_server_id)
+         SELECT id, owner, campaign_id, lead_id, step_id, variant_id, status, sent_at, clicked_url, clicked_at, email_server_id
+         FROM public.%I',
+        v_name, r.name
+      );
+      EXECUTE format('DROP TABLE public.%I', r.name);
+    END IF;
+
+    RETURN NEXT v_name;
+  END LOOP;
+END;
+$$;
+
+COMMENT ON TABLE public.send_queue IS 'Campaign messages waiting to be sent; claimed in leased batches by the send engine';
+COMMENT ON COLUMN public.send_queue.email_id IS 'email_log id of the current claim, drawn fresh per attempt';
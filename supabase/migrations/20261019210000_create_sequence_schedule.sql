@@ -0,0 +1,180 @@
+-- Durable due-index of sequence steps ("send step k to lead l at t").
+--
+-- One row per lead per campaign step. The scheduler
+-- (flask_app/scheduler.py) loads the ids and due times of the next window
+-- into an in-memory timing wheel and promotes rows into send_queue as
+-- they come due; a periodic sweep promotes anything overdue, which also
+-- covers rows added inside an already loaded window and restarts.
+--
+-- Rows are never deleted on promotion: their state keeps re-enrollment
+-- idempotent and makes cancellation a single indexed update.
+CREATE TABLE IF NOT EXISTS public.sequence_schedule (
+  id              UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+  owner           UUID NOT NULL,
+  campaign_id     UUID NOT NULL REFERENCES public.campaigns(id) ON DELETE CASCADE,
+  lead_id         UUID NOT NULL REFERENCES public.leads(id) ON DELETE CASCADE,
+  step_id         UUID NOT NULL REFERENCES public.campaign_steps(id) ON DELETE CASCADE,
+  variant_id      UUID REFERENCES public.step_variants(id) ON DELETE SET NULL,
+  email_server_id UUID REFERENCES public.email_servers(id) ON DELETE SET NULL,
+  due_at          TIMESTAMP WITH TIME ZONE NOT NULL,
+  state           TEXT NOT NULL DEFAULT 'pending' CHECK (state IN ('pending', 'queued', 'cancelled')),
+  queued_at       TIMESTAMP WITH TIME ZONE,
+  created_at      TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW(),
+  UNIQUE (lead_id, step_id)
+);
+
+-- Window loads and sweeps only touch pending rows
+CREATE INDEX IF NOT EXISTS idx_sequence_schedule_pending_due
+  ON public.sequence_schedule(due_at, id) WHERE state = 'pending';
+CREATE INDEX IF NOT EXISTS idx_sequence_schedule_campaign
+  ON public.sequence_schedule(campaign_id, state);
+
+-- A lead waits for its previous step to leave the queue
+CREATE INDEX IF NOT EXISTS idx_send_queue_lead_campaign ON public.send_queue(lead_id, campaign_id);
+
+ALTER TABLE public.sequence_schedule ENABLE ROW LEVEL SECURITY;
+
+CREATE POLICY "Users can view their own schedule"
+  ON public.sequence_schedule FOR SELECT USING (auth.uid() = owner);
+
+-- Ids and due times of pending steps in [p_from, p_until), in (due_at, id)
+-- keyset pages after (p_after_due, p_after_id)
+CREATE OR REPLACE FUNCTION public.schedule_window(
+  p_from TIMESTAMPTZ,
+  p_until TIMESTAMPTZ,
+  p_after_due TIMESTAMPTZ DEFAULT NULL,
+  p_after_id UUID DEFAULT NULL,
+  p_limit INT DEFAULT 10000
+)
+RETURNS TABLE (id UUID, due_at TIMESTAMPTZ)
+LANGUAGE sql
+STABLE
+AS $$
+  SELECT s.id, s.due_at
+  FROM public.sequence_schedule s
+  WHERE s.state = 'pending'
+    AND s.due_at >= p_from AND s.due_at < p_until
+    AND (s.due_at, s.id) > (COALESCE(p_after_due, '-infinity'::TIMESTAMPTZ),
+                            COALESCE(p_after_id, '00000000-0000-0000-0000-000000000000'::UUID))
+  ORDER BY s.due_at, s.id
+  LIMIT p_limit;
+$$;
+
+-- Move due pending steps into send_queue: the given ids, or (p_ids NULL)
+-- any overdue ones. Cancelled or already queued ids are skipped. A lead
+-- whose previous step is still in send_queue is held back, and at most
+-- one step per lead and campaign moves at a time, so steps go out in
+-- order. Returns the number of steps queued.
+CREATE OR REPLACE FUNCTION public.promote_schedule(p_ids UUID[] DEFAULT NULL, p_limit INT DEFAULT 5000)
+RETURNS INT
+LANGUAGE plpgsql
+AS $$
+DECLARE
+  v_promoted INT;
+BEGIN
+  WITH candidates AS (
+    SELECT s.id, s.lead_id, s.campaign_id, s.due_at
+    FROM public.sequence_schedule s
+    WHERE s.state = 'pending'
+      AND s.due_at <= NOW()
+      AND (p_ids IS NULL OR s.id = ANY(p_ids))
+      AND NOT EXISTS (
+        SELECT 1 FROM public.send_queue q
+        WHERE q.lead_id = s.lead_id AND q.campaign_id = s.campaign_id
+      )
+    ORDER BY s.due_at, s.id
+    LIMIT p_limit
+    FOR UPDATE SKIP LOCKED
+  ),
+  ready AS (
+    SELECT DISTINCT ON (c.lead_id, c.campaign_id) c.id
+    FROM candidates c
+    ORDER BY c.lead_id, c.campaign_id, c.due_at
+  ),
+  moved AS (
+    UPDATE public.sequence_schedule s
+       SET state = 'queued', queued_at = NOW()
+      FROM ready
+     WHERE s.id = ready.id
+    RETURNING s.owner, s.campaign_id, s.lead_id, s.step_id, s.variant_id, s.email_server_id, s.due_at
+  )
+  INSERT INTO public.send_queue (owner, campaign_id, lead_id, step_id, variant_id, email_server_id, scheduled_at, due_at)
+  SELECT m.owner, m.campaign_id, m.lead_id, m.step_id, m.variant_id, m.email_server_id, m.due_at, NOW()
+  FROM moved m
+  ON CONFLICT (lead_id, step_id) DO NOTHING;
+  GET DIAGNOSTICS v_promoted = ROW_COUNT;
+  RETURN v_promoted;
+END;
+$$;
+
+-- Cancel the pending and not yet claimed steps of (lead, campaign) pairs.
+-- Messages already claimed by a send engine still go out.
+CREATE OR REPLACE FUNCTION public.cancel_sequences(p_pairs JSONB)
+RETURNS INT
+LANGUAGE plpgsql
+AS $$
+DECLARE
+  v_cancelled INT;
+BEGIN
+  WITH pairs AS (
+    SELECT DISTINCT p.lead_id, p.campaign_id
+    FROM jsonb_to_recordset(p_pairs) AS p(lead_id UUID, campaign_id UUID)
+    WHERE p.lead_id IS NOT NULL
+  )
+  UPDATE public.sequence_schedule s
+     SET state = 'cancelled'
+    FROM pairs
+   WHERE s.lead_id = pairs.lead_id
+     AND (pairs.campaign_id IS NULL OR s.campaign_id = pairs.campaign_id)
+     AND s.state = 'pending';
+  GET DIAGNOSTICS v_cancelled = ROW_COUNT;
+
+  DELETE FROM public.send_queue q
+  USING jsonb_to_recordset(p_pairs) AS p(lead_id UUID, campaign_id UUID)
+  WHERE q.lead_id = p.lead_id
+    AND (p.campaign_id IS NULL OR q.campaign_id = p.campaign_id)
+    AND q.claimed_by IS NULL;
+
+  RETURN v_cancelled;
+END;
+$$;
+
+-- A reply ends the lead's sequence in that campaign
+CREATE OR REPLACE FUNCTION public.cancel_sequences_on_reply()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+  PERFORM public.cancel_sequences(COALESCE(jsonb_agg(DISTINCT jsonb_build_object(
+    'lead_id', r.lead_id, 'campaign_id', r.campaign_id)), '[]'::JSONB))
+  FROM new_rows r
+  WHERE r.event_type = 'reply' AND r.lead_id IS NOT NULL;
+  RETURN NULL;
+END;
+$$;
+
+CREATE TRIGGER email_events_cancel_sequences
+  AFTER INSERT ON public.email_events
+  REFERENCING NEW TABLE AS new_rows
+  FOR EACH STATEMENT EXECUTE FUNCTION public.cancel_sequences_on_reply();
+
+-- So does a permanent bounce
+CREATE OR REPLACE FUNCTION public.cancel_sequences_on_bounce()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+  PERFORM public.cancel_sequences(COALESCE(jsonb_agg(DISTINCT jsonb_build_object(
+    'lead_id', r.lead_id, 'campaign_id', r.campaign_id)), '[]'::JSONB))
+  FROM new_rows r
+  WHERE r.status = 'bounced' AND r.lead_id IS NOT NULL;
+  RETURN NULL;
+END;
+$$;
+
+CREATE TRIGGER email_log_cancel_sequences
+  AFTER INSERT ON public.email_log
+  REFERENCING NEW TABLE AS new_rows
+  FOR EACH STATEMENT EXECUTE FUNCTION public.cancel_sequences_on_bounce();
+
+COMMENT ON TABLE public.sequence_schedule IS 'Due times of every lead''s sequence steps; promoted into send_queue by the scheduler';
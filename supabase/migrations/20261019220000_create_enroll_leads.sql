@@ -0,0 +1,78 @@
+-- Set-based campaign enrollment: one INSERT ... SELECT expands leads x
+-- campaign steps x variant assignment into sequence_schedule.
+--
+-- Step due times are cumulative: each step's send_after is the delay after
+-- the previous step (the first step's after p_start_at). The variant of a
+-- (lead, step) is picked by a hash of both ids against the variants'
+-- cumulative weight_percent, so it is deterministic and re-enrollment picks
+-- the same one. Existing (lead, step) rows are left alone, whatever their
+-- state, which makes enrollment idempotent.
+CREATE OR REPLACE FUNCTION public.enroll_leads(
+  p_campaign_id UUID,
+  p_owner UUID,
+  p_lead_ids UUID[] DEFAULT NULL,
+  p_start_at TIMESTAMPTZ DEFAULT NULL,
+  p_email_server_id UUID DEFAULT NULL
+)
+RETURNS TABLE (leads INT, steps INT, scheduled INT, skipped INT)
+LANGUAGE plpgsql
+AS $$
+DECLARE
+  v_leads INT;
+  v_steps INT;
+  v_scheduled INT;
+BEGIN
+  IF NOT EXISTS (SELECT 1 FROM public.campaigns c WHERE c.id = p_campaign_id AND c.owner = p_owner) THEN
+    RAISE EXCEPTION 'Campaign not found' USING ERRCODE = 'no_data_found';
+  END IF;
+
+  -- Sends must never go out through another owner's server
+  IF p_email_server_id IS NOT NULL AND NOT EXISTS (
+    SELECT 1 FROM public.email_servers s WHERE s.id = p_email_server_id AND s.owner = p_owner
+  ) THEN
+    RAISE EXCEPTION 'Email server not found' USING ERRCODE = 'no_data_found';
+  END IF;
+
+  SELECT COUNT(*) INTO v_steps FROM public.campaign_steps st WHERE st.campaign_id = p_campaign_id;
+  SELECT COUNT(*) INTO v_leads
+  FROM public.leads l
+  WHERE l.owner = p_owner AND (p_lead_ids IS NULL OR l.id = ANY(p_lead_ids));
+
+  WITH step_times AS (
+    SELECT st.id AS step_id,
+           COALESCE(p_start_at, NOW())
+             + SUM(COALESCE(st.send_after, INTERVAL '0')) OVER (ORDER BY st.step_number, st.id) AS due_at
+    FROM public.campaign_steps st
+    WHERE st.campaign_id = p_campaign_id
+  ),
+  -- Each variant owns [lo, hi) of its step's total weight
+  variant_ranges AS (
+    SELECT v.step_id, v.id AS variant_id,
+           SUM(v.weight_percent) OVER w - v.weight_percent AS lo,
+           SUM(v.weight_percent) OVER w AS hi,
+           SUM(v.weight_percent) OVER (PARTITION BY v.step_id) AS total
+    FROM public.step_variants v
+    JOIN step_times s ON s.step_id = v.step_id
+    WHERE COALESCE(v.weight_percent, 0) > 0
+    WINDOW w AS (PARTITION BY v.step_id ORDER BY v.variant_idx, v.id)
+  ),
+  pairs AS (
+    SELECT l.id AS lead_id, s.step_id, s.due_at,
+           (hashtextextended(l.id::TEXT || s.step_id::TEXT, 0) & 2147483647) AS bucket
+    FROM public.leads l
+    CROSS JOIN step_times s
+    WHERE l.owner = p_owner AND (p_lead_ids IS NULL OR l.id = ANY(p_lead_ids))
+  )
+  INSERT INTO public.sequence_schedule (owner, campaign_id, lead_id, step_id, variant_id, email_server_id, due_at)
+  SELECT p_owner, p_campaign_id, p.lead_id, p.step_id, v.variant_id, p_email_server_id, p.due_at
+  FROM pairs p
+  LEFT JOIN variant_ranges v
+    ON v.step_id = p.step_id AND p.bucket % v.total >= v.lo AND p.bucket % v.total < v.hi
+  ON CONFLICT (lead_id, step_id) DO NOTHING;
+  GET DIAGNOSTICS v_scheduled = ROW_COUNT;
+
+  RETURN QUERY SELECT v_leads, v_steps, v_scheduled, v_leads * v_steps - v_scheduled;
+END;
+$$;
+
+COMMENT ON FUNCTION public.enroll_leads(UUID, UUID, UUID[], TIMESTAMPTZ, UUID) IS 'Schedule every step of a campaign for a set of leads (all of the owner''s leads if p_lead_ids is NULL); idempotent';
@@ -0,0 +1,170 @@
+-- Sender rotation across an owner's email servers.
+--
+-- email_server_usage counts each server's sends per UTC day, for quota
+-- weighting and utilization. sender_assignments remembers which server
+-- last sent to a lead in a campaign, so follow-ups (and the replies to
+-- them) stay in one mailbox thread. Both are maintained from email_log
+-- inserts, one aggregated statement per batch.
+CREATE TABLE IF NOT EXISTS public.email_server_usage (
+  email_server_id UUID NOT NULL REFERENCES public.email_servers(id) ON DELETE CASCADE,
+  day             DATE NOT NULL,
+  sent            INT NOT NULL DEFAULT 0,
+  bounced         INT NOT NULL DEFAULT 0,
+  PRIMARY KEY (email_server_id, day)
+);
+
+CREATE TABLE IF NOT EXISTS public.sender_assignments (
+  campaign_id     UUID NOT NULL REFERENCES public.campaigns(id) ON DELETE CASCADE,
+  lead_id         UUID NOT NULL REFERENCES public.leads(id) ON DELETE CASCADE,
+  email_server_id UUID NOT NULL REFERENCES public.email_servers(id) ON DELETE CASCADE,
+  assigned_at     TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW(),
+  PRIMARY KEY (campaign_id, lead_id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_sender_assignments_server ON public.sender_assignments(email_server_id);
+
+ALTER TABLE public.email_server_usage ENABLE ROW LEVEL SECURITY;
+ALTER TABLE public.sender_assignments ENABLE ROW LEVEL SECURITY;
+
+CREATE POLICY "Users can view usage of their email servers"
+  ON public.email_server_usage FOR SELECT
+  USING (EXISTS (SELECT 1 FROM public.email_servers s WHERE s.id = email_server_id AND s.owner = auth.uid()));
+
+CREATE POLICY "Users can view their sender assignments"
+  ON public.sender_assignments FOR SELECT
+  USING (EXISTS (SELECT 1 FROM public.email_servers s WHERE s.id = email_server_id AND s.owner = auth.uid()));
+
+CREATE OR REPLACE FUNCTION public.track_sender_usage()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+  INSERT INTO public.email_server_usage AS u (email_server_id, day, sent, bounced)
+  SELECT r.email_server_id, (r.sent_at AT TIME ZONE 'UTC')::DATE,
+         COUNT(*) FILTER (WHERE r.status <> 'bounced'),
+         COUNT(*) FILTER (WHERE r.status = 'bounced')
+  FROM new_rows r
+  WHERE r.email_server_id IS NOT NULL
+  GROUP BY 1, 2
+  ON CONFLICT (email_server_id, day) DO UPDATE
+    SET sent = u.sent + EXCLUDED.sent,
+        bounced = u.bounced + EXCLUDED.bounced;
+
+  INSERT INTO public.sender_assignments AS a (campaign_id, lead_id, email_server_id, assigned_at)
+  SELECT DISTINCT ON (r.campaign_id, r.lead_id) r.campaign_id, r.lead_id, r.email_server_id, r.sent_at
+  FROM new_rows r
+  WHERE r.status <> 'bounced'
+    AND r.email_server_id IS NOT NULL AND r.campaign_id IS NOT NULL AND r.lead_id IS NOT NULL
+  ORDER BY r.campaign_id, r.lead_id, r.sent_at DESC
+  ON CONFLICT (campaign_id, lead_id) DO UPDATE
+    SET email_server_id = EXCLUDED.email_server_id,
+        assigned_at = EXCLUDED.assigned_at
+    WHERE a.email_server_id IS DISTINCT FROM EXCLUDED.email_server_id;
+
+  RETURN NULL;
+END;
+$$;
+
+CREATE TRIGGER email_log_track_sender_usage
+  AFTER INSERT ON public.email_log
+  REFERENCING NEW TABLE AS new_rows
+  FOR EACH STATEMENT EXECUTE FUNCTION public.track_sender_usage();
+
+-- An owner's email servers with their daily quota (senders.daily_quota of
+-- the same address; NULL is unlimited) and today's usage
+CREATE OR REPLACE FUNCTION public.sender_pool(p_owner UUID)
+RETURNS TABLE (server JSONB, daily_quota INT, used_today INT)
+LANGUAGE sql
+STABLE
+AS $$
+  SELECT to_jsonb(s), q.daily_quota, COALESCE(u.sent + u.bounced, 0)
+  FROM public.email_servers s
+  LEFT JOIN LATERAL (
+    SELECT MIN(se.daily_quota) AS daily_quota
+    FROM public.senders se
+    WHERE se.owner = s.owner AND lower(se.email) = lower(s.email_address)
+  ) q ON TRUE
+  LEFT JOIN public.email_server_usage u
+    ON u.email_server_id = s.id AND u.day = (NOW() AT TIME ZONE 'UTC')::DATE
+  WHERE s.owner = p_owner;
+$$;
+
+-- Per-server utilization of an owner: today against quota, the last
+-- p_days days, and the number of lead threads pinned to the server
+CREATE OR REPLACE FUNCTION public.email_server_utilization(p_owner UUID, p_days INT DEFAULT 7)
+RETURNS TABLE (
+  id UUID, email_address TEXT, is_default BOOLEAN, daily_quota INT,
+  sent_today INT, bounced_today INT, remaining_today INT,
+  sent_period BIGINT, bounced_period BIGINT, threads BIGINT
+)
+LANGUAGE sql
+STABLE
+AS $$
+  SELECT p.server->>'id', p.server->>'email_address', (p.server->>'is_default')::BOOLEAN, p.daily_quota,
+         COALESCE(t.sent, 0), COALESCE(t.bounced, 0),
+         CASE WHEN p.daily_quota IS NULL THEN NULL ELSE GREATEST(p.daily_quota - p.used_today, 0) END,
+         COALESCE(w.sent, 0), COALESCE(w.bounced, 0),
+         (SELECT COUNT(*) FROM public.sender_assignments a WHERE a.email_server_id = (p.server->>'id')::UUID)
+  FROM public.sender_pool(p_owner) p
+  LEFT JOIN public.email_server_usage t
+    ON t.email_server_id = (p.server->>'id')::UUID AND t.day = (NOW() AT TIME ZONE 'UTC')::DATE
+  LEFT JOIN LATERAL (
+    SELECT SUM(u.sent) AS sent, SUM(u.bounced) AS bounced
+    FROM public.email_server_usage u
+    WHERE u.email_server_id = (p.server->>'id')::UUID
+      AND u.day > (NOW() AT TIME ZONE 'UTC')::DATE - p_days
+  ) w ON TRUE
+  ORDER BY p.server->>'email_address';
+$$;
+
+-- Claims now say which server a message is pinned to: its own
+-- email_server_id ('queue') or the lead's thread ('thread'). Unpinned
+-- messages are spread over the owner's servers by the send engine.
+DROP FUNCTION IF EXISTS public.claim_send_batch(TEXT, INT, INTERVAL);
+
+CREATE FUNCTION public.claim_send_batch(
+  p_worker TEXT,
+  p_limit INT DEFAULT 500,
+  p_lease INTERVAL DEFAULT INTERVAL '5 minutes'
+)
+RETURNS TABLE (
+  id UUID, email_id UUID, owner UUID, campaign_id UUID, lead_id UUID,
+  step_id UUID, variant_id UUID, email_server_id UUID, pinned TEXT,
+  scheduled_at TIMESTAMPTZ, attempts INT, lead JSONB
+)
+LANGUAGE sql
+AS $$
+  WITH due AS (
+    SELECT q.id FROM public.send_queue q
+    WHERE q.due_at <= NOW()
+    ORDER BY q.due_at
+    LIMIT p_limit
+    FOR UPDATE SKIP LOCKED
+  ),
+  claimed AS (
+    UPDATE public.send_queue q
+       SET claimed_by = p_worker,
+           due_at     = NOW() + p_lease,
+           attempts   = q.attempts + 1,
+           email_id   = public.uuid_generate_v7()
+      FROM due
+     WHERE q.id = due.id
+    RETURNING q.*
+  )
+  SELECT c.id, c.email_id, c.owner, c.campaign_id, c.lead_id, c.step_id, c.variant_id,
+         COALESCE(c.email_server_id, a.email_server_id),
+         CASE WHEN c.email_server_id IS NOT NULL THEN 'queue'
+              WHEN a.email_server_id IS NOT NULL THEN 'thread' END,
+         c.scheduled_at, c.attempts,
+         jsonb_build_object(
+           'email', l.email, 'bedrijf', l.bedrijf, 'website', l.website,
+           'linkedin', l.linkedin, 'image_path', l.image_path
+         )
+  FROM claimed c
+  JOIN public.leads l ON l.id = c.lead_id
+  LEFT JOIN public.sender_assignments a
+    ON a.campaign_id = c.campaign_id AND a.lead_id = c.lead_id;
+$$;
+
+COMMENT ON TABLE public.email_server_usage IS 'Sends and bounces per email server per UTC day';
+COMMENT ON TABLE public.sender_assignments IS 'The email server that last sent to a lead in a campaign; follow-ups stay on it';
@@ -0,0 +1,143 @@
+-- Senders: a mailbox identity with a daily send cap and an optional
+-- warm-up ramp, linked to the email server it sends through.
+--
+-- The ramp is computed when the sender is saved (flask_app/quota.py) and
+-- stored as one cap per warm-up day, so the cap of any day is an array
+-- lookup. Send engines lease quota in blocks (lease_quota) and count it
+-- down in memory; sender_quota_usage.leased is the atomic per-sender,
+-- per-day counter the leases come out of.
+CREATE TABLE IF NOT EXISTS public.senders (
+  id           UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+  owner        UUID REFERENCES auth.users(id) ON DELETE CASCADE,
+  email        TEXT,
+  display_name TEXT,
+  daily_quota  INT
+);
+
+ALTER TABLE public.senders
+  ADD COLUMN IF NOT EXISTS email_server_id UUID REFERENCES public.email_servers(id) ON DELETE SET NULL,
+  ADD COLUMN IF NOT EXISTS warmup_start_date DATE,
+  ADD COLUMN IF NOT EXISTS warmup_days INT CHECK (warmup_days BETWEEN 1 AND 365),
+  ADD COLUMN IF NOT EXISTS warmup_start_quota INT CHECK (warmup_start_quota >= 1),
+  ADD COLUMN IF NOT EXISTS warmup_curve TEXT CHECK (warmup_curve IN ('linear', 'exponential')),
+  ADD COLUMN IF NOT EXISTS ramp INT[],
+  ADD COLUMN IF NOT EXISTS created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+  ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW();
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_senders_email_server ON public.senders(email_server_id);
+CREATE INDEX IF NOT EXISTS idx_senders_owner ON public.senders(owner);
+
+ALTER TABLE public.senders ENABLE ROW LEVEL SECURITY;
+
+DROP POLICY IF EXISTS "Users can manage their own senders" ON public.senders;
+CREATE POLICY "Users can manage their own senders"
+  ON public.senders FOR ALL
+  USING (auth.uid() = owner)
+  WITH CHECK (auth.uid() = owner);
+
+DROP TRIGGER IF EXISTS update_senders_updated_at ON public.senders;
+CREATE TRIGGER update_senders_updated_at
+  BEFORE UPDATE ON public.senders
+  FOR EACH ROW
+  EXECUTE FUNCTION update_updated_at_column();
+
+CREATE TABLE IF NOT EXISTS public.sender_quota_usage (
+  sender_id UUID NOT NULL REFERENCES public.senders(id) ON DELETE CASCADE,
+  day       DATE NOT NULL,
+  leased    INT NOT NULL DEFAULT 0,
+  PRIMARY KEY (sender_id, day)
+);
+
+ALTER TABLE public.sender_quota_usage ENABLE ROW LEVEL SECURITY;
+
+CREATE POLICY "Users can view quota usage of their senders"
+  ON public.sender_quota_usage FOR SELECT
+  USING (EXISTS (SELECT 1 FROM public.senders s WHERE s.id = sender_id AND s.owner = auth.uid()));
+
+-- The cap of a sender on a day: the ramp's entry during warm-up (the first
+-- entry before it starts), daily_quota after it; NULL is unlimited
+CREATE OR REPLACE FUNCTION public.sender_daily_cap(p_sender public.senders, p_day DATE)
+RETURNS INT
+LANGUAGE sql
+IMMUTABLE
+AS $$
+  SELECT CASE
+    WHEN p_sender.ramp IS NULL OR p_sender.warmup_start_date IS NULL
+      OR p_day - p_sender.warmup_start_date >= cardinality(p_sender.ramp) THEN p_sender.daily_quota
+    ELSE p_sender.ramp[GREATEST(p_day - p_sender.warmup_start_date, 0) + 1]
+  END;
+$$;
+
+-- Lease up to p_amount sends of a sender's cap for a day. Returns what was
+-- granted (0 when the cap is used up); the row lock makes concurrent
+-- leases from several engines add up exactly.
+CREATE OR REPLACE FUNCTION public.lease_quota(p_sender_id UUID, p_day DATE, p_amount INT)
+RETURNS INT
+LANGUAGE plpgsql
+AS $$
+DECLARE
+  v_cap INT;
+  v_leased INT;
+  v_granted INT;
+BEGIN
+  SELECT public.sender_daily_cap(s, p_day) INTO v_cap FROM public.senders s WHERE s.id = p_sender_id;
+  IF NOT FOUND THEN
+    RETURN 0;
+  END IF;
+
+  INSERT INTO public.sender_quota_usage (sender_id, day) VALUES (p_sender_id, p_day)
+  ON CONFLICT (sender_id, day) DO NOTHING;
+
+  SELECT u.leased INTO v_leased
+  FROM public.sender_quota_usage u
+  WHERE u.sender_id = p_sender_id AND u.day = p_day
+  FOR UPDATE;
+
+  v_granted := CASE WHEN v_cap IS NULL THEN p_amount ELSE LEAST(p_amount, GREATEST(v_cap - v_leased, 0)) END;
+  IF v_granted > 0 THEN
+    UPDATE public.sender_quota_usage u
+       SET leased = u.leased + v_granted
+     WHERE u.sender_id = p_sender_id AND u.day = p_day;
+  END IF;
+  RETURN v_granted;
+END;
+$$;
+
+-- Give back the unused part of leases (engine shutdown)
+CREATE OR REPLACE FUNCTION public.return_quota(p_sender_id UUID, p_day DATE, p_amount INT)
+RETURNS VOID
+LANGUAGE sql
+AS $$
+  UPDATE public.sender_quota_usage u
+     SET leased = GREATEST(u.leased - p_amount, 0)
+   WHERE u.sender_id = p_sender_id AND u.day = p_day;
+$$;
+
+-- The sender pool now takes the sender linked to each server (or, for
+-- senders not linked yet, the one with the same address), today's cap of
+-- that sender, and its id for quota leases
+DROP FUNCTION IF EXISTS public.sender_pool(UUID);
+
+CREATE FUNCTION public.sender_pool(p_owner UUID)
+RETURNS TABLE (server JSONB, sender_id UUID, daily_quota INT, used_today INT)
+LANGUAGE sql
+STABLE
+AS $$
+  SELECT to_jsonb(s), q.id, q.cap, COALESCE(u.sent + u.bounced, 0)
+  FROM public.email_servers s
+  LEFT JOIN LATERAL (
+    SELECT se.id, public.sender_daily_cap(se, (NOW() AT TIME ZONE 'UTC')::DATE) AS cap
+    FROM public.senders se
+    WHERE se.owner = s.owner
+      AND (se.email_server_id = s.id
+           OR (se.email_server_id IS NULL AND lower(se.email) = lower(s.email_address)))
+    ORDER BY se.email_server_id = s.id DESC NULLS LAST
+    LIMIT 1
+  ) q ON TRUE
+  LEFT JOIN public.email_server_usage u
+    ON u.email_server_id = s.id AND u.day = (NOW() AT TIME ZONE 'UTC')::DATE
+  WHERE s.owner = p_owner;
+$$;
+
+COMMENT ON COLUMN public.senders.ramp IS 'Precomputed daily caps of the warm-up, one per day from warmup_start_date';
+COMMENT ON TABLE public.sender_quota_usage IS 'Sends leased per sender per UTC day';
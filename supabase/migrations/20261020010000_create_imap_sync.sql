@@ -0,0 +1,75 @@
+-- Incremental IMAP sync into inbox_emails.
+--
+-- mailbox_sync_state keeps each mailbox's UIDVALIDITY and the highest UID
+-- stored so far; a sync fetches only UIDs above it. store_inbox_batch
+-- inserts a batch and advances the mark in one transaction, so the mark
+-- never gets ahead of what is stored, and a batch fetched twice (after a
+-- crash) is ignored by the unique (email_server_id, uidvalidity, uid).
+ALTER TABLE public.inbox_emails
+  ADD COLUMN IF NOT EXISTS email_server_id UUID REFERENCES public.email_servers(id) ON DELETE SET NULL,
+  ADD COLUMN IF NOT EXISTS uidvalidity BIGINT,
+  ADD COLUMN IF NOT EXISTS uid BIGINT,
+  ADD COLUMN IF NOT EXISTS message_id TEXT,
+  ADD COLUMN IF NOT EXISTS in_reply_to TEXT;
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_inbox_emails_mailbox_uid
+  ON public.inbox_emails(email_server_id, uidvalidity, uid);
+
+CREATE TABLE IF NOT EXISTS public.mailbox_sync_state (
+  email_server_id UUID NOT NULL REFERENCES public.email_servers(id) ON DELETE CASCADE,
+  folder          TEXT NOT NULL DEFAULT 'INBOX',
+  uidvalidity     BIGINT,
+  last_uid        BIGINT NOT NULL DEFAULT 0,
+  last_synced_at  TIMESTAMP WITH TIME ZONE,
+  last_error      TEXT,
+  PRIMARY KEY (email_server_id, folder)
+);
+
+ALTER TABLE public.mailbox_sync_state ENABLE ROW LEVEL SECURITY;
+
+CREATE POLICY "Users can view sync state of their email servers"
+  ON public.mailbox_sync_state FOR SELECT
+  USING (EXISTS (SELECT 1 FROM public.email_servers s WHERE s.id = email_server_id AND s.owner = auth.uid()));
+
+CREATE OR REPLACE FUNCTION public.store_inbox_batch(
+  p_email_server_id UUID,
+  p_folder TEXT,
+  p_uidvalidity BIGINT,
+  p_last_uid BIGINT,
+  p_messages JSONB
+)
+RETURNS INT
+LANGUAGE plpgsql
+AS $$
+DECLARE
+  v_stored INT;
+BEGIN
+  INSERT INTO public.inbox_emails (
+    owner, email_server_id, uidvalidity, uid, recipient_email, sender_email, sender_name,
+    subject, body_preview, full_body, received_at, message_id, in_reply_to
+  )
+  SELECT s.owner, s.id, p_uidvalidity, m.uid, COALESCE(m.recipient_email, s.email_address),
+         COALESCE(m.sender_email, ''), m.sender_name, COALESCE(m.subject, ''), m.body_preview,
+         m.full_body, COALESCE(m.received_at, NOW()), m.message_id, m.in_reply_to
+  FROM jsonb_to_recordset(p_messages) AS m(
+    uid BIGINT, recipient_email TEXT, sender_email TEXT, sender_name TEXT, subject TEXT,
+    body_preview TEXT, full_body TEXT, received_at TIMESTAMPTZ, message_id TEXT, in_reply_to TEXT
+  )
+  JOIN public.email_servers s ON s.id = p_email_server_id
+  ON CONFLICT (email_server_id, uidvalidity, uid) DO NOTHING;
+  GET DIAGNOSTICS v_stored = ROW_COUNT;
+
+  INSERT INTO public.mailbox_sync_state AS st (email_server_id, folder, uidvalidity, last_uid, last_synced_at)
+  VALUES (p_email_server_id, p_folder, p_uidvalidity, p_last_uid, NOW())
+  ON CONFLICT (email_server_id, folder) DO UPDATE
+    SET last_uid = CASE WHEN st.uidvalidity = EXCLUDED.uidvalidity
+                        THEN GREATEST(st.last_uid, EXCLUDED.last_uid) ELSE EXCLUDED.last_uid END,
+        uidvalidity = EXCLUDED.uidvalidity,
+        last_synced_at = EXCLUDED.last_synced_at,
+        last_error = NULL;
+
+  RETURN v_stored;
+END;
+$$;
+
+COMMENT ON TABLE public.mailbox_sync_state IS 'IMAP UIDVALIDITY and UID high-water mark per mailbox folder';
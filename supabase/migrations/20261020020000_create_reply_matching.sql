@@ -0,0 +1,317 @@
+-- Match inbound replies to the sends they answer.
+--
+-- Every send stores its Message-ID (<email_id@domain>, see
+-- rendering.message_id). A reply names it in In-Reply-To or References.
+-- The email_log id is the local part of the Message-ID and a UUIDv7, so a
+-- referenced id is found with the same partition-pruned primary-key lookup
+-- record_email_events uses; no index over every Message-ID is needed.
+-- The stored Message-ID is then compared, so a foreign id with a UUID local
+-- part never matches.
+ALTER TABLE public.email_log
+  ADD COLUMN IF NOT EXISTS message_id TEXT;
+ALTER TABLE public.email_log_archive
+  ADD COLUMN IF NOT EXISTS message_id TEXT;
+
+ALTER TABLE public.inbox_emails
+  ADD COLUMN IF NOT EXISTS message_references TEXT,
+  ADD COLUMN IF NOT EXISTS reply_to_email_id UUID,
+  ADD COLUMN IF NOT EXISTS reply_checked_at TIMESTAMP WITH TIME ZONE;
+
+-- Only replies still waiting for a match are indexed
+CREATE INDEX IF NOT EXISTS idx_inbox_emails_reply_pending
+  ON public.inbox_emails(received_at)
+  WHERE reply_checked_at IS NULL AND (in_reply_to IS NOT NULL OR message_references IS NOT NULL);
+
+-- Same as before, plus the Message-ID of logged sends
+CREATE OR REPLACE FUNCTION public.complete_send_batch(p_results JSONB)
+RETURNS TABLE (logged INT, rescheduled INT, stale INT)
+LANGUAGE plpgsql
+AS $$
+DECLARE
+  v_logged INT;
+  v_rescheduled INT;
+  v_stale INT;
+BEGIN
+  CREATE TEMP TABLE IF NOT EXISTS send_results (
+    id UUID, email_id UUID, outcome TEXT, email_server_id UUID, message_id TEXT,
+    sent_at TIMESTAMPTZ, retry_at TIMESTAMPTZ, error TEXT
+  ) ON COMMIT DROP;
+
+  INSERT INTO send_results
+  SELECT * FROM jsonb_to_recordset(p_results)
+    AS r(id UUID, email_id UUID, outcome TEXT, email_server_id UUID, message_id TEXT,
+         sent_at TIMESTAMPTZ, retry_at TIMESTAMPTZ, error TEXT);
+
+  INSERT INTO public.email_log (id, owner, campaign_id, lead_id, step_id, variant_id, email_server_id,
+                                message_id, status, sent_at)
+  SELECT r.email_id, q.owner, q.campaign_id, q.lead_id, q.step_id, q.variant_id, r.email_server_id,
+         r.message_id,
+         (CASE r.outcome WHEN 'sent' THEN 'sent' ELSE 'bounced' END)::public.email_status,
+         COALESCE(r.sent_at, NOW())
+  FROM send_results r
+  JOIN public.send_queue q ON q.id = r.id AND q.email_id = r.email_id
+  WHERE r.outcome IN ('sent', 'failed');
+  GET DIAGNOSTICS v_logged = ROW_COUNT;
+
+  DELETE FROM public.send_queue q
+  USING send_results r
+  WHERE q.id = r.id AND q.email_id = r.email_id AND r.outcome IN ('sent', 'failed');
+
+  UPDATE public.send_queue q
+     SET due_at       = r.retry_at,
+         scheduled_at = r.retry_at,
+         claimed_by   = NULL,
+         email_id     = NULL,
+         last_error   = COALESCE(r.error, q.last_error),
+         attempts     = q.attempts - (r.outcome = 'deferred')::INT
+    FROM send_results r
+   WHERE q.id = r.id AND q.email_id = r.email_id AND r.outcome IN ('retry', 'deferred');
+  GET DIAGNOSTICS v_rescheduled = ROW_COUNT;
+
+  -- Results of leases that expired and were claimed again (or completed)
+  -- are ignored: the row now belongs to the newer claim
+  v_stale := jsonb_array_length(p_results) - v_logged - v_rescheduled;
+
+  RETURN QUERY SELECT v_logged, v_rescheduled, v_stale;
+END;
+$$;
+
+-- Same as before, plus the References header
+CREATE OR REPLACE FUNCTION public.store_inbox_batch(
+  p_email_server_id UUID,
+  p_folder TEXT,
+  p_uidvalidity BIGINT,
+  p_last_uid BIGINT,
+  p_messages JSONB
+)
+RETURNS INT
+LANGUAGE plpgsql
+AS $$
+DECLARE
+  v_stored INT;
+BEGIN
+  INSERT INTO public.inbox_emails (
+    owner, email_server_id, uidvalidity, uid, recipient_email, sender_email, sender_name,
+    subject, body_preview, full_body, received_at, message_id, in_reply_to, message_references
+  )
+  SELECT s.owner, s.id, p_uidvalidity, m.uid, COALESCE(m.recipient_email, s.email_address),
+         COALESCE(m.sender_email, ''), m.sender_name, COALESCE(m.subject, ''), m.body_preview,
+         m.full_body, COALESCE(m.received_at, NOW()), m.message_id, m.in_reply_to, m."references"
+  FROM jsonb_to_recordset(p_messages) AS m(
+    uid BIGINT, recipient_email TEXT, sender_email TEXT, sender_name TEXT, subject TEXT,
+    body_preview TEXT, full_body TEXT, received_at TIMESTAMPTZ, message_id TEXT, in_reply_to TEXT,
+    "references" TEXT
+  )
+  JOIN public.email_servers s ON s.id = p_email_server_id
+  ON CONFLICT (email_server_id, uidvalidity, uid) DO NOTHING;
+  GET DIAGNOSTICS v_stored = ROW_COUNT;
+
+  INSERT INTO public.mailbox_sync_state AS st (email_server_id, folder, uidvalidity, last_uid, last_synced_at)
+  VALUES (p_email_server_id, p_folder, p_uidvalidity, p_last_uid, NOW())
+  ON CONFLICT (email_server_id, folder) DO UPDATE
+    SET last_uid = CASE WHEN st.uidvalidity = EXCLUDED.uidvalidity
+                        THEN GREATEST(st.last_uid, EXCLUDED.last_uid) ELSE EXCLUDED.last_uid END,
+        uidvalidity = EXCLUDED.uidvalidity,
+        last_synced_at = EXCLUDED.last_synced_at,
+        last_error = NULL;
+
+  RETURN v_stored;
+END;
+$$;
+
+-- Check up to p_limit inbox emails with reply headers against email_log,
+-- and email_log_archive for late replies to older sends. In-Reply-To is
+-- tried first, then References from the newest entry back; the first of
+-- the owner's own sends wins. Every checked row is marked, matched or not,
+-- and all of them are returned (email_id NULL when unmatched) so the
+-- caller can tell a full batch from the last one. archived is TRUE when
+-- the send was found in the archive.
+CREATE OR REPLACE FUNCTION public.match_inbox_replies(p_limit INT DEFAULT 500)
+RETURNS TABLE (
+  inbox_email_id UUID, email_id UUID, owner UUID, sender_email TEXT,
+  subject TEXT, body_preview TEXT, received_at TIMESTAMPTZ, archived BOOLEAN
+)
+LANGUAGE sql
+AS $$
+  WITH pending AS (
+    SELECT i.id, i.owner, i.in_reply_to, i.message_references
+    FROM public.inbox_emails i
+    WHERE i.reply_checked_at IS NULL
+      AND (i.in_reply_to IS NOT NULL OR i.message_references IS NOT NULL)
+    ORDER BY i.received_at
+    LIMIT p_limit
+    FOR UPDATE SKIP LOCKED
+  ),
+  candidates AS (
+    SELECT p.id AS inbox_id, p.owner, c.message_id, c.email_id, c.header, c.ord
+    FROM pending p
+    CROSS JOIN LATERAL (
+      SELECT m.match[1] AS message_id, m.match[2]::UUID AS email_id, 0 AS header, m.n AS ord
+      FROM regexp_matches(COALESCE(p.in_reply_to, ''),
+                          '(<([0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12})@[^<>[:space:]]+>)',
+                          'g') WITH ORDINALITY AS m(match, n)
+      UNION ALL
+      SELECT m.match[1], m.match[2]::UUID, 1, -m.n
+      FROM regexp_matches(COALESCE(p.message_references, ''),
+                          '(<([0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12})@[^<>[:space:]]+>)',
+                          'g') WITH ORDINALITY AS m(match, n)
+    ) c
+  ),
+  found AS (
+    SELECT c.inbox_id, c.header, c.ord, l.id AS email_id, FALSE AS archived
+    FROM candidates c
+    JOIN public.email_log l
+      ON l.id = c.email_id
+     AND l.sent_at >= public.email_log_sent_at_from(c.email_id)
+     AND l.sent_at < public.email_log_sent_at_to(c.email_id)
+     AND l.owner = c.owner
+     -- Sends logged before Message-IDs were stored match on the id alone
+     AND (l.message_id IS NULL OR lower(l.message_id) = lower(c.message_id))
+    UNION ALL
+    -- Late replies to sends past the retention window; same pruned lookup
+    SELECT c.inbox_id, c.header, c.ord, a.id, TRUE
+    FROM candidates c
+    JOIN public.email_log_archive a
+      ON a.id = c.email_id
+     AND a.sent_at >= public.email_log_sent_at_from(c.email_id)
+     AND a.sent_at < public.email_log_sent_at_to(c.email_id)
+     AND a.owner = c.owner
+     AND (a.message_id IS NULL OR lower(a.message_id) = lower(c.message_id))
+  ),
+  matched AS (
+    SELECT DISTINCT ON (f.inbox_id) f.inbox_id, f.email_id, f.archived
+    FROM found f
+    ORDER BY f.inbox_id, f.header, f.ord, f.archived
+  ),
+  checked AS (
+    UPDATE public.inbox_emails i
+       SET reply_checked_at = NOW(),
+           reply_to_email_id = m.email_id
+      FROM pending p
+      LEFT JOIN matched m ON m.inbox_id = p.id
+     WHERE i.id = p.id
+    RETURNING i.id, i.reply_to_email_id, i.owner, i.sender_email, i.subject, i.body_preview, i.received_at
+  )
+  SELECT ch.*, COALESCE(m.archived, FALSE)
+  FROM checked ch
+  LEFT JOIN matched m ON m.inbox_id = ch.id;
+$$;
+
+-- Archived sends keep their Message-ID, so late replies to them can
+-- still be verified
+CREATE OR REPLACE VIEW public.email_log_all
+WITH (security_invoker = true) AS
+  SELECT id, owner, campaign_id, lead_id, step_id, variant_id, status, sent_at, clicked_url, clicked_at, FALSE AS archived, email_server_id, message_id
+  FROM public.email_log
+  UNION ALL
+  SELECT id, owner, campaign_id, lead_id, step_id, variant_id, status, sent_at, clicked_url, clicked_at, TRUE AS archived, email_server_id, message_id
+  FROM public.email_log_archive;
+
+CREATE OR REPLACE FUNCTION public.archive_email_log(p_before TIMESTAMPTZ, p_batch INT DEFAULT 5000)
+RETURNS INT
+LANGUAGE plpgsql
+AS $$
+DECLARE
+  v_moved INT;
+BEGIN
+  PERFORM public.create_email_log_archive_partition(month)
+  FROM (
+    SELECT DISTINCT date_trunc('month', sent_at)::DATE AS month
+    FROM (
+      SELECT sent_at FROM public.email_log_default
+      WHERE sent_at < p_before
+      ORDER BY sent_at
+      LIMIT p_batch
+    ) candidates
+  ) months;
+
+  WITH batch AS (
+    SELECT id, sent_at FROM public.email_log_default
+    WHERE sent_at < p_before
+    ORDER BY sent_at
+    LIMIT p_batch
+    FOR UPDATE SKIP LOCKED
+  ),
+  moved AS (
+    DELETE FROM public.email_log_default l
+    USING batch
+    WHERE l.id = batch.id AND l.sent_at = batch.sent_at
+    RETURNING l.id, l.owner, l.campaign_id, l.lead_id, l.step_id, l.variant_id,
+              l.status, l.sent_at, l.clicked_url, l.clicked_at, l.email_server_id, l.message_id
+  ),
+  inserted AS (
+    INSERT INTO public.email_log_archive
+      (id, owner, campaign_id, lead_id, step_id, variant_id, status, sent_at, clicked_url, clicked_at, email_server_id, message_id)
+    SELECT * FROM moved
+    RETURNING 1
+  )
+  SELECT COUNT(*) INTO v_moved FROM inserted;
+
+  RETURN v_moved;
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION public.archive_email_log_partitions(p_before TIMESTAMPTZ)
+RETURNS SETOF TEXT
+LANGUAGE plpgsql
+AS $$
+DECLARE
+  r       RECORD;
+  v_fk    TEXT;
+  v_end   DATE;
+  v_name  TEXT;
+BEGIN
+  FOR r IN
+    SELECT c.relname AS name, to_date(right(c.relname, 7), 'YYYY"m"MM') AS month
+    FROM pg_inherits i
+    JOIN pg_class c ON c.oid = i.inhrelid
+    WHERE i.inhparent = 'public.email_log'::REGCLASS
+      AND c.relname ~ '^email_log_y[0-9]{4}m[0-9]{2}$'
+    ORDER BY 2
+  LOOP
+    v_end := (r.month + INTERVAL '1 month')::DATE;
+    EXIT WHEN v_end > p_before;
+    v_name := format('email_log_archive_y%sm%s', to_char(r.month, 'YYYY'), to_char(r.month, 'MM'));
+
+    IF to_regclass(format('public.%I', v_name)) IS NULL THEN
+      -- Matches the archive's id index and proves the range, so the
+      -- attach below neither builds an index nor scans the rows
+      EXECUTE format('CREATE INDEX IF NOT EXISTS %I ON public.%I (id)', r.name || '_id_idx', r.name);
+      EXECUTE format(
+        'ALTER TABLE public.%I ADD CONSTRAINT %I CHECK (sent_at >= %L AND sent_at < %L)',
+        r.name, r.name || '_range', r.month, v_end
+      );
+      EXECUTE format('ALTER TABLE public.email_log DETACH PARTITION public.%I', r.name);
+
+      -- Archived sends outlive their campaigns and leads
+      FOR v_fk IN
+        SELECT conname FROM pg_constraint
+        WHERE conrelid = format('public.%I', r.name)::REGCLASS AND contype = 'f'
+      LOOP
+        EXECUTE format('ALTER TABLE public.%I DROP CONSTRAINT %I', r.name, v_fk);
+      END LOOP;
+
+      EXECUTE format('ALTER TABLE public.%I ADD COLUMN archived_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW()', r.name);
+      EXECUTE format('ALTER TABLE public.%I RENAME TO %I', r.name, v_name);
+      EXECUTE format(
+        'ALTER TABLE public.email_log_archive ATTACH PARTITION public.%I FOR VALUES FROM (%L) TO (%L)',
+        v_name, r.month, v_end
+      );
+    ELSE
+      EXECUTE format('ALTER TABLE public.email_log DETACH PARTITION public.%I', r.name);
+      EXECUTE format(
+        'INSERT INTO public.%I (id, owner, campaign_id, lead_id, step_id, variant_id, status, sent_at, clicked_url, clicked_at, email_server_id, message_id)
+         SELECT id, owner, campaign_id, lead_id, step_id, variant_id, status, sent_at, clicked_url, clicked_at, email_server_id, message_id
+         FROM public.%I',
+        v_name, r.name
+      );
+      EXECUTE format('DROP TABLE public.%I', r.name);
+    END IF;
+
+    RETURN NEXT v_name;
+  END LOOP;
+END;
+$$;
+
+COMMENT ON COLUMN public.email_log.message_id IS 'Message-ID header of the send; replies reference it';
+COMMENT ON COLUMN public.inbox_emails.reply_to_email_id IS 'email_log id of the send this email replies to, set by match_inbox_replies';
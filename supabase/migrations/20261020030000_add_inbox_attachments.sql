@@ -0,0 +1,53 @@
+-- Attachment metadata of inbound mail.
+--
+-- The IMAP sync parses messages as they stream in and never keeps
+-- attachments in the database. Each one is listed here as
+-- {filename, content_type, size} and, when INBOX_ATTACHMENT_DIR is set,
+-- the path of the file it was written to.
+ALTER TABLE public.inbox_emails
+  ADD COLUMN IF NOT EXISTS attachments JSONB NOT NULL DEFAULT '[]'::JSONB;
+
+-- Same as before, plus the attachment list
+CREATE OR REPLACE FUNCTION public.store_inbox_batch(
+  p_email_server_id UUID,
+  p_folder TEXT,
+  p_uidvalidity BIGINT,
+  p_last_uid BIGINT,
+  p_messages JSONB
+)
+RETURNS INT
+LANGUAGE plpgsql
+AS $$
+DECLARE
+  v_stored INT;
+BEGIN
+  INSERT INTO public.inbox_emails (
+    owner, email_server_id, uidvalidity, uid, recipient_email, sender_email, sender_name,
+    subject, body_preview, full_body, received_at, message_id, in_reply_to, message_references,
+    attachments
+  )
+  SELECT s.owner, s.id, p_uidvalidity, m.uid, COALESCE(m.recipient_email, s.email_address),
+         COALESCE(m.sender_email, ''), m.sender_name, COALESCE(m.subject, ''), m.body_preview,
+         m.full_body, COALESCE(m.received_at, NOW()), m.message_id, m.in_reply_to, m."references",
+         COALESCE(m.attachments, '[]'::JSONB)
+  FROM jsonb_to_recordset(p_messages) AS m(
+    uid BIGINT, recipient_email TEXT, sender_email TEXT, sender_name TEXT, subject TEXT,
+    body_preview TEXT, full_body TEXT, received_at TIMESTAMPTZ, message_id TEXT, in_reply_to TEXT,
+    "references" TEXT, attachments JSONB
+  )
+  JOIN public.email_servers s ON s.id = p_email_server_id
+  ON CONFLICT (email_server_id, uidvalidity, uid) DO NOTHING;
+  GET DIAGNOSTICS v_stored = ROW_COUNT;
+
+  INSERT INTO public.mailbox_sync_state AS st (email_server_id, folder, uidvalidity, last_uid, last_synced_at)
+  VALUES (p_email_server_id, p_folder, p_uidvalidity, p_last_uid, NOW())
+  ON CONFLICT (email_server_id, folder) DO UPDATE
+    SET last_uid = CASE WHEN st.uidvalidity = EXCLUDED.uidvalidity
+                        THEN GREATEST(st.last_uid, EXCLUDED.last_uid) ELSE EXCLUDED.last_uid END,
+        uidvalidity = EXCLUDED.uidvalidity,
+        last_synced_at = EXCLUDED.last_synced_at,
+        last_error = NULL;
+
+  RETURN v_stored;
+END;
+$$;
@@ -0,0 +1,392 @@
+-- Inbox API: keyset pages, threads and unread counters.
+--
+-- inbox_counters keeps total and unread per owner and mailbox, and
+-- inbox_threads keeps one summary row per conversation. Statement-level
+-- triggers on inbox_emails maintain both, one upsert per owner and
+-- mailbox (or thread) per statement. So the unread badge is a read of a
+-- few rows instead of a COUNT over the inbox. reconcile_inbox_counters()
+-- recomputes the counters and thread summaries to fix any drift.
+--
+-- A conversation is keyed by its root Message-ID: the first entry of
+-- References, else In-Reply-To, else the email's own Message-ID.
+
+ALTER TABLE public.inbox_emails
+  ADD COLUMN IF NOT EXISTS thread_key TEXT GENERATED ALWAYS AS (
+    COALESCE(
+      substring(message_references FROM '<[^<>]+>'),
+      substring(in_reply_to FROM '<[^<>]+>'),
+      message_id,
+      id::TEXT
+    )
+  ) STORED;
+
+-- Keyset order is (received_at, id); unread-only pages have their own index
+DROP INDEX IF EXISTS public.idx_inbox_emails_owner_received;
+CREATE INDEX IF NOT EXISTS idx_inbox_emails_owner_received
+  ON public.inbox_emails(owner, received_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_inbox_emails_owner_unread
+  ON public.inbox_emails(owner, received_at DESC, id DESC) WHERE NOT is_read;
+CREATE INDEX IF NOT EXISTS idx_inbox_emails_thread
+  ON public.inbox_emails(owner, thread_key, received_at);
+
+CREATE TABLE IF NOT EXISTS public.inbox_counters (
+  owner           UUID NOT NULL,
+  email_server_id UUID,
+  total           BIGINT NOT NULL DEFAULT 0,
+  unread          BIGINT NOT NULL DEFAULT 0,
+  updated_at      TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW(),
+  reconciled_at   TIMESTAMP WITH TIME ZONE,
+  -- Emails without a mailbox (email_server_id NULL) share one row
+  UNIQUE NULLS NOT DISTINCT (owner, email_server_id)
+);
+
+CREATE TABLE IF NOT EXISTS public.inbox_threads (
+  owner             UUID NOT NULL,
+  thread_key        TEXT NOT NULL,
+  subject           TEXT,
+  last_email_id     UUID NOT NULL,
+  last_sender_email TEXT,
+  last_sender_name  TEXT,
+  last_preview      TEXT,
+  last_received_at  TIMESTAMP WITH TIME ZONE NOT NULL,
+  messages          INT NOT NULL DEFAULT 0,
+  unread            INT NOT NULL DEFAULT 0,
+  PRIMARY KEY (owner, thread_key)
+);
+
+CREATE INDEX IF NOT EXISTS idx_inbox_threads_recent
+  ON public.inbox_threads(owner, last_received_at DESC, thread_key DESC);
+
+ALTER TABLE public.inbox_counters ENABLE ROW LEVEL SECURITY;
+ALTER TABLE public.inbox_threads ENABLE ROW LEVEL SECURITY;
+
+CREATE POLICY "Users can view their own inbox counters"
+  ON public.inbox_counters FOR SELECT USING (auth.uid() = owner);
+
+CREATE POLICY "Users can view their own inbox threads"
+  ON public.inbox_threads FOR SELECT USING (auth.uid() = owner);
+
+-- Thread summaries computed from inbox_emails (all of an owner's threads when p_keys is NULL)
+CREATE OR REPLACE FUNCTION public.inbox_thread_rows(p_owner UUID, p_keys TEXT[] DEFAULT NULL)
+RETURNS SETOF public.inbox_threads
+LANGUAGE sql
+STABLE
+AS $$
+  SELECT p_owner, e.thread_key,
+         (array_agg(e.subject ORDER BY e.received_at, e.id))[1],
+         (array_agg(e.id ORDER BY e.received_at DESC, e.id DESC))[1],
+         (array_agg(e.sender_email ORDER BY e.received_at DESC, e.id DESC))[1],
+         (array_agg(e.sender_name ORDER BY e.received_at DESC, e.id DESC))[1],
+         (array_agg(e.body_preview ORDER BY e.received_at DESC, e.id DESC))[1],
+         MAX(e.received_at),
+         COUNT(*)::INT,
+         (COUNT(*) FILTER (WHERE NOT e.is_read))::INT
+  FROM public.inbox_emails e
+  WHERE e.owner = p_owner
+    AND (p_keys IS NULL OR e.thread_key = ANY(p_keys))
+  GROUP BY e.thread_key;
+$$;
+
+-- The trigger functions run as their owner: the app marks emails read with
+-- the user's token, and users cannot write the counter tables themselves.
+CREATE OR REPLACE FUNCTION public.inbox_emails_inserted()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+BEGIN
+  INSERT INTO public.inbox_counters AS c (owner, email_server_id, total, unread)
+  SELECT owner, email_server_id, COUNT(*), COUNT(*) FILTER (WHERE NOT is_read)
+  FROM new_rows
+  GROUP BY owner, email_server_id
+  ORDER BY owner, email_server_id
+  ON CONFLICT (owner, email_server_id) DO UPDATE
+    SET total = c.total + EXCLUDED.total,
+        unread = c.unread + EXCLUDED.unread,
+        updated_at = NOW();
+
+  WITH latest AS (
+    SELECT DISTINCT ON (owner, thread_key) *
+    FROM new_rows
+    ORDER BY owner, thread_key, received_at DESC, id DESC
+  ),
+  counts AS (
+    SELECT owner, thread_key, COUNT(*)::INT AS messages, (COUNT(*) FILTER (WHERE NOT is_read))::INT AS unread,
+           (array_agg(subject ORDER BY received_at, id))[1] AS subject
+    FROM new_rows
+    GROUP BY owner, thread_key
+  )
+  INSERT INTO public.inbox_threads AS t (
+    owner, thread_key, subject, last_email_id, last_sender_email, last_sender_name,
+    last_preview, last_received_at, messages, unread
+  )
+  SELECT l.owner, l.thread_key, c.subject, l.id, l.sender_email, l.sender_name,
+         l.body_preview, l.received_at, c.messages, c.unread
+  FROM latest l
+  JOIN counts c ON c.owner = l.owner AND c.thread_key = l.thread_key
+  ORDER BY l.owner, l.thread_key
+  ON CONFLICT (owner, thread_key) DO UPDATE
+    SET messages = t.messages + EXCLUDED.messages,
+        unread = t.unread + EXCLUDED.unread,
+        last_email_id     = CASE WHEN EXCLUDED.last_received_at >= t.last_received_at THEN EXCLUDED.last_email_id ELSE t.last_email_id END,
+        last_sender_email = CASE WHEN EXCLUDED.last_received_at >= t.last_received_at THEN EXCLUDED.last_sender_email ELSE t.last_sender_email END,
+        last_sender_name  = CASE WHEN EXCLUDED.last_received_at >= t.last_received_at THEN EXCLUDED.last_sender_name ELSE t.last_sender_name END,
+        last_preview      = CASE WHEN EXCLUDED.last_received_at >= t.last_received_at THEN EXCLUDED.last_preview ELSE t.last_preview END,
+        last_received_at  = GREATEST(t.last_received_at, EXCLUDED.last_received_at);
+  RETURN NULL;
+END;
+$$;
+
+-- Only read-state and mailbox changes move counts (the reply matcher and
+-- other updates leave them alone)
+CREATE OR REPLACE FUNCTION public.inbox_emails_updated()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+BEGIN
+  WITH changed AS (
+    SELECT o.owner, o.thread_key, o.email_server_id AS old_server, n.email_server_id AS new_server,
+           (NOT o.is_read)::INT AS old_unread, (NOT n.is_read)::INT AS new_unread
+    FROM old_rows o
+    JOIN new_rows n ON n.id = o.id
+    WHERE o.is_read IS DISTINCT FROM n.is_read
+       OR o.email_server_id IS DISTINCT FROM n.email_server_id
+  ),
+  deltas AS (
+    SELECT owner, old_server AS email_server_id, -1 AS total, -old_unread AS unread FROM changed
+    UNION ALL
+    SELECT owner, new_server, 1, new_unread FROM changed
+  ),
+  counters AS (
+    INSERT INTO public.inbox_counters AS c (owner, email_server_id, total, unread)
+    SELECT owner, email_server_id, SUM(total), SUM(unread)
+    FROM deltas
+    GROUP BY owner, email_server_id
+    HAVING SUM(total) <> 0 OR SUM(unread) <> 0
+    ORDER BY owner, email_server_id
+    ON CONFLICT (owner, email_server_id) DO UPDATE
+      SET total = c.total + EXCLUDED.total,
+          unread = c.unread + EXCLUDED.unread,
+          updated_at = NOW()
+    RETURNING 1
+  )
+  UPDATE public.inbox_threads t
+     SET unread = t.unread + d.unread
+    FROM (
+      SELECT owner, thread_key, SUM(new_unread - old_unread)::INT AS unread
+      FROM changed
+      GROUP BY owner, thread_key
+      HAVING SUM(new_unread - old_unread) <> 0
+    ) d
+   WHERE t.owner = d.owner AND t.thread_key = d.thread_key;
+  RETURN NULL;
+END;
+$$;
+
+-- Deletes are rare; the threads that lost emails are rebuilt from what is left
+CREATE OR REPLACE FUNCTION public.inbox_emails_deleted()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+BEGIN
+  INSERT INTO public.inbox_counters AS c (owner, email_server_id, total, unread)
+  SELECT owner, email_server_id, -COUNT(*), -COUNT(*) FILTER (WHERE NOT is_read)
+  FROM old_rows
+  GROUP BY owner, email_server_id
+  ORDER BY owner, email_server_id
+  ON CONFLICT (owner, email_server_id) DO UPDATE
+    SET total = c.total + EXCLUDED.total,
+        unread = c.unread + EXCLUDED.unread,
+        updated_at = NOW();
+
+  DELETE FROM public.inbox_threads t
+  USING (SELECT DISTINCT owner, thread_key FROM old_rows) d
+  WHERE t.owner = d.owner AND t.thread_key = d.thread_key;
+
+  INSERT INTO public.inbox_threads
+  SELECT r.*
+  FROM (SELECT owner, array_agg(DISTINCT thread_key) AS keys FROM old_rows GROUP BY owner) d
+  CROSS JOIN LATERAL public.inbox_thread_rows(d.owner, d.keys) r;
+  RETURN NULL;
+END;
+$$;
+
+-- Recompute counters and thread summaries from inbox_emails. Returns the
+-- number of counter and thread rows that had drifted.
+CREATE OR REPLACE FUNCTION public.reconcile_inbox_counters(p_owner UUID DEFAULT NULL)
+RETURNS INT
+LANGUAGE plpgsql
+AS $$
+DECLARE
+  v_fixed INT;
+BEGIN
+  WITH actual AS (
+    SELECT owner, email_server_id, COUNT(*) AS total, COUNT(*) FILTER (WHERE NOT is_read) AS unread
+    FROM public.inbox_emails
+    WHERE p_owner IS NULL OR owner = p_owner
+    GROUP BY owner, email_server_id
+  ),
+  cleared AS (
+    DELETE FROM public.inbox_counters c
+    WHERE (p_owner IS NULL OR c.owner = p_owner)
+      AND NOT EXISTS (
+        SELECT 1 FROM actual a
+        WHERE a.owner = c.owner AND a.email_server_id IS NOT DISTINCT FROM c.email_server_id
+      )
+    RETURNING 1
+  ),
+  fixed AS (
+    INSERT INTO public.inbox_counters AS c (owner, email_server_id, total, unread, reconciled_at)
+    SELECT owner, email_server_id, total, unread, NOW()
+    FROM actual
+    ON CONFLICT (owner, email_server_id) DO UPDATE
+      SET total = EXCLUDED.total,
+          unread = EXCLUDED.unread,
+          reconciled_at = NOW(),
+          updated_at = NOW()
+    WHERE (c.total, c.unread) IS DISTINCT FROM (EXCLUDED.total, EXCLUDED.unread)
+    RETURNING 1
+  )
+  SELECT (SELECT COUNT(*) FROM fixed) + (SELECT COUNT(*) FROM cleared) INTO v_fixed;
+
+  WITH actual AS (
+    SELECT r.*
+    FROM (SELECT DISTINCT owner FROM public.inbox_emails WHERE p_owner IS NULL OR owner = p_owner) o
+    CROSS JOIN LATERAL public.inbox_thread_rows(o.owner) r
+  ),
+  cleared AS (
+    DELETE FROM public.inbox_threads t
+    WHERE (p_owner IS NULL OR t.owner = p_owner)
+      AND NOT EXISTS (
+        SELECT 1 FROM actual a
+        WHERE a.owner = t.owner AND a.thread_key = t.thread_key
+      )
+    RETURNING 1
+  ),
+  fixed AS (
+    INSERT INTO public.inbox_threads AS t
+    SELECT * FROM actual
+    ON CONFLICT (owner, thread_key) DO UPDATE
+      SET subject           = EXCLUDED.subject,
+          last_email_id     = EXCLUDED.last_email_id,
+          last_sender_email = EXCLUDED.last_sender_email,
+          last_sender_name  = EXCLUDED.last_sender_name,
+          last_preview      = EXCLUDED.last_preview,
+          last_received_at  = EXCLUDED.last_received_at,
+          messages          = EXCLUDED.messages,
+          unread            = EXCLUDED.unread
+    WHERE (t.subject, t.last_email_id, t.last_sender_email, t.last_sender_name, t.last_preview,
+           t.last_received_at, t.messages, t.unread)
+          IS DISTINCT FROM
+          (EXCLUDED.subject, EXCLUDED.last_email_id, EXCLUDED.last_sender_email, EXCLUDED.last_sender_name,
+           EXCLUDED.last_preview, EXCLUDED.last_received_at, EXCLUDED.messages, EXCLUDED.unread)
+    RETURNING 1
+  )
+  SELECT v_fixed + (SELECT COUNT(*) FROM fixed) + (SELECT COUNT(*) FROM cleared) INTO v_fixed;
+
+  RETURN v_fixed;
+END;
+$$;
+
+-- One page of emails, newest first, after a (received_at, id) position
+CREATE OR REPLACE FUNCTION public.inbox_page(
+  p_owner UUID,
+  p_before_ts TIMESTAMPTZ DEFAULT NULL,
+  p_before_id UUID DEFAULT NULL,
+  p_limit INT DEFAULT 50,
+  p_unread_only BOOLEAN DEFAULT FALSE,
+  p_email_server_id UUID DEFAULT NULL
+)
+RETURNS TABLE (
+  id UUID, email_server_id UUID, thread_key TEXT, sender_email TEXT, sender_name TEXT,
+  recipient_email TEXT, subject TEXT, body_preview TEXT, received_at TIMESTAMPTZ,
+  is_read BOOLEAN, reply_to_email_id UUID
+)
+LANGUAGE sql
+STABLE
+AS $$
+  SELECT e.id, e.email_server_id, e.thread_key, e.sender_email, e.sender_name,
+         e.recipient_email, e.subject, e.body_preview, e.received_at, e.is_read, e.reply_to_email_id
+  FROM public.inbox_emails e
+  WHERE e.owner = p_owner
+    AND (p_before_ts IS NULL OR (e.received_at, e.id) < (p_before_ts, p_before_id))
+    AND (NOT p_unread_only OR NOT e.is_read)
+    AND (p_email_server_id IS NULL OR e.email_server_id = p_email_server_id)
+  ORDER BY e.received_at DESC, e.id DESC
+  LIMIT p_limit;
+$$;
+
+-- One page of threads, most recently active first, after a (last_received_at, thread_key) position
+CREATE OR REPLACE FUNCTION public.inbox_threads_page(
+  p_owner UUID,
+  p_before_ts TIMESTAMPTZ DEFAULT NULL,
+  p_before_key TEXT DEFAULT NULL,
+  p_limit INT DEFAULT 50,
+  p_unread_only BOOLEAN DEFAULT FALSE
+)
+RETURNS SETOF public.inbox_threads
+LANGUAGE sql
+STABLE
+AS $$
+  SELECT t.*
+  FROM public.inbox_threads t
+  WHERE t.owner = p_owner
+    AND (p_before_ts IS NULL OR (t.last_received_at, t.thread_key) < (p_before_ts, p_before_key))
+    AND (NOT p_unread_only OR t.unread > 0)
+  ORDER BY t.last_received_at DESC, t.thread_key DESC
+  LIMIT p_limit;
+$$;
+
+-- Set the read state of the selected emails in one statement. Emails
+-- already in that state are not touched, so the counters move once per
+-- changed email. Returns the number changed.
+CREATE OR REPLACE FUNCTION public.mark_inbox_read(
+  p_owner UUID,
+  p_is_read BOOLEAN DEFAULT TRUE,
+  p_ids UUID[] DEFAULT NULL,
+  p_email_server_id UUID DEFAULT NULL,
+  p_thread_key TEXT DEFAULT NULL,
+  p_before TIMESTAMPTZ DEFAULT NULL
+)
+RETURNS INT
+LANGUAGE sql
+AS $$
+  WITH changed AS (
+    UPDATE public.inbox_emails e
+       SET is_read = p_is_read
+     WHERE e.owner = p_owner
+       AND e.is_read <> p_is_read
+       AND (p_ids IS NULL OR e.id = ANY(p_ids))
+       AND (p_email_server_id IS NULL OR e.email_server_id = p_email_server_id)
+       AND (p_thread_key IS NULL OR e.thread_key = p_thread_key)
+       AND (p_before IS NULL OR e.received_at <= p_before)
+    RETURNING 1
+  )
+  SELECT COUNT(*)::INT FROM changed;
+$$;
+
+-- Initial fill of counters and threads, before the triggers exist
+SELECT public.reconcile_inbox_counters();
+
+CREATE TRIGGER inbox_emails_inserted
+  AFTER INSERT ON public.inbox_emails
+  REFERENCING NEW TABLE AS new_rows
+  FOR EACH STATEMENT EXECUTE FUNCTION public.inbox_emails_inserted();
+
+CREATE TRIGGER inbox_emails_updated
+  AFTER UPDATE ON public.inbox_emails
+  REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+  FOR EACH STATEMENT EXECUTE FUNCTION public.inbox_emails_updated();
+
+CREATE TRIGGER inbox_emails_deleted
+  AFTER DELETE ON public.inbox_emails
+  REFERENCING OLD TABLE AS old_rows
+  FOR EACH STATEMENT EXECUTE FUNCTION public.inbox_emails_deleted();
+
+COMMENT ON TABLE public.inbox_counters IS 'Incrementally maintained total and unread inbox counts per owner and mailbox';
+COMMENT ON TABLE public.inbox_threads IS 'Incrementally maintained conversation summaries of inbox_emails';
@@ -0,0 +1,102 @@
+-- Keep inbox_emails free of duplicates when a mailbox's UIDVALIDITY changes.
+--
+-- After a UIDVALIDITY change the sync reads the lookback window again
+-- under the new UIDVALIDITY. The unique (email_server_id, uidvalidity, uid)
+-- does not see the rows stored under the old one, so every message was
+-- stored twice. store_inbox_batch now re-keys an email already stored
+-- under another UIDVALIDITY to its new UID instead of inserting it again.
+-- Emails are matched by Message-ID, or, when there is none, by received
+-- time, sender and subject. Read state, reply matching and thread
+-- summaries stay with the existing row.
+
+CREATE INDEX IF NOT EXISTS idx_inbox_emails_mailbox_message
+  ON public.inbox_emails(email_server_id, message_id);
+
+-- Drop the copies earlier re-reads stored, keeping the newest UIDVALIDITY
+DELETE FROM public.inbox_emails e
+USING public.inbox_emails newer
+WHERE newer.email_server_id = e.email_server_id
+  AND newer.message_id = e.message_id
+  AND newer.uidvalidity > e.uidvalidity;
+
+CREATE OR REPLACE FUNCTION public.store_inbox_batch(
+  p_email_server_id UUID,
+  p_folder TEXT,
+  p_uidvalidity BIGINT,
+  p_last_uid BIGINT,
+  p_messages JSONB
+)
+RETURNS INT
+LANGUAGE plpgsql
+AS $$
+DECLARE
+  v_stored INT;
+BEGIN
+  -- Re-key emails this mailbox stored under an earlier UIDVALIDITY; one
+  -- existing row per incoming UID and one incoming UID per existing row
+  WITH incoming AS (
+    SELECT *
+    FROM jsonb_to_recordset(p_messages) AS m(
+      uid BIGINT, sender_email TEXT, subject TEXT, received_at TIMESTAMPTZ, message_id TEXT
+    )
+  ),
+  candidates AS (
+    SELECT DISTINCT ON (i.uid) i.uid, e.id
+    FROM incoming i
+    JOIN public.inbox_emails e
+      ON e.email_server_id = p_email_server_id
+     AND e.uidvalidity IS DISTINCT FROM p_uidvalidity
+     AND CASE WHEN i.message_id IS NOT NULL THEN e.message_id = i.message_id
+              ELSE e.message_id IS NULL
+               AND e.received_at = i.received_at
+               AND e.sender_email = COALESCE(i.sender_email, '')
+               AND e.subject = COALESCE(i.subject, '')
+         END
+    -- A batch fetched twice may have stored the new key already
+    WHERE NOT EXISTS (
+      SELECT 1 FROM public.inbox_emails x
+      WHERE x.email_server_id = p_email_server_id AND x.uidvalidity = p_uidvalidity AND x.uid = i.uid
+    )
+    ORDER BY i.uid, e.received_at, e.id
+  ),
+  matches AS (
+    SELECT DISTINCT ON (id) id, uid
+    FROM candidates
+    ORDER BY id, uid
+  )
+  UPDATE public.inbox_emails e
+     SET uidvalidity = p_uidvalidity,
+         uid = matches.uid
+    FROM matches
+   WHERE e.id = matches.id;
+
+  INSERT INTO public.inbox_emails (
+    owner, email_server_id, uidvalidity, uid, recipient_email, sender_email, sender_name,
+    subject, body_preview, full_body, received_at, message_id, in_reply_to, message_references,
+    attachments
+  )
+  SELECT s.owner, s.id, p_uidvalidity, m.uid, COALESCE(m.recipient_email, s.email_address),
+         COALESCE(m.sender_email, ''), m.sender_name, COALESCE(m.subject, ''), m.body_preview,
+         m.full_body, COALESCE(m.received_at, NOW()), m.message_id, m.in_reply_to, m."references",
+         COALESCE(m.attachments, '[]'::JSONB)
+  FROM jsonb_to_recordset(p_messages) AS m(
+    uid BIGINT, recipient_email TEXT, sender_email TEXT, sender_name TEXT, subject TEXT,
+    body_preview TEXT, full_body TEXT, received_at TIMESTAMPTZ, message_id TEXT, in_reply_to TEXT,
+    "references" TEXT, attachments JSONB
+  )
+  JOIN public.email_servers s ON s.id = p_email_server_id
+  ON CONFLICT (email_server_id, uidvalidity, uid) DO NOTHING;
+  GET DIAGNOSTICS v_stored = ROW_COUNT;
+
+  INSERT INTO public.mailbox_sync_state AS st (email_server_id, folder, uidvalidity, last_uid, last_synced_at)
+  VALUES (p_email_server_id, p_folder, p_uidvalidity, p_last_uid, NOW())
+  ON CONFLICT (email_server_id, folder) DO UPDATE
+    SET last_uid = CASE WHEN st.uidvalidity = EXCLUDED.uidvalidity
+                        THEN GREATEST(st.last_uid, EXCLUDED.last_uid) ELSE EXCLUDED.last_uid END,
+        uidvalidity = EXCLUDED.uidvalidity,
+        last_synced_at = EXCLUDED.last_synced_at,
+        last_error = NULL;
+
+  RETURN v_stored;
+END;
+$$;
@@ -0,0 +1,10 @@
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def clear_response_cache():
+    """Cached responses must not leak between tests"""
+    from flask_app.cache import response_cache
+    response_cache.clear()
+    yield
+    response_cache.clear()
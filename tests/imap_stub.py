@@ -0,0 +1,174 @@
+"""Minimal threaded IMAP server for tests: one INBOX per login, UID SEARCH/FETCH (with partials) and IDLE"""
+import re
+import socketserver
+import threading
+from datetime import datetime, timezone
+
+
+def _uid_set(text, uids):
+    """UIDs of a sequence set like 1,4:6,9:* among uids"""
+    top = max(uids, default=0)
+    chosen = set()
+    for part in text.split(","):
+        low, _, high = part.partition(":")
+        low = top if low == "*" else int(low)
+        high = low if not high else top if high == "*" else int(high)
+        low, high = min(low, high), max(low, high)
+        chosen.update(uid for uid in uids if low <= uid <= high)
+    return sorted(chosen)
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def send(self, data):
+        with self.write_lock:
+            self.wfile.write(data if isinstance(data, bytes) else f"{data}\r\n".encode())
+
+    def handle(self):
+        stub = self.server
+        self.write_lock = threading.Lock()
+        self.user = None
+        with stub.lock:
+            stub.connections += 1
+        self.send("* OK IMAP stub ready")
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            tag, _, rest = line.decode().rstrip("\r\n").partition(" ")
+            command, _, args = rest.partition(" ")
+            command = command.upper()
+            if command == "UID":
+                command, _, args = args.partition(" ")
+                command = "UID " + command.upper()
+            with stub.lock:
+                stub.commands.append(command)
+
+            if command == "CAPABILITY":
+                self.send("* CAPABILITY IMAP4rev1" + (" IDLE" if stub.idle else ""))
+                self.send(f"{tag} OK CAPABILITY completed")
+            elif command == "LOGIN":
+                user, password = [value.strip('"') for value in args.split(" ", 1)]
+                if password != stub.password:
+                    self.send(f"{tag} NO [AUTHENTICATIONFAILED] bad credentials")
+                    continue
+                self.user = user
+                self.send(f"{tag} OK LOGIN completed")
+            elif command in ("SELECT", "EXAMINE"):
+                with stub.lock:
+                    count = len(stub.mailbox(self.user))
+                    uidvalidity = stub.uidvalidity
+                self.send(f"* {count} EXISTS")
+                self.send(f"* OK [UIDVALIDITY {uidvalidity}] UIDs valid")
+                self.send(f"{tag} OK [READ-ONLY] {command} completed")
+            elif command == "UID SEARCH":
+                self._search(tag, args)
+            elif command == "UID FETCH":
+                self._fetch(tag, args)
+            elif command == "IDLE":
+                self._idle(tag)
+            elif command == "NOOP":
+                self.send(f"{tag} OK NOOP completed")
+            elif command == "LOGOUT":
+                self.send("* BYE")
+                self.send(f"{tag} OK LOGOUT completed")
+                return
+            else:
+                self.send(f"{tag} BAD unknown command")
+
+    def _search(self, tag, args):
+        stub = self.server
+        with stub.lock:
+            messages = stub.mailbox(self.user)
+        words = args.split()
+        if words[0].upper() == "UID":
+            uids = _uid_set(words[1], [uid for uid, _, _ in messages])
+        elif words[0].upper() == "SINCE":
+            since = datetime.strptime(words[1], "%d-%b-%Y").replace(tzinfo=timezone.utc)
+            uids = [uid for uid, received, _ in messages if received >= since]
+        else:
+            uids = [uid for uid, _, _ in messages]
+        self.send("* SEARCH" + "".join(f" {uid}" for uid in uids))
+        self.send(f"{tag} OK SEARCH completed")
+
+    def _fetch(self, tag, args):
+        stub = self.server
+        uid_text, _, items = args.partition(" ")
+        partial = re.search(r"BODY\.PEEK\[\]<(\d+)\.(\d+)>", items)
+        with stub.lock:
+            messages = stub.mailbox(self.user)
+            stub.fetches.append(uid_text)
+        wanted = set(_uid_set(uid_text, [uid for uid, _, _ in messages]))
+        for seq, (uid, received, raw) in enumerate(messages, start=1):
+            if uid not in wanted:
+                continue
+            offset = int(partial.group(1)) if partial else 0
+            body = raw[offset:offset + int(partial.group(2))] if partial else raw
+            date = received.strftime("%d-%b-%Y %H:%M:%S +0000")
+            self.send(f'* {seq} FETCH (UID {uid} RFC822.SIZE {len(raw)} INTERNALDATE "{date}" '
+                      f'BODY[]<{offset}> {{{len(body)}}}\r\n'.encode() + body + b")\r\n")
+        self.send(f"{tag} OK FETCH completed")
+
+    def _idle(self, tag):
+        stub = self.server
+        self.send("+ idling")
+        with stub.lock:
+            stub.idlers.append(self)
+        try:
+            while True:
+                line = self.rfile.readline()
+                if not line or line.strip().upper() == b"DONE":
+                    break
+        finally:
+            with stub.lock:
+                stub.idlers.remove(self)
+        self.send(f"{tag} OK IDLE terminated")
+
+
+class IMAPStub(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, password="secret", uidvalidity=1000, idle=True):
+        super().__init__(("127.0.0.1", 0), _Handler)
+        self.password = password
+        self.uidvalidity = uidvalidity
+        self.idle = idle
+        self.lock = threading.Lock()
+        self.mailboxes = {}
+        self.next_uid = {}
+        self.connections = 0
+        self.commands = []
+        self.fetches = []
+        self.idlers = []
+        threading.Thread(target=self.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True).start()
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def mailbox(self, user):
+        return list(self.mailboxes.get(user, []))
+
+    def append(self, user, raw, received=None):
+        """Deliver a message to user's INBOX and tell IDLE sessions; returns its UID"""
+        with self.lock:
+            uid = self.next_uid.get(user, 0) + 1
+            self.next_uid[user] = uid
+            self.mailboxes.setdefault(user, []).append((uid, received or datetime.now(timezone.utc), raw))
+            count = len(self.mailboxes[user])
+            idlers = [handler for handler in self.idlers if handler.user == user]
+        for handler in idlers:
+            handler.send(f"* {count} EXISTS")
+        return uid
+
+    def reset(self, uidvalidity):
+        """Renumber every mailbox under a new UIDVALIDITY, as after a server rebuild"""
+        with self.lock:
+            self.uidvalidity = uidvalidity
+            for user, messages in self.mailboxes.items():
+                self.mailboxes[user] = [(uid + 100, received, raw) for uid, received, raw in messages]
+                self.next_uid[user] = max((uid for uid, _, _ in self.mailboxes[user]), default=0)
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
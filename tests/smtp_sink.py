@@ -0,0 +1,68 @@
+"""Minimal threaded SMTP sink for tests: accepts everything, records commands"""
+import base64
+import socketserver
+import threading
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def reply(self, line):
+        self.wfile.write(f"{line}\r\n".encode())
+
+    def handle(self):
+        sink = self.server.sink
+        with sink.lock:
+            sink.connections += 1
+        self.reply("220 sink ready")
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode().strip()
+            verb = command.split(" ", 1)[0].upper()
+            with sink.lock:
+                sink.commands.append(verb)
+            if verb == "EHLO":
+                self.wfile.write(b"250-sink\r\n250-AUTH PLAIN\r\n250 8BITMIME\r\n")
+            elif verb == "AUTH":
+                credentials = base64.b64decode(command.split(" ")[2]).split(b"\0")
+                ok = credentials[2].decode() == sink.password
+                self.reply("235 ok" if ok else "535 bad credentials")
+            elif verb == "DATA":
+                self.reply("354 go ahead")
+                body = []
+                while (data := self.rfile.readline()) not in (b".\r\n", b""):
+                    body.append(data)
+                with sink.lock:
+                    sink.messages.append(b"".join(body))
+                self.reply("250 queued")
+            elif verb == "QUIT":
+                self.reply("221 bye")
+                return
+            elif verb == "RCPT" and sink.refuse and sink.refuse in command:
+                self.reply("550 no such user")
+            else:
+                self.reply("250 ok")
+
+
+class SMTPSink(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, password="secret", refuse=None):
+        super().__init__(("127.0.0.1", 0), _Handler)
+        self.sink = self
+        self.password = password
+        self.refuse = refuse
+        self.lock = threading.Lock()
+        self.connections = 0
+        self.commands = []
+        self.messages = []
+        threading.Thread(target=self.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True).start()
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
@@ -0,0 +1,140 @@
+import json
+import threading
+
+import pytest
+from unittest.mock import patch
+from flask import Flask
+
+from flask_app.admission import AdmissionController, SpillStore, ACCEPT, SPILL, SHED
+
+
+def make_controller(samples, **kwargs):
+    """Controller that reads from a list of samples and resamples every call"""
+    it = iter(samples)
+    return AdmissionController(
+        sampler=lambda: next(it),
+        spill_depth=100,
+        shed_depth=1000,
+        spill_lag=60,
+        shed_lag=300,
+        sample_interval=0,
+        **kwargs
+    )
+
+
+def test_states_follow_queue_depth():
+    """Test that depth thresholds map to accept, spill and shed"""
+    controller = make_controller([
+        {"depth": 10, "lag": 0},
+        {"depth": 150, "lag": 0},
+        {"depth": 5000, "lag": 0},
+    ])
+    assert controller.state() == ACCEPT
+    assert controller.state() == SPILL
+    assert controller.state() == SHED
+
+
+def test_worker_lag_alone_triggers_shedding():
+    """Test that a lagging worker pool sheds even with a short queue"""
+    controller = make_controller([{"depth": 0, "lag": 600}])
+    assert controller.state() == SHED
+
+
+def test_state_steps_down_below_low_water_mark():
+    """Test that the state does not flap right below a threshold"""
+    controller = make_controller([
+        {"depth": 150, "lag": 0},
+        {"depth": 95, "lag": 0},
+        {"depth": 50, "lag": 0},
+    ])
+    assert controller.state() == SPILL
+    assert controller.state() == SPILL
+    assert controller.state() == ACCEPT
+
+
+def test_missing_broker_sample_fails_open():
+    """Test that the webhook keeps accepting when Redis cannot be read"""
+    controller = make_controller([None])
+    assert controller.state() == ACCEPT
+
+
+def test_recovery_callback_runs_once():
+    """Test that returning to accept triggers the spill drain"""
+    recovered = []
+    controller = make_controller(
+        [{"depth": 150, "lag": 0}, {"depth": 0, "lag": 0}, {"depth": 0, "lag": 0}],
+        on_recover=lambda: recovered.append(True)
+    )
+    controller.state()
+    controller.state()
+    controller.state()
+    assert recovered == [True]
+
+
+def test_spill_store_drains_in_batches(tmp_path):
+    """Test that spilled events are replayed in batches and files removed"""
+    store = SpillStore(str(tmp_path))
+    store.write_batch([{"email_id": str(i)} for i in range(3)])
+    store.write_batch([{"email_id": "3"}])
+
+    batches = []
+    replayed = store.drain(batches.append, batch_size=3)
+
+    assert replayed == 4
+    assert [len(b) for b in batches] == [3, 1]
+    assert store.pending() == 0
+
+
+def test_webhook_returns_429_when_shedding():
+    """Test that the webhook answers 429 with Retry-After while shedding"""
+    from flask_app.routes import email_webhooks
+    app = Flask(__name__)
+    app.register_blueprint(email_webhooks.email_webhooks_bp)
+
+    with patch.object(email_webhooks.admission, "state", return_value=SHED):
+        response = app.test_client().post(
+            "/webhooks/email/event",
+            json={"event": "open", "email_id": "123e4567-e89b-12d3-a456-426614174000"}
+        )
+
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == str(email_webhooks.admission.retry_after)
+
+
+def test_drains_claim_every_process_file_exactly_once(tmp_path):
+    """Test files of other and dead processes, stale claims, concurrent drains and failed dispatch"""
+    for name in ("spill-101.jsonl", "spill-102.jsonl.17.draining", "spill-103.jsonl.claimed-999999999-dead"):
+        (tmp_path / name).write_text("".join(json.dumps({"email_id": f"{name}-{i}"}) + "\n" for i in range(50)))
+    store = SpillStore(str(tmp_path))
+    store.write_batch([{"email_id": "own"}])
+
+    seen = []
+    lock = threading.Lock()
+
+    def dispatch(batch):
+        with lock:
+            seen.extend(event["email_id"] for event in batch)
+
+    threads = [threading.Thread(target=store.drain, args=(dispatch,), kwargs={"batch_size": 7}) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(seen) == len(set(seen)) == 151
+    assert store.pending() == 0
+
+    store.write_batch([{"email_id": str(i)} for i in range(5)])
+    calls = []
+
+    def failing(batch):
+        calls.append(len(batch))
+        if len(calls) == 2:
+            raise RuntimeError("broker down")
+
+    with pytest.raises(RuntimeError):
+        store.drain(failing, batch_size=2)
+    retried = []
+    assert store.drain(retried.extend, batch_size=10) == 3
+    assert [event["email_id"] for event in retried] == ["2", "3", "4"]
+    assert store.pending() == 0
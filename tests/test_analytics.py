@@ -0,0 +1,111 @@
+import os
+import time
+import pytest
+import numpy as np
+from unittest.mock import MagicMock
+
+from flask_app import analytics
+
+
+def _variant(step_id, sent, opened, clicked, replied, idx=1):
+    return {
+        "campaign_id": "campaign-1", "step_id": step_id, "variant_id": f"{step_id}-{idx}",
+        "variant_idx": idx, "sent": sent, "opened": opened, "clicked": clicked, "replied": replied,
+    }
+
+
+def test_funnel_rates_and_wilson_interval():
+    """Test funnel rates and that the Wilson interval matches the closed form"""
+    rows = [_variant("step-1", 100, 40, 10, 5), _variant("step-2", 0, 0, 0, 0)]
+    stats = analytics.compute_variant_stats(rows, seed=1)
+
+    assert stats["open_rate"].tolist() == [0.4, 0.0]
+    assert stats["click_to_open_rate"][0] == 0.25
+    assert stats["reply_to_click_rate"][0] == 0.5
+    # 5/100 at 95%: [0.0215, 0.1118]
+    assert round(stats["ci_low"][0], 4) == 0.0215
+    assert round(stats["ci_high"][0], 4) == 0.1118
+    # No sends: uninformative interval
+    assert (stats["ci_low"][1], stats["ci_high"][1]) == (0.0, 1.0)
+
+
+def test_win_probabilities_sum_to_one_per_step():
+    """Test that variants compete within their step only"""
+    rows = [
+        _variant("step-1", 1000, 0, 0, 50, idx=1),
+        _variant("step-1", 1000, 0, 0, 90, idx=2),
+        _variant("step-2", 20, 0, 0, 2, idx=1),
+        _variant("step-2", 20, 0, 0, 2, idx=2),
+        _variant("step-2", 20, 0, 0, 2, idx=3),
+        _variant("step-3", 10, 0, 0, 1, idx=1),
+    ]
+    stats = analytics.compute_variant_stats(rows, seed=7)
+    prob = stats["prob_best"]
+
+    assert prob[0] + prob[1] == pytest.approx(1.0)
+    assert prob[1] > 0.99
+    assert prob[2:5].sum() == pytest.approx(1.0)
+    assert np.all(np.abs(prob[2:5] - 1 / 3) < 0.1)
+    assert prob[5] == 1.0
+    # Lift is relative to the first variant of the step
+    assert stats["lift"][0] == 0.0
+    assert stats["lift"][1] == pytest.approx(0.8)
+
+
+def test_group_layout_keeps_input_order():
+    """Test the padded layout used to vectorize across steps"""
+    group, position, groups, width = analytics.group_layout(["b", "a", "b", "c", "b"])
+    assert groups == 3
+    assert width == 3
+    assert position.tolist() == [0, 0, 1, 0, 2]
+    assert group[0] == group[2] == group[4]
+
+
+def test_rejects_unknown_metric():
+    """Test that unsupported metrics are rejected"""
+    with pytest.raises(ValueError):
+        analytics.compute_variant_stats([], metric="bounced")
+
+
+def test_thousands_of_variants_under_a_second():
+    """Test that a few thousand variants are scored in one fast pass"""
+    rng = np.random.default_rng(0)
+    rows = []
+    for step in range(1500):
+        for idx in range(1, 4):
+            sent = int(rng.integers(0, 5000))
+            replied = int(rng.binomial(sent, 0.05))
+            rows.append(_variant(f"step-{step}", sent, replied * 4, replied * 2, replied, idx=idx))
+
+    start = time.perf_counter()
+    stats = analytics.compute_variant_stats(rows, seed=0)
+    elapsed = time.perf_counter() - start
+
+    assert len(stats["prob_best"]) == 4500
+    assert elapsed < 1.0
+
+
+def test_variants_endpoint(monkeypatch):
+    """Test the /stats/variants endpoint"""
+    from flask_app import create_app
+    os.environ["FLASK_ENV"] = "development"
+    os.environ["DEV_API_KEY"] = "dev-secret"
+    mock = MagicMock()
+    mock.rpc.return_value.execute.return_value = MagicMock(data=[
+        _variant("step-1", 200, 80, 20, 10, idx=1),
+        _variant("step-1", 200, 90, 30, 20, idx=2),
+    ])
+    monkeypatch.setattr('flask_app.analytics.create_supabase_client', lambda: mock)
+    client = create_app().test_client()
+
+    response = client.get('/stats/variants?campaign_id=campaign-1', headers={"X-API-Key": "dev-secret"})
+
+    assert response.status_code == 200
+    data = response.get_json()
+    assert data["metric"] == "replied"
+    assert [v["variant_idx"] for v in data["variants"]] == [1, 2]
+    assert data["variants"][1]["prob_best"] > 0.5
+    mock.rpc.assert_called_once_with("email_variant_totals", {"p_owner": "00000000-0000-0000-0000-000000000000", "p_campaign_id": "campaign-1"})
+
+    response = client.get('/stats/variants?metric=bounced', headers={"X-API-Key": "dev-secret"})
+    assert response.status_code == 400
@@ -0,0 +1,61 @@
+from datetime import datetime, timedelta, timezone
+from unittest.mock import MagicMock
+
+from flask_app import archival
+
+
+def _mock_archive(monkeypatch, moved):
+    mock = MagicMock()
+    mock.rpc.return_value.execute.side_effect = [MagicMock(data=count) for count in moved]
+    monkeypatch.setattr('flask_app.archival.create_supabase_client', lambda: mock)
+    return mock
+
+
+def test_archives_in_batches_until_caught_up(monkeypatch):
+    """Test that archival keeps moving full batches and stops on a short one"""
+    mock = _mock_archive(monkeypatch, [1000, 1000, 12])
+
+    assert archival.archive_email_log(retention_days=30, batch_size=1000) == 2012
+    assert mock.rpc.call_count == 3
+
+    name, params = mock.rpc.call_args[0]
+    assert name == "archive_email_log"
+    assert params["p_batch"] == 1000
+    cutoff = datetime.fromisoformat(params["p_before"])
+    expected = datetime.now(timezone.utc) - timedelta(days=30)
+    assert abs((cutoff - expected).total_seconds()) < 60
+
+
+def test_run_is_bounded(monkeypatch):
+    """Test that one run stops after max_batches"""
+    mock = _mock_archive(monkeypatch, [10, 10, 10])
+
+    assert archival.archive_email_log(batch_size=10, max_batches=2) == 20
+    assert mock.rpc.call_count == 2
+
+
+def test_maintain_partitions_creates_ahead_and_archives_expired_months(monkeypatch):
+    """Test the partition maintenance round trip"""
+    mock = MagicMock()
+    responses = {
+        "ensure_email_log_partitions": ["email_log_y2026m10", "email_log_y2026m11"],
+        "ensure_email_events_partitions": ["email_events_y2026m10", "email_events_y2026m11"],
+        "archive_email_log_partitions": ["email_log_archive_y2026m06"],
+    }
+
+    def rpc(name, params):
+        call = MagicMock()
+        call.execute.return_value = MagicMock(data=responses[name])
+        return call
+
+    mock.rpc.side_effect = rpc
+    monkeypatch.setattr('flask_app.archival.create_supabase_client', lambda: mock)
+
+    result = archival.maintain_partitions(retention_days=90, months_ahead=1)
+
+    assert result == {"partitions": 2, "archived": ["email_log_archive_y2026m06"]}
+    calls = {c[0][0]: c[0][1] for c in mock.rpc.call_args_list}
+    assert calls["ensure_email_log_partitions"] == {"p_months_ahead": 1}
+    assert calls["ensure_email_events_partitions"] == {"p_months_ahead": 1}
+    cutoff = datetime.fromisoformat(calls["archive_email_log_partitions"]["p_before"])
+    assert abs((cutoff - (datetime.now(timezone.utc) - timedelta(days=90))).total_seconds()) < 60
@@ -0,0 +1,142 @@
+import threading
+import time
+import pytest
+from flask import Flask, g, jsonify
+from unittest.mock import MagicMock
+
+from flask_app.cache import ResponseCache, cached_response, invalidate_after_write
+from flask_app import cache as cache_module
+
+
+def _local_cache(**kwargs):
+    return ResponseCache(redis_getter=lambda: None, **kwargs)
+
+
+def test_hit_after_miss_and_ttl_expiry():
+    """Test that values are reused until their TTL runs out"""
+    cache = _local_cache(ttl=0.05)
+    compute = MagicMock(return_value=("value", True))
+
+    assert cache.get_or_compute("owner-1", "/stats/overview/", compute) == ("value", False)
+    assert cache.get_or_compute("owner-1", "/stats/overview/", compute) == ("value", True)
+    assert compute.call_count == 1
+
+    time.sleep(0.06)
+    cache.get_or_compute("owner-1", "/stats/overview/", compute)
+    assert compute.call_count == 2
+    assert cache.stats()["hit_rate"] == round(1 / 3, 4)
+
+
+def test_invalidation_is_per_owner():
+    """Test that invalidating one owner keeps other owners' entries"""
+    cache = _local_cache()
+    compute = MagicMock(return_value=("value", True))
+    cache.get_or_compute("owner-1", "/campaigns", compute)
+    cache.get_or_compute("owner-2", "/campaigns", compute)
+
+    cache.invalidate(["owner-1"])
+
+    assert cache.get_or_compute("owner-1", "/campaigns", compute)[1] is False
+    assert cache.get_or_compute("owner-2", "/campaigns", compute)[1] is True
+
+
+def test_uncacheable_results_are_not_stored():
+    """Test that failed responses are recomputed"""
+    cache = _local_cache()
+    compute = MagicMock(return_value=("error", False))
+    cache.get_or_compute("owner-1", "/stats/overview/", compute)
+    cache.get_or_compute("owner-1", "/stats/overview/", compute)
+    assert compute.call_count == 2
+
+
+def test_concurrent_identical_requests_compute_once():
+    """Test single-flight: concurrent callers share one computation"""
+    cache = _local_cache()
+    release = threading.Event()
+    calls = []
+
+    def compute():
+        calls.append(1)
+        release.wait(2)
+        return "value", True
+
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(cache.get_or_compute("owner-1", "/stats/overview/", compute)))
+        for _ in range(8)
+    ]
+    for thread in threads:
+        thread.start()
+    while cache.stats()["coalesced"] + cache.stats()["misses"] < 8:
+        time.sleep(0.001)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1
+    assert [value for value, _ in results] == ["value"] * 8
+    assert cache.stats()["coalesced"] == 7
+
+
+def test_errors_propagate_to_waiting_callers():
+    """Test that a failed computation is raised and not cached"""
+    cache = _local_cache()
+
+    def compute():
+        raise RuntimeError("database unavailable")
+
+    with pytest.raises(RuntimeError):
+        cache.get_or_compute("owner-1", "/stats/overview/", compute)
+    assert cache.get_or_compute("owner-1", "/stats/overview/", lambda: ("value", True)) == ("value", False)
+
+
+def test_redis_generations_are_shared():
+    """Test that invalidations go through Redis when it is configured"""
+    redis = MagicMock()
+    redis.get.return_value = b"3"
+    cache = ResponseCache(redis_getter=lambda: redis)
+
+    assert cache.generation("owner-1") == "0.3"
+    cache.invalidate(["owner-1"])
+    redis.pipeline.return_value.incr.assert_called_once_with("cache:gen:owner-1")
+
+    # An unreachable Redis bypasses the cache instead of serving stale data
+    redis.get.side_effect = ConnectionError("down")
+    compute = MagicMock(return_value=("value", True))
+    cache.get_or_compute("owner-1", "/campaigns", compute)
+    cache.get_or_compute("owner-1", "/campaigns", compute)
+    assert compute.call_count == 2
+
+
+def test_decorated_view_is_invalidated_by_writes(monkeypatch):
+    """Test the view decorator and the after_request invalidation hook"""
+    monkeypatch.setattr(cache_module, "response_cache", _local_cache())
+    app = Flask(__name__)
+    counter = {"calls": 0}
+
+    @app.before_request
+    def set_user():
+        g.user_id = "owner-1"
+
+    @app.route("/things", methods=["GET"])
+    @cached_response
+    def list_things():
+        counter["calls"] += 1
+        return jsonify({"calls": counter["calls"]})
+
+    @app.route("/things", methods=["POST"])
+    def create_thing():
+        return jsonify({}), 201
+
+    app.after_request(invalidate_after_write)
+    client = app.test_client()
+
+    assert client.get("/things").headers["X-Cache"] == "MISS"
+    response = client.get("/things")
+    assert response.headers["X-Cache"] == "HIT"
+    assert response.get_json() == {"calls": 1}
+    # Different query parameters are cached separately
+    assert client.get("/things?page=2").headers["X-Cache"] == "MISS"
+
+    client.post("/things")
+    assert client.get("/things").get_json() == {"calls": 3}
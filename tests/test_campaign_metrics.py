@@ -0,0 +1,68 @@
+import os
+from unittest.mock import MagicMock
+from flask import Flask
+
+from flask_app import campaign_metrics
+from flask_app.routes.campaigns import campaigns_bp
+
+
+def _mock_refresh(monkeypatch, counts):
+    mock = MagicMock()
+    mock.rpc.return_value.execute.side_effect = [
+        MagicMock(data=[{"owner": "owner-1", "campaigns": count}] if count else []) for count in counts
+    ]
+    monkeypatch.setattr('flask_app.campaign_metrics.create_supabase_client', lambda: mock)
+    return mock
+
+
+def test_refresh_drains_dirty_campaigns_in_batches(monkeypatch):
+    """Test that refresh keeps going while full batches come back"""
+    mock = _mock_refresh(monkeypatch, [100, 100, 37])
+
+    assert campaign_metrics.refresh(batch_size=100) == 237
+    assert mock.rpc.call_count == 3
+    mock.rpc.assert_called_with("refresh_campaign_metrics", {"p_limit": 100})
+
+
+def test_refresh_is_bounded(monkeypatch):
+    """Test that one run stops after max_batches calls"""
+    mock = _mock_refresh(monkeypatch, [10, 10, 10])
+
+    assert campaign_metrics.refresh(batch_size=10, max_batches=2) == 20
+    assert mock.rpc.call_count == 2
+
+
+def test_refresh_invalidates_cached_responses_of_refreshed_owners(monkeypatch):
+    """Test that owners whose metrics changed do not keep serving cached lists"""
+    mock = MagicMock()
+    mock.rpc.return_value.execute.return_value = MagicMock(data=[
+        {"owner": "owner-1", "campaigns": 3},
+        {"owner": "owner-2", "campaigns": 1},
+    ])
+    monkeypatch.setattr('flask_app.campaign_metrics.create_supabase_client', lambda: mock)
+    invalidated = []
+    monkeypatch.setattr('flask_app.campaign_metrics.invalidate_owners', lambda owners: invalidated.extend(owners))
+
+    assert campaign_metrics.refresh(batch_size=100) == 4
+    assert invalidated == ["owner-1", "owner-2"]
+
+
+def test_list_campaigns_embeds_metrics(monkeypatch):
+    """Test that the campaign list is one query with the metrics embedded"""
+    os.environ["DEV_API_KEY"] = "dev-secret"
+    mock = MagicMock()
+    rows = [{"id": "c1", "name": "Launch", "metrics": {"sent": 120, "replied": 6, "reply_rate": 0.05}}]
+    # Development mode lists without the owner filter
+    mock.table.return_value.select.return_value.order.return_value.execute.return_value = MagicMock(data=rows)
+    monkeypatch.setattr('flask_app.routes.campaigns.create_supabase_client', lambda: mock)
+
+    app = Flask(__name__)
+    app.config["ENV"] = "development"
+    app.register_blueprint(campaigns_bp)
+    response = app.test_client().get('/campaigns', headers={"X-API-Key": "dev-secret"})
+
+    assert response.status_code == 200
+    assert response.get_json()[0]["metrics"]["reply_rate"] == 0.05
+    mock.table.assert_called_once_with("campaigns")
+    select = mock.table.return_value.select.call_args[0][0]
+    assert select.startswith("*, metrics:campaign_metrics(")
@@ -2,6 +2,7 @@ import os
 import pytest
 from unittest.mock import MagicMock, patch
 from flask import g
+from flask_app.campaign_metrics import EMBED as METRICS_EMBED
 
 
 @pytest.fixture
@@ -64,7 +65,7 @@ def test_list_campaigns_ok(client, mock_supabase):
     
     # Verify mock calls
     mock_supabase.table.assert_called_once_with("campaigns")
-    mock_table.select.assert_called_once_with("*")
+    mock_table.select.assert_called_once_with(f"*, {METRICS_EMBED}")
     mock_select.eq.assert_called_once()  # eq("owner", g.user_id)
     mock_eq.order.assert_called_once_with("created_at", desc=True)
 
@@ -259,5 +260,5 @@ def test_list_campaigns_dev_ok(client, mock_supabase):
     
     # Verify mock calls - should not call eq() in dev mode
     mock_supabase.table.assert_called_once_with("campaigns")
-    mock_table.select.assert_called_once_with("*")
+    mock_table.select.assert_called_once_with(f"*, {METRICS_EMBED}")
     mock_select.order.assert_called_once_with("created_at", desc=True)
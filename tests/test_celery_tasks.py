@@ -0,0 +1,65 @@
+from unittest.mock import patch
+
+from flask_app import celery_config
+from flask_app.celery_tasks import celery_app, enqueue_events, process_email_events_batch
+from flask_app.email_events import build_event
+
+
+def test_event_tasks_are_routed_per_type():
+    """Test that each single-event task is routed to its own queue"""
+    routes = celery_app.conf.task_routes
+    assert routes["flask_app.celery_tasks.process_email_reply_event"]["queue"] == "events.reply"
+    assert routes["flask_app.celery_tasks.process_email_click_event"]["queue"] == "events.click"
+    assert routes["flask_app.celery_tasks.process_email_open_event"]["queue"] == "events.open"
+
+
+def test_replies_have_highest_priority():
+    """Test that replies outrank clicks and opens (0 is highest on Redis)"""
+    priorities = celery_config.EVENT_PRIORITIES
+    assert priorities["reply"] < priorities["click"] < priorities["open"]
+
+
+def test_results_are_ignored():
+    """Test that event tasks do not write results"""
+    assert celery_app.conf.task_ignore_result is True
+    assert process_email_events_batch.ignore_result is True
+
+
+def test_enqueue_events_chunks_per_type():
+    """Test that events are grouped by type and split into batch-size chunks"""
+    events = [build_event("open", f"open-{i}") for i in range(5)]
+    events += [build_event("reply", "reply-1")]
+
+    with patch.object(process_email_events_batch, "apply_async") as mock_apply:
+        queued = enqueue_events(events, batch_size=2)
+
+    assert queued == 4
+    calls = [call.kwargs for call in mock_apply.call_args_list]
+    open_calls = [c for c in calls if c["queue"] == "events.open"]
+    reply_calls = [c for c in calls if c["queue"] == "events.reply"]
+    assert [len(c["args"][0]) for c in open_calls] == [2, 2, 1]
+    assert len(reply_calls) == 1
+    assert reply_calls[0]["priority"] == 0
+
+
+def test_worker_lag_is_measured_from_enqueue_time():
+    """Test that old events (replays, late replies) do not count as worker lag"""
+    old_reply = build_event("reply", "reply-1", timestamp="2026-01-01T00:00:00+00:00")
+
+    with patch.object(process_email_events_batch, "apply_async") as mock_apply:
+        enqueue_events([old_reply])
+    kwargs = mock_apply.call_args.kwargs["kwargs"]
+
+    with patch("flask_app.celery_tasks.record_worker_lag") as mock_lag, \
+         patch("flask_app.celery_tasks.record_events"):
+        process_email_events_batch.apply(args=[[old_reply]], kwargs=kwargs)
+
+    mock_lag.assert_called_once_with(kwargs["enqueued_at"])
+
+
+def test_periodic_jobs_run_on_the_maintenance_queue():
+    """Test that beat jobs go to a queue the documented maintenance worker reads"""
+    routes = celery_app.conf.task_routes
+    for entry in celery_config.beat_schedule.values():
+        assert routes[entry["task"]]["queue"] == "maintenance"
+    assert "-Q maintenance" in celery_config.__doc__
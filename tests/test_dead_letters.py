@@ -0,0 +1,110 @@
+import os
+import subprocess
+import sys
+
+import pytest
+from unittest.mock import MagicMock, patch
+from postgrest.exceptions import APIError
+
+from flask_app import dead_letters
+from flask_app.admission import SpillStore
+
+
+@pytest.fixture
+def spill(tmp_path, monkeypatch):
+    store = SpillStore(str(tmp_path))
+    monkeypatch.setattr(dead_letters, "spill_store", store)
+    return store
+
+
+@pytest.fixture
+def mock_supabase(monkeypatch):
+    mock = MagicMock()
+    monkeypatch.setattr(dead_letters, "create_supabase_client", lambda: mock)
+    return mock
+
+
+def test_store_spills_to_disk_when_database_is_down(spill, monkeypatch):
+    """Test that dead letters survive a database outage"""
+    def unavailable():
+        raise Exception("connection refused")
+    monkeypatch.setattr(dead_letters, "create_supabase_client", unavailable)
+
+    stored = dead_letters.store_dead_letters([{"email_id": "1"}, {"email_id": "2"}], "boom")
+
+    assert stored == 2
+    assert spill.pending() == 1
+
+
+def test_replay_bisects_failing_batch(spill, mock_supabase):
+    """Test that one bad event does not block the rest of its batch"""
+    rows = [{"id": i, "event": {"email_id": str(i)}} for i in range(1, 5)]
+    select = mock_supabase.table.return_value.select.return_value
+    chain = select.is_.return_value.lte.return_value.gt.return_value.order.return_value.limit.return_value
+    chain.execute.return_value = MagicMock(data=rows)
+
+    def record(events):
+        if any(event["email_id"] == "3" for event in events):
+            raise APIError({"code": "22P02", "message": "invalid input syntax for type uuid"})
+
+    with patch("flask_app.email_events.record_events", side_effect=record):
+        result = dead_letters.replay_dead_letters(batch_size=10)
+
+    assert result == {"imported": 0, "replayed": 3, "deferred": 1}
+
+    # The bad event is deferred with backoff
+    mock_supabase.rpc.assert_called_once()
+    assert mock_supabase.rpc.call_args[0][1]["p_ids"] == [3]
+
+    # The others are marked replayed in one update
+    update = mock_supabase.table.return_value.update.return_value
+    assert sorted(update.in_.call_args[0][1]) == [1, 2, 4]
+
+
+def _due(mock_supabase, rows):
+    select = mock_supabase.table.return_value.select.return_value
+    chain = select.is_.return_value.lte.return_value.gt.return_value.order.return_value.limit.return_value
+    chain.execute.return_value = MagicMock(data=rows)
+
+
+def test_outage_stops_the_run_without_bisecting(spill, mock_supabase):
+    """Test that a connection failure costs one call and leaves the rows due"""
+    _due(mock_supabase, [{"id": i, "event": {"email_id": str(i)}} for i in range(1, 9)])
+    mock_supabase.rpc.return_value.execute.side_effect = Exception("connection refused")
+    record = MagicMock(side_effect=Exception("503 Service Unavailable"))
+
+    with patch("flask_app.email_events.record_events", record):
+        result = dead_letters.replay_dead_letters(batch_size=8)
+
+    assert result == {"imported": 0, "replayed": 0, "deferred": 0}
+    assert record.call_count == 1
+    mock_supabase.rpc.assert_not_called()
+
+    # A row error whose defer fails is logged and the row stays due
+    record = MagicMock(side_effect=APIError({"code": "23503", "message": "foreign key violation"}))
+    with patch("flask_app.email_events.record_events", record):
+        result = dead_letters.replay_dead_letters(batch_size=10)
+    assert result["deferred"] == 0
+
+
+def test_replay_imports_dead_letters_spilled_by_another_process(spill, mock_supabase):
+    """Test that the CLI/beat replay picks up spill files of webhook and worker processes"""
+    code = (
+        "from flask_app import dead_letters\n"
+        "def down():\n"
+        "    raise Exception('connection refused')\n"
+        "dead_letters.create_supabase_client = down\n"
+        "dead_letters.store_dead_letters([{'email_id': '1'}, {'email_id': '2'}], 'boom')\n"
+    )
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    subprocess.run([sys.executable, "-c", code], cwd=root, check=True,
+                   env={**os.environ, "DEAD_LETTER_SPILL_DIR": spill.directory})
+    assert spill.pending() == 1
+    _due(mock_supabase, [])
+
+    result = dead_letters.replay_dead_letters()
+
+    assert result["imported"] == 2
+    inserted = mock_supabase.table.return_value.insert.call_args[0][0]
+    assert [row["event"]["email_id"] for row in inserted] == ["1", "2"]
+    assert spill.pending() == 0
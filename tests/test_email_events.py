@@ -2,7 +2,8 @@
 Unit tests for email event handling functions.
 
 This module contains tests for the email event handling functions in the email_events module,
-specifically focusing on verifying that click events are correctly recorded with 'clicked' status.
+specifically focusing on verifying that events are appended to email_events through the
+record_email_events function, with click URLs and timestamps preserved.
 """
 import unittest
 from unittest.mock import patch, MagicMock
@@ -12,86 +13,111 @@ import os
 # Add the parent directory to the path so we can import the flask_app module
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
-from flask_app.email_events import handle_click_event, handle_reply_event, handle_open_event
+from flask_app.email_events import (
+    handle_click_event,
+    handle_reply_event,
+    handle_open_event,
+    build_event,
+    record_events,
+    normalize_timestamp,
+)
 
 class TestEmailEvents(unittest.TestCase):
     """Test cases for email event handling functions."""
-    
-    @patch('flask_app.email_events.create_supabase_client')
-    def test_handle_click_event_uses_clicked_status(self, mock_create_client):
-        """Test that handle_click_event uses 'clicked' status instead of 'replied'."""
-        # Setup mock
+
+    def _mock_client(self, mock_create_client):
         mock_client = MagicMock()
-        mock_table = MagicMock()
-        mock_update = MagicMock()
-        mock_eq = MagicMock()
-        mock_execute = MagicMock()
-        
+        mock_rpc = MagicMock()
         mock_create_client.return_value = mock_client
-        mock_client.table.return_value = mock_table
-        mock_table.update.return_value = mock_update
-        mock_update.eq.return_value = mock_eq
-        mock_eq.execute.return_value = MagicMock()
-        
+        mock_client.rpc.return_value = mock_rpc
+        mock_rpc.execute.return_value = MagicMock(data=[])
+        return mock_client, mock_rpc
+
+    @patch('flask_app.email_events.create_supabase_client')
+    def test_handle_click_event_records_url_and_timestamp(self, mock_create_client):
+        """Test that handle_click_event appends a click event with URL and timestamp."""
+        mock_client, mock_rpc = self._mock_client(mock_create_client)
+
         # Call the function
         email_id = "test-email-id"
         link_url = "https://example.com/test-link"
         timestamp = "2025-06-13T12:34:56Z"
         result = handle_click_event(email_id, link_url, timestamp)
-        
+
         # Verify the function returns True on success
         self.assertTrue(result)
-        
-        # Verify the Supabase client was created
-        mock_create_client.assert_called_once()
-        
-        # Verify the table method was called with 'email_log'
-        mock_client.table.assert_called_once_with("email_log")
-        
-        # Verify update was called with the correct status 'clicked' (not 'replied')
-        mock_table.update.assert_called_once()
-        update_args = mock_table.update.call_args[0][0]
-        self.assertEqual(update_args["status"], "clicked")
-        self.assertEqual(update_args["clicked_url"], link_url)
-        self.assertEqual(update_args["clicked_at"], timestamp)
-        
-        # Verify eq was called with the correct email_id
-        mock_update.eq.assert_called_once_with("id", email_id)
-        
-        # Verify execute was called
-        mock_eq.execute.assert_called_once()
-    
+
+        # Verify the event was written through record_email_events
+        mock_client.rpc.assert_called_once()
+        function_name, params = mock_client.rpc.call_args[0]
+        self.assertEqual(function_name, "record_email_events")
+        self.assertEqual(len(params["p_events"]), 1)
+
+        event = params["p_events"][0]
+        self.assertEqual(event["event_type"], "click")
+        self.assertEqual(event["email_id"], email_id)
+        self.assertEqual(event["url"], link_url)
+        self.assertEqual(event["ts"], timestamp)
+
+        # The status column is no longer overwritten directly
+        mock_client.table.assert_not_called()
+        mock_rpc.execute.assert_called_once()
+
     @patch('flask_app.email_events.create_supabase_client')
-    def test_handle_reply_event_uses_replied_status(self, mock_create_client):
-        """Test that handle_reply_event still uses 'replied' status."""
-        # Setup mock
-        mock_client = MagicMock()
-        mock_table = MagicMock()
-        mock_update = MagicMock()
-        mock_eq = MagicMock()
-        mock_execute = MagicMock()
-        
-        mock_create_client.return_value = mock_client
-        mock_client.table.return_value = mock_table
-        mock_table.update.return_value = mock_update
-        mock_update.eq.return_value = mock_eq
-        mock_eq.execute.return_value = MagicMock()
-        
+    def test_handle_reply_event_keeps_reply_content(self, mock_create_client):
+        """Test that handle_reply_event stores the reply body in the event metadata."""
+        mock_client, _ = self._mock_client(mock_create_client)
+
         # Call the function
         email_id = "test-email-id"
         reply_content = "This is a test reply"
         timestamp = "2025-06-13T12:34:56Z"
         result = handle_reply_event(email_id, reply_content, timestamp)
-        
+
         # Verify the function returns True on success
         self.assertTrue(result)
-        
-        # Verify update was called with the correct status 'replied'
-        mock_table.update.assert_called_once()
-        update_args = mock_table.update.call_args[0][0]
-        self.assertEqual(update_args["status"], "replied")
-        self.assertEqual(update_args["reply_content"], reply_content)
-        self.assertEqual(update_args["replied_at"], timestamp)
+
+        event = mock_client.rpc.call_args[0][1]["p_events"][0]
+        self.assertEqual(event["event_type"], "reply")
+        self.assertEqual(event["metadata"]["reply_content"], reply_content)
+        self.assertEqual(event["ts"], timestamp)
+
+    @patch('flask_app.dead_letters.store_dead_letters')
+    @patch('flask_app.email_events.create_supabase_client')
+    def test_handle_open_event_dead_letters_on_error(self, mock_create_client, mock_store):
+        """Test that a database failure is reported as False and the event is kept."""
+        mock_create_client.side_effect = Exception("database unavailable")
+        self.assertFalse(handle_open_event("test-email-id"))
+
+        mock_store.assert_called_once()
+        events, error = mock_store.call_args[0]
+        self.assertEqual(events[0]["event_type"], "open")
+        self.assertEqual(str(error), "database unavailable")
+
+    @patch('flask_app.email_events.create_supabase_client')
+    def test_record_events_writes_batch_in_one_call(self, mock_create_client):
+        """Test that a batch of events is written with a single RPC call."""
+        mock_client, _ = self._mock_client(mock_create_client)
+
+        events = [build_event("open", f"email-{i}") for i in range(50)]
+        record_events(events)
+
+        mock_client.rpc.assert_called_once_with("record_email_events", {"p_events": events})
+
+    @patch('flask_app.email_events.create_supabase_client')
+    def test_record_events_skips_empty_batch(self, mock_create_client):
+        """Test that an empty batch does not touch the database."""
+        self.assertEqual(record_events([]), [])
+        mock_create_client.assert_not_called()
+
+    def test_build_event_rejects_unknown_type(self):
+        """Test that unknown event types are rejected."""
+        with self.assertRaises(ValueError):
+            build_event("bounce", "test-email-id")
+
+    def test_normalize_timestamp_accepts_epoch_seconds(self):
+        """Test that unix timestamps are converted to ISO 8601 in UTC."""
+        self.assertEqual(normalize_timestamp(0), "1970-01-01T00:00:00+00:00")
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,75 @@
+import uuid
+from datetime import datetime, timedelta, timezone
+from unittest.mock import MagicMock
+
+import pytest
+
+from flask_app import email_log
+
+
+def test_uuid7_encodes_creation_time():
+    """Test version, variant and the embedded millisecond timestamp"""
+    created = datetime(2026, 10, 19, 12, 30, tzinfo=timezone.utc)
+    email_id = email_log.uuid7(created.timestamp())
+
+    assert email_id.version == 7
+    assert email_id.variant == uuid.RFC_4122
+    assert email_log.id_time(email_id) == created
+    # Time-ordered: later ids sort after earlier ones
+    assert str(email_log.uuid7(created.timestamp() + 1)) > str(email_id)
+
+
+def test_by_id_adds_the_partition_key():
+    """Test that a UUIDv7 lookup is narrowed to its sent_at window"""
+    created = datetime(2026, 10, 19, tzinfo=timezone.utc)
+    email_id = email_log.uuid7(created.timestamp())
+    query = MagicMock()
+
+    email_log.by_id(query, email_id)
+
+    query.eq.assert_called_once_with("id", str(email_id))
+    ranged = query.eq.return_value
+    ranged.gte.assert_called_once_with("sent_at", (created - email_log.ID_SLACK).isoformat())
+    ranged.gte.return_value.lt.assert_called_once_with("sent_at", (created + email_log.ID_SLACK).isoformat())
+
+
+def test_legacy_ids_are_not_narrowed():
+    """Test that random UUIDs fall back to an id-only filter"""
+    query = MagicMock()
+    legacy_id = uuid.uuid4()
+
+    assert email_log.sent_at_bounds(legacy_id) == (None, None)
+    assert email_log.by_id(query, legacy_id) is query.eq.return_value
+    query.eq.return_value.gte.assert_not_called()
+
+
+def test_by_ids_spans_all_ids():
+    """Test one sent_at range covering a batch of ids"""
+    first = datetime(2026, 9, 1, tzinfo=timezone.utc)
+    last = datetime(2026, 10, 1, tzinfo=timezone.utc)
+    ids = [email_log.uuid7(last.timestamp()), email_log.uuid7(first.timestamp())]
+    query = MagicMock()
+
+    email_log.by_ids(query, ids)
+
+    ranged = query.in_.return_value
+    ranged.gte.assert_called_once_with("sent_at", (first - email_log.ID_SLACK).isoformat())
+    ranged.gte.return_value.lt.assert_called_once_with("sent_at", (last + email_log.ID_SLACK).isoformat())
+
+    mixed = MagicMock()
+    email_log.by_ids(mixed, ids + [uuid.uuid4()])
+    mixed.in_.return_value.gte.assert_not_called()
+
+
+def test_in_range_requires_both_ends():
+    """Test that time-range reads cannot skip the partition key"""
+    start = datetime(2026, 10, 1, tzinfo=timezone.utc)
+    query = MagicMock()
+
+    email_log.in_range(query, start, start + timedelta(days=1))
+    query.gte.assert_called_once_with("sent_at", start.isoformat())
+
+    with pytest.raises(ValueError):
+        email_log.in_range(query, start, None)
+    with pytest.raises(ValueError):
+        email_log.in_range(query, start, start)
@@ -0,0 +1,90 @@
+import os
+import uuid
+from unittest.mock import MagicMock
+
+import pytest
+from flask import Flask
+
+from flask_app import enrollment
+from flask_app.routes.campaigns import campaigns_bp
+
+CAMPAIGN_ID = "6f1c2d3e-0000-4000-8000-000000000001"
+
+
+@pytest.fixture
+def mock_supabase(monkeypatch):
+    mock = MagicMock()
+    monkeypatch.setattr('flask_app.enrollment.create_supabase_client', lambda: mock)
+    return mock
+
+
+def _client():
+    app = Flask(__name__)
+    app.config["ENV"] = "development"
+    os.environ["DEV_API_KEY"] = "dev-secret"
+    app.register_blueprint(campaigns_bp)
+    return app.test_client()
+
+
+def test_enroll_chunks_lead_ids_and_sums_counts(mock_supabase):
+    """Test that lead ids are deduplicated, sent in chunks and the counts added up"""
+    lead_ids = [str(uuid.uuid4()) for _ in range(5)]
+    mock_supabase.rpc.return_value.execute.side_effect = [
+        MagicMock(data=[{"leads": 2, "steps": 3, "scheduled": 6, "skipped": 0}]),
+        MagicMock(data=[{"leads": 2, "steps": 3, "scheduled": 3, "skipped": 3}]),
+        MagicMock(data=[{"leads": 1, "steps": 3, "scheduled": 0, "skipped": 3}]),
+    ]
+
+    counts = enrollment.enroll(CAMPAIGN_ID, "user-1", lead_ids=lead_ids + lead_ids[:2], chunk_size=2)
+
+    assert counts == {"leads": 5, "steps": 3, "scheduled": 9, "skipped": 6}
+    chunks = [call.args[1]["p_lead_ids"] for call in mock_supabase.rpc.call_args_list]
+    assert chunks == [lead_ids[0:2], lead_ids[2:4], lead_ids[4:5]]
+
+
+def test_enroll_rejects_bad_lead_ids(mock_supabase):
+    """Test that a non-UUID lead id fails before touching the database"""
+    with pytest.raises(ValueError):
+        enrollment.enroll(CAMPAIGN_ID, "user-1", lead_ids=["not-a-uuid"])
+    mock_supabase.rpc.assert_not_called()
+
+
+def test_enroll_endpoint(mock_supabase):
+    """Test the endpoint for all leads, a missing campaign and a body without leads"""
+    client = _client()
+    headers = {"X-API-Key": "dev-secret"}
+    mock_supabase.rpc.return_value.execute.return_value = MagicMock(
+        data=[{"leads": 100000, "steps": 3, "scheduled": 300000, "skipped": 0}])
+
+    response = client.post(f"/campaigns/{CAMPAIGN_ID}/enroll", json={"all_leads": True}, headers=headers)
+
+    assert response.status_code == 200
+    assert response.get_json()["scheduled"] == 300000
+    assert mock_supabase.rpc.call_args.args[1]["p_lead_ids"] is None
+
+    mock_supabase.rpc.return_value.execute.side_effect = Exception("Campaign not found")
+    response = client.post(f"/campaigns/{CAMPAIGN_ID}/enroll", json={"all_leads": True}, headers=headers)
+    assert response.status_code == 404
+
+    response = client.post(f"/campaigns/{CAMPAIGN_ID}/enroll", json={}, headers=headers)
+    assert response.status_code == 400
+
+
+def test_enroll_rejects_another_owners_email_server(mock_supabase, monkeypatch):
+    """Test that an email server not owned by the user is refused before enrolling"""
+    servers = MagicMock()
+    servers.table.return_value.select.return_value.eq.return_value.eq.return_value.execute.return_value = \
+        MagicMock(data=[])
+    monkeypatch.setattr('flask_app.routes.campaigns.create_supabase_client', lambda: servers)
+    client = _client()
+
+    response = client.post(f"/campaigns/{CAMPAIGN_ID}/enroll", headers={"X-API-Key": "dev-secret"},
+                           json={"all_leads": True, "email_server_id": "6f1c2d3e-0000-4000-8000-000000000009"})
+
+    assert response.status_code == 400
+    assert response.get_json() == {"error": "Email server not found"}
+    mock_supabase.rpc.assert_not_called()
+
+    mock_supabase.rpc.return_value.execute.side_effect = Exception("Email server not found")
+    with pytest.raises(ValueError):
+        enrollment.enroll(CAMPAIGN_ID, "user-1", email_server_id="6f1c2d3e-0000-4000-8000-000000000009")
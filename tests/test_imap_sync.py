@@ -0,0 +1,223 @@
+import threading
+import time
+from email.message import EmailMessage
+from types import SimpleNamespace
+
+import pytest
+
+from flask_app.imap_sync import ImapSyncWorker, MailboxSync
+from flask_app.mime_stream import parse_message, synthetic_message
+from tests.imap_stub import IMAPStub
+
+
+class FakeStore:
+    """
+    Stands in for the supabase client: email_servers, mailbox_sync_state and store_inbox_batch.
+
+    Like store_inbox_batch, an email stored under another UIDVALIDITY is
+    re-keyed by Message-ID instead of stored again.
+    """
+
+    def __init__(self, servers=()):
+        self.servers = list(servers)
+        self.states = {}
+        self.inbox = {}
+        self.batches = []
+        self.lock = threading.Lock()
+
+    def rpc(self, name, params):
+        with self.lock:
+            self.batches.append(params)
+            key = params["p_email_server_id"]
+            stored = 0
+            for message in params["p_messages"]:
+                uid_key = (key, params["p_uidvalidity"], message["uid"])
+                stale = [old for old, stored_message in self.inbox.items()
+                         if old[0] == key and old[1] != params["p_uidvalidity"]
+                         and stored_message["message_id"] == message["message_id"]]
+                if stale and uid_key not in self.inbox:
+                    self.inbox[uid_key] = self.inbox.pop(stale[0])
+                elif uid_key not in self.inbox:
+                    self.inbox[uid_key] = message
+                    stored += 1
+            self.states[key] = {"uidvalidity": params["p_uidvalidity"], "last_uid": params["p_last_uid"]}
+        return SimpleNamespace(execute=lambda: SimpleNamespace(data=stored))
+
+    def table(self, name):
+        query = SimpleNamespace()
+        filters = {}
+        query.select = lambda columns: query
+
+        def eq(column, value):
+            filters[column] = value
+            return query
+
+        def execute():
+            if name == "email_servers":
+                return SimpleNamespace(data=self.servers)
+            state = self.states.get(filters.get("email_server_id"))
+            return SimpleNamespace(data=[state] if state else [])
+
+        query.eq = eq
+        query.execute = execute
+        query.upsert = lambda row: SimpleNamespace(execute=lambda: SimpleNamespace(data=[row]))
+        return query
+
+    def subjects(self, server_id):
+        with self.lock:
+            return sorted(message["subject"] for (key, _, _), message in self.inbox.items() if key == server_id)
+
+
+def _server(stub, index=0):
+    return {"id": f"server-{index}", "email_address": f"box{index}@example.com", "password": "secret",
+            "pop_imap_server": f"127.0.0.1:{stub.port}", "use_ssl": False, "use_tls": False}
+
+
+def _raw(subject, body="Hello", sender="Lead <lead@example.org>", html=False):
+    message = EmailMessage()
+    message["From"] = sender
+    message["To"] = "box0@example.com"
+    message["Subject"] = subject
+    message["Message-ID"] = f"<{subject.replace(' ', '-')}@example.org>"
+    message["In-Reply-To"] = "<0190b3a0-0000-7000-8000-000000000001@example.com>"
+    message["References"] = "<first-message-of-the-thread@example.com> <0190b3a0-0000-7000-8000-000000000001@example.com>"
+    message["Date"] = "Mon, 19 Oct 2026 10:00:00 +0000"
+    if html:
+        message.set_content(f"<html><body><p>{body}</p></body></html>", subtype="html")
+    else:
+        message.set_content(body)
+    return message.as_bytes()
+
+
+@pytest.fixture
+def stub():
+    server = IMAPStub()
+    yield server
+    server.stop()
+
+
+def _wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.02)
+    return False
+
+
+def test_parse_message_reads_headers_and_text():
+    """Test sender, reply headers and a text preview from an HTML-only message"""
+    parsed = parse_message(_raw("Re: Offer", body="Sounds   good, call me", html=True))
+
+    assert parsed["sender_email"] == "lead@example.org" and parsed["sender_name"] == "Lead"
+    assert parsed["subject"] == "Re: Offer"
+    assert parsed["body_preview"] == "Sounds good, call me"
+    assert parsed["in_reply_to"] == "<0190b3a0-0000-7000-8000-000000000001@example.com>"
+    assert parsed["references"] == \
+        "<first-message-of-the-thread@example.com> <0190b3a0-0000-7000-8000-000000000001@example.com>"
+    assert parsed["received_at"] == "2026-10-19T10:00:00+00:00"
+
+
+def test_sync_fetches_only_new_uids_in_batches_on_one_connection(stub):
+    """Test batching, the high-water mark across cycles and connection reuse"""
+    for i in range(7):
+        stub.append("box0@example.com", _raw(f"Message {i}"))
+    store = FakeStore()
+    mailbox = MailboxSync(_server(stub), store, batch_size=3)
+
+    assert mailbox.cycle() == 7
+    assert [batch["p_last_uid"] for batch in store.batches] == [3, 6, 7]
+
+    stub.append("box0@example.com", _raw("Message 7"))
+    assert mailbox.cycle() == 1
+    assert mailbox.cycle() == 0
+    mailbox.close()
+
+    assert stub.connections == 1
+    assert stub.fetches[-1] == "8"
+    assert len(store.subjects("server-0")) == 8
+    assert "STORE" not in stub.commands
+
+
+def test_large_message_is_fetched_in_chunks_until_its_text_is_read(stub):
+    """Test that range fetches continue a large message and stop before its attachment"""
+    raw = synthetic_message(attachment_bytes=500000)
+    stub.append("box0@example.com", raw)
+    store = FakeStore()
+    mailbox = MailboxSync(_server(stub), store, chunk_bytes=1024)
+
+    assert mailbox.cycle() == 1
+    mailbox.close()
+
+    stored = next(iter(store.inbox.values()))
+    assert stored["full_body"] == parse_message(raw)["full_body"]
+    assert stored["truncated"] and stored["attachments"] == []
+    assert 1 < stub.fetches.count("1") < 10
+
+
+def test_uidvalidity_change_reads_the_mailbox_again(stub):
+    """Test that a new UIDVALIDITY resets the mark and re-keys stored mail instead of duplicating it"""
+    for i in range(3):
+        stub.append("box0@example.com", _raw(f"Message {i}"))
+    store = FakeStore()
+    MailboxSync(_server(stub), store).cycle()
+
+    stub.reset(uidvalidity=2000)
+    stub.append("box0@example.com", _raw("Message 3"))
+    mailbox = MailboxSync(_server(stub), store)
+    assert mailbox.cycle() == 1
+    mailbox.close()
+
+    assert store.states["server-0"] == {"uidvalidity": 2000, "last_uid": 104}
+    assert sorted(store.inbox) == [("server-0", 2000, uid) for uid in (101, 102, 103, 104)]
+    assert store.subjects("server-0") == [f"Message {i}" for i in range(4)]
+
+
+def test_worker_syncs_many_mailboxes_and_wakes_on_idle(stub):
+    """Test concurrent initial syncs, then that pushed mail arrives through IDLE without polling"""
+    servers = [_server(stub, i) for i in range(12)]
+    for server in servers:
+        for i in range(5):
+            stub.append(server["email_address"], _raw(f"{server['email_address']} {i}"))
+    store = FakeStore(servers)
+    worker = ImapSyncWorker(workers=4, supabase=store, poll_interval=3600, idle_refresh=3600)
+    thread = threading.Thread(target=worker.run)
+    thread.start()
+    try:
+        assert _wait_for(lambda: len(store.inbox) == 60 and len(stub.idlers) == 12)
+        stub.append("box3@example.com", _raw("Pushed"))
+        assert _wait_for(lambda: "Pushed" in store.subjects("server-3"))
+    finally:
+        worker.stop()
+        thread.join(timeout=5)
+
+    assert not thread.is_alive()
+    assert worker.stats["idle_wakeups"] == 1
+    assert stub.connections == 12
+    assert stub.idlers == []
+
+
+def test_worker_polls_servers_without_idle_and_backs_off_on_errors():
+    """Test polling without IDLE, and that a bad login is retried later without stopping the others"""
+    stub = IMAPStub(idle=False)
+    try:
+        good = _server(stub, 0)
+        bad = dict(_server(stub, 1), password="wrong")
+        stub.append(good["email_address"], _raw("First"))
+        store = FakeStore([good, bad])
+        worker = ImapSyncWorker(workers=2, supabase=store, poll_interval=0.1)
+        thread = threading.Thread(target=worker.run)
+        thread.start()
+        try:
+            assert _wait_for(lambda: store.subjects("server-0") == ["First"])
+            stub.append(good["email_address"], _raw("Second"))
+            assert _wait_for(lambda: store.subjects("server-0") == ["First", "Second"])
+        finally:
+            worker.stop()
+            thread.join(timeout=5)
+    finally:
+        stub.stop()
+
+    assert worker.stats["errors"] == 1
+    assert worker.mailboxes["server-1"].failures == 1
+    assert stub.connections == 2
@@ -0,0 +1,122 @@
+import os
+from datetime import datetime, timezone
+from unittest.mock import MagicMock
+
+import pytest
+from flask import Flask
+
+from flask_app import inbox
+from flask_app.routes.inbox import inbox_bp
+
+EMAIL_1 = "11111111-1111-1111-1111-111111111111"
+EMAIL_2 = "22222222-2222-2222-2222-222222222222"
+EMAIL_3 = "33333333-3333-3333-3333-333333333333"
+SERVER_ID = "123e4567-e89b-12d3-a456-426614174000"
+HEADERS = {"X-API-Key": "dev-secret"}
+
+
+@pytest.fixture
+def mock_supabase(monkeypatch):
+    mock = MagicMock()
+    monkeypatch.setattr("flask_app.inbox.create_supabase_client", lambda: mock)
+    return mock
+
+
+@pytest.fixture
+def client():
+    os.environ["DEV_API_KEY"] = "dev-secret"
+    app = Flask(__name__)
+    app.config["ENV"] = "development"
+    app.register_blueprint(inbox_bp)
+    return app.test_client()
+
+
+def _email(email_id, received_at):
+    return {"id": email_id, "received_at": received_at, "subject": "Re: Offer", "is_read": False}
+
+
+def test_cursor_round_trip():
+    """Test that a cursor decodes to its keyset position and that bad cursors are rejected"""
+    received_at = datetime.now(timezone.utc).isoformat()
+    cursor = inbox.encode_cursor(received_at, "<root@example.com>")
+
+    assert inbox.decode_cursor(cursor) == (datetime.fromisoformat(received_at), "<root@example.com>")
+    assert inbox.decode_cursor(None) == (None, None)
+    with pytest.raises(ValueError):
+        inbox.decode_cursor("not-a-cursor")
+    with pytest.raises(ValueError):
+        inbox.decode_cursor(inbox.encode_cursor("2026-10-19T10:00:00", EMAIL_1))
+
+
+def test_pages_fetch_one_extra_row_for_has_more(mock_supabase):
+    """Test the keyset parameters, the has_more probe row and the next cursor"""
+    rows = [_email(EMAIL_3, "2026-10-19T12:00:00+00:00"), _email(EMAIL_2, "2026-10-19T11:00:00+00:00"),
+            _email(EMAIL_1, "2026-10-19T10:00:00+00:00")]
+    mock_supabase.rpc.return_value.execute.return_value = MagicMock(data=rows)
+    since = inbox.encode_cursor("2026-10-19T13:00:00+00:00", EMAIL_1)
+
+    page = inbox.list_emails("owner-1", cursor=since, limit=2, unread_only=True, email_server_id=SERVER_ID)
+
+    assert [email["id"] for email in page["emails"]] == [EMAIL_3, EMAIL_2]
+    assert page["has_more"] is True
+    assert inbox.decode_cursor(page["cursor"]) == (datetime.fromisoformat("2026-10-19T11:00:00+00:00"), EMAIL_2)
+    name, params = mock_supabase.rpc.call_args[0]
+    assert name == "inbox_page"
+    assert params == {"p_owner": "owner-1", "p_before_ts": "2026-10-19T13:00:00+00:00", "p_before_id": EMAIL_1,
+                      "p_limit": 3, "p_unread_only": True, "p_email_server_id": SERVER_ID}
+
+    mock_supabase.rpc.return_value.execute.return_value = MagicMock(data=[])
+    threads = inbox.list_threads("owner-1", cursor=since)
+    assert threads == {"threads": [], "cursor": since, "has_more": False}
+    assert mock_supabase.rpc.call_args[0][0] == "inbox_threads_page"
+
+
+def test_mark_read_needs_a_selection_and_is_one_call(mock_supabase):
+    """Test selector validation and the single mark_inbox_read call"""
+    mock_supabase.rpc.return_value.execute.return_value = MagicMock(data=2)
+
+    with pytest.raises(ValueError):
+        inbox.mark_read("owner-1")
+    with pytest.raises(ValueError):
+        inbox.mark_read("owner-1", ids=["not-a-uuid"])
+    assert mock_supabase.rpc.call_count == 0
+
+    before = datetime(2026, 10, 19, tzinfo=timezone.utc)
+    assert inbox.mark_read("owner-1", ids=[EMAIL_1, EMAIL_2], thread_key="<root@example.com>", before=before) == 2
+    mock_supabase.rpc.assert_called_once_with("mark_inbox_read", {
+        "p_owner": "owner-1", "p_is_read": True, "p_ids": [EMAIL_1, EMAIL_2], "p_email_server_id": None,
+        "p_thread_key": "<root@example.com>", "p_before": before.isoformat(),
+    })
+
+
+def test_inbox_endpoints(mock_supabase, client):
+    """Test counters, paging, mark-read and single-email responses and validation"""
+    mock_supabase.table.return_value.select.return_value.eq.return_value.execute.return_value = MagicMock(data=[
+        {"email_server_id": SERVER_ID, "total": 40, "unread": 3},
+        {"email_server_id": None, "total": 2, "unread": 2},
+    ])
+    response = client.get("/inbox/unread", headers=HEADERS)
+    assert response.status_code == 200
+    assert response.get_json()["total"] == 42 and response.get_json()["unread"] == 5
+
+    mock_supabase.rpc.return_value.execute.return_value = MagicMock(data=[_email(EMAIL_1, "2026-10-19T10:00:00+00:00")])
+    response = client.get("/inbox?unread=true", headers=HEADERS)
+    assert response.status_code == 200
+    assert response.get_json()["has_more"] is False
+    assert mock_supabase.rpc.call_args[0][1]["p_unread_only"] is True
+
+    assert client.get("/inbox?cursor=garbage", headers=HEADERS).status_code == 400
+    assert client.get("/inbox?limit=500", headers=HEADERS).status_code == 400
+    assert client.get("/inbox/not-a-uuid", headers=HEADERS).status_code == 400
+    assert client.get("/inbox/thread", headers=HEADERS).status_code == 400
+
+    mock_supabase.rpc.return_value.execute.return_value = MagicMock(data=7)
+    response = client.post("/inbox/mark-read", json={"all": True}, headers=HEADERS)
+    assert response.status_code == 200 and response.get_json() == {"changed": 7}
+    assert client.post("/inbox/mark-read", json={}, headers=HEADERS).status_code == 400
+    assert client.post("/inbox/mark-read", json={"before": "yesterday"}, headers=HEADERS).status_code == 400
+
+    mock_supabase.table.return_value.select.return_value.eq.return_value.eq.return_value.execute.return_value = \
+        MagicMock(data=[])
+    assert client.get(f"/inbox/{EMAIL_1}", headers=HEADERS).status_code == 404
+    assert client.get("/inbox/unread").status_code == 401
@@ -0,0 +1,110 @@
+import os
+import time
+import numpy as np
+from unittest.mock import MagicMock
+from flask import Flask
+
+from flask_app import lead_scoring
+from flask_app.routes.leads import leads_bp
+
+
+def test_recent_and_stronger_engagement_scores_higher():
+    """Test recency decay, event weights and the 0-100 range"""
+    scores = lead_scoring.score_arrays(
+        lead_idx=[0, 1, 2, 3],
+        age_days=[0, 28, 0, 0],
+        opens=[1, 1, 0, 0],
+        clicks=[0, 0, 0, 0],
+        replies=[0, 0, 1, 0],
+        n_leads=5,
+    )
+
+    assert scores[0] > scores[1] > 0
+    # Two half-lives: a quarter of the raw engagement
+    assert scores[1] == np.float32(round(100 * -np.expm1(-0.25 / lead_scoring.SCORE_SCALE), 2))
+    assert scores[2] > scores[0]
+    assert scores[3] == 0 and scores[4] == 0
+    assert scores.max() <= 100
+
+
+def test_repeat_engagement_is_boosted():
+    """Test that the same engagement spread over more days scores higher"""
+    scores = lead_scoring.score_arrays(
+        lead_idx=[0, 1, 1], age_days=[0, 0, 0], opens=[2, 1, 1],
+        clicks=[0, 0, 0], replies=[0, 0, 0], n_leads=2,
+    )
+    assert scores[1] > scores[0]
+
+
+def test_million_lead_days_score_in_under_a_second():
+    """Test that scoring is vectorized over the whole chunk"""
+    rng = np.random.default_rng(0)
+    rows, leads = 1_000_000, 250_000
+    lead_idx = np.sort(rng.integers(0, leads, rows))
+
+    start = time.perf_counter()
+    scores = lead_scoring.score_arrays(
+        lead_idx, rng.integers(0, 180, rows), rng.poisson(1, rows),
+        rng.poisson(0.2, rows), rng.poisson(0.02, rows), n_leads=leads,
+    )
+    elapsed = time.perf_counter() - start
+
+    assert scores.shape == (leads,)
+    assert elapsed < 1.0
+
+
+def test_score_owner_walks_chunks_and_writes_in_bulk(monkeypatch):
+    """Test the keyset walk: one read and one bulk write per chunk"""
+    mock = MagicMock()
+    chunks = {
+        None: {"last_id": "lead-3", "lead_ids": ["lead-1", "lead-3"], "lead_idx": [0, 0, 1],
+               "age_days": [0, 1, 2], "opens": [1, 1, 0], "clicks": [0, 0, 0], "replies": [0, 0, 1]},
+        "lead-3": {"last_id": "lead-5", "lead_ids": None, "lead_idx": None,
+                   "age_days": None, "opens": None, "clicks": None, "replies": None},
+        "lead-5": {"last_id": None},
+    }
+
+    def rpc(name, params):
+        call = MagicMock()
+        if name == "lead_engagement_chunk":
+            call.execute.return_value = MagicMock(data=[chunks[params["p_after"]]])
+        else:
+            call.execute.return_value = MagicMock(data=len(params["p_lead_ids"]))
+        return call
+
+    mock.rpc.side_effect = rpc
+    monkeypatch.setattr('flask_app.lead_scoring.create_supabase_client', lambda: mock)
+
+    assert lead_scoring.score_owner("owner-1", chunk_size=3) == {"leads": 2, "updated": 2}
+
+    writes = [c[0][1] for c in mock.rpc.call_args_list if c[0][0] == "apply_lead_scores"]
+    assert [(w["p_after"], w["p_until"]) for w in writes] == [(None, "lead-3"), ("lead-3", "lead-5")]
+    assert writes[0]["p_lead_ids"] == ["lead-1", "lead-3"]
+    assert len(writes[0]["p_scores"]) == 2
+    # A chunk without engagement still resets its leads to 0
+    assert writes[1]["p_lead_ids"] == []
+
+
+def test_list_leads_sorted_by_score(monkeypatch):
+    """Test /leads?sort=score orders by score with a stable tiebreak"""
+    os.environ["DEV_API_KEY"] = "dev-secret"
+    mock = MagicMock()
+    owner_query = mock.table.return_value.select.return_value.eq.return_value
+    owner_query.execute.return_value = MagicMock(count=1)
+    ordered = owner_query.order.return_value.order.return_value
+    ordered.range.return_value.execute.return_value = MagicMock(data=[{"id": "lead-1", "engagement_score": 87.5}])
+    monkeypatch.setattr('flask_app.routes.leads.create_supabase_client', lambda: mock)
+
+    app = Flask(__name__)
+    app.config["ENV"] = "development"
+    app.register_blueprint(leads_bp)
+    client = app.test_client()
+
+    response = client.get('/leads?sort=score', headers={"X-API-Key": "dev-secret"})
+
+    assert response.status_code == 200
+    assert response.get_json()["items"][0]["engagement_score"] == 87.5
+    owner_query.order.assert_called_once_with("engagement_score", desc=True)
+    owner_query.order.return_value.order.assert_called_once_with("id")
+
+    assert client.get('/leads?sort=email', headers={"X-API-Key": "dev-secret"}).status_code == 400
@@ -0,0 +1,110 @@
+import json
+import os
+from unittest.mock import MagicMock
+
+from flask_app import live_events
+from flask_app.live_events import Broadcaster, format_sse
+
+
+def _local_broadcaster(**kwargs):
+    return Broadcaster(redis_getter=lambda: None, **kwargs)
+
+
+def test_messages_fan_out_to_all_clients_of_an_owner():
+    """Test that every client of the owner gets the message and nobody else"""
+    broadcaster = _local_broadcaster()
+    first = broadcaster.subscribe("owner-1")
+    second = broadcaster.subscribe("owner-1")
+    other = broadcaster.subscribe("owner-2")
+
+    broadcaster.publish("owner-1", "stats", {"replies": 3})
+
+    assert first.get_nowait() == ("stats", {"replies": 3})
+    assert second.get_nowait() == ("stats", {"replies": 3})
+    assert other.empty()
+
+    broadcaster.unsubscribe("owner-1", first)
+    broadcaster.unsubscribe("owner-1", second)
+    broadcaster.unsubscribe("owner-2", other)
+    assert broadcaster.client_count() == 0
+
+
+def test_slow_client_drops_oldest_message():
+    """Test that a full client queue never blocks the publisher"""
+    broadcaster = _local_broadcaster(queue_size=2)
+    client_queue = broadcaster.subscribe("owner-1")
+    for i in range(3):
+        broadcaster.deliver("owner-1", "stats", {"n": i})
+
+    assert [client_queue.get_nowait()[1]["n"] for _ in range(2)] == [1, 2]
+
+
+def test_stream_yields_messages_and_heartbeats():
+    """Test the SSE framing of the stream generator"""
+    broadcaster = _local_broadcaster()
+    stream = broadcaster.stream("owner-1", heartbeat=0.01)
+
+    assert next(stream).startswith("retry:")
+    assert next(stream) == ": keepalive\n\n"
+
+    broadcaster.publish("owner-1", "emails", {"emails": []})
+    assert next(stream) == 'event: emails\ndata: {"emails":[]}\n\n'
+
+    stream.close()
+    assert broadcaster.client_count() == 0
+
+
+def test_publish_goes_through_redis_when_configured():
+    """Test that messages are published on the owner's channel"""
+    redis = MagicMock()
+    broadcaster = Broadcaster(redis_getter=lambda: redis)
+    broadcaster.publish("owner-1", "stats", {"replies": 1})
+
+    channel, message = redis.publish.call_args[0]
+    assert channel == "live:owner-1"
+    assert json.loads(message) == {"type": "stats", "data": {"replies": 1}}
+
+
+def test_publish_email_updates_groups_by_owner(monkeypatch):
+    """Test that one batch becomes one emails and one stats message per owner"""
+    broadcaster = _local_broadcaster()
+    monkeypatch.setattr(live_events, "broadcaster", broadcaster)
+    get_overviews = MagicMock(return_value={"owner-1": {"replies": 2}, "owner-2": {"replies": 0}})
+    monkeypatch.setattr(live_events.stats_engine, "get_overviews", get_overviews)
+    client_queue = broadcaster.subscribe("owner-1")
+
+    live_events.publish_email_updates([
+        {"email_id": "e1", "owner": "owner-1", "campaign_id": "c1", "status": "replied"},
+        {"email_id": "e2", "owner": "owner-1", "campaign_id": "c1", "status": "opened"},
+        {"email_id": "e3", "owner": "owner-2", "campaign_id": "c2", "status": "opened"},
+    ])
+
+    get_overviews.assert_called_once()
+    event_type, data = client_queue.get_nowait()
+    assert event_type == "emails"
+    assert [email["email_id"] for email in data["emails"]] == ["e1", "e2"]
+    assert client_queue.get_nowait() == ("stats", {"replies": 2})
+    assert client_queue.empty()
+
+
+def test_stream_endpoint(monkeypatch):
+    """Test that /live/stream answers with an event stream"""
+    from flask_app import create_app
+    os.environ["FLASK_ENV"] = "development"
+    os.environ["DEV_API_KEY"] = "dev-secret"
+    client = create_app().test_client()
+
+    response = client.get('/live/stream', headers={"X-API-Key": "dev-secret"}, buffered=False)
+
+    assert response.status_code == 200
+    assert response.mimetype == "text/event-stream"
+    assert response.headers["Cache-Control"] == "no-cache"
+    assert next(response.response).decode().startswith("retry:")
+    response.close()
+
+    assert client.get('/live/stream').status_code == 401
+
+
+def test_format_sse():
+    """Test compact JSON framing"""
+    assert format_sse("stats", {"a": 1}) == 'event: stats\ndata: {"a":1}\n\n'
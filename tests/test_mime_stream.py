@@ -0,0 +1,91 @@
+import binascii
+import os
+import tracemalloc
+from email import message_from_bytes, policy
+
+from flask_app.mime_stream import SpillDirectory, benchmark, parse_message, parse_stream, synthetic_message
+
+
+def _chunks(raw, size):
+    return (raw[i:i + size] for i in range(0, len(raw), size))
+
+
+def _mixed(text_part, attachment, encoding="base64"):
+    return (b'From: "Lead" <Lead@Example.org>\r\nTo: box@example.com\r\nSubject: =?utf-8?q?R=C3=A9ponse?=\r\n'
+            b'Content-Type: multipart/mixed; boundary="b1"\r\n\r\npreamble\r\n--b1\r\n' + text_part +
+            b'\r\n--b1\r\nContent-Type: application/octet-stream\r\n'
+            b'Content-Transfer-Encoding: ' + encoding.encode() + b'\r\n'
+            b'Content-Disposition: attachment; filename="../quote 2026.bin"\r\n\r\n' + attachment +
+            b"\r\n--b1--\r\nepilogue")
+
+
+def test_any_chunking_gives_the_email_package_result():
+    """Test nested multiparts, quoted-printable and base64 parts fed one byte at a time and whole"""
+    raw = synthetic_message(attachment_bytes=3000)
+    expected = message_from_bytes(raw, policy=policy.default).get_body(("plain",)).get_content()
+
+    whole = parse_message(raw)
+
+    assert whole == parse_stream(_chunks(raw, 1)) == parse_stream(_chunks(raw, 77))
+    assert whole["full_body"] == expected
+    assert whole["body_preview"].startswith("Line 0: thanks for reaching out, café at 10 works for me. Line 1:")
+    assert len(whole["body_preview"]) == 200
+    assert whole["in_reply_to"] == "<0190b3a0-0000-7000-8000-000000000001@example.com>"
+    assert whole["attachments"] == [{"filename": "offer.pdf", "content_type": "application/pdf", "size": 3000}]
+    assert not whole["truncated"]
+
+
+def test_attachments_are_spilled_exactly_and_text_is_capped(tmp_path):
+    """Test byte-exact binary and base64 spills, long lines, and the text limit"""
+    payload = os.urandom(200000).replace(b"\n--", b"\n-x")
+    text = b"Content-Type: text/plain; charset=utf-8\r\nContent-Transfer-Encoding: quoted-printable\r\n\r\n" + \
+        binascii.b2a_qp(("é" * 30000).encode(), istext=True)
+    encoded = binascii.b2a_base64(payload)
+
+    for raw in (_mixed(text, payload, "binary"), _mixed(text, encoded)):
+        parsed = parse_stream(_chunks(raw, 1000), store=SpillDirectory(str(tmp_path)), max_line_bytes=4096)
+        attachment = parsed["attachments"][0]
+        assert parsed["full_body"] == "é" * 30000
+        assert parsed["sender_email"] == "lead@example.org" and parsed["subject"] == "Réponse"
+        assert attachment["size"] == len(payload)
+        assert os.path.dirname(attachment["path"]) == str(tmp_path)
+        assert attachment["path"].endswith("-.._quote_2026.bin")
+        with open(attachment["path"], "rb") as f:
+            assert f.read() == payload
+
+    capped = parse_message(_mixed(text, encoded), max_text_chars=100)
+    assert capped["full_body"] == "é" * 100 and capped["truncated"]
+
+
+def test_html_only_single_part_and_cut_off_messages():
+    """Test the HTML fallback, a closing boundary without line ending, and a message cut short"""
+    html = (b"From: lead@example.org\r\nContent-Type: text/html; charset=iso-8859-1\r\n\r\n"
+            b"<p>Caf\xe9   at <b>ten</b></p>")
+    assert parse_message(html)["body_preview"] == "Café at ten"
+
+    raw = synthetic_message(attachment_bytes=50000)
+    cut = parse_message(raw[:len(raw) // 2])
+    assert cut["truncated"] and cut["full_body"].startswith("Line 0")
+    assert cut["attachments"][0]["size"] < 50000
+
+
+def test_memory_stays_bounded_by_the_chunk_not_the_message():
+    """Test that peak memory of an 8 MB attachment stays far below the message size"""
+    raw = synthetic_message(attachment_bytes=8 * 1024 * 1024)
+    view = memoryview(raw)
+
+    tracemalloc.start()
+    parsed = parse_stream(view[i:i + 65536] for i in range(0, len(view), 65536))
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    assert parsed["attachments"][0]["size"] == 8 * 1024 * 1024
+    assert peak < 1024 * 1024
+
+
+def test_benchmark_reports_throughput_and_memory():
+    """Test the bundled benchmark on a small run"""
+    result = benchmark(messages=20, attachment_mb=1, every=5)
+
+    assert result["messages"] == 20 and result["messages_per_second"] > 0
+    assert result["peak_bytes"] < result["email_package_peak_bytes"]
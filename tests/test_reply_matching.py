@@ -0,0 +1,71 @@
+from types import SimpleNamespace
+
+from flask_app.reply_matching import match_replies
+
+EMAIL_ID = "0190b3a0-0000-7000-8000-000000000001"
+
+
+class FakeInbox:
+    """Stands in for match_inbox_replies: hands out checked rows in batches of p_limit"""
+
+    def __init__(self, rows):
+        self.rows = list(rows)
+        self.calls = 0
+
+    def rpc(self, name, params):
+        assert name == "match_inbox_replies"
+        self.calls += 1
+        batch, self.rows = self.rows[:params["p_limit"]], self.rows[params["p_limit"]:]
+        return SimpleNamespace(execute=lambda: SimpleNamespace(data=batch))
+
+
+def _row(i, email_id=EMAIL_ID):
+    return {"inbox_email_id": f"inbox-{i}", "email_id": email_id, "owner": "user-1",
+            "sender_email": "lead@example.org", "subject": "Re: Offer", "body_preview": "Sounds good",
+            "received_at": "2026-10-19T10:00:00+00:00"}
+
+
+def test_matched_replies_become_reply_events_in_batches():
+    """Test one dispatch per batch, skipped unmatched rows and the event contents"""
+    inbox = FakeInbox([_row(i, None if i % 3 == 0 else EMAIL_ID) for i in range(7)])
+    batches = []
+
+    result = match_replies(batch_size=3, supabase=inbox, dispatch=batches.append)
+
+    assert result == {"checked": 7, "matched": 4, "archived": 0}
+    assert [len(batch) for batch in batches] == [2, 2]
+    assert inbox.calls == 3
+    event = batches[0][0]
+    assert event["event_type"] == "reply" and event["email_id"] == EMAIL_ID
+    assert event["ts"] == "2026-10-19T10:00:00+00:00"
+    assert event["metadata"] == {"inbox_email_id": "inbox-1", "from": "lead@example.org",
+                                 "subject": "Re: Offer", "reply_content": "Sounds good"}
+
+
+def test_run_is_bounded_and_failed_dispatch_is_dead_lettered(monkeypatch):
+    """Test max_batches, and that replies whose dispatch fails are kept as dead letters"""
+    stored = []
+    monkeypatch.setattr("flask_app.reply_matching.store_dead_letters",
+                        lambda events, error: stored.append((events, str(error))))
+
+    def dispatch(events):
+        raise RuntimeError("broker down")
+
+    inbox = FakeInbox([_row(i) for i in range(10)])
+    result = match_replies(batch_size=2, max_batches=3, supabase=inbox, dispatch=dispatch)
+
+    assert result == {"checked": 6, "matched": 6, "archived": 0}
+    assert len(inbox.rows) == 4
+    assert [len(events) for events, _ in stored] == [2, 2, 2]
+    assert stored[0][1] == "broker down"
+
+
+def test_replies_to_archived_sends_are_linked_without_events():
+    """Test that late replies matched in the archive are counted but not sent to the pipeline"""
+    rows = [_row(0), {**_row(1), "archived": True}]
+    batches = []
+
+    result = match_replies(batch_size=10, supabase=FakeInbox(rows), dispatch=batches.append)
+
+    assert result == {"checked": 2, "matched": 1, "archived": 1}
+    assert [event["metadata"]["inbox_email_id"] for event in batches[0]] == ["inbox-0"]
@@ -0,0 +1,102 @@
+import os
+import pytest
+from datetime import datetime, timedelta, timezone
+from unittest.mock import MagicMock
+
+from flask_app import rollups
+
+
+@pytest.fixture
+def client():
+    from flask_app import create_app
+    os.environ["FLASK_ENV"] = "development"
+    os.environ["DEV_API_KEY"] = "dev-secret"
+    return create_app().test_client()
+
+
+@pytest.fixture
+def mock_supabase(monkeypatch):
+    """Create and configure a MagicMock for Supabase client"""
+    mock = MagicMock()
+    mock.rpc.return_value.execute.return_value = MagicMock(data=[])
+    monkeypatch.setattr('flask_app.rollups.create_supabase_client', lambda: mock)
+    return mock
+
+
+def _recent(days_ago):
+    today = rollups.truncate(datetime.now(timezone.utc), "day")
+    return today - timedelta(days=days_ago)
+
+
+def test_series_is_zero_filled_per_bucket(mock_supabase):
+    """Test that buckets without rollup rows are returned as zeros"""
+    start = _recent(3)
+    mock_supabase.rpc.return_value.execute.return_value = MagicMock(data=[
+        {"bucket": (start + timedelta(days=1)).isoformat(), "sent": 10, "opens": 7, "opened": 4}
+    ])
+
+    series = rollups.get_series("user-1", start, start + timedelta(days=3))
+
+    assert [point["bucket"] for point in series] == [
+        (start + timedelta(days=i)).isoformat() for i in range(3)
+    ]
+    assert series[0]["sent"] == 0
+    assert series[1]["sent"] == 10
+    assert series[1]["opened"] == 4
+    assert series[1]["clicks"] == 0
+
+    name, params = mock_supabase.rpc.call_args[0]
+    assert name == "email_rollup_series"
+    assert params["p_grain"] == "day"
+    assert params["p_owner"] == "user-1"
+
+
+def test_hourly_series_uses_daily_buckets_past_retention(mock_supabase):
+    """Test that hourly ranges fall back to day buckets beyond the hourly retention"""
+    start = _recent(rollups.HOURLY_RETENTION_DAYS + 2)
+    end = _recent(rollups.HOURLY_RETENTION_DAYS - 1)
+
+    series = rollups.get_series("user-1", start, end, granularity="hour")
+
+    granularities = [point["granularity"] for point in series]
+    assert granularities[:2] == ["day", "day"]
+    assert granularities.count("hour") == 24
+    assert len(series) == 2 + 24
+
+
+def test_series_rejects_bad_ranges(mock_supabase):
+    """Test that unknown granularities and inverted ranges are rejected"""
+    start = _recent(1)
+    with pytest.raises(ValueError):
+        rollups.get_series("user-1", start, start + timedelta(days=1), granularity="minute")
+    with pytest.raises(ValueError):
+        rollups.get_series("user-1", start, start)
+    mock_supabase.rpc.assert_not_called()
+
+
+def test_series_endpoint(client, mock_supabase):
+    """Test the /stats/series endpoint and its validation"""
+    response = client.get(
+        '/stats/series?from=2026-01-01&to=2026-01-08&granularity=day',
+        headers={"X-API-Key": "dev-secret"}
+    )
+    assert response.status_code == 200
+    data = response.get_json()
+    assert data["granularity"] == "day"
+    assert len(data["series"]) == 7
+
+    response = client.get('/stats/series?granularity=week', headers={"X-API-Key": "dev-secret"})
+    assert response.status_code == 400
+
+
+def test_reconcile_recomputes_recent_buckets(mock_supabase):
+    """Test that the reconcile job recomputes the last days of buckets"""
+    mock_supabase.rpc.return_value.execute.return_value = MagicMock(data=3)
+
+    assert rollups.reconcile(days=7) == 3
+
+    name, params = mock_supabase.rpc.call_args[0]
+    assert name == "reconcile_email_rollups"
+    since = datetime.fromisoformat(params["p_since"])
+    assert timedelta(days=6, hours=23) < datetime.now(timezone.utc) - since < timedelta(days=7, hours=1)
+    assert params["p_hourly_retention"] == f"{rollups.HOURLY_RETENTION_DAYS} days"
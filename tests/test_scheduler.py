@@ -0,0 +1,97 @@
+import random
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+from flask_app.scheduler import SequenceScheduler, TimingWheel
+
+START = 1_800_000_000.0
+
+
+class FakeSchedule:
+    """Stands in for the supabase client over an in-memory sequence_schedule"""
+
+    def __init__(self, due_times, clock):
+        self.pending = {f"step-{i}": due for i, due in enumerate(due_times)}
+        self.clock = clock
+        self.calls = []
+
+    def rpc(self, name, params):
+        self.calls.append((name, params))
+        if name == "schedule_window":
+            start = datetime.fromisoformat(params["p_from"]).timestamp()
+            until = datetime.fromisoformat(params["p_until"]).timestamp()
+            after = (datetime.fromisoformat(params["p_after_due"]).timestamp(), params["p_after_id"]) \
+                if params["p_after_due"] else (float("-inf"), "")
+            rows = sorted((due, step) for step, due in self.pending.items()
+                          if start <= due < until and (due, step) > after)[:params["p_limit"]]
+            data = [{"id": step, "due_at": datetime.fromtimestamp(due, tz=timezone.utc).isoformat()}
+                    for due, step in rows]
+        else:
+            now = self.clock()
+            ids = params["p_ids"] if params["p_ids"] is not None else list(self.pending)
+            ready = [step for step in ids if self.pending.get(step, float("inf")) <= now][:params["p_limit"]]
+            for step in ready:
+                del self.pending[step]
+            data = len(ready)
+        return SimpleNamespace(execute=lambda: SimpleNamespace(data=data))
+
+
+def test_timing_wheel_fires_each_item_on_its_tick():
+    """Test that items across all levels and the overflow fire exactly when due"""
+    rng = random.Random(7)
+    wheel = TimingWheel(START, sizes=(8, 8, 8))
+    due = {f"item-{i}": START + rng.randrange(0, 2000) for i in range(500)}
+    for item, at in due.items():
+        wheel.add(item, at)
+
+    fired = {}
+    for second in range(0, 2001):
+        for item in wheel.advance(START + second):
+            fired[item] = START + second
+
+    assert fired == due
+    assert wheel.count == 0
+
+
+def test_past_due_items_fire_on_the_next_tick():
+    """Test that adding an overdue item does not lose it"""
+    wheel = TimingWheel(START)
+    wheel.advance(START + 10)
+    wheel.add("late", START + 3)
+
+    assert wheel.advance(START + 10) == []
+    assert wheel.advance(START + 11) == ["late"]
+
+
+def test_scheduler_sweeps_then_promotes_from_the_window():
+    """Test recovery, on-time promotion in batches and that only the window is in memory"""
+    now = [START]
+    schedule = FakeSchedule([START - 60] * 3 + [START + 5] * 5 + [START + 3600], lambda: now[0])
+    scheduler = SequenceScheduler(supabase=schedule, window_seconds=600, batch_size=2, clock=lambda: now[0])
+
+    scheduler.recover()
+
+    assert scheduler.stats["swept"] == 3
+    assert scheduler.wheel.count == 5
+
+    now[0] = START + 5
+    assert scheduler.tick() == 5
+    promotions = [params for name, params in schedule.calls if name == "promote_schedule" and params["p_ids"]]
+    assert [len(params["p_ids"]) for params in promotions] == [2, 2, 1]
+    assert list(schedule.pending) == ["step-8"]
+
+
+def test_window_load_is_capped():
+    """Test that a dense window is loaded in parts up to max_loaded"""
+    now = [START]
+    schedule = FakeSchedule([START + i for i in range(1, 11)], lambda: now[0])
+    scheduler = SequenceScheduler(supabase=schedule, window_seconds=600, page_size=3, max_loaded=4,
+                                  clock=lambda: now[0])
+
+    scheduler.recover()
+
+    assert scheduler.wheel.count == 4
+    assert scheduler.loaded_until == START + 4
+    now[0] = START + 4
+    scheduler.tick()
+    assert scheduler.load_window(now[0]) == 4
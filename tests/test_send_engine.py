@@ -0,0 +1,210 @@
+import email
+import threading
+import uuid
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+import pytest
+
+from flask_app import rendering
+from flask_app.send_engine import SendEngine, Throttle, TokenBucket
+from flask_app.smtp_pool import SMTPPoolManager
+from tests.smtp_sink import SMTPSink
+
+
+class FakeQueue:
+    """Stands in for the supabase client: claim_send_batch, sender_pool, complete_send_batch and row reads"""
+
+    def __init__(self, rows, servers, steps):
+        self.rows = list(rows)
+        self.servers = servers
+        self.tables = {"campaign_steps": steps, "step_variants": []}
+        self.results = []
+        self.lock = threading.Lock()
+
+    def rpc(self, name, params):
+        if name == "claim_send_batch":
+            with self.lock:
+                batch, self.rows = self.rows[:params["p_limit"]], self.rows[params["p_limit"]:]
+            data = batch
+        elif name == "sender_pool":
+            data = [{"server": server, "daily_quota": server.get("daily_quota"), "used_today": 0}
+                    for server in self.servers if params["p_owner"] == "user-1"]
+        else:
+            self.results.extend(params["p_results"])
+            data = []
+        return SimpleNamespace(execute=lambda: SimpleNamespace(data=data))
+
+    def table(self, name):
+        rows = self.tables[name]
+        query = SimpleNamespace()
+        query.select = lambda columns: query
+        query.in_ = lambda column, ids: SimpleNamespace(
+            execute=lambda: SimpleNamespace(data=[row for row in rows if row["id"] in ids]))
+        return query
+
+    def outcomes(self):
+        counts = {}
+        for result in self.results:
+            counts[result["outcome"]] = counts.get(result["outcome"], 0) + 1
+        return counts
+
+
+@pytest.fixture
+def sink():
+    server = SMTPSink(refuse="nobody@")
+    yield server
+    server.stop()
+
+
+@pytest.fixture(autouse=True)
+def tracking_env(monkeypatch):
+    monkeypatch.setenv("TRACKING_SECRET", "test-secret")
+    monkeypatch.setenv("TRACKING_BASE_URL", "https://t.example.com")
+
+
+def _servers(sink, count):
+    return [{
+        "id": f"server-{i}", "smtp_server": "127.0.0.1", "smtp_port": sink.port,
+        "email_address": f"sender{i}@example.com", "password": "secret",
+        "use_ssl": False, "use_tls": False, "max_connections": 4,
+    } for i in range(count)]
+
+
+def _rows(count, servers, domains=("example.org",), recipient="lead{i}@{domain}", pinned=None):
+    now = datetime.now(timezone.utc).isoformat()
+    return [{
+        "id": str(uuid.uuid4()), "email_id": str(uuid.uuid4()), "owner": "user-1",
+        "campaign_id": "campaign-1", "lead_id": f"lead-{i}", "step_id": "step-1", "variant_id": None,
+        "email_server_id": servers[i % len(servers)]["id"] if pinned else None, "pinned": pinned,
+        "scheduled_at": now, "attempts": 1,
+        "lead": {"email": recipient.format(i=i, domain=domains[i % len(domains)]), "bedrijf": f"Company {i}"},
+    } for i in range(count)]
+
+
+STEP = {"id": "step-1", "subject": "Hi {{company}}",
+        "html": '<html><body><p>Hello {{company}}</p><a href="https://example.com/x">x</a></body></html>'}
+
+
+def _engine(queue, throttle=None, **options):
+    options.setdefault("poll_interval", 0.05)
+    options.setdefault("flush_interval", 0.05)
+    return SendEngine(worker_id="test", supabase=queue, throttle=throttle or Throttle(0, 1, 0, 1),
+                      pools=SMTPPoolManager(reap_interval=0), redis_getter=lambda: None, **options)
+
+
+def test_token_bucket_allows_burst_then_rate():
+    """Test that a bucket admits burst sends at once and then one per interval"""
+    bucket = TokenBucket(rate=10, burst=3)
+    for _ in range(3):
+        assert bucket.earliest(100.0) == 100.0
+        bucket.take(100.0)
+
+    assert round(bucket.earliest(100.0), 3) == 100.1
+    assert TokenBucket(rate=0).earliest(100.0) == 100.0
+
+
+def test_throttle_needs_both_buckets():
+    """Test that a send takes a token from its sender and its domain, or from neither"""
+    throttle = Throttle(sender_rate_per_minute=600, sender_burst=1, domain_rate_per_minute=60, domain_burst=1)
+
+    assert throttle.acquire("s1", "gmail.com", 0.0) == 0.0
+    assert throttle.acquire("s2", "gmail.com", 0.0) == 1.0
+    assert round(throttle.acquire("s1", "outlook.com", 0.0), 3) == 0.1
+    assert throttle.acquire("s1", "outlook.com", 0.1) == 0.0
+    assert round(throttle.acquire("s2", "gmail.com", 0.5), 3) == 0.5
+    assert throttle.projected("s2", "gmail.com", 0.5, queued=2) == 3.0
+
+
+def test_render_fills_placeholders_and_tracks_links():
+    """Test placeholders, HTML escaping, click rewriting and the open pixel"""
+    raw = rendering.build_message(
+        "0190b3a0-0000-7000-8000-000000000001", "me@example.com", "lead@example.org",
+        "Hi {{company}}{{firstName}}", STEP["html"], {"bedrijf": "A & B"},
+    )
+    message = email.message_from_bytes(raw)
+    html = message.get_payload()[1].get_payload(decode=True).decode()
+
+    assert message["Subject"] == "Hi A & B"
+    assert message["Message-ID"] == "<0190b3a0-0000-7000-8000-000000000001@example.com>"
+    assert "Hello A &amp; B" in html
+    assert 'href="https://t.example.com/t/c/' in html and "https://example.com/x" not in html
+    assert html.index("/t/o/") < html.index("</body>")
+
+
+def test_lead_data_cannot_add_headers():
+    """Test that line breaks in lead fields are folded out of the subject"""
+    raw = rendering.build_message(str(uuid.uuid4()), "me@example.com", "lead@example.org",
+                                  "Hi {{company}}", "<p>x</p>", {"bedrijf": "A\r\nBcc: victim@example.com"})
+    message = email.message_from_bytes(raw)
+
+    assert message["Bcc"] is None
+    assert message["Subject"] == "Hi A Bcc: victim@example.com"
+
+
+def test_engine_sends_and_records_outcomes(sink):
+    """Test that sends, refusals and unsendable rows are recorded in one write-back"""
+    servers = _servers(sink, 1)
+    rows = _rows(5, servers) + _rows(1, servers, recipient="nobody@example.org")
+    rows.append(dict(rows[0], id="no-server", owner="user-2"))
+    queue = FakeQueue(rows, servers, [STEP])
+
+    stats = _engine(queue).run(until_idle=True)
+
+    assert queue.outcomes() == {"sent": 5, "failed": 1, "retry": 1}
+    assert len(sink.messages) == 5
+    assert stats["sent"] == 5 and stats["in_flight"] == 0
+    retry = next(result for result in queue.results if result["id"] == "no-server")
+    assert retry["retry_at"] > retry["sent_at"]
+    sent = next(result for result in queue.results if result["outcome"] == "sent")
+    assert sent["message_id"] == f"<{sent['email_id']}@example.com>"
+
+
+def test_domain_throttle_spaces_sends_and_hands_back_the_rest(sink):
+    """Test that each domain is spaced by its bucket and overflow past the lease is deferred"""
+    servers = _servers(sink, 1)
+    rows = _rows(6, servers, domains=("slow.example",)) + _rows(4, servers, domains=("fast.example",))
+    queue = FakeQueue(rows, servers, [STEP])
+    throttle = Throttle(0, 1, domain_rate_per_minute=300, domain_burst=1)
+
+    # Messages may wait 0.8 of a 1.2s lease for tokens: room for five sends at 5/s
+    stats = _engine(queue, throttle=throttle, lease_seconds=1.2).run(until_idle=True)
+
+    assert queue.outcomes() == {"sent": 9, "deferred": 1}
+    waits = stats["throttle_waits"]
+    assert waits["throttled"] == 4 + 3
+    assert waits["top_domains"]["slow.example"] > waits["top_domains"]["fast.example"]
+    deferred = next(result for result in queue.results if result["outcome"] == "deferred")
+    assert deferred["retry_at"] > deferred["sent_at"]
+
+
+def test_engine_throughput_against_local_smtp(sink):
+    """Test that one engine sustains tens of thousands of messages per hour"""
+    servers = _servers(sink, 4)
+    queue = FakeQueue(_rows(2000, servers, domains=("a.example", "b.example", "c.example"), pinned="queue"),
+                      servers, [STEP])
+
+    stats = _engine(queue, workers=16, batch_size=500).run(until_idle=True)
+
+    assert queue.outcomes() == {"sent": 2000}
+    assert len(sink.messages) == 2000
+    assert stats["throughput_per_hour"] > 50000
+
+
+def test_outcomes_of_reclaimed_leases_are_counted_as_stale():
+    """Test that results ignored by complete_send_batch after a lease expired are reported"""
+    queue = FakeQueue([], [], [])
+    queue.rpc = lambda name, params: SimpleNamespace(
+        execute=lambda: SimpleNamespace(data=[{"logged": 1, "rescheduled": 0, "stale": 1}]))
+    engine = _engine(queue)
+    engine._results.extend([
+        {"id": "q-1", "email_id": "e-1", "outcome": "sent"},
+        {"id": "q-2", "email_id": "e-old", "outcome": "sent"},
+    ])
+
+    engine._flush(force=True)
+
+    snapshot = engine.stats.snapshot()
+    assert snapshot["recorded"] == 2
+    assert snapshot["stale"] == 1
+    assert not engine._results
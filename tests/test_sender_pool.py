@@ -0,0 +1,177 @@
+import os
+import smtplib
+import socket
+from types import SimpleNamespace
+from unittest.mock import MagicMock
+
+import pytest
+from flask import Flask
+
+from flask_app.sender_pool import SenderPool, SenderUnavailable, merge_health
+from flask_app.send_engine import SendEngine, Throttle
+from flask_app.smtp_pool import SMTPPoolManager
+from flask_app.routes.email_servers import email_servers_bp
+from tests.smtp_sink import SMTPSink
+from tests.test_send_engine import STEP, FakeQueue, _rows, _servers
+
+
+class FakePool:
+    """Stands in for the supabase client's sender_pool rpc"""
+
+    def __init__(self, entries):
+        self.entries = entries
+        self.calls = 0
+
+    def rpc(self, name, params):
+        self.calls += 1
+        return SimpleNamespace(execute=lambda: SimpleNamespace(data=self.entries))
+
+
+def _entry(server_id, quota=None, used=0, sender_id=None):
+    return {"server": {"id": server_id, "email_address": f"{server_id}@example.com"},
+            "sender_id": sender_id, "daily_quota": quota, "used_today": used}
+
+
+def _row(lead, pinned=None, server_id=None, attempts=1):
+    return {"owner": "user-1", "campaign_id": "campaign-1", "lead_id": lead,
+            "email_server_id": server_id, "pinned": pinned, "attempts": attempts}
+
+
+def test_rotation_weights_by_remaining_quota_and_is_sticky():
+    """Test that unpinned leads spread by quota left and a lead maps to the same server"""
+    pool = SenderPool(FakePool([_entry("a", quota=100000), _entry("b", quota=100000, used=75000)]))
+
+    chosen = [pool.choose(_row(f"lead-{i}"))["id"] for i in range(4000)]
+
+    share_a = chosen.count("a") / len(chosen)
+    assert 0.75 < share_a < 0.85
+    assert pool.choose(_row("lead-7"))["id"] == chosen[7]
+    assert pool.choose(_row("lead-7", pinned="thread", server_id="b"))["id"] == "b"
+
+
+def test_breaker_opens_fails_over_and_probes():
+    """Test that repeated server errors take a server out, threads fail over and a probe restores it"""
+    now = [0.0]
+    pool = SenderPool(FakePool([_entry("a"), _entry("b")]), failure_threshold=3, cooldown=30,
+                      failover_attempts=2, clock=lambda: now[0])
+    for _ in range(3):
+        pool.record("a", error=ConnectionRefusedError("refused"))
+    pool.record("b", error=smtplib.SMTPRecipientsRefused({"x@example.org": (550, b"no")}))
+
+    assert pool.snapshot()["a"]["state"] == "open"
+    assert pool.snapshot()["b"]["state"] == "closed"
+    assert {pool.choose(_row(f"lead-{i}"))["id"] for i in range(50)} == {"b"}
+    with pytest.raises(SenderUnavailable) as waiting:
+        pool.choose(_row("lead-1", pinned="thread", server_id="a", attempts=1))
+    assert waiting.value.counts_attempt
+    assert pool.choose(_row("lead-1", pinned="thread", server_id="a", attempts=2))["id"] == "b"
+    with pytest.raises(SenderUnavailable) as deferred:
+        pool.choose(_row("lead-1", pinned="queue", server_id="a"))
+    assert not deferred.value.counts_attempt and deferred.value.retry_in == 30
+
+    now[0] = 31.0
+    assert pool.choose(_row("lead-1", pinned="queue", server_id="a"))["id"] == "a"
+    with pytest.raises(SenderUnavailable):
+        pool.choose(_row("lead-2", pinned="queue", server_id="a"))
+    pool.record("a", latency=0.2)
+    assert pool.snapshot()["a"]["state"] == "closed"
+
+
+def test_exhausted_quota_defers_without_an_attempt():
+    """Test that servers out of quota take nothing and the message waits for quota"""
+    pool = SenderPool(FakePool([_entry("a", quota=10, used=9)]))
+
+    assert pool.choose(_row("lead-1"))["id"] == "a"
+    with pytest.raises(SenderUnavailable) as error:
+        pool.choose(_row("lead-2"))
+
+    assert not error.value.counts_attempt and error.value.retry_in > 0
+    assert pool.snapshot()["a"]["remaining_today"] == 0
+
+
+def test_leased_cap_moves_leads_to_the_next_server():
+    """Test that a server whose sender has no quota left is skipped, and released quota comes back"""
+    quota = MagicMock()
+    left = {"sender-a": 2, "sender-b": 1000}
+
+    def take(sender_id):
+        if not left[sender_id]:
+            return False
+        left[sender_id] -= 1
+        return True
+
+    quota.take.side_effect = take
+    quota.refund.side_effect = lambda sender_id: left.__setitem__(sender_id, left[sender_id] + 1)
+    pool = SenderPool(FakePool([_entry("a", sender_id="sender-a"), _entry("b", sender_id="sender-b")]), quota=quota)
+
+    chosen = [pool.choose(_row(f"lead-{i}"))["id"] for i in range(20)]
+    assert chosen.count("a") == 2
+    with pytest.raises(SenderUnavailable) as capped:
+        pool.choose(_row("lead-x", pinned="thread", server_id="a"))
+    assert not capped.value.counts_attempt
+
+    pool.release("a")
+    assert pool.choose(_row("lead-x", pinned="thread", server_id="a"))["id"] == "a"
+
+
+def test_engine_moves_sends_off_a_dead_server(monkeypatch):
+    """Test that once a server's breaker opens, its leads go out through the healthy one"""
+    monkeypatch.setenv("TRACKING_SECRET", "test-secret")
+    monkeypatch.setenv("TRACKING_BASE_URL", "https://t.example.com")
+    sink = SMTPSink()
+    try:
+        with socket.socket() as probe:
+            probe.bind(("127.0.0.1", 0))
+            dead_port = probe.getsockname()[1]
+        servers = _servers(sink, 2)
+        servers[1]["smtp_port"] = dead_port
+        rows = {row["id"]: row for row in _rows(200, servers)}
+        queue = FakeQueue(rows.values(), servers, [STEP])
+        senders = SenderPool(queue, failure_threshold=3, cooldown=60)
+        pools = SMTPPoolManager(reap_interval=0)
+
+        def run():
+            SendEngine(worker_id="test", supabase=queue, throttle=Throttle(0, 1, 0, 1), workers=4, pools=pools,
+                       senders=senders, redis_getter=lambda: None, poll_interval=0.05,
+                       flush_interval=0.05).run(until_idle=True)
+
+        run()
+        first = queue.outcomes()
+        # Handed-back messages are claimed again and routed to the healthy server
+        queue.rows = [rows[result["id"]] for result in queue.results if result["outcome"] == "deferred"]
+        run()
+    finally:
+        sink.stop()
+
+    assert 3 <= first["retry"] <= 3 + 4 * 2
+    assert first["deferred"] > 50
+    assert queue.outcomes()["sent"] == 200 - first["retry"]
+    assert len(sink.messages) == 200 - first["retry"]
+    assert senders.snapshot()["server-1"]["state"] == "open"
+
+
+def test_utilization_endpoint_merges_engine_health(monkeypatch):
+    """Test that database usage is returned with the health every engine reports"""
+    supabase = MagicMock()
+    supabase.rpc.return_value.execute.return_value = MagicMock(data=[
+        {"id": "a", "email_address": "a@example.com", "sent_today": 40, "daily_quota": 100, "remaining_today": 60},
+        {"id": "b", "email_address": "b@example.com", "sent_today": 0, "daily_quota": None, "remaining_today": None},
+    ])
+    monkeypatch.setattr("flask_app.routes.email_servers.create_supabase_client", lambda: supabase)
+    monkeypatch.setattr("flask_app.routes.email_servers.send_engine.published_stats", lambda: [
+        {"senders": {"a": {"state": "closed", "latency_ms": 100.0, "sends": 30, "errors": 0}}},
+        {"senders": {"a": {"state": "open", "latency_ms": 200.0, "sends": 10, "errors": 5}}},
+    ])
+    app = Flask(__name__)
+    app.config["ENV"] = "development"
+    os.environ["DEV_API_KEY"] = "dev-secret"
+    app.register_blueprint(email_servers_bp)
+
+    response = app.test_client().get("/email-servers/utilization?days=30", headers={"X-API-Key": "dev-secret"})
+
+    assert response.status_code == 200
+    servers = {server["id"]: server for server in response.get_json()["servers"]}
+    assert servers["a"]["health"] == {"state": "open", "latency_ms": 125.0, "sends": 40, "errors": 5}
+    assert servers["b"]["health"] is None
+    assert supabase.rpc.call_args.args[1]["p_days"] == 30
+    assert merge_health([]) == {}
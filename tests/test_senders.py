@@ -1,57 +1,174 @@
 import os
+import threading
+from datetime import date
+from types import SimpleNamespace
+from unittest.mock import MagicMock
+
 import pytest
-from unittest.mock import MagicMock, patch
+from flask import Flask
+
+from flask_app.quota import QuotaStore, daily_cap, ramp_schedule
+from flask_app.routes.senders import senders_bp
+
+SENDER_ID = "123e4567-e89b-12d3-a456-426614174000"
+HEADERS = {"X-API-Key": "dev-secret"}
 
 
 @pytest.fixture
-def app():
-    from flask_app import create_app
-    os.environ["FLASK_ENV"] = "development"
-    os.environ["DEV_API_KEY"] = "dev-secret"
-    return create_app()
+def mock_supabase(monkeypatch):
+    mock = MagicMock()
+    monkeypatch.setattr("flask_app.routes.senders.create_supabase_client", lambda: mock)
+    return mock
 
 
 @pytest.fixture
-def client(app):
+def client():
+    app = Flask(__name__)
+    app.config["ENV"] = "development"
+    os.environ["DEV_API_KEY"] = "dev-secret"
+    app.register_blueprint(senders_bp)
     return app.test_client()
 
 
-def test_list_senders_ok(client):
-    """Test listing senders returns 200 and empty array"""
-    # Make request with dev API key
-    response = client.get('/senders/', headers={"X-API-Key": "dev-secret"})
-    
-    # Assertions
+class FakeLeases:
+    """Stands in for lease_quota/return_quota over one sender_quota_usage row"""
+
+    def __init__(self, cap):
+        self.cap = cap
+        self.leased = 0
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def rpc(self, name, params):
+        self.calls.append(name)
+        with self.lock:
+            if name == "lease_quota":
+                data = min(params["p_amount"], max(self.cap - self.leased, 0))
+                self.leased += data
+            else:
+                self.leased -= params["p_amount"]
+                data = None
+        return SimpleNamespace(execute=lambda: SimpleNamespace(data=data))
+
+
+def test_ramp_schedules():
+    """Test linear and exponential ramps and the cap lookup during and after warm-up"""
+    assert ramp_schedule(100, 5, 20) == [20, 40, 60, 80, 100]
+    assert ramp_schedule(1000, 4, 10, "exponential") == [10, 46, 215, 1000]
+    assert ramp_schedule(50, 3) == [5, 28, 50]
+    with pytest.raises(ValueError):
+        ramp_schedule(100, 5, 200)
+
+    sender = {"daily_quota": 100, "ramp": [20, 40, 60], "warmup_start_date": "2026-10-01"}
+    assert daily_cap(sender, date(2026, 9, 30)) == 20
+    assert daily_cap(sender, date(2026, 10, 2)) == 40
+    assert daily_cap(sender, date(2026, 10, 4)) == 100
+
+
+def test_quota_store_leases_blocks_and_never_exceeds_the_cap():
+    """Test that concurrent takes cost one round trip per block and stop exactly at the cap"""
+    leases = FakeLeases(cap=1000)
+    store = QuotaStore(leases, block=50, today=lambda: date(2026, 10, 20))
+    taken = []
+
+    def worker():
+        taken.append(sum(store.take("sender-1") for _ in range(300)))
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sum(taken) == 1000
+    assert leases.calls.count("lease_quota") == 1000 // 50 + 1
+    assert not store.take("sender-1")
+    assert leases.calls.count("lease_quota") == 21
+
+
+def test_quota_store_returns_leftovers_and_starts_over_each_day():
+    """Test refunds, returning unused sends and a fresh lease on a new day"""
+    day = [date(2026, 10, 20)]
+    leases = FakeLeases(cap=100)
+    store = QuotaStore(leases, block=10, today=lambda: day[0])
+
+    assert store.take("sender-1") and store.take("sender-1")
+    store.refund("sender-1")
+    store.release()
+    assert leases.leased == 1
+
+    day[0] = date(2026, 10, 21)
+    leases.leased = 0
+    assert store.take("sender-1")
+    assert store.snapshot()["sender-1"] == {"day": "2026-10-21", "left": 9, "exhausted": False}
+
+
+def test_list_senders(client, mock_supabase):
+    """Test listing senders with today's cap"""
+    mock_supabase.table.return_value.select.return_value.eq.return_value.order.return_value.execute.return_value = \
+        MagicMock(data=[{"id": SENDER_ID, "email": "a@example.com", "daily_quota": 200, "ramp": None}])
+
+    response = client.get("/senders/", headers=HEADERS)
+
     assert response.status_code == 200
-    json_data = response.get_json()
-    
-    # Check response is an empty array
-    assert isinstance(json_data, list)
-    assert len(json_data) == 0
+    assert response.get_json()[0]["cap_today"] == 200
 
 
-def test_create_sender_not_implemented(client):
-    """Test create sender endpoint returns 501 Not Implemented"""
-    response = client.post('/senders/', json={}, headers={"X-API-Key": "dev-secret"})
-    assert response.status_code == 501
+def test_create_sender_computes_the_ramp(client, mock_supabase):
+    """Test that creating a sender with a warm-up stores the precomputed ramp"""
+    table = mock_supabase.table.return_value
+    table.select.return_value.eq.return_value.eq.return_value.execute.return_value = MagicMock(data=[{"id": "s-1"}])
+    table.insert.return_value.execute.return_value = MagicMock(data=[{"id": SENDER_ID}])
 
+    response = client.post("/senders/", headers=HEADERS, json={
+        "email": "new@example.com", "email_server_id": "s-1", "daily_quota": 100,
+        "warmup_days": 5, "warmup_start_quota": 20, "warmup_start_date": "2026-10-20",
+    })
 
-def test_get_sender_not_implemented(client):
-    """Test get sender endpoint returns 501 Not Implemented"""
-    response = client.get('/senders/123e4567-e89b-12d3-a456-426614174000', 
-                         headers={"X-API-Key": "dev-secret"})
-    assert response.status_code == 501
+    assert response.status_code == 201
+    inserted = table.insert.call_args.args[0]
+    assert inserted["ramp"] == [20, 40, 60, 80, 100]
+    assert inserted["warmup_curve"] == "linear" and inserted["warmup_start_date"] == "2026-10-20"
 
 
-def test_update_sender_not_implemented(client):
-    """Test update sender endpoint returns 501 Not Implemented"""
-    response = client.patch('/senders/123e4567-e89b-12d3-a456-426614174000', 
-                           json={}, headers={"X-API-Key": "dev-secret"})
-    assert response.status_code == 501
+def test_create_sender_validation(client, mock_supabase):
+    """Test that a warm-up without a quota, a bad curve or a foreign server is refused"""
+    table = mock_supabase.table.return_value
+    table.select.return_value.eq.return_value.eq.return_value.execute.return_value = MagicMock(data=[])
+
+    assert client.post("/senders/", headers=HEADERS,
+                       json={"email": "x@example.com", "warmup_days": 5}).status_code == 400
+    assert client.post("/senders/", headers=HEADERS,
+                       json={"email": "x@example.com", "daily_quota": 10, "warmup_days": 5,
+                             "warmup_curve": "steep"}).status_code == 400
+    response = client.post("/senders/", headers=HEADERS, json={"email": "x@example.com", "email_server_id": "s-9"})
+    assert response.status_code == 400
+    assert response.get_json()["error"] == "Email server not found"
+    table.insert.assert_not_called()
+
+
+def test_update_sender_recomputes_the_ramp(client, mock_supabase):
+    """Test that raising the quota keeps the warm-up and stretches its ramp"""
+    table = mock_supabase.table.return_value
+    table.select.return_value.eq.return_value.eq.return_value.execute.return_value = MagicMock(data=[{
+        "id": SENDER_ID, "daily_quota": 100, "warmup_days": 3, "warmup_start_quota": 10,
+        "warmup_curve": "linear", "warmup_start_date": "2026-10-20",
+    }])
+    table.update.return_value.eq.return_value.eq.return_value.execute.return_value = MagicMock(data=[{"id": SENDER_ID}])
+
+    response = client.patch(f"/senders/{SENDER_ID}", headers=HEADERS, json={"daily_quota": 200})
+
+    assert response.status_code == 200
+    updated = table.update.call_args.args[0]
+    assert updated["ramp"] == [10, 105, 200]
+    assert updated["warmup_start_date"] == "2026-10-20"
+
 
+def test_get_and_delete_missing_sender(client, mock_supabase):
+    """Test 404s for a sender that is not the user's"""
+    table = mock_supabase.table.return_value
+    table.select.return_value.eq.return_value.eq.return_value.execute.return_value = MagicMock(data=[])
+    table.delete.return_value.eq.return_value.eq.return_value.execute.return_value = MagicMock(data=[])
 
-def test_delete_sender_not_implemented(client):
-    """Test delete sender endpoint returns 501 Not Implemented"""
-    response = client.delete('/senders/123e4567-e89b-12d3-a456-426614174000', 
-                            headers={"X-API-Key": "dev-secret"})
-    assert response.status_code == 501
+    assert client.get(f"/senders/{SENDER_ID}", headers=HEADERS).status_code == 404
+    assert client.delete(f"/senders/{SENDER_ID}", headers=HEADERS).status_code == 404
@@ -0,0 +1,157 @@
+import os
+import smtplib
+import socket
+import threading
+from unittest.mock import MagicMock
+
+import pytest
+from flask import Flask
+
+from flask_app.routes.email_servers import email_servers_bp
+from flask_app.smtp_pool import SMTPConnectionPool, SMTPPoolManager, PoolExhausted
+from tests.smtp_sink import SMTPSink
+
+MESSAGE = b"Subject: hi\r\n\r\nHello\r\n"
+
+
+@pytest.fixture
+def sink():
+    server = SMTPSink(refuse="nobody@")
+    yield server
+    server.stop()
+
+
+def _server(sink, **overrides):
+    row = {
+        "id": "server-1", "smtp_server": "127.0.0.1", "smtp_port": sink.port,
+        "email_address": "me@example.com", "password": "secret",
+        "use_ssl": False, "use_tls": False,
+    }
+    row.update(overrides)
+    return row
+
+
+def test_messages_reuse_one_authenticated_session(sink):
+    """Test that after the first message each send is only MAIL, RCPT and DATA"""
+    pool = SMTPConnectionPool(_server(sink))
+
+    for i in range(20):
+        pool.send("me@example.com", [f"lead{i}@example.com"], MESSAGE)
+
+    assert sink.connections == 1
+    assert sink.commands[:2] == ["EHLO", "AUTH"]
+    assert sink.commands[2:] == ["MAIL", "RCPT", "DATA"] * 20
+    assert len(sink.messages) == 20
+    assert pool.stats()["opened"] == 1 and pool.stats()["reused"] == 19
+
+
+def test_concurrency_is_limited_per_server(sink):
+    """Test that concurrent senders share at most max_connections sessions"""
+    pool = SMTPConnectionPool(_server(sink, max_connections=2))
+    threads = [
+        threading.Thread(target=lambda: [pool.send("me@example.com", "to@example.com", MESSAGE) for _ in range(5)])
+        for _ in range(6)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(sink.messages) == 30
+    assert sink.connections <= 2
+
+    with pool.session():
+        with pool.session():
+            with pytest.raises(PoolExhausted):
+                with pool.session(timeout=0.05):
+                    pass
+
+
+def test_idle_sessions_are_evicted(sink):
+    """Test that expired idle sessions are closed with QUIT"""
+    pool = SMTPConnectionPool(_server(sink), idle_timeout=0)
+    pool.send("me@example.com", "to@example.com", MESSAGE)
+
+    assert pool.evict_idle() == 1
+    assert sink.commands[-1] == "QUIT"
+    pool.send("me@example.com", "to@example.com", MESSAGE)
+    assert sink.connections == 2
+
+
+def test_dropped_session_is_replaced(sink):
+    """Test the health check and the retry of a send on a dropped session"""
+    pool = SMTPConnectionPool(_server(sink), check_interval=3600)
+    pool.send("me@example.com", "to@example.com", MESSAGE)
+    pool._idle[0].smtp.sock.shutdown(socket.SHUT_RDWR)
+
+    # Not due for a NOOP check: the send fails and is retried
+    pool.send("me@example.com", "to@example.com", MESSAGE)
+    assert len(sink.messages) == 2
+    assert sink.connections == 2
+
+    pool.check_interval = 0
+    pool._idle[0].smtp.sock.shutdown(socket.SHUT_RDWR)
+    # Due for a check: the dead session is discarded before use
+    pool.send("me@example.com", "to@example.com", MESSAGE)
+    assert sink.connections == 3
+    assert pool.stats()["evicted"] == 1
+
+
+def test_refused_recipient_keeps_the_session(sink):
+    """Test that a protocol-level refusal does not retire the session"""
+    pool = SMTPConnectionPool(_server(sink))
+
+    with pytest.raises(smtplib.SMTPRecipientsRefused):
+        pool.send("me@example.com", ["nobody@example.com"], MESSAGE)
+    refused = pool.send("me@example.com", ["nobody@example.com", "to@example.com"], MESSAGE)
+
+    assert list(refused) == ["nobody@example.com"]
+    assert sink.connections == 1
+
+
+def test_sessions_are_retired_after_max_messages(sink):
+    """Test the per-session message cap"""
+    pool = SMTPConnectionPool(_server(sink), max_messages=3)
+    for _ in range(7):
+        pool.send("me@example.com", "to@example.com", MESSAGE)
+    assert sink.connections == 3
+
+
+def test_manager_replaces_pool_when_server_changes(sink):
+    """Test that pools are keyed by server id and rebuilt on config changes"""
+    manager = SMTPPoolManager()
+    server = _server(sink)
+
+    first = manager.pool(server)
+    assert manager.pool(dict(server)) is first
+
+    manager.send(server, "me@example.com", "to@example.com", MESSAGE)
+    replaced = manager.pool(_server(sink, password="rotated"))
+    assert replaced is not first
+    assert sink.commands[-1] == "QUIT"
+
+    with pytest.raises(smtplib.SMTPAuthenticationError):
+        manager.send(_server(sink, password="rotated"), "me@example.com", "to@example.com", MESSAGE)
+    assert list(manager.stats()) == ["server-1"]
+    manager.close()
+
+
+def test_email_server_max_connections_is_validated(monkeypatch):
+    """Test that the per-server limit is stored and bounded"""
+    os.environ["DEV_API_KEY"] = "dev-secret"
+    mock = MagicMock()
+    mock.table.return_value.insert.return_value.execute.return_value = MagicMock(data=[{"id": "server-1"}])
+    monkeypatch.setattr('flask_app.routes.email_servers.create_supabase_client', lambda: mock)
+    app = Flask(__name__)
+    app.config["ENV"] = "development"
+    app.register_blueprint(email_servers_bp)
+    client = app.test_client()
+    body = {"email_address": "me@example.com", "password": "secret",
+            "pop_imap_server": "imap.example.com", "smtp_server": "smtp.example.com"}
+
+    response = client.post('/email-servers', json={**body, "max_connections": 5}, headers={"X-API-Key": "dev-secret"})
+    assert response.status_code == 201
+    assert mock.table.return_value.insert.call_args[0][0]["max_connections"] == 5
+
+    response = client.post('/email-servers', json={**body, "max_connections": 0}, headers={"X-API-Key": "dev-secret"})
+    assert response.status_code == 400
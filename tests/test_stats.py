@@ -0,0 +1,77 @@
+import os
+import pytest
+from unittest.mock import MagicMock
+
+
+@pytest.fixture
+def app():
+    from flask_app import create_app
+    os.environ["FLASK_ENV"] = "development"
+    os.environ["DEV_API_KEY"] = "dev-secret"
+    return create_app()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def mock_supabase(monkeypatch):
+    """Create and configure a MagicMock for Supabase client"""
+    mock = MagicMock()
+    monkeypatch.setattr('flask_app.stats_engine.create_supabase_client', lambda: mock)
+    return mock
+
+
+def test_overview_reads_counter_row(client, mock_supabase):
+    """Test that the overview is computed from the owner's counter row"""
+    mock_execute = MagicMock()
+    mock_execute.data = [{
+        "leads": 120, "campaigns": 4, "active_campaigns": 2, "sent": 1000,
+        "bounced": 50, "opened": 380, "clicked": 95, "replied": 19,
+        "updated_at": "2025-01-01T00:00:00Z"
+    }]
+    select = mock_supabase.table.return_value.select.return_value
+    select.eq.return_value.limit.return_value.execute.return_value = mock_execute
+
+    response = client.get('/stats/overview/', headers={"X-API-Key": "dev-secret"})
+
+    assert response.status_code == 200
+    data = response.get_json()
+    assert data["leads"] == 120
+    assert data["opens"] == 380
+    assert data["replies"] == 19
+    assert data["delivery_rate"] == 0.95
+    assert data["open_rate"] == 0.4
+    assert data["reply_rate"] == 0.02
+
+    # One primary-key read, no counting over email_log
+    mock_supabase.table.assert_called_once_with("owner_stats")
+
+
+def test_overview_without_counters_is_zero(client, mock_supabase):
+    """Test that a new owner gets zeros instead of an error"""
+    select = mock_supabase.table.return_value.select.return_value
+    select.eq.return_value.limit.return_value.execute.return_value = MagicMock(data=[])
+
+    response = client.get('/stats/overview/', headers={"X-API-Key": "dev-secret"})
+
+    assert response.status_code == 200
+    data = response.get_json()
+    assert data["leads"] == 0
+    assert data["open_rate"] == 0.0
+
+
+def test_overviews_for_several_owners_in_one_query(mock_supabase):
+    """Test that live updates read the counters of a whole batch at once"""
+    from flask_app import stats_engine
+    mock_execute = MagicMock()
+    mock_execute.data = [{"owner": "owner-1", "sent": 10, "replied": 2}]
+    mock_supabase.table.return_value.select.return_value.in_.return_value.execute.return_value = mock_execute
+
+    overviews = stats_engine.get_overviews(["owner-2", "owner-1", None])
+
+    mock_supabase.table.return_value.select.return_value.in_.assert_called_once_with("owner", ["owner-1", "owner-2"])
+    assert overviews["owner-1"]["replies"] == 2
+    assert overviews["owner-2"]["sent"] == 0
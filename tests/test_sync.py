@@ -0,0 +1,117 @@
+import os
+from datetime import datetime, timedelta, timezone
+from unittest.mock import MagicMock
+
+import pytest
+from flask import Flask
+
+from flask_app import sync
+from flask_app.routes.sync import sync_bp
+
+LEAD_1 = "11111111-1111-1111-1111-111111111111"
+LEAD_2 = "22222222-2222-2222-2222-222222222222"
+
+
+def _mock_changes(monkeypatch, changes):
+    mock = MagicMock()
+    mock.rpc.return_value.execute.return_value = MagicMock(data=changes)
+    monkeypatch.setattr('flask_app.sync.create_supabase_client', lambda: mock)
+    return mock
+
+
+def _client():
+    os.environ["DEV_API_KEY"] = "dev-secret"
+    app = Flask(__name__)
+    app.config["ENV"] = "development"
+    app.register_blueprint(sync_bp)
+    return app.test_client()
+
+
+def test_cursor_round_trip():
+    """Test that a cursor decodes to the keyset position it was made from"""
+    changed_at = datetime.now(timezone.utc).isoformat()
+    cursor = sync.encode_cursor(changed_at, LEAD_1)
+
+    assert "=" not in cursor
+    assert sync.decode_cursor(cursor) == (datetime.fromisoformat(changed_at), LEAD_1, datetime.fromisoformat(changed_at))
+    assert sync.decode_cursor(None) == (None, None, None)
+    with pytest.raises(ValueError):
+        sync.decode_cursor("not-a-cursor")
+
+
+def test_changes_split_upserts_and_tombstones(monkeypatch):
+    """Test one page of changes and the cursor of its last change"""
+    now = datetime.now(timezone.utc)
+    changes = [
+        {"op": "upsert", "id": LEAD_1, "changed_at": (now - timedelta(minutes=2)).isoformat(),
+         "record": {"id": LEAD_1, "email": "a@example.com"}},
+        {"op": "delete", "id": LEAD_2, "changed_at": (now - timedelta(minutes=1)).isoformat(), "record": None},
+    ]
+    mock = _mock_changes(monkeypatch, changes)
+    since = sync.encode_cursor((now - timedelta(hours=1)).isoformat(), LEAD_2)
+
+    result = sync.get_changes("leads", "owner-1", cursor=since, limit=2)
+
+    assert result["upserts"] == [{"id": LEAD_1, "email": "a@example.com"}]
+    assert result["deleted"] == [LEAD_2]
+    assert result["has_more"] is True
+    assert sync.decode_cursor(result["cursor"])[1] == LEAD_2
+    # A full page only vouches for the changes it returned
+    assert sync.decode_cursor(result["cursor"])[2] == datetime.fromisoformat(changes[-1]["changed_at"])
+
+    name, params = mock.rpc.call_args[0]
+    assert name == "sync_changes"
+    assert params["p_resource"] == "leads"
+    assert params["p_owner"] == "owner-1"
+    assert params["p_after_id"] == LEAD_2
+    assert params["p_limit"] == 2
+
+
+def test_caught_up_keeps_the_position_and_advances_the_sync_time(monkeypatch):
+    """Test that an empty page keeps the keyset position and moves the sync time forward"""
+    _mock_changes(monkeypatch, [])
+    changed_at = (datetime.now(timezone.utc) - timedelta(days=2)).isoformat()
+    since = sync.encode_cursor(changed_at, LEAD_1)
+
+    result = sync.get_changes("campaigns", "owner-1", cursor=since)
+
+    assert result["upserts"] == [] and result["deleted"] == [] and result["has_more"] is False
+    after_ts, after_id, synced_at = sync.decode_cursor(result["cursor"])
+    assert (after_ts, after_id) == (datetime.fromisoformat(changed_at), LEAD_1)
+    assert synced_at > datetime.now(timezone.utc) - timedelta(minutes=1)
+
+
+def test_unchanged_resource_does_not_expire(monkeypatch):
+    """Test that expiry follows the sync time, not the time of the last change"""
+    _mock_changes(monkeypatch, [])
+    now = datetime.now(timezone.utc)
+    old_change = (now - timedelta(days=sync.TOMBSTONE_RETENTION_DAYS + 5)).isoformat()
+
+    recent = sync.encode_cursor(old_change, LEAD_1, (now - timedelta(days=1)).isoformat())
+    assert sync.get_changes("templates", "owner-1", cursor=recent)["has_more"] is False
+
+    with pytest.raises(sync.CursorExpired):
+        sync.get_changes("templates", "owner-1", cursor=sync.encode_cursor(old_change, LEAD_1))
+
+
+def test_sync_endpoint(monkeypatch):
+    """Test /sync/<resource> responses and validation"""
+    _mock_changes(monkeypatch, [
+        {"op": "upsert", "id": LEAD_1, "changed_at": datetime.now(timezone.utc).isoformat(), "record": {"id": LEAD_1}},
+    ])
+    client = _client()
+    headers = {"X-API-Key": "dev-secret"}
+
+    response = client.get('/sync/templates', headers=headers)
+    assert response.status_code == 200
+    assert response.get_json()["upserts"] == [{"id": LEAD_1}]
+
+    assert client.get('/sync/users', headers=headers).status_code == 400
+    assert client.get('/sync/leads?since=garbage', headers=headers).status_code == 400
+    assert client.get('/sync/leads?limit=5000', headers=headers).status_code == 400
+
+    expired = sync.encode_cursor(
+        (datetime.now(timezone.utc) - timedelta(days=sync.TOMBSTONE_RETENTION_DAYS + 1)).isoformat(), LEAD_1
+    )
+    assert client.get(f'/sync/leads?since={expired}', headers=headers).status_code == 410
+    assert client.get('/sync/leads').status_code == 401
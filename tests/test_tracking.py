@@ -0,0 +1,104 @@
+import os
+import pytest
+from unittest.mock import patch
+from flask import Flask
+
+from flask_app.tracking import make_open_token, make_click_token, parse_token, InvalidToken
+
+EMAIL_ID = "123e4567-e89b-12d3-a456-426614174000"
+
+
+@pytest.fixture(autouse=True)
+def tracking_secret(monkeypatch):
+    monkeypatch.setenv("TRACKING_SECRET", "test-secret")
+
+
+@pytest.fixture
+def client():
+    from flask_app.routes.tracking import tracking_bp
+    app = Flask(__name__)
+    app.register_blueprint(tracking_bp)
+    return app.test_client()
+
+
+def test_click_token_roundtrip():
+    """Test that a click token carries the email id and URL"""
+    token = make_click_token(EMAIL_ID, "https://example.com/pricing?ref=mail")
+    assert parse_token(token) == (EMAIL_ID, "https://example.com/pricing?ref=mail")
+
+
+def test_open_token_has_no_url():
+    """Test that an open token only carries the email id"""
+    assert parse_token(make_open_token(EMAIL_ID)) == (EMAIL_ID, None)
+
+
+def test_tampered_token_is_rejected():
+    """Test that changing the token invalidates the signature"""
+    token = make_click_token(EMAIL_ID, "https://example.com/")
+    tampered = token[:-2] + ("A" if token[-2] != "A" else "B") + token[-1]
+    with pytest.raises(InvalidToken):
+        parse_token(tampered)
+
+
+def test_token_signed_with_other_secret_is_rejected(monkeypatch):
+    """Test that tokens from another deployment do not verify"""
+    token = make_open_token(EMAIL_ID)
+    monkeypatch.setenv("TRACKING_SECRET", "other-secret")
+    with pytest.raises(InvalidToken):
+        parse_token(token)
+
+
+def test_only_http_links_can_be_tracked():
+    """Test that javascript: and similar URLs are refused"""
+    with pytest.raises(ValueError):
+        make_click_token(EMAIL_ID, "javascript:alert(1)")
+
+
+def test_click_redirects_and_buffers_event(client):
+    """Test that the click endpoint redirects and records the click after the response"""
+    token = make_click_token(EMAIL_ID, "https://example.com/")
+    with patch("flask_app.routes.tracking.event_buffer") as mock_buffer:
+        response = client.get(f"/t/c/{token}")
+        assert response.status_code == 302
+        assert response.headers["Location"] == "https://example.com/"
+        response.close()
+
+    event = mock_buffer.add.call_args[0][0]
+    assert event["event_type"] == "click"
+    assert event["email_id"] == EMAIL_ID
+    assert event["url"] == "https://example.com/"
+
+
+def test_open_pixel_served_for_invalid_token(client):
+    """Test that the pixel is always served but bad tokens are not recorded"""
+    with patch("flask_app.routes.tracking.event_buffer") as mock_buffer:
+        response = client.get("/t/o/not-a-token.gif")
+        response.close()
+
+    assert response.status_code == 200
+    assert response.mimetype == "image/gif"
+    mock_buffer.add.assert_not_called()
+
+
+def test_invalid_click_token_returns_404(client):
+    """Test that an unsigned click link is not followed"""
+    response = client.get("/t/c/not-a-token")
+    assert response.status_code == 404
+
+
+def test_unconfigured_secret_still_serves_pixel(client, monkeypatch):
+    """Test that a missing TRACKING_SECRET does not turn tracking requests into 500s"""
+    open_token = make_open_token(EMAIL_ID)
+    click_token = make_click_token(EMAIL_ID, "https://example.com/")
+    monkeypatch.delenv("TRACKING_SECRET")
+    monkeypatch.delenv("SECRET_KEY", raising=False)
+
+    with patch("flask_app.routes.tracking.event_buffer") as mock_buffer:
+        pixel = client.get(f"/t/o/{open_token}.gif")
+        pixel.close()
+        click = client.get(f"/t/c/{click_token}")
+
+    assert pixel.status_code == 200
+    assert pixel.mimetype == "image/gif"
+    assert click.status_code == 404
+    mock_buffer.add.assert_not_called()